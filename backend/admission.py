@@ -0,0 +1,227 @@
+"""Admission control in front of the LLM.
+
+* :class:`AdmissionController` caps the number of concurrent LLM calls and
+  the number of requests waiting for one. When the queue is full (or a request
+  waited too long) it fails fast with :class:`Overloaded` instead of letting
+  requests pile up until the provider starts rejecting them.
+* :class:`TokenBucketLimiter` applies a per-client request rate;
+  :class:`SharedRateLimiter` does it across worker processes.
+
+Both report a ``retry_after`` (seconds) that the API returns in the
+``Retry-After`` header.
+"""
+
+import asyncio
+import math
+import os
+import time
+from collections import OrderedDict, deque
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Deque, Dict, Final, Optional, Tuple
+
+from backend.metrics import record_stage  # noqa: WPS433 import from parent
+
+LLM_MAX_CONCURRENCY: Final[int] = int(os.environ.get("LLM_MAX_CONCURRENCY", "32"))
+LLM_MAX_QUEUE: Final[int] = int(os.environ.get("LLM_MAX_QUEUE", "64"))
+LLM_QUEUE_TIMEOUT: Final[float] = float(os.environ.get("LLM_QUEUE_TIMEOUT", "30"))
+# Seconds a shutting-down worker waits for the LLM calls in flight.
+SHUTDOWN_DRAIN_SECONDS: Final[float] = float(os.environ.get("SHUTDOWN_DRAIN_SECONDS", "30"))
+# Requests per minute allowed per client; 0 disables the per-client limit.
+CLIENT_RATE_LIMIT_PER_MINUTE: Final[float] = float(os.environ.get("CLIENT_RATE_LIMIT_PER_MINUTE", "0"))
+CLIENT_RATE_LIMIT_BURST: Final[int] = int(os.environ.get("CLIENT_RATE_LIMIT_BURST", "10"))
+
+# Number of recent queue waits kept for the percentile metrics.
+_WAIT_SAMPLES: Final[int] = 1024
+
+
+class Overloaded(Exception):
+    """Raised when a request cannot be admitted; ``retry_after`` is in seconds."""
+
+    def __init__(self, reason: str, retry_after: float) -> None:
+        super().__init__(reason)
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+class AdmissionController:
+    """Bounded concurrency with a bounded, time-limited wait queue."""
+
+    def __init__(
+        self,
+        max_concurrency: int = LLM_MAX_CONCURRENCY,
+        max_queue: int = LLM_MAX_QUEUE,
+        queue_timeout: float = LLM_QUEUE_TIMEOUT,
+    ) -> None:
+        self.max_concurrency = max_concurrency
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+        self.active = 0
+        self.waiting = 0
+        self.admitted = 0
+        self.rejected: Dict[str, int] = {"queue_full": 0, "timeout": 0, "draining": 0}
+        # Set by drain(): no new request is admitted.
+        self.draining = False
+        self._waits: Deque[float] = deque(maxlen=_WAIT_SAMPLES)
+        self._wait_total = 0.0
+        # Moving average of how long a slot is held, used for Retry-After.
+        self._service_time = 1.0
+
+    def saturated(self) -> bool:
+        """True if a new request would be rejected right now.
+
+        A request counts as waiting from the moment it asks for a slot, before
+        the semaphore hands it one, so a burst arriving in one event-loop tick
+        is bounded too.
+        """
+        return self.active + self.waiting >= self.max_concurrency + self.max_queue
+
+    def retry_after(self) -> float:
+        """Estimated seconds until the queue has room again."""
+        return max(1.0, math.ceil(self._service_time * (self.waiting + 1) / self.max_concurrency))
+
+    @asynccontextmanager
+    async def slot(self) -> AsyncIterator[None]:
+        """Hold one LLM slot for the duration of the ``async with`` block.
+
+        Raises:
+            Overloaded: The wait queue is full, the wait exceeded ``queue_timeout``
+                or the process is shutting down.
+        """
+        if self.draining:
+            self.rejected["draining"] += 1
+            raise Overloaded("draining", self.retry_after())
+        if self.saturated():
+            self.rejected["queue_full"] += 1
+            raise Overloaded("queue_full", self.retry_after())
+
+        self.waiting += 1
+        start = time.monotonic()
+        try:
+            await asyncio.wait_for(self._semaphore.acquire(), timeout=self.queue_timeout)
+        except asyncio.TimeoutError:
+            self.rejected["timeout"] += 1
+            raise Overloaded("timeout", self.retry_after()) from None
+        finally:
+            self.waiting -= 1
+        waited = time.monotonic() - start
+        self._waits.append(waited)
+        record_stage("admission_wait", waited)
+        self._wait_total += waited
+
+        self.active += 1
+        self.admitted += 1
+        held_since = time.monotonic()
+        try:
+            yield
+        finally:
+            self.active -= 1
+            self._semaphore.release()
+            self._service_time = 0.9 * self._service_time + 0.1 * (time.monotonic() - held_since)
+
+    async def drain(self, timeout: float) -> bool:
+        """Stop admitting requests and wait up to ``timeout`` seconds for the admitted ones.
+
+        Requests already queued are still served. Returns False if calls were
+        still in flight when the time ran out.
+        """
+        self.draining = True
+        deadline = time.monotonic() + timeout
+        while (self.active or self.waiting) and time.monotonic() < deadline:
+            await asyncio.sleep(0.05)
+        return not (self.active or self.waiting)
+
+    def stats(self) -> Dict[str, float]:
+        """Queue depth, in-flight calls, rejections and wait-time metrics."""
+        waits = sorted(self._waits)
+
+        def percentile(q: float) -> float:
+            return waits[min(int(len(waits) * q), len(waits) - 1)] if waits else 0.0
+
+        return {
+            "in_flight": self.active,
+            "queue_depth": self.waiting,
+            "max_concurrency": self.max_concurrency,
+            "max_queue": self.max_queue,
+            "admitted": self.admitted,
+            "rejected_queue_full": self.rejected["queue_full"],
+            "rejected_timeout": self.rejected["timeout"],
+            "rejected_draining": self.rejected["draining"],
+            "draining": self.draining,
+            "wait_seconds_total": self._wait_total,
+            "wait_seconds_p50": percentile(0.5),
+            "wait_seconds_p95": percentile(0.95),
+            "wait_seconds_max": waits[-1] if waits else 0.0,
+        }
+
+
+class TokenBucketLimiter:
+    """Per-client token buckets refilled at ``rate_per_minute``."""
+
+    def __init__(
+        self,
+        rate_per_minute: float = CLIENT_RATE_LIMIT_PER_MINUTE,
+        burst: int = CLIENT_RATE_LIMIT_BURST,
+        max_clients: int = 100_000,
+    ) -> None:
+        self.rate = rate_per_minute / 60.0
+        self.burst = burst
+        self.max_clients = max_clients
+        # client -> (tokens, last refill), least recently seen first.
+        self._buckets: "OrderedDict[str, Tuple[float, float]]" = OrderedDict()
+        self.limited = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.rate > 0
+
+    def acquire(self, client: str) -> Optional[float]:
+        """Take one token for ``client``; return the seconds to wait if none is left."""
+        if not self.enabled:
+            return None
+        now = time.monotonic()
+        tokens, last = self._buckets.pop(client, (float(self.burst), now))
+        tokens = min(float(self.burst), tokens + (now - last) * self.rate)
+        retry_after = None
+        if tokens >= 1.0:
+            tokens -= 1.0
+        else:
+            self.limited += 1
+            retry_after = (1.0 - tokens) / self.rate
+        self._buckets[client] = (tokens, now)
+        if len(self._buckets) > self.max_clients:
+            self._buckets.popitem(last=False)
+        return retry_after
+
+
+class SharedRateLimiter:
+    """Per-client request rate shared by the workers, as fixed one-minute windows in the shared store.
+
+    Counts are kept with ``INCR`` and ``EXPIRE`` (:mod:`backend.shared_state`);
+    unlike the token bucket there is no separate burst, and a client may send
+    up to twice the rate across the boundary of two windows.
+    """
+
+    def __init__(self, store: Any, rate_per_minute: float = CLIENT_RATE_LIMIT_PER_MINUTE) -> None:
+        self.store = store
+        self.rate_per_minute = rate_per_minute
+        self.limited = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.rate_per_minute > 0
+
+    def acquire(self, client: str) -> Optional[float]:
+        """Count one request of ``client``; return the seconds to wait if over the rate."""
+        if not self.enabled:
+            return None
+        now = time.time()
+        window = int(now // 60)
+        key = f"ratelimit:{client}:{window}"
+        count = self.store.incr(key)
+        if count == 1:
+            self.store.expire(key, 120)
+        if count <= self.rate_per_minute:
+            return None
+        self.limited += 1
+        return (window + 1) * 60 - now
@@ -0,0 +1,209 @@
+"""Exact-match cache of assistant replies.
+
+Replies are keyed on a canonical hash of the model, the system prompt and the
+normalized conversation, so repeated questions ("compare Pedri and Gavi") are
+answered without calling the LLM. Up to three tiers are used:
+
+* an in-process LRU with a time-to-live and a maximum number of entries;
+* an optional SQLite file (``RESPONSE_CACHE_DB_PATH``) shared by every worker
+  on the machine. Disk hits are promoted to the in-process tier.
+* an optional shared store (:mod:`backend.shared_state`: Redis or its SQLite
+  stand-in) shared by every worker of the deployment, used the same way.
+
+The async endpoints use :meth:`ResponseCache.aget` and :meth:`ResponseCache.aset`,
+which answer from memory on the event loop and query the other tiers in a
+worker thread.
+"""
+
+import asyncio
+import hashlib
+import json
+import math
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, Dict, Final, List, Optional, Tuple
+
+RESPONSE_CACHE_ENABLED: Final[bool] = os.environ.get("RESPONSE_CACHE_ENABLED", "1") != "0"
+RESPONSE_CACHE_TTL_SECONDS: Final[float] = float(os.environ.get("RESPONSE_CACHE_TTL_SECONDS", "3600"))
+RESPONSE_CACHE_MAX_ENTRIES: Final[int] = int(os.environ.get("RESPONSE_CACHE_MAX_ENTRIES", "1024"))
+RESPONSE_CACHE_DISK_MAX_ENTRIES: Final[int] = int(os.environ.get("RESPONSE_CACHE_DISK_MAX_ENTRIES", "100000"))
+# Unset by default: the disk tier is opt-in.
+RESPONSE_CACHE_DB_PATH: Final[Optional[str]] = os.environ.get("RESPONSE_CACHE_DB_PATH") or None
+
+# Disk evictions run once every this many writes rather than on every write.
+_DISK_EVICT_EVERY: Final[int] = 100
+
+
+def _normalize(content: str) -> str:
+    """Case- and whitespace-insensitive form of a message."""
+    return " ".join(content.split()).casefold()
+
+
+def response_cache_key(model: str, messages: List[Dict[str, str]]) -> str:
+    """Return the canonical hash of a request.
+
+    Args:
+        model (str): Model the reply is generated with.
+        messages (List[Dict[str, str]]): The conversation, system prompt first.
+
+    Returns:
+        str: A hex SHA-256 digest.
+    """
+    canonical = json.dumps(
+        [model, [[message["role"], _normalize(message["content"])] for message in messages]],
+        ensure_ascii=False,
+        separators=(",", ":"),
+    )
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+
+class ResponseCache:
+    """Tiered (memory, optional SQLite, optional shared store) cache of assistant replies."""
+
+    def __init__(
+        self,
+        ttl_seconds: float = RESPONSE_CACHE_TTL_SECONDS,
+        max_entries: int = RESPONSE_CACHE_MAX_ENTRIES,
+        db_path: Optional[str] = RESPONSE_CACHE_DB_PATH,
+        disk_max_entries: int = RESPONSE_CACHE_DISK_MAX_ENTRIES,
+        shared: Optional[Any] = None,
+    ) -> None:
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.disk_max_entries = disk_max_entries
+        # key -> (expiry wall-clock timestamp, reply), least recently used first.
+        self._memory: "OrderedDict[str, Tuple[float, str]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._writes = 0
+        self.hits: Dict[str, int] = {"memory": 0, "disk": 0, "shared": 0}
+        self._shared = shared
+        self.misses = 0
+        self._conn: Optional[sqlite3.Connection] = None
+        if db_path is not None:
+            Path(db_path).parent.mkdir(parents=True, exist_ok=True)
+            self._conn = sqlite3.connect(db_path, check_same_thread=False, isolation_level=None, timeout=5.0)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS responses (key TEXT PRIMARY KEY, reply TEXT NOT NULL, expires_at REAL NOT NULL)"
+            )
+            self._conn.execute("CREATE INDEX IF NOT EXISTS responses_expires_at ON responses (expires_at)")
+
+    def get(self, key: str) -> Optional[str]:
+        """Return the cached reply for ``key``, or ``None`` on a miss."""
+        reply = self._get_memory(key)
+        return reply if reply is not None else self._get_stored(key)
+
+    async def aget(self, key: str) -> Optional[str]:
+        """:meth:`get` that looks the disk and shared tiers up in a worker thread."""
+        reply = self._get_memory(key)
+        if reply is not None:
+            return reply
+        if self.stored:
+            return await asyncio.to_thread(self._get_stored, key)
+        return self._get_stored(key)
+
+    def set(self, key: str, reply: str) -> None:
+        """Store ``reply`` under ``key`` in every tier."""
+        expires_at = time.time() + self.ttl_seconds
+        with self._lock:
+            self._remember(key, reply, expires_at)
+        self._set_stored(key, reply, expires_at)
+
+    async def aset(self, key: str, reply: str) -> None:
+        """:meth:`set` that writes the disk and shared tiers in a worker thread."""
+        expires_at = time.time() + self.ttl_seconds
+        with self._lock:
+            self._remember(key, reply, expires_at)
+        if self.stored:
+            await asyncio.to_thread(self._set_stored, key, reply, expires_at)
+
+    @property
+    def stored(self) -> bool:
+        """Whether a disk or shared tier is configured, whose calls may block."""
+        return self._conn is not None or self._shared is not None
+
+    def stats(self) -> Dict[str, int]:
+        """Hit/miss counters and current size of the in-process tier."""
+        with self._lock:
+            return {
+                "hits_memory": self.hits["memory"],
+                "hits_disk": self.hits["disk"],
+                "hits_shared": self.hits["shared"],
+                "misses": self.misses,
+                "entries": len(self._memory),
+            }
+
+    def _get_memory(self, key: str) -> Optional[str]:
+        now = time.time()
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is None:
+                return None
+            if entry[0] >= now:
+                self._memory.move_to_end(key)
+                self.hits["memory"] += 1
+                return entry[1]
+            del self._memory[key]
+            return None
+
+    def _get_stored(self, key: str) -> Optional[str]:
+        """Look ``key`` up in the disk, then the shared tier; promote a hit to memory."""
+        if self._conn is not None:
+            with self._lock:
+                row = self._conn.execute(
+                    "SELECT reply, expires_at FROM responses WHERE key = ? AND expires_at >= ?", (key, time.time())
+                ).fetchone()
+                if row is not None:
+                    self._remember(key, row[0], row[1])
+                    self.hits["disk"] += 1
+                    return row[0]
+        if self._shared is not None:
+            # Outside the lock: the shared store may be slow and has its own.
+            entry = self._shared.get(f"reply:{key}")
+            if entry is not None:
+                expires_at, reply = json.loads(entry)
+                with self._lock:
+                    self._remember(key, reply, expires_at)
+                    self.hits["shared"] += 1
+                return reply
+        with self._lock:
+            self.misses += 1
+        return None
+
+    def _set_stored(self, key: str, reply: str, expires_at: float) -> None:
+        if self._conn is not None:
+            with self._lock:
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO responses (key, reply, expires_at) VALUES (?, ?, ?)",
+                    (key, reply, expires_at),
+                )
+                self._writes += 1
+                if self._writes % _DISK_EVICT_EVERY == 0:
+                    self._evict_disk()
+        if self._shared is not None:
+            # The expiry travels with the reply so that promoted copies expire with it.
+            self._shared.set(f"reply:{key}", json.dumps([expires_at, reply]), ex=math.ceil(self.ttl_seconds))
+
+    def _remember(self, key: str, reply: str, expires_at: float) -> None:
+        self._memory[key] = (expires_at, reply)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_entries:
+            self._memory.popitem(last=False)
+
+    def _evict_disk(self) -> None:
+        """Drop expired rows, then the ones closest to expiry above the size limit."""
+        assert self._conn is not None
+        self._conn.execute("DELETE FROM responses WHERE expires_at < ?", (time.time(),))
+        self._conn.execute(
+            """
+            DELETE FROM responses WHERE key NOT IN (
+                SELECT key FROM responses ORDER BY expires_at DESC LIMIT ?
+            )
+            """,
+            (self.disk_max_entries,),
+        )
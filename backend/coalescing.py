@@ -0,0 +1,48 @@
+"""Single-flight deduplication of identical in-flight LLM calls.
+
+When several clients ask the same question before the first answer came back,
+the caches cannot help yet. :class:`SingleFlight` lets the first request start
+the upstream call and every identical concurrent request await the same task.
+"""
+
+import asyncio
+from typing import Awaitable, Callable, Dict, Generic, TypeVar
+
+T = TypeVar("T")
+
+
+class SingleFlight(Generic[T]):
+    """Run at most one call per key at a time and share its outcome."""
+
+    def __init__(self) -> None:
+        self._in_flight: Dict[str, "asyncio.Task[T]"] = {}
+        self.calls = 0
+        self.coalesced = 0
+
+    async def do(self, key: str, fn: Callable[[], Awaitable[T]]) -> T:
+        """Return the result of ``fn()``, sharing it with concurrent callers of ``key``.
+
+        The call runs in its own task, so a caller that disconnects does not
+        cancel it for the others. If it raises, every waiter receives the
+        exception.
+        """
+        task = self._in_flight.get(key)
+        if task is None:
+            self.calls += 1
+            task = asyncio.ensure_future(fn())
+            self._in_flight[key] = task
+            task.add_done_callback(lambda done: self._forget(key, done))
+        else:
+            self.coalesced += 1
+        return await asyncio.shield(task)
+
+    def _forget(self, key: str, task: "asyncio.Task[T]") -> None:
+        if self._in_flight.get(key) is task:
+            del self._in_flight[key]
+        if not task.cancelled():
+            # Mark the exception as retrieved even if every waiter went away.
+            task.exception()
+
+    def in_flight(self) -> int:
+        """Number of distinct upstream calls currently running."""
+        return len(self._in_flight)
@@ -0,0 +1,206 @@
+"""Content-addressed cache of LLM completions, for eval runs.
+
+Every provider call made through :mod:`backend.utils` (the agent) and the
+eval scripts' ``call_llm`` can be looked up here first. The key is a hash
+of the model, the exact prompt messages (prompt-cache breakpoints aside),
+the ``response_format`` schema and the sampling parameters, so editing one
+prompt only misses for the calls that prompt produces. Completions are stored
+whole (usage included) in an SQLite file in WAL mode, which any number of
+worker processes can share. The least recently used entries are evicted above
+``LLM_CACHE_MAX_BYTES``.
+
+``LLM_CACHE_MODE`` selects the behaviour:
+
+* ``off`` (default): no lookups; the server runs this way.
+* ``on``: read, and store what misses.
+* ``replay``: read only; a miss raises :class:`LLMCacheMiss` instead of
+  calling the provider, for deterministic, offline and free CI re-runs.
+* ``refresh``: do not read, store every fresh completion.
+"""
+
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Any, Dict, Final, FrozenSet, List, Optional, Sequence
+
+LLM_CACHE_MODES: Final[Sequence[str]] = ("off", "on", "replay", "refresh")
+LLM_CACHE_MODE: Final[str] = os.environ.get("LLM_CACHE_MODE", "off")
+LLM_CACHE_PATH: Final[str] = os.environ.get(
+    "LLM_CACHE_PATH", str(Path(__file__).parent.parent / "data" / "llm_cache.sqlite3")
+)
+LLM_CACHE_MAX_BYTES: Final[int] = int(os.environ.get("LLM_CACHE_MAX_BYTES", str(1 << 30)))
+
+# Size checks (and evictions) run once every this many writes rather than on every write.
+_EVICT_EVERY: Final[int] = 100
+# Evictions go down to this fraction of the limit, so they do not run on every check.
+_EVICT_TO: Final[float] = 0.9
+# Completion arguments that change how a call is made, not what it returns.
+_TRANSPORT_PARAMS: Final[FrozenSet[str]] = frozenset(
+    {"api_base", "api_key", "base_url", "max_retries", "timeout", "stream", "metadata", "client", "extra_headers"}
+)
+
+
+class LLMCacheMiss(LookupError):
+    """Raised in ``replay`` mode for a call that has no recorded completion."""
+
+
+def _text(content: Any) -> str:
+    """Message content as text; content blocks (prompt-cache breakpoints) are joined."""
+    if isinstance(content, list):
+        return "".join(block.get("text", "") for block in content)
+    return content or ""
+
+
+def _schema(response_format: Any) -> Any:
+    """JSON schema of a pydantic ``response_format`` class; other values as they are."""
+    if isinstance(response_format, type) and hasattr(response_format, "model_json_schema"):
+        return response_format.model_json_schema()
+    return response_format
+
+
+def llm_cache_key(model: str, messages: List[Dict[str, Any]], **params: Any) -> str:
+    """Return the canonical hash of a completion request.
+
+    Args:
+        model (str): Model the completion is requested from.
+        messages (List[Dict[str, Any]]): The prompt, as sent to the provider.
+        **params: Completion arguments. ``response_format`` is reduced to its
+            schema; transport arguments (``api_base``, ``timeout``...) are ignored.
+
+    Returns:
+        str: A hex SHA-256 digest.
+    """
+    sampling = {name: value for name, value in params.items() if name not in _TRANSPORT_PARAMS and value is not None}
+    if "response_format" in sampling:
+        sampling["response_format"] = _schema(sampling["response_format"])
+    canonical = json.dumps(
+        [model, [[message["role"], _text(message.get("content"))] for message in messages], sampling],
+        ensure_ascii=False,
+        separators=(",", ":"),
+        sort_keys=True,
+        default=str,
+    )
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+
+class LLMCache:
+    """SQLite store of completions (as JSON) keyed by :func:`llm_cache_key`."""
+
+    def __init__(self, path: str = LLM_CACHE_PATH, mode: str = "on", max_bytes: int = LLM_CACHE_MAX_BYTES) -> None:
+        if mode not in LLM_CACHE_MODES or mode == "off":
+            raise ValueError(f"LLM cache mode must be one of on, replay, refresh; got {mode!r}")
+        self.path = path
+        self.mode = mode
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._writes = 0
+        self.hits = 0
+        self.misses = 0
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        # Writers of other processes hold the lock briefly; wait for them instead of failing.
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None, timeout=30.0)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS completions (
+                key TEXT PRIMARY KEY,
+                model TEXT NOT NULL,
+                response TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                created_at REAL NOT NULL,
+                used_at REAL NOT NULL
+            )
+            """
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS completions_used_at ON completions (used_at)")
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        """Return the completion stored under ``key``, or ``None`` on a miss.
+
+        Raises:
+            LLMCacheMiss: On a miss in ``replay`` mode.
+        """
+        if self.mode == "refresh":
+            return None
+        with self._lock:
+            row = self._conn.execute("SELECT response FROM completions WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+                self._conn.execute("UPDATE completions SET used_at = ? WHERE key = ?", (time.time(), key))
+        if row is None:
+            if self.mode == "replay":
+                raise LLMCacheMiss(f"no recorded completion for {key} in {self.path}")
+            return None
+        return json.loads(row[0])
+
+    def set(self, key: str, model: str, response: Dict[str, Any]) -> None:
+        """Store the completion ``response`` under ``key`` (not in ``replay`` mode)."""
+        if self.mode == "replay":
+            return
+        data = json.dumps(response, ensure_ascii=False, default=str)
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO completions (key, model, response, size, created_at, used_at) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (key, model, data, len(data), now, now),
+            )
+            self._writes += 1
+            if self._writes % _EVICT_EVERY == 0:
+                self._evict()
+
+    def stats(self) -> Dict[str, int]:
+        """Hit/miss counters of this process and the size of the store."""
+        with self._lock:
+            entries, size = self._conn.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM completions").fetchone()
+            return {"hits": self.hits, "misses": self.misses, "entries": entries, "bytes": size}
+
+    def _evict(self) -> None:
+        """Drop the least recently used completions while the store is above ``max_bytes``."""
+        (size,) = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM completions").fetchone()
+        if size <= self.max_bytes:
+            return
+        excess = size - int(self.max_bytes * _EVICT_TO)
+        self._conn.execute(
+            """
+            DELETE FROM completions WHERE key IN (
+                SELECT key FROM (
+                    SELECT key, size, SUM(size) OVER (ORDER BY used_at, key) AS freed FROM completions
+                ) WHERE freed - size < ?
+            )
+            """,
+            (excess,),
+        )
+
+    def close(self) -> None:
+        self._conn.close()
+
+
+_llm_cache: Optional[LLMCache] = None
+_configured = False
+
+
+def configure_llm_cache(mode: str = LLM_CACHE_MODE, path: str = LLM_CACHE_PATH) -> Optional[LLMCache]:
+    """Set the process-wide cache used by every LLM call (``off``: none) and return it."""
+    global _llm_cache, _configured
+    if mode not in LLM_CACHE_MODES:
+        raise ValueError(f"LLM cache mode must be one of {', '.join(LLM_CACHE_MODES)}; got {mode!r}")
+    if _llm_cache is not None:
+        _llm_cache.close()
+    _llm_cache = None if mode == "off" else LLMCache(path, mode)
+    _configured = True
+    return _llm_cache
+
+
+def get_llm_cache() -> Optional[LLMCache]:
+    """The process-wide cache, configured from ``LLM_CACHE_MODE`` on first use."""
+    if not _configured:
+        configure_llm_cache()
+    return _llm_cache
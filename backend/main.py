@@ -1,17 +1,119 @@
 """FastAPI application entry-point for the football chatbot."""
 
+import asyncio
+import json
+import logging
+import math
+import signal
+import threading
+from contextlib import asynccontextmanager
 from pathlib import Path
-from typing import Final, List, Dict
+from typing import Any, AsyncIterator, Awaitable, Callable, Final, List, Dict, Optional, Tuple
 
-from fastapi import FastAPI, HTTPException, status # type: ignore
-from fastapi.responses import HTMLResponse # type: ignore
+from fastapi import FastAPI, Header, HTTPException, Query, Request, Response, status # type: ignore
+from fastapi.responses import HTMLResponse, PlainTextResponse, StreamingResponse # type: ignore
 from fastapi.staticfiles import StaticFiles # type: ignore
 from pydantic import BaseModel, Field
 
-from backend.utils import get_agent_response  # noqa: WPS433 import from parent
+from backend.admission import (  # noqa: WPS433 import from parent
+    SHUTDOWN_DRAIN_SECONDS,
+    AdmissionController,
+    Overloaded,
+    SharedRateLimiter,
+    TokenBucketLimiter,
+)
+from backend.cache import RESPONSE_CACHE_ENABLED, ResponseCache, response_cache_key  # noqa: WPS433 import from parent
+from backend.coalescing import SingleFlight  # noqa: WPS433 import from parent
+from backend.metrics import (  # noqa: WPS433 import from parent
+    CACHE_LOOKUPS,
+    REGISTRY,
+    REQUEST_ERRORS,
+    CallbackCounter,
+    Gauge,
+    MetricsMiddleware,
+    instrument,
+    stage,
+)
+from backend.players import player_name_terms  # noqa: WPS433 import from parent
+from backend.router import get_router  # noqa: WPS433 import from parent
+from backend.semantic_cache import SEMANTIC_CACHE_ENABLED, SemanticCache  # noqa: WPS433 import from parent
+from backend.sessions import InMemorySessionStore, create_session_store, new_session_id  # noqa: WPS433 import from parent
+from backend.shared_state import get_shared_state  # noqa: WPS433 import from parent
+from backend.usage import TokenBudgetExceeded, charged_to, get_usage_ledger  # noqa: WPS433 import from parent
+from backend.utils import (  # noqa: WPS433 import from parent
+    DEFAULT_RETRY_POLICY,
+    MODEL_NAME,
+    WARM_UP_ON_STARTUP,
+    aget_agent_response,
+    astream_agent_response,
+    call_stats,
+    close_async_client,
+    ContextStats,
+    hedge_delay,
+    last_context_stats,
+    warm_up,
+    with_system_prompt,
+)
 
 APP_TITLE: Final[str] = "Scouting Chatbot" # type: ignore
-app = FastAPI(title=APP_TITLE)
+
+logger = logging.getLogger(__name__)
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI) -> AsyncIterator[None]:
+    """Warm the LLM client in the background and release it on shutdown.
+
+    The warm-up runs as a task so the app starts serving immediately; chat
+    requests arriving before it finished wait for it in :func:`_llm_ready`.
+    New LLM calls are refused (503) from the moment the server is asked to
+    stop (:func:`_drain_on_signal`); the ones in flight, including coalesced
+    calls whose clients went away, get up to ``SHUTDOWN_DRAIN_SECONDS`` to
+    finish; the token usage still in memory is written last.
+    """
+    app.state.warm_up = asyncio.create_task(warm_up()) if WARM_UP_ON_STARTUP else None
+    handlers = _drain_on_signal()
+    yield
+    for signum, handler in handlers.items():
+        signal.signal(signum, handler)
+    if not await admission.drain(SHUTDOWN_DRAIN_SECONDS):
+        logger.warning("Shutting down with %d LLM calls still in flight", admission.active)
+    if app.state.warm_up is not None:
+        app.state.warm_up.cancel()
+    await close_async_client()
+    ledger = get_usage_ledger()
+    if ledger is not None:
+        await asyncio.to_thread(ledger.flush)
+
+
+def _drain_on_signal() -> Dict[int, Any]:
+    """Set ``admission.draining`` as soon as SIGINT or SIGTERM arrives.
+
+    uvicorn first waits for the open connections and only then runs the
+    lifespan shutdown, so its handlers are wrapped: requests still arriving
+    on open connections get 503 instead of new LLM calls. Returns the wrapped
+    handlers, to restore.
+    """
+    if threading.current_thread() is not threading.main_thread():
+        # Signal handlers can only be set from the main thread (not under TestClient).
+        return {}
+    handlers = {}
+    for signum in (signal.SIGINT, signal.SIGTERM):
+        handler = signal.getsignal(signum)
+        if not callable(handler):
+            continue
+
+        def drain_then(number: int, frame: Any, handler: Callable[..., Any] = handler) -> None:
+            admission.draining = True
+            handler(number, frame)
+
+        handlers[signum] = signal.signal(signum, drain_then)
+    return handlers
+
+
+app = FastAPI(title=APP_TITLE, lifespan=lifespan)
+# Per-stage latency, status codes and in-flight requests, served at /metrics.
+app.add_middleware(MetricsMiddleware)
 
 # -----------------------------------------------------------------------------
 # Application setup
@@ -21,6 +123,41 @@ app = FastAPI(title=APP_TITLE)
 STATIC_DIR = Path(__file__).parent.parent / "frontend"
 app.mount("/static", StaticFiles(directory=STATIC_DIR), name="static")
 
+# Store shared by the workers (SHARED_STATE_URL), if any.
+shared_state = get_shared_state()
+# Conversation histories of clients using the session endpoints.
+session_store = create_session_store()
+# Exact-match cache of replies; disabled with RESPONSE_CACHE_ENABLED=0.
+response_cache: Optional[ResponseCache] = ResponseCache(shared=shared_state) if RESPONSE_CACHE_ENABLED else None
+# Near-duplicate single-turn queries; consulted after an exact-match miss.
+semantic_cache: Optional[SemanticCache] = (
+    SemanticCache(names=player_name_terms()) if RESPONSE_CACHE_ENABLED and SEMANTIC_CACHE_ENABLED else None
+)
+# Bounded number of concurrent LLM calls and of requests queued for one.
+admission = AdmissionController()
+# Optional per-client request rate (CLIENT_RATE_LIMIT_PER_MINUTE), counted across workers if they share state.
+rate_limiter = SharedRateLimiter(shared_state) if shared_state is not None else TokenBucketLimiter()
+# Identical concurrent /chat requests share one upstream call.
+agent_calls: SingleFlight[Tuple[List[Dict[str, str]], Optional[ContextStats]]] = SingleFlight()
+
+REGISTRY.register(Gauge("chatbot_llm_in_flight", "LLM calls currently holding an admission slot.", fn=lambda: admission.active))
+REGISTRY.register(Gauge("chatbot_llm_queue_depth", "Requests waiting for an admission slot.", fn=lambda: admission.waiting))
+REGISTRY.register(Gauge(
+    "chatbot_llm_distinct_in_flight", "Distinct upstream calls shared by coalesced requests.", fn=agent_calls.in_flight,
+))
+REGISTRY.register(CallbackCounter(
+    "chatbot_llm_policy_events_total",
+    "Attempts, retries, timeouts, fallbacks and hedges of the LLM retry policy.",
+    ("event",),
+    fn=lambda: {(event,): count for event, count in call_stats.items()},
+))
+REGISTRY.register(CallbackCounter(
+    "chatbot_router_routes_total",
+    "First questions by route: canned reply (out_of_scope), cheap model (clarify) or MODEL_NAME (full).",
+    ("route",),
+    fn=lambda: {(route,): count for route, count in get_router().counts.items()},
+))
+
 # -----------------------------------------------------------------------------
 # Request / response models
 # -----------------------------------------------------------------------------
@@ -41,30 +178,442 @@ class ChatResponse(BaseModel):
 
     messages: List[ChatMessage] = Field(..., description="The updated conversation history.")
 
+
+class SessionChatRequest(BaseModel):
+    """Schema for one turn of a server-side session; only the new message is sent."""
+
+    session_id: Optional[str] = Field(None, description="Session to continue; omit to start a new one.")
+    message: ChatMessage = Field(..., description="The new user message.")
+
+
+class SessionChatResponse(BaseModel):
+    """Schema for the reply to a session turn; only the new message is returned."""
+
+    session_id: str = Field(..., description="Session to send with the next turn.")
+    message: ChatMessage = Field(..., description="The assistant's reply.")
+
 # -----------------------------------------------------------------------------
 # Routes
 # -----------------------------------------------------------------------------
 
-@app.post("/chat", response_model=ChatResponse)
-async def chat_endpoint(payload: ChatRequest) -> ChatResponse:
-    """Main conversation endpoint.
-    
-    It proxies the user's messages to the LLM and returns the assistant's response.
+def _set_context_headers(response: Response, stats: Optional[ContextStats]) -> None:
+    """Expose the prompt size before and after context trimming."""
+    if stats is not None:
+        response.headers["X-Prompt-Tokens-Before"] = str(stats.prompt_tokens_before)
+        response.headers["X-Prompt-Tokens-After"] = str(stats.prompt_tokens_after)
+
+
+async def _llm_ready() -> None:
+    """Wait for a still-running startup warm-up before calling the LLM."""
+    task = getattr(app.state, "warm_up", None)
+    if task is not None and not task.done():
+        # Shielded so a cancelled request does not cancel the shared warm-up.
+        await asyncio.shield(task)
+
+def _client_id(request: Request) -> str:
+    """Identify the caller for per-client rate limits."""
+    return request.headers.get("x-client-id") or (request.client.host if request.client else "unknown")
+
+
+def _retry_after_headers(seconds: float) -> Dict[str, str]:
+    return {"Retry-After": str(max(1, math.ceil(seconds)))}
+
+
+async def _admit_client(client: str) -> None:
+    """Apply the per-client rate limit before spending an LLM call."""
+    if isinstance(rate_limiter, SharedRateLimiter) and rate_limiter.enabled:
+        # INCR on the shared store: off the event loop.
+        retry_after = await asyncio.to_thread(rate_limiter.acquire, client)
+    else:
+        retry_after = rate_limiter.acquire(client)
+    if retry_after is not None:
+        raise HTTPException(
+            status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+            detail="Too many requests from this client. Please slow down.",
+            headers=_retry_after_headers(retry_after),
+        )
+
+
+def _usage_account(session_id: Optional[str]) -> Optional[str]:
+    """Usage account charged for the LLM calls of a session (see :mod:`backend.usage`)."""
+    return f"session:{session_id}" if session_id else None
+
+
+def _budget_error(exc: TokenBudgetExceeded) -> HTTPException:
+    return HTTPException(
+        status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+        detail="This session has used its token budget. Please start a new session.",
+    )
+
+
+async def _check_budget(account: Optional[str]) -> None:
+    """Refuse a request whose session has used its token budget before spending an LLM call."""
+    ledger = get_usage_ledger()
+    if ledger is None or account is None:
+        return
+    try:
+        await ledger.acheck(account=account)
+    except TokenBudgetExceeded as exc:
+        REQUEST_ERRORS.inc(type="token_budget")
+        raise _budget_error(exc) from exc
+
+
+def _overloaded_error(exc: Overloaded) -> HTTPException:
+    return HTTPException(
+        status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+        detail="The assistant is handling too many requests. Please retry shortly.",
+        headers=_retry_after_headers(exc.retry_after),
+    )
+
+
+def _cache_policy(cache_control: Optional[str]) -> Tuple[bool, bool]:
+    """Return whether the response cache may be read and written for a request.
+
+    Clients bypass the cache with the standard ``Cache-Control`` request
+    header: ``no-cache`` skips the lookup (the fresh reply is still stored),
+    ``no-store`` skips the cache entirely.
     """
-    # Convert Pydantic models to simple dicts for the agent
-    request_messages: List[Dict[str, str]] = [msg.model_dump() for msg in payload.messages]
+    directives = {directive.strip().lower() for directive in (cache_control or "").split(",")}
+    if response_cache is None or "no-store" in directives:
+        return False, False
+    return "no-cache" not in directives, True
+
+
+def _single_turn_query(messages: List[Dict[str, str]]) -> Optional[str]:
+    """Return the user's message if ``messages`` is a system prompt plus one user turn."""
+    if len(messages) == 2 and messages[1]["role"] == "user":
+        return messages[1]["content"]
+    return None
+
+
+async def _read_caches(messages: List[Dict[str, str]], cache_control: Optional[str]) -> Tuple[Optional[str], str]:
+    """Look ``messages`` up in the exact-match, then the semantic cache.
+
+    Returns:
+        Tuple[Optional[str], str]: The cached reply (or ``None``) and the ``X-Cache`` value.
+    """
+    read, write = _cache_policy(cache_control)
+    if read:
+        reply = await response_cache.aget(response_cache_key(MODEL_NAME, messages))
+        if reply is not None:
+            return reply, "HIT"
+        query = _single_turn_query(messages)
+        if semantic_cache is not None and query is not None:
+            reply = semantic_cache.get(query, response_cache_key(MODEL_NAME, messages[:1]))
+            if reply is not None:
+                return reply, "HIT-SEMANTIC"
+    return None, "MISS" if write else "BYPASS"
+
+
+async def _write_caches(messages: List[Dict[str, str]], reply: str, cache_control: Optional[str]) -> None:
+    """Store a fresh reply in the caches the request allows."""
+    _, write = _cache_policy(cache_control)
+    if not write:
+        return
+    await response_cache.aset(response_cache_key(MODEL_NAME, messages), reply)
+    query = _single_turn_query(messages)
+    if semantic_cache is not None and query is not None:
+        semantic_cache.set(query, response_cache_key(MODEL_NAME, messages[:1]), reply)
+
+
+async def _agent_reply(
+    request_messages: List[Dict[str, str]],
+    cache_control: Optional[str],
+    response: Response,
+    client: str,
+    account: Optional[str] = None,
+) -> List[Dict[str, str]]:
+    """Answer ``request_messages`` from the response caches or the agent, charging ``account``."""
+    messages = with_system_prompt(request_messages)
+    with stage("cache_lookup"):
+        reply, cache_status = await _read_caches(messages, cache_control)
+    CACHE_LOOKUPS.inc(result=cache_status.lower().replace("-", "_"))
+    response.headers["X-Cache"] = cache_status
+    if reply is not None:
+        return messages + [{"role": "assistant", "content": reply}]
+
+    await _check_budget(account)
+    await _admit_client(client)
+
+    async def call_agent() -> Tuple[List[Dict[str, str]], Optional[ContextStats]]:
+        async with admission.slot():
+            await _llm_ready()
+            with charged_to(account):
+                updated = await aget_agent_response(messages)
+        # Context variables set in the shared task are not visible to the waiters.
+        return updated, last_context_stats.get()
 
     try:
-        updated_messages_dicts = get_agent_response(request_messages)
+        with stage("llm"):
+            if _cache_policy(cache_control)[0]:
+                # Requests allowed to read the cache may also share an in-flight call.
+                updated_messages_dicts, stats = await agent_calls.do(response_cache_key(MODEL_NAME, messages), call_agent)
+            else:
+                updated_messages_dicts, stats = await call_agent()
+    except Overloaded as exc:
+        REQUEST_ERRORS.inc(type="overloaded")
+        raise _overloaded_error(exc) from exc
+    except TokenBudgetExceeded as exc:
+        REQUEST_ERRORS.inc(type="token_budget")
+        raise _budget_error(exc) from exc
     except Exception as exc:
+        REQUEST_ERRORS.inc(type=type(exc).__name__)
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail=f"Error processing request: {str(exc)}"
         ) from exc
+
+    await _write_caches(messages, updated_messages_dicts[-1]["content"], cache_control)
+    _set_context_headers(response, stats)
+    return updated_messages_dicts
+
+@app.post("/chat", response_model=ChatResponse)
+@instrument
+async def chat_endpoint(
+    payload: ChatRequest,
+    request: Request,
+    response: Response,
+    cache_control: Optional[str] = Header(None),
+    x_session_id: Optional[str] = Header(None),
+) -> ChatResponse:
+    """Main conversation endpoint.
     
+    It proxies the user's messages to the LLM and returns the assistant's response.
+    Clients keeping the history themselves may send an ``X-Session-Id``
+    header so that the session's token usage and budget are accounted.
+    """
+    # Convert Pydantic models to simple dicts for the agent
+    with stage("model_dump"):
+        request_messages: List[Dict[str, str]] = [msg.model_dump() for msg in payload.messages]
+
+    updated_messages_dicts = await _agent_reply(
+        request_messages, cache_control, response, _client_id(request), _usage_account(x_session_id)
+    )
+
     # Convert dicts back to Pydantic models for the response
-    response_messages: List[ChatMessage] = [ChatMessage(**msg) for msg in updated_messages_dicts]
-    return ChatResponse(messages=response_messages)
+    with stage("build_response"):
+        response_messages: List[ChatMessage] = [ChatMessage(**msg) for msg in updated_messages_dicts]
+        return ChatResponse(messages=response_messages)
+
+def _sse_event(event: str, data: Any) -> str:
+    """Format one Server-Sent Event frame with a JSON payload."""
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+async def _stream_reply(
+    request_messages: List[Dict[str, str]],
+    done_payload: Callable[[List[Dict[str, str]]], Awaitable[Dict[str, Any]]],
+    cache_control: Optional[str],
+    client: str,
+    account: Optional[str] = None,
+) -> StreamingResponse:
+    """Relay the reply to ``request_messages`` as Server-Sent Events.
+
+    One ``delta`` event is sent per chunk produced by the model, then a
+    ``done`` event whose body is ``await done_payload(updated_messages)``. A cached
+    reply is sent as a single ``delta``. Failures after the stream started are
+    reported with an ``error`` event since the status code has already been sent.
+    """
+    messages = with_system_prompt(request_messages)
+    with stage("cache_lookup"):
+        cached_reply, cache_status = await _read_caches(messages, cache_control)
+    CACHE_LOOKUPS.inc(result=cache_status.lower().replace("-", "_"))
+    if cached_reply is None:
+        await _check_budget(account)
+        await _admit_client(client)
+        # Fail fast while the status code can still be sent.
+        if admission.saturated():
+            REQUEST_ERRORS.inc(type="overloaded")
+            raise _overloaded_error(Overloaded("queue_full", admission.retry_after()))
+        await _llm_ready()
+
+    async def event_stream() -> AsyncIterator[str]:
+        if cached_reply is not None:
+            yield _sse_event("delta", {"content": cached_reply})
+            yield _sse_event("done", await done_payload(messages + [{"role": "assistant", "content": cached_reply}]))
+            return
+
+        parts: List[str] = []
+        try:
+            with stage("llm"), charged_to(account):
+                async with admission.slot():
+                    async for delta in astream_agent_response(messages):
+                        parts.append(delta)
+                        yield _sse_event("delta", {"content": delta})
+        except Overloaded as exc:
+            REQUEST_ERRORS.inc(type="overloaded")
+            yield _sse_event("error", {"detail": _overloaded_error(exc).detail, "retry_after": exc.retry_after})
+            return
+        except Exception as exc:
+            REQUEST_ERRORS.inc(type=type(exc).__name__)
+            yield _sse_event("error", {"detail": f"Error processing request: {str(exc)}"})
+            return
+
+        reply = "".join(parts).strip()
+        await _write_caches(messages, reply, cache_control)
+        yield _sse_event("done", await done_payload(messages + [{"role": "assistant", "content": reply}]))
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        # Disable caching and proxy buffering so every delta reaches the browser immediately.
+        headers={
+            "Cache-Control": "no-cache",
+            "X-Accel-Buffering": "no",
+            "X-Cache": cache_status,
+        },
+    )
+
+
+@app.post("/chat/stream")
+@instrument
+async def chat_stream_endpoint(
+    payload: ChatRequest,
+    request: Request,
+    cache_control: Optional[str] = Header(None),
+    x_session_id: Optional[str] = Header(None),
+) -> StreamingResponse:
+    """Streaming variant of :func:`chat_endpoint`.
+
+    The ``done`` event carries the same body as :class:`ChatResponse`.
+    """
+    with stage("model_dump"):
+        request_messages: List[Dict[str, str]] = [msg.model_dump() for msg in payload.messages]
+
+    async def done_payload(messages: List[Dict[str, str]]) -> Dict[str, Any]:
+        return ChatResponse(messages=messages).model_dump()
+
+    return await _stream_reply(
+        request_messages,
+        done_payload,
+        cache_control,
+        _client_id(request),
+        _usage_account(x_session_id),
+    )
+
+
+async def _in_session_store(method: Callable[..., Any], *args: Any) -> Any:
+    """Call a ``session_store`` method; in a worker thread unless the store is in memory."""
+    if isinstance(session_store, InMemorySessionStore):
+        return method(*args)
+    return await asyncio.to_thread(method, *args)
+
+
+async def _session_turn(payload: SessionChatRequest) -> Tuple[str, List[Dict[str, str]], List[Dict[str, str]]]:
+    """Resolve the session of ``payload``.
+
+    Returns:
+        Tuple: The session id, its stored history and the messages to send to the agent.
+    """
+    if payload.session_id is None:
+        session_id, history = new_session_id(), []
+    else:
+        with stage("session_load"):
+            history = await _in_session_store(session_store.get, payload.session_id)
+        session_id = payload.session_id
+        if history is None:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail="Unknown or expired session. Start a new one by omitting session_id.",
+            )
+    return session_id, history, history + [payload.message.model_dump()]
+
+
+@app.post("/chat/session", response_model=SessionChatResponse)
+@instrument
+async def chat_session_endpoint(
+    payload: SessionChatRequest,
+    request: Request,
+    response: Response,
+    cache_control: Optional[str] = Header(None),
+) -> SessionChatResponse:
+    """Conversation endpoint keeping the history on the server.
+
+    Only the new user message travels in the request and only the
+    assistant's reply in the response.
+    """
+    session_id, history, request_messages = await _session_turn(payload)
+
+    updated_messages_dicts = await _agent_reply(
+        request_messages, cache_control, response, _client_id(request), _usage_account(session_id)
+    )
+
+    # Store the new turn (plus the system prompt on the first one).
+    with stage("session_store"):
+        await _in_session_store(session_store.append, session_id, updated_messages_dicts[len(history):])
+    return SessionChatResponse(session_id=session_id, message=ChatMessage(**updated_messages_dicts[-1]))
+
+
+@app.post("/chat/session/stream")
+@instrument
+async def chat_session_stream_endpoint(
+    payload: SessionChatRequest,
+    request: Request,
+    cache_control: Optional[str] = Header(None),
+) -> StreamingResponse:
+    """Streaming variant of :func:`chat_session_endpoint`.
+
+    The ``done`` event carries the same body as :class:`SessionChatResponse`.
+    """
+    session_id, history, request_messages = await _session_turn(payload)
+
+    async def done_payload(updated_messages: List[Dict[str, str]]) -> Dict[str, Any]:
+        with stage("session_store"):
+            await _in_session_store(session_store.append, session_id, updated_messages[len(history):])
+        return SessionChatResponse(session_id=session_id, message=ChatMessage(**updated_messages[-1])).model_dump()
+
+    return await _stream_reply(
+        request_messages, done_payload, cache_control, _client_id(request), _usage_account(session_id)
+    )
+
+
+@app.delete("/chat/session/{session_id}", status_code=status.HTTP_204_NO_CONTENT)
+async def delete_session_endpoint(session_id: str) -> None:
+    """Forget a server-side session."""
+    await _in_session_store(session_store.delete, session_id)
+
+@app.get("/cache/stats")
+async def cache_stats_endpoint() -> Dict[str, int]:
+    """Hit/miss counters of the response caches and coalesced requests."""
+    stats = response_cache.stats() if response_cache is not None else {}
+    if semantic_cache is not None:
+        stats.update({f"semantic_{name}": value for name, value in semantic_cache.stats().items()})
+    stats["coalesced"] = agent_calls.coalesced
+    return stats
+
+@app.get("/admission/stats")
+async def admission_stats_endpoint() -> Dict[str, Any]:
+    """Queue depth, wait times and rejections of the LLM admission control."""
+    stats = admission.stats()
+    stats["rate_limited"] = rate_limiter.limited
+    return stats
+
+@app.get("/llm/stats")
+async def llm_stats_endpoint() -> Dict[str, Any]:
+    """Attempts, retries, timeouts, fallbacks and hedges of the LLM calls, and routed questions."""
+    stats: Dict[str, Any] = dict(call_stats)
+    stats["models"] = list(DEFAULT_RETRY_POLICY.models)
+    stats["routes"] = dict(get_router().counts)
+    stats["hedge_delay_seconds"] = hedge_delay(MODEL_NAME)
+    return stats
+
+@app.get("/usage/stats")
+async def usage_stats_endpoint(
+    by: List[str] = Query(["model"]), limit: Optional[int] = None
+) -> List[Dict[str, Any]]:
+    """Calls, tokens and USD cost of the LLM calls, grouped by model, account (session) and/or day."""
+    ledger = get_usage_ledger()
+    if ledger is None:
+        return []
+    try:
+        return await asyncio.to_thread(ledger.report, by, None, limit)
+    except ValueError as exc:
+        raise HTTPException(status_code=status.HTTP_422_UNPROCESSABLE_ENTITY, detail=str(exc)) from exc
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def metrics_endpoint() -> PlainTextResponse:
+    """Latency histograms, token counts, cache lookups, errors and gauges (Prometheus text format)."""
+    return PlainTextResponse(REGISTRY.render(), media_type="text/plain; version=0.0.4; charset=utf-8")
 
 @app.get("/", response_class=HTMLResponse)
 async def index() -> HTMLResponse:  # noqa: WPS430
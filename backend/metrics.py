@@ -0,0 +1,341 @@
+"""In-process metrics served at ``GET /metrics`` in the Prometheus text format.
+
+Counters, gauges and histograms are plain dictionaries keyed by label values,
+so recording a sample costs a lock and a few dictionary operations and no
+client library is needed.
+
+Request latency is broken down into *stages*. :class:`MetricsMiddleware`
+measures the stages FastAPI runs around a handler (``parse``: reading and
+validating the body, ``serialize``: encoding the response) and the handler
+code marks its own stages with :func:`stage`. Every stage is recorded in the
+``chatbot_stage_seconds`` histogram and, with ``METRICS_TIMING_HEADER=1``,
+returned in a ``Server-Timing`` response header.
+"""
+
+import bisect
+import functools
+import os
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Awaitable, Callable, Dict, Final, Iterator, List, Optional, Tuple, TypeVar, Union
+
+METRICS_TIMING_HEADER: Final[bool] = os.environ.get("METRICS_TIMING_HEADER", "0") != "0"
+# Upper bounds (seconds) of the latency histogram buckets.
+LATENCY_BUCKETS: Final[Tuple[float, ...]] = (
+    0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0,
+)
+
+F = TypeVar("F", bound=Callable[..., Awaitable[Any]])
+M = TypeVar("M", bound="Metric")
+Labels = Tuple[str, ...]
+
+
+def _format_labels(names: Tuple[str, ...], values: Labels, extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_value(value: float) -> str:
+    return str(int(value)) if float(value).is_integer() else repr(float(value))
+
+
+class Metric:
+    """Base class: a named family of samples, one per combination of label values."""
+
+    kind = "untyped"
+
+    def __init__(self, name: str, documentation: str, labelnames: Tuple[str, ...] = ()) -> None:
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = labelnames
+        self._lock = threading.Lock()
+
+    def _key(self, labels: Dict[str, str]) -> Labels:
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def expose(self) -> List[str]:
+        """Return the ``# HELP``/``# TYPE`` lines followed by the samples."""
+        return [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"] + self._samples()
+
+    def _samples(self) -> List[str]:
+        raise NotImplementedError
+
+
+class Counter(Metric):
+    """Monotonically increasing count."""
+
+    kind = "counter"
+
+    def __init__(self, name: str, documentation: str, labelnames: Tuple[str, ...] = ()) -> None:
+        super().__init__(name, documentation, labelnames)
+        self._values: Dict[Labels, float] = {}
+
+    def inc(self, amount: float = 1.0, **labels: str) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def value(self, **labels: str) -> float:
+        """Current count for ``labels``."""
+        with self._lock:
+            return self._values.get(self._key(labels), 0.0)
+
+    def _samples(self) -> List[str]:
+        with self._lock:
+            values = list(self._values.items())
+        return [f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}" for key, value in values]
+
+
+class Gauge(Metric):
+    """Value that goes up and down, or is read from ``fn`` when the metrics are scraped.
+
+    ``fn`` returns either a number or a mapping of label values to numbers.
+    """
+
+    kind = "gauge"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Tuple[str, ...] = (),
+        fn: Optional[Callable[[], Union[float, Dict[Labels, float]]]] = None,
+    ) -> None:
+        super().__init__(name, documentation, labelnames)
+        self._values: Dict[Labels, float] = {}
+        self._fn = fn
+
+    def inc(self, amount: float = 1.0, **labels: str) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def dec(self, amount: float = 1.0, **labels: str) -> None:
+        self.inc(-amount, **labels)
+
+    def _samples(self) -> List[str]:
+        if self._fn is not None:
+            value = self._fn()
+            values = list(value.items()) if isinstance(value, dict) else [((), value)]
+        else:
+            with self._lock:
+                values = list(self._values.items())
+        return [f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}" for key, value in values]
+
+
+class CallbackCounter(Gauge):
+    """Counter whose values are read from ``fn`` (e.g. counters kept by another module)."""
+
+    kind = "counter"
+
+
+class Histogram(Metric):
+    """Cumulative histogram with fixed bucket bounds."""
+
+    kind = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Tuple[str, ...] = (),
+        buckets: Tuple[float, ...] = LATENCY_BUCKETS,
+    ) -> None:
+        super().__init__(name, documentation, labelnames)
+        self.buckets = buckets
+        # labels -> [count per bucket (non-cumulative, last one is +Inf), sum]
+        self._values: Dict[Labels, Tuple[List[int], List[float]]] = {}
+
+    def observe(self, value: float, **labels: str) -> None:
+        key = self._key(labels)
+        # First bucket whose upper bound is >= value; len(buckets) is +Inf.
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            entry = self._values.get(key)
+            if entry is None:
+                entry = self._values[key] = ([0] * (len(self.buckets) + 1), [0.0])
+            entry[0][index] += 1
+            entry[1][0] += value
+
+    def _samples(self) -> List[str]:
+        with self._lock:
+            values = [(key, list(counts), total[0]) for key, (counts, total) in self._values.items()]
+        lines = []
+        for key, counts, total in values:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += count
+                le = 'le="+Inf"' if bound == float("inf") else f'le="{bound!r}"'
+                lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, key, le)} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(self.labelnames, key)} {repr(total)}")
+            lines.append(f"{self.name}_count{_format_labels(self.labelnames, key)} {cumulative}")
+        return lines
+
+
+class Registry:
+    """The metrics exposed by one process."""
+
+    def __init__(self) -> None:
+        self._metrics: Dict[str, Metric] = {}
+
+    def register(self, metric: M) -> M:
+        """Add ``metric``; registering a name again replaces the previous metric."""
+        self._metrics[metric.name] = metric
+        return metric
+
+    def render(self) -> str:
+        """Return every metric in the Prometheus text exposition format."""
+        lines: List[str] = []
+        for metric in self._metrics.values():
+            lines.extend(metric.expose())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+STAGE_SECONDS = REGISTRY.register(Histogram(
+    "chatbot_stage_seconds", "Time spent in each stage of a request.", ("endpoint", "stage"),
+))
+REQUEST_SECONDS = REGISTRY.register(Histogram(
+    "chatbot_request_seconds", "Time from receiving a request to sending its last byte.", ("endpoint",),
+))
+HTTP_REQUESTS = REGISTRY.register(Counter(
+    "chatbot_http_requests_total", "HTTP requests by endpoint and status code.", ("endpoint", "status"),
+))
+HTTP_IN_FLIGHT = REGISTRY.register(Gauge(
+    "chatbot_http_in_flight_requests", "HTTP requests currently being handled.",
+))
+LLM_TOKENS = REGISTRY.register(Counter(
+    "chatbot_llm_tokens_total", "Tokens reported by the provider, by model and kind.", ("model", "kind"),
+))
+LLM_ERRORS = REGISTRY.register(Counter(
+    "chatbot_llm_errors_total", "Failed LLM attempts by model and exception type.", ("model", "type"),
+))
+REQUEST_ERRORS = REGISTRY.register(Counter(
+    "chatbot_request_errors_total", "Chat requests that failed, by error type.", ("type",),
+))
+CACHE_LOOKUPS = REGISTRY.register(Counter(
+    "chatbot_cache_lookups_total", "Response cache lookups by result (hit, hit_semantic, miss, bypass).", ("result",),
+))
+
+
+class RequestTimings:
+    """Stage durations (seconds) of the request being handled."""
+
+    __slots__ = ("start", "handler_start", "handler_end", "stages")
+
+    def __init__(self) -> None:
+        self.start = time.perf_counter()
+        self.handler_start: Optional[float] = None
+        self.handler_end: Optional[float] = None
+        self.stages: Dict[str, float] = {}
+
+    def add(self, name: str, seconds: float) -> None:
+        self.stages[name] = self.stages.get(name, 0.0) + seconds
+
+    def server_timing(self) -> str:
+        """Format the stages as a ``Server-Timing`` header (durations in ms)."""
+        total = (time.perf_counter() - self.start) * 1000
+        parts = [f"{name};dur={seconds * 1000:.2f}" for name, seconds in self.stages.items()]
+        return ", ".join(parts + [f"total;dur={total:.2f}"])
+
+
+_current_timings: ContextVar[Optional[RequestTimings]] = ContextVar("current_timings", default=None)
+
+
+def record_stage(name: str, seconds: float) -> None:
+    """Add ``seconds`` to stage ``name`` of the current request.
+
+    Outside a request (e.g. the eval scripts) the sample goes straight to the
+    histogram with an empty ``endpoint`` label.
+    """
+    timings = _current_timings.get()
+    if timings is not None:
+        timings.add(name, seconds)
+    else:
+        STAGE_SECONDS.observe(seconds, endpoint="", stage=name)
+
+
+@contextmanager
+def stage(name: str) -> Iterator[None]:
+    """Time the body of the ``with`` block as stage ``name``."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        record_stage(name, time.perf_counter() - start)
+
+
+def instrument(handler: F) -> F:
+    """Mark when a route handler starts and returns.
+
+    Time before the handler runs is the ``parse`` stage (body read and
+    Pydantic validation); time after it returned until the response starts
+    is the ``serialize`` stage.
+    """
+
+    @functools.wraps(handler)
+    async def wrapper(*args: Any, **kwargs: Any) -> Any:
+        timings = _current_timings.get()
+        if timings is not None:
+            timings.handler_start = time.perf_counter()
+        try:
+            return await handler(*args, **kwargs)
+        finally:
+            if timings is not None:
+                timings.handler_end = time.perf_counter()
+
+    return wrapper  # type: ignore[return-value]
+
+
+class MetricsMiddleware:
+    """ASGI middleware recording request latency, stages and status codes."""
+
+    def __init__(self, app: Any, timing_header: bool = METRICS_TIMING_HEADER) -> None:
+        self.app = app
+        self.timing_header = timing_header
+
+    async def __call__(self, scope: Dict[str, Any], receive: Callable, send: Callable) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        timings = RequestTimings()
+        token = _current_timings.set(timings)
+        status_code = 500
+
+        async def send_with_timings(message: Dict[str, Any]) -> None:
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+                now = time.perf_counter()
+                if timings.handler_start is not None:
+                    timings.add("parse", timings.handler_start - timings.start)
+                if timings.handler_end is not None:
+                    timings.add("serialize", now - timings.handler_end)
+                if self.timing_header:
+                    message["headers"] = list(message.get("headers", [])) + [
+                        (b"server-timing", timings.server_timing().encode("latin-1"))
+                    ]
+            await send(message)
+
+        HTTP_IN_FLIGHT.inc()
+        try:
+            await self.app(scope, receive, send_with_timings)
+        finally:
+            HTTP_IN_FLIGHT.dec()
+            _current_timings.reset(token)
+            route = scope.get("route")
+            endpoint = getattr(route, "path", "unmatched")
+            for name, seconds in timings.stages.items():
+                STAGE_SECONDS.observe(seconds, endpoint=endpoint, stage=name)
+            REQUEST_SECONDS.observe(time.perf_counter() - timings.start, endpoint=endpoint)
+            HTTP_REQUESTS.inc(endpoint=endpoint, status=str(status_code))
@@ -0,0 +1,346 @@
+"""Local player knowledge base with an in-process retrieval index.
+
+Without data the model answers questions about age, team and market value
+from memory and hedges. This module loads a table of player facts
+(``data/players.csv`` by default) once into NumPy columns, and
+:meth:`PlayerIndex.search` finds the players a query is about:
+
+* names, aliases and teams are scored with BM25 over an inverted index kept
+  as flat arrays (one slice of document ids and weights per term);
+* countries, positions and age limits in the query ("German defenders under
+  25") become filters on the columns.
+
+Rows are stored by descending market value, so ties, and queries that only
+have filters, return the most valuable players first. A search is a handful
+of array operations; ``benchmarks/bench_retrieval.py`` checks that it stays
+under a millisecond at 100k players.
+"""
+
+import csv
+import datetime
+import os
+import re
+import unicodedata
+from collections import Counter
+from functools import lru_cache
+from pathlib import Path
+from typing import Dict, Final, FrozenSet, List, NamedTuple, Optional, Sequence, Tuple, Union
+
+import numpy as np
+
+from backend.semantic_cache import COUNTRY_TERMS, POSITION_TERMS  # noqa: WPS433 import from parent
+
+PLAYER_FACTS_ENABLED: Final[bool] = os.environ.get("PLAYER_FACTS_ENABLED", "1") != "0"
+PLAYER_DATA_PATH: Final[Path] = Path(
+    os.environ.get("PLAYER_DATA_PATH", Path(__file__).parent.parent / "data" / "players.csv")
+)
+# Players whose facts are added to the prompt.
+PLAYER_FACTS_TOP_K: Final[int] = int(os.environ.get("PLAYER_FACTS_TOP_K", "5"))
+
+POSITIONS: Final[Tuple[str, ...]] = ("GK", "DF", "MF", "FW")
+_POSITION_TERMS: Final[Dict[str, int]] = {term: POSITIONS.index(position) for term, position in POSITION_TERMS.items()}
+# Words of team names that say nothing about a player.
+_STOPWORDS: Final[FrozenSet[str]] = frozenset("fc cf ac rb club the of de".split())
+
+_NON_WORD = re.compile(r"[^a-z0-9]+")
+_WORD = re.compile(r"\w+")
+# Letters that Unicode normalization does not reduce to ASCII.
+_TRANSLITERATION: Final[Dict[int, str]] = str.maketrans({"ø": "o", "æ": "ae", "ß": "ss", "đ": "d", "ł": "l", "ı": "i"})
+_UNDER_AGE = re.compile(r"\b(?:(?:under|below|younger than) ?|u)(\d{2})\b")
+_OVER_AGE = re.compile(r"\b(?:over|above|older than) ?(\d{2})\b")
+
+_BM25_K1: Final[float] = 1.2
+_BM25_B: Final[float] = 0.75
+# Text matches scoring below this fraction of the best match are dropped.
+_MIN_RELATIVE_SCORE: Final[float] = 0.4
+# Posting lists longer than this are only used to re-rank (see PlayerIndex._text_matches).
+_COMMON_TERM_ROWS: Final[int] = 1000
+# Rows checked by the first step of a filter scan; each further step doubles.
+_SCAN_CHUNK: Final[int] = 2048
+
+
+def normalize(text: str) -> List[str]:
+    """Casefold ``text``, strip accents and punctuation and split it into words."""
+    text = unicodedata.normalize("NFKD", text.casefold().translate(_TRANSLITERATION))
+    return _NON_WORD.sub(" ", text.encode("ascii", "ignore").decode("ascii")).split()
+
+
+class PlayerQuery(NamedTuple):
+    """A query split into free-text terms and column filters."""
+
+    terms: List[str]
+    countries: FrozenSet[str]
+    positions: FrozenSet[int]
+    # Exclusive age bounds.
+    max_age: Optional[int]
+    min_age: Optional[int]
+
+    @property
+    def has_filters(self) -> bool:
+        return bool(self.countries or self.positions or self.max_age is not None or self.min_age is not None)
+
+
+def parse_query(text: str) -> PlayerQuery:
+    """Extract countries, positions and age limits; the remaining words are search terms."""
+    words = normalize(text)
+    joined = " ".join(words)
+    under, over = _UNDER_AGE.search(joined), _OVER_AGE.search(joined)
+    terms = [
+        word for word in dict.fromkeys(words)
+        if word not in COUNTRY_TERMS and word not in _POSITION_TERMS and word not in _STOPWORDS
+        and not word.isdigit()
+    ]
+    return PlayerQuery(
+        terms=terms,
+        countries=frozenset(COUNTRY_TERMS[word] for word in words if word in COUNTRY_TERMS),
+        positions=frozenset(_POSITION_TERMS[word] for word in words if word in _POSITION_TERMS),
+        max_age=int(under.group(1)) if under else None,
+        min_age=int(over.group(1)) if over else None,
+    )
+
+
+def _isin(column: np.ndarray, values: List[int]) -> np.ndarray:
+    # Faster than np.isin for the one or two values a query filters on.
+    mask = column == values[0] if values else np.zeros(len(column), dtype=bool)
+    for value in values[1:]:
+        mask |= column == value
+    return mask
+
+
+def _categories(values: Sequence[str]) -> Tuple[List[str], np.ndarray]:
+    """Dictionary-encode ``values``: (distinct values, int32 code per row)."""
+    index: Dict[str, int] = {}
+    codes = np.fromiter((index.setdefault(value, len(index)) for value in values), dtype=np.int32, count=len(values))
+    return list(index), codes
+
+
+def _country_code(nationality: str) -> str:
+    """Code of the first word of ``nationality`` that names a country ("South Korea" -> "kr")."""
+    return next((COUNTRY_TERMS[word] for word in normalize(nationality) if word in COUNTRY_TERMS), "")
+
+
+def _ages(birth_dates: np.ndarray, today: datetime.date) -> np.ndarray:
+    years = birth_dates.astype("datetime64[Y]").astype(np.int32) + 1970
+    months = birth_dates.astype("datetime64[M]").astype(np.int32) % 12 + 1
+    days = (birth_dates - birth_dates.astype("datetime64[M]")).astype(np.int32) + 1
+    had_birthday = months * 100 + days <= today.month * 100 + today.day
+    return (today.year - years - (~had_birthday).astype(np.int32)).astype(np.int16)
+
+
+class PlayerIndex:
+    """Columnar player table with a BM25 index over names, aliases and teams."""
+
+    def __init__(
+        self,
+        names: Sequence[str],
+        birth_dates: Sequence[str],
+        nationalities: Sequence[str],
+        positions: Sequence[str],
+        roles: Sequence[str],
+        teams: Sequence[str],
+        market_values: Sequence[float],
+        as_of: Sequence[str],
+        aliases: Optional[Sequence[str]] = None,
+        today: Optional[datetime.date] = None,
+    ) -> None:
+        values = np.asarray(market_values, dtype=np.float32)
+        order = np.argsort(-values, kind="stable")
+
+        def column(data: Sequence[str]) -> List[str]:
+            return [data[i] for i in order]
+
+        self.names = np.asarray(column(names), dtype=object)
+        self.birth_dates = np.asarray(column(birth_dates), dtype="datetime64[D]")
+        self.ages = _ages(self.birth_dates, today or datetime.date.today())
+        self.positions = np.fromiter((POSITIONS.index(p) for p in column(positions)), dtype=np.int8, count=len(order))
+        self.market_values = values[order]
+        self._nationalities, self.nationalities = _categories(column(nationalities))
+        self._roles, self.roles = _categories(column(roles))
+        self._teams, self.teams = _categories(column(teams))
+        self._as_of, self.as_of = _categories(column(as_of))
+        country_ids = {code: i for i, code in enumerate(dict.fromkeys(map(_country_code, self._nationalities)))}
+        self._country_ids = country_ids
+        self.countries = np.asarray(
+            [country_ids[_country_code(name)] for name in self._nationalities], dtype=np.int16
+        )[self.nationalities]
+        self._aliases = column(aliases) if aliases is not None else [""] * len(order)
+        self._build_bm25(self._aliases)
+
+    def _build_bm25(self, aliases: Sequence[str]) -> None:
+        vocabulary: Dict[str, int] = {}
+        docs: List[int] = []
+        terms: List[int] = []
+        counts: List[int] = []
+        lengths = np.zeros(len(self), dtype=np.float32)
+        for doc, (name, alias, team) in enumerate(zip(self.names, aliases, self.teams)):
+            tokens = [token for token in normalize(f"{name} {alias} {self._teams[team]}") if token not in _STOPWORDS]
+            lengths[doc] = len(tokens)
+            for token, count in Counter(tokens).items():
+                docs.append(doc)
+                terms.append(vocabulary.setdefault(token, len(vocabulary)))
+                counts.append(count)
+        doc_ids = np.asarray(docs, dtype=np.int32)
+        term_ids = np.asarray(terms, dtype=np.int32)
+        tf = np.asarray(counts, dtype=np.float32)
+
+        df = np.bincount(term_ids, minlength=len(vocabulary)).astype(np.float32)
+        idf = np.log1p((len(self) - df + 0.5) / (df + 0.5))
+        norm = _BM25_K1 * (1 - _BM25_B + _BM25_B * lengths[doc_ids] / max(float(lengths.mean()), 1.0))
+        weights = idf[term_ids] * tf * (_BM25_K1 + 1) / (tf + norm)
+
+        # Postings grouped by term, documents ascending (= market value descending) within a term.
+        order = np.lexsort((doc_ids, term_ids))
+        self._vocabulary = vocabulary
+        self._postings = doc_ids[order]
+        self._weights = weights[order].astype(np.float32)
+        self._offsets = np.concatenate(([0], np.cumsum(df.astype(np.int64))))
+
+    @classmethod
+    def from_csv(cls, path: Path, today: Optional[datetime.date] = None) -> "PlayerIndex":
+        """Load a CSV with the columns of ``data/players.csv``."""
+        with open(path, newline="", encoding="utf-8") as f:
+            rows = list(csv.DictReader(f))
+        return cls(
+            names=[row["name"] for row in rows],
+            birth_dates=[row["birth_date"] for row in rows],
+            nationalities=[row["nationality"] for row in rows],
+            positions=[row["position"] for row in rows],
+            roles=[row["role"] for row in rows],
+            teams=[row["team"] for row in rows],
+            market_values=[float(row["market_value_eur_m"]) for row in rows],
+            as_of=[row["as_of"] for row in rows],
+            aliases=[row.get("aliases") or "" for row in rows],
+            today=today,
+        )
+
+    def __len__(self) -> int:
+        return len(self.names)
+
+    def name_terms(self) -> Dict[str, str]:
+        """Words of the names, aliases and teams as a user may type them, mapped to their index term.
+
+        Both the accented ("mbappé") and the plain ("mbappe") spelling map to
+        the term of the BM25 index ("mbappe").
+        """
+        terms = {term: term for term in self._vocabulary}
+        for text in (*self.names, *self._aliases, *self._teams):
+            for word in _WORD.findall(text.casefold()):
+                normalized = normalize(word)
+                if len(normalized) == 1 and normalized[0] in self._vocabulary:
+                    terms[word] = normalized[0]
+        return terms
+
+    def mentions(self, terms: Sequence[str]) -> bool:
+        """True if any of ``terms`` occurs in a player's name, aliases or team."""
+        return any(term in self._vocabulary for term in terms)
+
+    def _matches(self, query: PlayerQuery, rows: Union[slice, np.ndarray]) -> np.ndarray:
+        """Boolean mask of ``rows`` that pass the query's filters."""
+        mask = np.ones(len(self.positions[rows]), dtype=bool)
+        if query.countries:
+            ids = [self._country_ids[code] for code in query.countries if code in self._country_ids]
+            mask &= _isin(self.countries[rows], ids)
+        if query.positions:
+            mask &= _isin(self.positions[rows], list(query.positions))
+        if query.max_age is not None:
+            mask &= self.ages[rows] < query.max_age
+        if query.min_age is not None:
+            mask &= self.ages[rows] > query.min_age
+        return mask
+
+    def _filtered(self, query: PlayerQuery, k: int) -> np.ndarray:
+        """The ``k`` most valuable rows passing the query's filters.
+
+        Rows are scanned in growing chunks from the most valuable, so common
+        filters stop after the first chunk and only rare ones scan the table.
+        """
+        found: List[np.ndarray] = []
+        start, size, total = 0, _SCAN_CHUNK, 0
+        while start < len(self) and total < k:
+            stop = min(start + size, len(self))
+            hits = start + np.flatnonzero(self._matches(query, slice(start, stop)))
+            found.append(hits)
+            total += len(hits)
+            start, size = stop, size * 2
+        return np.concatenate(found)[:k] if found else np.empty(0, dtype=np.int64)
+
+    def _text_matches(self, terms: List[str]) -> np.ndarray:
+        """Rows matching ``terms`` by descending BM25 score, weak matches dropped.
+
+        Terms found in more than ``_COMMON_TERM_ROWS`` rows ("city", "united")
+        only add to the score of rows matched by rarer terms, so a search never
+        walks a long posting list.
+        """
+        ids = [self._vocabulary[word] for word in terms if word in self._vocabulary]
+        postings = [slice(self._offsets[term], self._offsets[term + 1]) for term in ids]
+        rare = [s for s in postings if s.stop - s.start <= _COMMON_TERM_ROWS]
+        if not rare:
+            return np.empty(0, dtype=np.int64)
+        if len(rare) == 1:
+            rows, scores = self._postings[rare[0]], self._weights[rare[0]].astype(np.float64)
+        else:
+            rows, inverse = np.unique(np.concatenate([self._postings[s] for s in rare]), return_inverse=True)
+            scores = np.bincount(inverse, weights=np.concatenate([self._weights[s] for s in rare]))
+        for common in (s for s in postings if s.stop - s.start > _COMMON_TERM_ROWS):
+            # Posting lists are sorted by row, so look the candidates up by bisection.
+            docs = self._postings[common]
+            at = np.minimum(np.searchsorted(docs, rows), len(docs) - 1)
+            scores = scores + np.where(docs[at] == rows, self._weights[common][at], 0.0)
+        # Stable sort keeps the more valuable player first among equal scores.
+        order = np.argsort(-scores, kind="stable")
+        rows, scores = rows[order], scores[order]
+        return rows[scores >= scores[0] * _MIN_RELATIVE_SCORE].astype(np.int64)
+
+    def search(self, text: str, k: int = PLAYER_FACTS_TOP_K) -> np.ndarray:
+        """Return the rows of up to ``k`` players ``text`` asks about, best first.
+
+        Players named in the query come first, restricted to the query's
+        filters if any of them pass ("Real Madrid defenders"). Otherwise the
+        most valuable players passing the filters fill the remaining places
+        ("Pedri vs. German midfielders"). A query without names or filters
+        returns nothing.
+        """
+        query = parse_query(text)
+        named = self._text_matches(query.terms)
+        if not query.has_filters:
+            return named[:k]
+        if len(named):
+            passing = named[self._matches(query, named)]
+            if len(passing):
+                return passing[:k]
+            named = named[:k]
+        others = self._filtered(query, k + len(named))
+        others = others[~np.isin(others, named)][:k - len(named)]
+        return np.concatenate((named, others))
+
+    def facts(self, rows: Sequence[int]) -> List[str]:
+        """One line of facts per row, for the prompt."""
+        return [
+            f"{self.names[row]}: born {self.birth_dates[row]} (age {self.ages[row]}), "
+            f"{self._nationalities[self.nationalities[row]]}, {self._roles[self.roles[row]]} "
+            f"({POSITIONS[self.positions[row]]}), {self._teams[self.teams[row]]}, "
+            f"market value ~€{self.market_values[row]:g}m (team and value as of {self._as_of[self.as_of[row]]})"
+            for row in rows
+        ]
+
+
+@lru_cache(maxsize=1)
+def get_player_index() -> Optional[PlayerIndex]:
+    """Load the knowledge base on first use; None if it is disabled or the file is missing."""
+    if not PLAYER_FACTS_ENABLED or not PLAYER_DATA_PATH.exists():
+        return None
+    return PlayerIndex.from_csv(PLAYER_DATA_PATH)
+
+
+def player_name_terms() -> Dict[str, str]:
+    """:meth:`PlayerIndex.name_terms` of the knowledge base (empty without one)."""
+    index = get_player_index()
+    return index.name_terms() if index is not None else {}
+
+
+def player_facts(text: str, k: int = PLAYER_FACTS_TOP_K) -> List[str]:
+    """Facts about the players ``text`` asks about (empty without a knowledge base)."""
+    index = get_player_index()
+    if index is None or k <= 0:
+        return []
+    return index.facts(index.search(text, k))
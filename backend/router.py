@@ -0,0 +1,244 @@
+"""Routing of first questions to a canned reply, a cheap model or ``MODEL_NAME``.
+
+Queries come in three kinds, the scenarios of
+``evals/generate_synthetic_queries.py``. Each is served the cheapest way that
+still answers it:
+
+* ``out_of_scope``: the rules and the classifier agree that the query is not
+  about football. The rules find a general-assistant word in it (weather,
+  recipe, joke, ...) and nothing football-related (no football words,
+  competitions, positions, age limits, known players and teams), and the
+  query is closer to a general-assistant request (:data:`OFF_TOPIC_EXAMPLES`)
+  than to any football query by at least ``ROUTER_OFF_TOPIC_MARGIN``. The
+  query gets :data:`CANNED_REPLY` and the LLM is not called. A query the rules
+  are unsure about ("how good is kobbie mainoo": no football word, but no
+  off-topic one either) is never refused.
+* ``clarify``: the classifier is confident that the request is ambiguous and
+  it names no known player, so a cheaper model (``ROUTER_CHEAP_MODEL``) asks
+  for the missing details in a short reply.
+* ``full``: everything else gets the full scouting report from ``MODEL_NAME``.
+  Refusing a scouting question about a player missing from the knowledge
+  base costs more than a model call declining an off-topic one, so doubtful
+  queries end up here.
+
+The classifier works on the character n-gram embeddings of
+:mod:`backend.semantic_cache`, fitted on the labelled synthetic queries
+(``ROUTER_TRAINING_PATH``) on first use: a nearest-centroid model for the
+scenarios, and nearest neighbours among the football queries and
+:data:`OFF_TOPIC_EXAMPLES` for the topic. Its "shouldn't be handled" label is
+not used for canned replies: on held-out dimension tuples it confuses valid
+requests ("an Argentine player like Messi") with unsupported ones. Without
+training data nothing is refused. Only the first question of a conversation
+is routed; follow-ups depend on context and go to ``MODEL_NAME``.
+"""
+
+import csv
+import json
+import os
+from functools import lru_cache
+from pathlib import Path
+from typing import Dict, Final, FrozenSet, List, NamedTuple, Optional, Sequence
+
+import numpy as np
+
+from backend.players import get_player_index, normalize, parse_query  # noqa: WPS433 import from parent
+from backend.semantic_cache import NGramVectorizer, tokenize  # noqa: WPS433 import from parent
+
+ROUTER_ENABLED: Final[bool] = os.environ.get("ROUTER_ENABLED", "1") != "0"
+ROUTER_TRAINING_PATH: Final[Path] = Path(
+    os.environ.get(
+        "ROUTER_TRAINING_PATH", Path(__file__).parent.parent / "evals" / "synthetic_queries_for_analysis.csv"
+    )
+)
+# Minimum cosine-similarity margin of the "ambiguous request" centroid over the
+# runner-up before a query is sent to the cheap model.
+ROUTER_MIN_MARGIN: Final[float] = float(os.environ.get("ROUTER_MIN_MARGIN", "0.1"))
+# Minimum cosine-similarity margin of the nearest off-topic example over the
+# nearest football query before a query may get the canned reply.
+ROUTER_OFF_TOPIC_MARGIN: Final[float] = float(os.environ.get("ROUTER_OFF_TOPIC_MARGIN", "0.1"))
+
+OUT_OF_SCOPE: Final[str] = "out_of_scope"
+CLARIFY: Final[str] = "clarify"
+FULL: Final[str] = "full"
+ROUTES: Final[Sequence[str]] = (OUT_OF_SCOPE, CLARIFY, FULL)
+AMBIGUOUS_LABEL: Final[str] = "ambiguous request"
+
+CANNED_REPLY: Final[str] = (
+    "I'm a football scouting assistant, so I can only help with questions about football players. "
+    "Try asking for players by nationality, position, age or playing style, for example: "
+    "*\"young Spanish midfielders with great vision\"* or *\"how old is Pedri and what is his market value?\"*"
+)
+
+# Words that put a query in the football domain (positions are recognized by
+# :func:`backend.players.parse_query`, names and teams by the knowledge base).
+_FOOTBALL_TERMS: Final[FrozenSet[str]] = frozenset(
+    "football footballer footballers soccer player players scout scouts scouting scouted team teams club clubs "
+    "squad squads league leagues transfer transfers sign signing signings coach manager tactics tactical formation "
+    "offside dribble dribbling dribbler pass passing passer tackle tackling header heading shot shooting finishing "
+    "goal goals assist assists cap caps pitch match matches fixture season prospect prospects talent talents "
+    "starter starters lineup xi mid mids fifa uefa messi ronaldo worth value valuation wonderkid wonderkids "
+    "youngster youngsters stats cup cups ballon champion champions championship championships trophy trophies "
+    "title titles final finals tournament tournaments copa euro euros libertadores bundesliga laliga liga serie "
+    "ligue eredivisie premier".split()
+)
+# Words of general-assistant requests; the rules only call a query off-topic if it has one.
+_OFF_TOPIC_TERMS: Final[FrozenSet[str]] = frozenset(
+    "hi hello hey thanks bye weather rain forecast recipe recipes cook cooking dinner pasta bake python javascript "
+    "java code coding program programming function sql debug bug equation math calculate convert capital "
+    "president presidential election population mountain joke jokes poem song movie movies story translate "
+    "password router laptop computer email flight flights hotel hotels diet weight symptoms flu doctor bitcoin "
+    "invest stock stocks summarize article essay homework".split()
+)
+
+# Requests for a general assistant, the counterpart of the football queries
+# when the classifier judges whether a query is off-topic.
+OFF_TOPIC_EXAMPLES: Final[Sequence[str]] = (
+    "hi", "hey", "hello there", "hey, how are you?", "good morning", "thanks, bye", "who are you",
+    "what can you do?", "what's the weather like tomorrow", "will it rain this weekend",
+    "give me a recipe for banana bread", "what should I cook for dinner tonight", "fix this javascript error",
+    "how do I write a for loop in java", "explain how a neural network works", "help me debug my SQL query",
+    "what is 17 times 23", "solve this equation for x", "convert 10 miles to kilometers",
+    "who was the first president of the united states", "when did world war two end",
+    "what is the tallest mountain in the world", "what is the population of china",
+    "who is the richest person in the world", "what is the meaning of life", "recommend a good movie to watch",
+    "write a poem about the sea", "tell me a funny story", "tell me something interesting",
+    "translate this sentence into spanish", "how do you say thank you in japanese", "book me a flight to london",
+    "what are the best hotels in rome", "how do I lose weight fast", "what are the symptoms of the flu",
+    "should I invest in bitcoin", "how do I change my email password", "my laptop won't turn on",
+    "write a cover letter for a job application", "summarize this article for me", "what time is it in new york",
+)
+OFF_TOPIC_LABEL: Final[str] = "off-topic"
+
+
+class Route(NamedTuple):
+    """Where a query is sent, and why."""
+
+    name: str
+    # Classifier label and its similarity margin over the runner-up (None without a classifier).
+    label: Optional[str] = None
+    margin: float = 0.0
+
+
+def in_domain(text: str) -> bool:
+    """True if ``text`` mentions football, a competition, a position, an age limit or a known player or team."""
+    if any(word in _FOOTBALL_TERMS for word in normalize(text)):
+        return True
+    query = parse_query(text)
+    if query.positions or query.max_age is not None or query.min_age is not None:
+        return True
+    return names_known_player(text)
+
+
+def off_topic(text: str) -> bool:
+    """True if ``text`` has a general-assistant word and nothing football-related.
+
+    Names are not looked for: most players are not in the knowledge base, and
+    a query without an off-topic word is not refused whatever it names.
+    """
+    return any(word in _OFF_TOPIC_TERMS for word in normalize(text)) and not in_domain(text)
+
+
+def names_known_player(text: str) -> bool:
+    """True if ``text`` mentions a player or team of the knowledge base."""
+    index = get_player_index()
+    return index is not None and index.mentions(parse_query(text).terms)
+
+
+class QueryRouter:
+    """Nearest-centroid classifier of query scenarios plus the routing rules."""
+
+    def __init__(
+        self,
+        vectorizer: Optional[NGramVectorizer] = None,
+        min_margin: float = ROUTER_MIN_MARGIN,
+        off_topic_margin: float = ROUTER_OFF_TOPIC_MARGIN,
+    ) -> None:
+        self.vectorizer = vectorizer or NGramVectorizer()
+        self.min_margin = min_margin
+        self.off_topic_margin = off_topic_margin
+        self.enabled = ROUTER_ENABLED
+        self.labels: List[str] = []
+        self._centroids = np.zeros((0, self.vectorizer.dim), dtype=np.float32)
+        # Unit vectors of the training queries and of the off-topic examples.
+        self._football = np.zeros((0, self.vectorizer.dim), dtype=np.float32)
+        self._off_topic = np.zeros((0, self.vectorizer.dim), dtype=np.float32)
+        self.counts: Dict[str, int] = {route: 0 for route in ROUTES}
+
+    def fit(
+        self, queries: Sequence[str], labels: Sequence[str], off_topic: Sequence[str] = OFF_TOPIC_EXAMPLES
+    ) -> "QueryRouter":
+        """Set one unit-length centroid per label from the labelled ``queries``, and the topic neighbours."""
+        vectors = np.stack([self.vectorizer.transform(tokenize(query)) for query in queries])
+        self.labels = sorted(set(labels))
+        targets = np.asarray(labels)
+        centroids = np.stack([vectors[targets == label].mean(axis=0) for label in self.labels])
+        self._centroids = centroids / np.maximum(np.linalg.norm(centroids, axis=1, keepdims=True), 1e-9)
+        self._football = vectors
+        self._off_topic = np.stack([self.vectorizer.transform(tokenize(text)) for text in off_topic])
+        return self
+
+    def topic(self, text: str) -> Optional[Route]:
+        """Out of scope if ``text`` is nearer an off-topic example than any football query by the margin.
+
+        Returns None if the router was not trained, and a ``full`` route
+        otherwise; either way the label is the nearer side and the margin its
+        lead (negative when the football side is nearer).
+        """
+        if not len(self._football) or not len(self._off_topic):
+            return None
+        vector = self.vectorizer.transform(tokenize(text))
+        margin = float((self._off_topic @ vector).max() - (self._football @ vector).max())
+        name = OUT_OF_SCOPE if margin >= self.off_topic_margin else FULL
+        return Route(name, OFF_TOPIC_LABEL if margin > 0 else "football", margin)
+
+    def classify(self, text: str) -> Optional[Route]:
+        """Nearest label of ``text`` and its margin; None if the router was not trained."""
+        if len(self.labels) < 2:
+            return None
+        similarities = self._centroids @ self.vectorizer.transform(tokenize(text))
+        best, runner_up = np.argsort(-similarities)[:2]
+        label = self.labels[best]
+        margin = float(similarities[best] - similarities[runner_up])
+        name = CLARIFY if label == AMBIGUOUS_LABEL and margin >= self.min_margin else FULL
+        return Route(name, label, margin)
+
+    def route(self, messages: List[Dict[str, str]]) -> Route:
+        """Route a conversation (system prompt first) by its first and only user question."""
+        turns = [message for message in messages if message["role"] != "system"]
+        if not self.enabled or len(turns) != 1 or turns[0]["role"] != "user":
+            route = Route(FULL)
+        else:
+            text = turns[0]["content"]
+            # Both the rules and the classifier must call the query off-topic.
+            topic = self.topic(text) if off_topic(text) else None
+            if topic is not None and topic.name == OUT_OF_SCOPE:
+                route = topic
+            else:
+                route = self.classify(text) or Route(FULL)
+                if route.name == CLARIFY and names_known_player(text):
+                    # A question about a named player is specific enough for a full report.
+                    route = route._replace(name=FULL)
+        self.counts[route.name] += 1
+        return route
+
+
+def load_training_data(path: Path) -> List[List[str]]:
+    """(query, scenario) pairs of the rows kept in a synthetic queries CSV."""
+    with open(path, newline="", encoding="utf-8") as f:
+        return [
+            [row["query"], json.loads(row["dimension_tuple_json"])["Scenario"]]
+            for row in csv.DictReader(f)
+            if row.get("is_realistic_and_kept", "1") != "0"
+        ]
+
+
+@lru_cache(maxsize=1)
+def get_router() -> QueryRouter:
+    """The process-wide router, trained on ``ROUTER_TRAINING_PATH`` if it exists."""
+    router = QueryRouter()
+    if ROUTER_TRAINING_PATH.exists():
+        pairs = load_training_data(ROUTER_TRAINING_PATH)
+        if pairs:
+            queries, labels = zip(*pairs)
+            router.fit(queries, labels)
+    return router
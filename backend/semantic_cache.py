@@ -0,0 +1,293 @@
+"""Semantic cache for single-turn queries.
+
+The exact-match cache misses rephrasings of the same request ("neEd some good
+German defenders who are good at the offside trap" vs. "looking for strong
+defensive players from germany..."). This cache embeds each query with a
+CPU-only hashed character n-gram vectorizer and answers a new query with the
+reply of its nearest cached neighbour when their cosine similarity reaches a
+threshold.
+
+Surface similarity alone would happily answer "German defenders" with the
+reply for "Brazilian defenders", or "compare Pedri and Bellingham" with the
+reply for "compare Pedri and Gavi", so a query only matches entries with the
+same *key terms*: the countries, positions, leagues and numbers (ages,
+prices) it mentions, and the words of player and team names known to the knowledge base
+(:func:`backend.players.player_name_terms`). Names the knowledge base does not
+know are only told apart by similarity, hence the high default threshold.
+
+The index is a preallocated NumPy matrix of unit vectors, so a lookup is one
+matrix-vector product over the entries sharing the query's key terms. Memory is bounded by ``capacity * dim * 4`` bytes; when
+full, the least recently used entry is overwritten.
+"""
+
+import os
+import re
+import threading
+import time
+import zlib
+from typing import Dict, Final, FrozenSet, List, Mapping, Optional, Tuple
+
+import numpy as np
+
+SEMANTIC_CACHE_ENABLED: Final[bool] = os.environ.get("SEMANTIC_CACHE_ENABLED", "0") == "1"
+SEMANTIC_CACHE_THRESHOLD: Final[float] = float(os.environ.get("SEMANTIC_CACHE_THRESHOLD", "0.65"))
+SEMANTIC_CACHE_CAPACITY: Final[int] = int(os.environ.get("SEMANTIC_CACHE_CAPACITY", "4096"))
+SEMANTIC_CACHE_TTL_SECONDS: Final[float] = float(os.environ.get("SEMANTIC_CACHE_TTL_SECONDS", "3600"))
+SEMANTIC_CACHE_DIM: Final[int] = 512
+
+_NON_WORD = re.compile(r"[^\w]+")
+# ASCII bytes to their lowercase word character, or a space (the NUL separator is kept).
+_ASCII_WORDS = bytes(
+    byte if chr(byte).isalnum() or byte in (0, ord("_")) else ord(" ") for byte in range(128)
+).lower() + b" " * 128
+
+# Filler words that say nothing about the requested players.
+_STOPWORDS: Final[FrozenSet[str]] = frozenset(
+    "a an the for of to in on with who is are that and or me i some any find looking need plz pls please "
+    "help can you u my we our be good players player football footballer footballers soccer "
+    "searching scouting recommend recommendations suggest show".split()
+)
+
+# Country names and demonyms, mapped to one code per country.
+COUNTRY_TERMS: Final[Dict[str, str]] = {
+    term: code
+    for code, terms in {
+        "ar": "argentina argentine argentinian argentinean",
+        "be": "belgium belgian",
+        "br": "brazil brazilian",
+        "ca": "canada canadian",
+        "ci": "ivorian",
+        "cl": "chile chilean",
+        "cm": "cameroon cameroonian",
+        "co": "colombia colombian",
+        "hr": "croatia croatian",
+        "de": "germany german",
+        "dk": "denmark danish",
+        "ec": "ecuador ecuadorian",
+        "eg": "egypt egyptian",
+        "en": "england english",
+        "es": "spain spanish",
+        "fr": "france french",
+        "ge": "georgia georgian",
+        "gh": "ghana ghanaian",
+        "gr": "greece greek",
+        "it": "italy italian",
+        "jp": "japan japanese",
+        "kr": "korea korean",
+        "ma": "morocco moroccan",
+        "mx": "mexico mexican",
+        "ng": "nigeria nigerian",
+        "nl": "netherlands dutch holland",
+        "no": "norway norwegian",
+        "pe": "peru peruvian",
+        "pl": "poland polish",
+        "pt": "portugal portuguese",
+        "py": "paraguay paraguayan",
+        "rs": "serbia serbian",
+        "sc": "scotland scottish",
+        "se": "sweden swedish",
+        "si": "slovenia slovenian",
+        "sn": "senegal senegalese",
+        "tr": "turkey turkish",
+        "us": "usa american",
+        "uy": "uruguay uruguayan",
+        "ve": "venezuela venezuelan",
+    }.items()
+    for term in terms.split()
+}
+
+# Position words, mapped to one code per position.
+POSITION_TERMS: Final[Dict[str, str]] = {
+    term: position
+    for position, terms in {
+        "GK": "goalkeeper goalkeepers keeper keepers goalie goalies gk",
+        "DF": "defender defenders defence defense defensive defending back backs fullback fullbacks centreback "
+              "centrebacks centerback centerbacks cb lb rb",
+        "MF": "midfielder midfielders midfield playmaker playmakers cm cdm cam",
+        "FW": "forward forwards striker strikers attacker attackers winger wingers scorer scorers "
+              "goalscorer goalscorers",
+    }.items()
+    for term in terms.split()
+}
+
+
+# League names, mapped to one code per league.
+LEAGUE_TERMS: Final[Dict[str, str]] = {
+    term: league
+    for league, terms in {
+        "epl": "premier epl",
+        "laliga": "liga laliga",
+        "seriea": "serie",
+        "bundesliga": "bundesliga",
+        "ligue1": "ligue",
+        "eredivisie": "eredivisie",
+        "mls": "mls",
+    }.items()
+    for term in terms.split()
+}
+
+
+def tokenize(text: str) -> List[str]:
+    """Lowercase ``text``, strip punctuation and emojis and drop filler words."""
+    return [token for token in _NON_WORD.sub(" ", text.casefold()).split() if token not in _STOPWORDS]
+
+
+def tokenize_many(texts: List[str]) -> List[List[str]]:
+    """:func:`tokenize` every text; ASCII texts go through one byte translation (for large batches)."""
+    ascii_blob = "\x00".join(text for text in texts if text.isascii()).encode("ascii").translate(_ASCII_WORDS)
+    ascii_texts = iter(ascii_blob.decode("ascii").split("\x00"))
+    stopwords = _STOPWORDS
+    return [
+        [token for token in next(ascii_texts).split() if token not in stopwords] if text.isascii() else tokenize(text)
+        for text in texts
+    ]
+
+
+def key_terms(tokens: List[str], names: Optional[Mapping[str, str]] = None) -> str:
+    """Countries, positions, leagues, numbers and known names of a query; only queries with equal key terms may match.
+
+    Args:
+        tokens (List[str]): The tokens of the query (see :func:`tokenize`).
+        names (Optional[Mapping[str, str]]): Words of known names, mapped to one spelling ("mbappé" -> "mbappe").
+    """
+    terms = {COUNTRY_TERMS[token] for token in tokens if token in COUNTRY_TERMS}
+    terms.update(POSITION_TERMS[token] for token in tokens if token in POSITION_TERMS)
+    terms.update(LEAGUE_TERMS[token] for token in tokens if token in LEAGUE_TERMS)
+    terms.update(token for token in tokens if token.isdigit())
+    if names:
+        terms.update(f"@{names[token]}" for token in tokens if token in names)
+    return " ".join(sorted(terms))
+
+
+class NGramVectorizer:
+    """Hashed character n-gram embeddings (no model download, CPU only).
+
+    Each word contributes its character n-grams (with word boundaries), so
+    typos and inflections ("defenders", "defensive", "dEfensive") still
+    overlap. Counts are square-rooted to dampen repeated n-grams.
+    """
+
+    def __init__(self, dim: int = SEMANTIC_CACHE_DIM, n: int = 4) -> None:
+        self.dim = dim
+        self.n = n
+
+    def transform(self, tokens: List[str]) -> np.ndarray:
+        """Return the L2-normalized ``float32`` embedding of a tokenized query."""
+        buckets = [
+            # crc32 is stable across processes, unlike the built-in hash().
+            zlib.crc32(padded[i:i + self.n].encode("utf-8")) % self.dim
+            for padded in (f" {token} " for token in tokens)
+            for i in range(max(len(padded) - self.n + 1, 1))
+        ]
+        vector = np.sqrt(np.bincount(buckets, minlength=self.dim).astype(np.float32))
+        norm = float(np.linalg.norm(vector))
+        return vector / norm if norm else vector
+
+
+class SemanticCache:
+    """Bounded nearest-neighbour cache of replies to single-turn queries."""
+
+    def __init__(
+        self,
+        capacity: int = SEMANTIC_CACHE_CAPACITY,
+        threshold: float = SEMANTIC_CACHE_THRESHOLD,
+        ttl_seconds: float = SEMANTIC_CACHE_TTL_SECONDS,
+        vectorizer: Optional[NGramVectorizer] = None,
+        names: Optional[Mapping[str, str]] = None,
+    ) -> None:
+        self.capacity = capacity
+        self.names = names or {}
+        self.threshold = threshold
+        self.ttl_seconds = ttl_seconds
+        self.vectorizer = vectorizer or NGramVectorizer()
+        self._vectors = np.zeros((capacity, self.vectorizer.dim), dtype=np.float32)
+        # Per slot: partition (namespace + key terms) id, expiry and last use.
+        self._partitions = np.full(capacity, -1, dtype=np.int64)
+        self._expires_at = np.zeros(capacity, dtype=np.float64)
+        self._last_used = np.zeros(capacity, dtype=np.float64)
+        self._replies: List[Optional[str]] = [None] * capacity
+        # Ids of the partitions that have entries, and their number of slots;
+        # a partition is forgotten when its last slot is reused.
+        self._partition_ids: Dict[str, int] = {}
+        self._partition_keys: Dict[int, str] = {}
+        self._partition_sizes: Dict[int, int] = {}
+        self._next_partition = 0
+        self._size = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, query: str, namespace: str) -> Optional[str]:
+        """Return the reply of the most similar cached query, if similar enough.
+
+        Args:
+            query (str): The user's message.
+            namespace (str): Identifies the model and system prompt the reply is valid for.
+        """
+        tokens = tokenize(query)
+        vector = self.vectorizer.transform(tokens)
+        with self._lock:
+            partition = self._partition_ids.get(f"{namespace}|{key_terms(tokens, self.names)}")
+            match = self._nearest(vector, partition) if partition is not None else None
+            if match is None:
+                self.misses += 1
+                return None
+            self._last_used[match] = time.monotonic()
+            self.hits += 1
+            return self._replies[match]
+
+    def set(self, query: str, namespace: str, reply: str) -> None:
+        """Cache ``reply`` for ``query``, evicting the least recently used entry when full."""
+        tokens = tokenize(query)
+        vector = self.vectorizer.transform(tokens)
+        now = time.monotonic()
+        with self._lock:
+            if self._size < self.capacity:
+                slot = self._size
+                self._size += 1
+            else:
+                slot = int(np.argmin(self._last_used))
+                self._release(int(self._partitions[slot]))
+            partition_key = f"{namespace}|{key_terms(tokens, self.names)}"
+            partition = self._partition_ids.get(partition_key)
+            if partition is None:
+                partition = self._partition_ids[partition_key] = self._next_partition
+                self._partition_keys[partition] = partition_key
+                self._next_partition += 1
+            self._partition_sizes[partition] = self._partition_sizes.get(partition, 0) + 1
+            self._vectors[slot] = vector
+            self._partitions[slot] = partition
+            self._expires_at[slot] = now + self.ttl_seconds
+            self._last_used[slot] = now
+            self._replies[slot] = reply
+
+    def stats(self) -> Dict[str, int]:
+        """Hit/miss counters and current number of entries."""
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "entries": self._size,
+                "partitions": len(self._partition_ids),
+            }
+
+    def _release(self, partition: int) -> None:
+        """Take a reused slot out of ``partition``; forget the partition with its last slot."""
+        left = self._partition_sizes[partition] - 1
+        if left:
+            self._partition_sizes[partition] = left
+        else:
+            del self._partition_sizes[partition]
+            del self._partition_ids[self._partition_keys.pop(partition)]
+
+    def _nearest(self, vector: np.ndarray, partition: int) -> Optional[int]:
+        # Only entries of the same partition are scored, which keeps the
+        # matrix-vector product small even when the cache is full.
+        candidates = np.flatnonzero(
+            (self._partitions[:self._size] == partition) & (self._expires_at[:self._size] >= time.monotonic())
+        )
+        if not len(candidates):
+            return None
+        similarities = self._vectors[candidates] @ vector
+        best = int(np.argmax(similarities))
+        return int(candidates[best]) if similarities[best] >= self.threshold else None
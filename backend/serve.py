@@ -0,0 +1,95 @@
+"""Production launch: several uvicorn workers sharing sessions, caches and rate limits.
+
+``uvicorn backend.main:app`` runs one process. This entry point runs one
+worker per available core (``--workers``, or ``WEB_CONCURRENCY``) and, unless
+configured otherwise, points them all at one shared store
+(:mod:`backend.shared_state`):
+
+* ``SHARED_STATE_URL`` defaults to a SQLite stand-in in ``data/``; set it to
+  ``redis://...`` to share state with workers on other machines;
+* ``SESSION_BACKEND`` defaults to ``shared``, so any worker can continue any
+  session;
+* the response cache gets a shared tier and the per-client rate limit
+  (``CLIENT_RATE_LIMIT_PER_MINUTE``) is counted across workers.
+
+Admission control (``LLM_MAX_CONCURRENCY``, ``LLM_MAX_QUEUE``), the semantic
+cache, token budgets and ``/metrics`` remain per worker.
+
+On SIGTERM or Ctrl+C every worker refuses new LLM calls with 503 at once,
+stops accepting connections and waits up to ``--drain-seconds`` for the
+requests in flight (uvicorn's graceful shutdown), then as long again at most
+for LLM calls that outlived their requests (coalesced calls whose clients
+went away) before it exits.
+
+The shared store is called from worker threads, off the event loop.
+
+Usage::
+
+    python -m backend.serve --host 0.0.0.0 --port 8000
+    python -m backend.serve --workers 4 --drain-seconds 60
+"""
+
+import argparse
+import os
+import sys
+from pathlib import Path
+from typing import Dict, List
+
+# Add the project root to Python path
+sys.path.append(str(Path(__file__).parent.parent))
+
+from backend.admission import SHUTDOWN_DRAIN_SECONDS  # noqa: E402
+from backend.shared_state import SHARED_STATE_DEFAULT_PATH  # noqa: E402
+
+
+def default_workers() -> int:
+    """``WEB_CONCURRENCY`` if set, otherwise the number of cores this process may run on."""
+    if os.environ.get("WEB_CONCURRENCY"):
+        return max(1, int(os.environ["WEB_CONCURRENCY"]))
+    try:
+        return max(1, len(os.sched_getaffinity(0)))
+    except AttributeError:  # not available on macOS and Windows
+        return os.cpu_count() or 1
+
+
+def shared_environment(environ: Dict[str, str]) -> Dict[str, str]:
+    """The settings the workers need to share state, where ``environ`` leaves them unset."""
+    defaults = {
+        "SHARED_STATE_URL": f"sqlite:///{SHARED_STATE_DEFAULT_PATH}",
+        "SESSION_BACKEND": "shared",
+    }
+    return {name: value for name, value in defaults.items() if not environ.get(name)}
+
+
+def main(argv: List[str] = None) -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--workers", type=int, default=default_workers())
+    parser.add_argument("--drain-seconds", type=float, default=SHUTDOWN_DRAIN_SECONDS,
+                        help="How long a stopping worker waits for requests and LLM calls in flight.")
+    parser.add_argument("--log-level", default="info")
+    args = parser.parse_args(argv)
+
+    import uvicorn
+
+    # Inherited by the workers, which read them when they import backend.main.
+    os.environ.update(shared_environment(os.environ))
+    os.environ["SHUTDOWN_DRAIN_SECONDS"] = str(args.drain_seconds)
+    if os.environ["SESSION_BACKEND"] == "memory" and args.workers > 1:
+        parser.error("SESSION_BACKEND=memory keeps sessions per worker; use shared or sqlite with several workers")
+    print(f"Starting {args.workers} worker(s) on http://{args.host}:{args.port}, "
+          f"shared state at {os.environ['SHARED_STATE_URL']}")
+    uvicorn.run(
+        "backend.main:app",
+        host=args.host,
+        port=args.port,
+        workers=args.workers,
+        # The app refuses new LLM calls from the signal on, not only after this window.
+        timeout_graceful_shutdown=args.drain_seconds,
+        log_level=args.log_level,
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,230 @@
+"""Server-side conversation sessions.
+
+Clients that use a session only send the new user turn; the history lives
+here, keyed by a session id handed out on the first turn. Three backends are
+available:
+
+* :class:`InMemorySessionStore` (default): per-process dict with TTL and LRU
+  eviction.
+* :class:`SQLiteSessionStore`: one row per message in a local SQLite file, so
+  sessions survive restarts. Only the new messages are written on each turn.
+* :class:`SharedSessionStore`: one list per session in the shared store
+  (:mod:`backend.shared_state`), so that any worker can continue any session.
+
+The backend is selected with ``SESSION_BACKEND`` (``memory``, ``sqlite`` or
+``shared``).
+"""
+
+import json
+import math
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, Dict, Final, List, Optional, Tuple
+
+from backend.shared_state import get_shared_state  # noqa: WPS433 import from parent
+
+SESSION_BACKEND: Final[str] = os.environ.get("SESSION_BACKEND", "memory")
+SESSION_TTL_SECONDS: Final[float] = float(os.environ.get("SESSION_TTL_SECONDS", str(6 * 60 * 60)))
+SESSION_MAX_ENTRIES: Final[int] = int(os.environ.get("SESSION_MAX_ENTRIES", "10000"))
+SESSION_DB_PATH: Final[Path] = Path(
+    os.environ.get("SESSION_DB_PATH", Path(__file__).parent.parent / "data" / "sessions.sqlite3")
+)
+
+Messages = List[Dict[str, str]]
+
+
+def new_session_id() -> str:
+    """Return a fresh, unguessable session id."""
+    return uuid.uuid4().hex
+
+
+class SessionStore:
+    """Interface shared by the session backends."""
+
+    def get(self, session_id: str) -> Optional[Messages]:
+        """Return a copy of the session's history, or ``None`` if unknown or expired."""
+        raise NotImplementedError
+
+    def append(self, session_id: str, messages: Messages) -> None:
+        """Append ``messages`` to the session, creating it if needed."""
+        raise NotImplementedError
+
+    def delete(self, session_id: str) -> None:
+        """Forget the session."""
+        raise NotImplementedError
+
+
+class InMemorySessionStore(SessionStore):
+    """Per-process store with time-to-live and least-recently-used eviction."""
+
+    def __init__(self, ttl_seconds: float = SESSION_TTL_SECONDS, max_entries: int = SESSION_MAX_ENTRIES) -> None:
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        # session id -> (expiry timestamp, messages), least recently used first.
+        self._sessions: "OrderedDict[str, Tuple[float, Messages]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, session_id: str) -> Optional[Messages]:
+        with self._lock:
+            entry = self._sessions.get(session_id)
+            if entry is None:
+                return None
+            expires_at, messages = entry
+            if expires_at < time.monotonic():
+                del self._sessions[session_id]
+                return None
+            self._sessions.move_to_end(session_id)
+            return list(messages)
+
+    def append(self, session_id: str, messages: Messages) -> None:
+        with self._lock:
+            entry = self._sessions.pop(session_id, None)
+            history = entry[1] if entry is not None else []
+            history.extend(messages)
+            self._sessions[session_id] = (time.monotonic() + self.ttl_seconds, history)
+            while len(self._sessions) > self.max_entries:
+                self._sessions.popitem(last=False)
+
+    def delete(self, session_id: str) -> None:
+        with self._lock:
+            self._sessions.pop(session_id, None)
+
+
+class SQLiteSessionStore(SessionStore):
+    """SQLite-backed store; messages are stored one row each and only appended."""
+
+    def __init__(
+        self,
+        path: Path = SESSION_DB_PATH,
+        ttl_seconds: float = SESSION_TTL_SECONDS,
+        max_entries: int = SESSION_MAX_ENTRIES,
+    ) -> None:
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        self._conn = sqlite3.connect(str(path), check_same_thread=False, isolation_level=None, timeout=30.0)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS sessions (
+                id TEXT PRIMARY KEY,
+                last_used REAL NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS sessions_last_used ON sessions (last_used);
+            CREATE TABLE IF NOT EXISTS session_messages (
+                session_id TEXT NOT NULL,
+                seq INTEGER NOT NULL,
+                message TEXT NOT NULL,
+                PRIMARY KEY (session_id, seq)
+            );
+            """
+        )
+        self._lock = threading.Lock()
+
+    def get(self, session_id: str) -> Optional[Messages]:
+        with self._lock:
+            row = self._conn.execute("SELECT last_used FROM sessions WHERE id = ?", (session_id,)).fetchone()
+            if row is None:
+                return None
+            now = time.time()
+            if row[0] + self.ttl_seconds < now:
+                self._delete(session_id)
+                return None
+            self._conn.execute("UPDATE sessions SET last_used = ? WHERE id = ?", (now, session_id))
+            rows = self._conn.execute(
+                "SELECT message FROM session_messages WHERE session_id = ? ORDER BY seq", (session_id,)
+            ).fetchall()
+        return [json.loads(message) for (message,) in rows]
+
+    def append(self, session_id: str, messages: Messages) -> None:
+        with self._lock:
+            # Takes the write lock up front, so workers appending at once wait instead of failing.
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                created = self._conn.execute(
+                    "INSERT OR IGNORE INTO sessions (id, last_used) VALUES (?, ?)", (session_id, time.time())
+                ).rowcount
+                self._conn.execute("UPDATE sessions SET last_used = ? WHERE id = ?", (time.time(), session_id))
+                (next_seq,) = self._conn.execute(
+                    "SELECT COALESCE(MAX(seq) + 1, 0) FROM session_messages WHERE session_id = ?", (session_id,)
+                ).fetchone()
+                self._conn.executemany(
+                    "INSERT INTO session_messages (session_id, seq, message) VALUES (?, ?, ?)",
+                    [(session_id, next_seq + i, json.dumps(message)) for i, message in enumerate(messages)],
+                )
+                if created:
+                    self._evict()
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+
+    def delete(self, session_id: str) -> None:
+        with self._lock:
+            self._delete(session_id)
+
+    def _delete(self, session_id: str) -> None:
+        self._conn.execute("DELETE FROM session_messages WHERE session_id = ?", (session_id,))
+        self._conn.execute("DELETE FROM sessions WHERE id = ?", (session_id,))
+
+    def _evict(self) -> None:
+        """Drop expired sessions, then the least recently used ones above the limit."""
+        expired_before = time.time() - self.ttl_seconds
+        stale = self._conn.execute(
+            """
+            SELECT id FROM sessions
+            WHERE last_used < ?
+               OR id NOT IN (SELECT id FROM sessions ORDER BY last_used DESC LIMIT ?)
+            """,
+            (expired_before, self.max_entries),
+        ).fetchall()
+        for (session_id,) in stale:
+            self._delete(session_id)
+
+
+class SharedSessionStore(SessionStore):
+    """Store in the shared key-value store; each session is a list that expires when idle.
+
+    Sessions are bounded by their time-to-live only: the store (Redis, or its
+    SQLite stand-in) evicts by expiry rather than by count.
+    """
+
+    def __init__(self, store: Any, ttl_seconds: float = SESSION_TTL_SECONDS) -> None:
+        self.store = store
+        self.ttl_seconds = ttl_seconds
+
+    def get(self, session_id: str) -> Optional[Messages]:
+        key = f"session:{session_id}"
+        messages = self.store.lrange(key, 0, -1)
+        if not messages:
+            return None
+        self.store.expire(key, math.ceil(self.ttl_seconds))
+        return [json.loads(message) for message in messages]
+
+    def append(self, session_id: str, messages: Messages) -> None:
+        key = f"session:{session_id}"
+        self.store.rpush(key, *(json.dumps(message) for message in messages))
+        self.store.expire(key, math.ceil(self.ttl_seconds))
+
+    def delete(self, session_id: str) -> None:
+        self.store.delete(f"session:{session_id}")
+
+
+def create_session_store(backend: str = SESSION_BACKEND) -> SessionStore:
+    """Build the session store selected by ``SESSION_BACKEND``."""
+    if backend == "memory":
+        return InMemorySessionStore()
+    if backend == "sqlite":
+        return SQLiteSessionStore()
+    if backend == "shared":
+        store = get_shared_state()
+        if store is None:
+            raise ValueError("SESSION_BACKEND=shared needs SHARED_STATE_URL.")
+        return SharedSessionStore(store)
+    raise ValueError(f"Unknown SESSION_BACKEND {backend!r}; expected 'memory', 'sqlite' or 'shared'.")
@@ -0,0 +1,247 @@
+"""State shared by the worker processes of one deployment.
+
+Several uvicorn workers (``python -m backend.serve``) do not share memory, so
+the state a request may need in any worker (session histories, cached
+replies, per-client rate limits) goes through a key-value store with the
+subset of the Redis API used here, as exposed by ``redis-py`` with
+``decode_responses=True``: ``get``/``set`` (with ``ex`` and ``nx``),
+``delete``, ``exists``, ``incr``, ``expire``, ``ttl``, ``rpush`` and
+``lrange``.
+
+``SHARED_STATE_URL`` selects the store:
+
+* ``sqlite:///path/to/file.sqlite3``: :class:`SQLiteSharedState`, a local
+  stand-in in a SQLite file (WAL) that every process on the machine opens;
+* ``redis://host:port/db``: a Redis server, through the optional ``redis``
+  package, for workers spread over several machines;
+* unset: no shared state; every worker keeps its own.
+
+Keys expire like Redis keys: expired keys are invisible at once and deleted
+in batches every few hundred writes.
+"""
+
+import os
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Any, Final, Iterator, List, Optional, Union
+
+SHARED_STATE_URL: Final[str] = os.environ.get("SHARED_STATE_URL", "")
+# Default store of ``python -m backend.serve`` when SHARED_STATE_URL is unset.
+SHARED_STATE_DEFAULT_PATH: Final[Path] = Path(__file__).parent.parent / "data" / "shared_state.sqlite3"
+
+# Expired keys are deleted once every this many writes rather than on every write.
+_PURGE_EVERY: Final[int] = 500
+
+Value = Union[str, int, float]
+
+
+class SQLiteSharedState:
+    """Redis-compatible subset over a SQLite file shared by the processes of a machine.
+
+    Strings and lists live in one keyspace, as in Redis; expiry times are
+    wall-clock timestamps so that every process agrees on them. Writes are
+    single ``BEGIN IMMEDIATE`` transactions, so concurrent ``incr`` and
+    ``rpush`` calls from different processes are not lost.
+    """
+
+    def __init__(self, path: Union[str, Path]) -> None:
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._conn = sqlite3.connect(str(self.path), check_same_thread=False, isolation_level=None, timeout=30.0)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS keys (
+                key TEXT PRIMARY KEY,
+                kind TEXT NOT NULL,
+                value TEXT,
+                expires_at REAL
+            );
+            CREATE INDEX IF NOT EXISTS keys_expires_at ON keys (expires_at) WHERE expires_at IS NOT NULL;
+            CREATE TABLE IF NOT EXISTS list_items (
+                key TEXT NOT NULL,
+                seq INTEGER NOT NULL,
+                value TEXT NOT NULL,
+                PRIMARY KEY (key, seq)
+            );
+            """
+        )
+        self._lock = threading.Lock()
+        self._writes = 0
+
+    def ping(self) -> bool:
+        self._conn.execute("SELECT 1").fetchone()
+        return True
+
+    def get(self, name: str) -> Optional[str]:
+        """The string stored at ``name``, or ``None``."""
+        with self._lock:
+            row = self._live(name)
+        return row[1] if row is not None and row[0] == "string" else None
+
+    def set(self, name: str, value: Value, ex: Optional[float] = None, nx: bool = False) -> Optional[bool]:
+        """Store ``value`` at ``name``, expiring after ``ex`` seconds; with ``nx``, only if absent."""
+        expires_at = time.time() + ex if ex is not None else None
+        with self._write():
+            if nx and self._live(name) is not None:
+                return None
+            self._conn.execute("DELETE FROM list_items WHERE key = ?", (name,))
+            self._conn.execute(
+                "INSERT OR REPLACE INTO keys (key, kind, value, expires_at) VALUES (?, 'string', ?, ?)",
+                (name, str(value), expires_at),
+            )
+        return True
+
+    def delete(self, *names: str) -> int:
+        """Delete ``names``; return how many existed."""
+        with self._write():
+            deleted = sum(self._live(name) is not None for name in names)
+            for name in names:
+                self._delete(name)
+        return deleted
+
+    def exists(self, *names: str) -> int:
+        with self._lock:
+            return sum(self._live(name) is not None for name in names)
+
+    def incr(self, name: str, amount: int = 1) -> int:
+        """Add ``amount`` to the integer at ``name`` (0 if absent), keeping its expiry; return the result."""
+        with self._write():
+            row = self._live(name)
+            if row is not None and row[0] != "string":
+                raise TypeError(f"{name!r} holds a list, not an integer")
+            value = (int(row[1]) if row is not None else 0) + amount
+            if row is None:
+                self._delete(name)
+                self._conn.execute(
+                    "INSERT INTO keys (key, kind, value, expires_at) VALUES (?, 'string', ?, NULL)",
+                    (name, str(value)),
+                )
+            else:
+                self._conn.execute("UPDATE keys SET value = ? WHERE key = ?", (str(value), name))
+        return value
+
+    def expire(self, name: str, seconds: float) -> bool:
+        """Expire ``name`` in ``seconds``; False if it does not exist."""
+        now = time.time()
+        with self._write():
+            return self._conn.execute(
+                "UPDATE keys SET expires_at = ? WHERE key = ? AND (expires_at IS NULL OR expires_at >= ?)",
+                (now + seconds, name, now),
+            ).rowcount > 0
+
+    def ttl(self, name: str) -> int:
+        """Seconds until ``name`` expires: -1 if it never does, -2 if it does not exist."""
+        with self._lock:
+            row = self._live(name)
+        if row is None:
+            return -2
+        return -1 if row[2] is None else max(0, round(row[2] - time.time()))
+
+    def rpush(self, name: str, *values: Value) -> int:
+        """Append ``values`` to the list at ``name``; return its new length."""
+        with self._write():
+            row = self._live(name)
+            if row is not None and row[0] != "list":
+                raise TypeError(f"{name!r} holds a string, not a list")
+            if row is None:
+                self._delete(name)
+                self._conn.execute(
+                    "INSERT INTO keys (key, kind, value, expires_at) VALUES (?, 'list', NULL, NULL)", (name,)
+                )
+            (next_seq,) = self._conn.execute(
+                "SELECT COALESCE(MAX(seq) + 1, 0) FROM list_items WHERE key = ?", (name,)
+            ).fetchone()
+            self._conn.executemany(
+                "INSERT INTO list_items (key, seq, value) VALUES (?, ?, ?)",
+                [(name, next_seq + i, str(value)) for i, value in enumerate(values)],
+            )
+        return next_seq + len(values)
+
+    def lrange(self, name: str, start: int, end: int) -> List[str]:
+        """Items ``start`` to ``end`` (inclusive, negative from the end) of the list at ``name``."""
+        with self._lock:
+            row = self._live(name)
+            if row is None or row[0] != "list":
+                return []
+            items = [value for (value,) in self._conn.execute(
+                "SELECT value FROM list_items WHERE key = ? ORDER BY seq", (name,)
+            )]
+        stop = len(items) if end == -1 else (end + 1 if end >= 0 else len(items) + end + 1)
+        return items[start:stop]
+
+    def close(self) -> None:
+        self._conn.close()
+
+    def _live(self, name: str) -> Optional[Any]:
+        """The (kind, value, expires_at) row of ``name`` if it has not expired."""
+        row = self._conn.execute("SELECT kind, value, expires_at FROM keys WHERE key = ?", (name,)).fetchone()
+        if row is None or (row[2] is not None and row[2] < time.time()):
+            return None
+        return row
+
+    def _delete(self, name: str) -> None:
+        self._conn.execute("DELETE FROM list_items WHERE key = ?", (name,))
+        self._conn.execute("DELETE FROM keys WHERE key = ?", (name,))
+
+    @contextmanager
+    def _write(self) -> Iterator[None]:
+        """One ``BEGIN IMMEDIATE`` transaction under the lock; purges expired keys now and then."""
+        with self._lock:
+            # IMMEDIATE takes the write lock up front: a deferred transaction
+            # that read first could not upgrade once another process wrote.
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                yield
+                self._writes += 1
+                if self._writes % _PURGE_EVERY == 0:
+                    self._purge()
+                self._conn.execute("COMMIT")
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+
+    def _purge(self) -> None:
+        """Delete the keys that expired."""
+        expired = self._conn.execute(
+            "SELECT key FROM keys WHERE expires_at IS NOT NULL AND expires_at < ?", (time.time(),)
+        ).fetchall()
+        for (name,) in expired:
+            self._delete(name)
+
+
+def connect_shared_state(url: str) -> Any:
+    """Open the store at ``url`` (``sqlite:///path`` or ``redis://...``)."""
+    if url.startswith("sqlite:///"):
+        return SQLiteSharedState(url[len("sqlite:///"):])
+    if url.startswith(("redis://", "rediss://", "unix://")):
+        # Optional dependency, only needed with a Redis server.
+        import redis
+
+        return redis.Redis.from_url(url, decode_responses=True)
+    raise ValueError(f"SHARED_STATE_URL must start with sqlite:/// or redis://; got {url!r}")
+
+
+_shared_state: Optional[Any] = None
+_configured = False
+
+
+def configure_shared_state(url: str = SHARED_STATE_URL) -> Optional[Any]:
+    """Set the process-wide shared store (empty ``url``: none) and return it."""
+    global _shared_state, _configured
+    if _shared_state is not None:
+        _shared_state.close()
+    _shared_state = connect_shared_state(url) if url else None
+    _configured = True
+    return _shared_state
+
+
+def get_shared_state() -> Optional[Any]:
+    """The process-wide shared store, configured from ``SHARED_STATE_URL`` on first use."""
+    if not _configured:
+        configure_shared_state()
+    return _shared_state
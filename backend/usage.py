@@ -0,0 +1,449 @@
+"""Token and cost accounting of LLM calls, per session and per eval run.
+
+Every completion whose usage the provider reports is charged to the
+*account* of the current context, set with :func:`charged_to`:
+``session:<id>`` for the chat endpoints, ``run:<name>`` for the eval scripts
+(calls outside any account are recorded unattributed). Completions replayed
+from the LLM cache cost nothing and are not charged.
+
+Recording is in memory: one list append and one addition under a lock. A
+background thread writes the pending calls to an SQLite file in WAL mode
+(shared by any number of worker processes) in a single transaction every
+``USAGE_FLUSH_INTERVAL`` seconds, sooner once ``USAGE_FLUSH_CALLS`` calls are
+pending, and at exit.
+
+Token budgets (prompt plus completion tokens) are checked before a call:
+``USAGE_SESSION_TOKEN_BUDGET`` per session, ``USAGE_RUN_TOKEN_BUDGET`` per
+eval run, or the budget set for an account with :meth:`UsageLedger.set_budget`
+(0: none). :meth:`UsageLedger.check` raises :class:`TokenBudgetExceeded` once
+the budget is used up, so the call is refused before it is sent. The total of
+an account starts from what the store holds for it when the process first
+checks it (budgets survive restarts); calls already in flight still complete,
+and other processes' calls made after that are not seen. The totals of the
+``USAGE_MAX_ACCOUNTS`` most recently used accounts are kept in memory; the
+others are loaded again when next checked. Async callers use
+:meth:`UsageLedger.acheck`, which loads a total in a worker thread.
+
+The ledger is off unless ``USAGE_ENABLED=1`` or a budget is set.
+
+Costs are computed when reporting: from ``USAGE_PRICES``, then the prices
+bundled below for models litellm's cost map lacks, then litellm's map.
+
+Usage::
+
+    python -m backend.usage --by model account --since 2025-06-01
+"""
+
+import argparse
+import asyncio
+import atexit
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from contextvars import ContextVar
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Dict, Final, Iterator, List, NamedTuple, Optional, Sequence, Tuple
+
+logger = logging.getLogger(__name__)
+
+USAGE_DB_PATH: Final[str] = os.environ.get(
+    "USAGE_DB_PATH", str(Path(__file__).parent.parent / "data" / "usage.sqlite3")
+)
+USAGE_FLUSH_INTERVAL: Final[float] = float(os.environ.get("USAGE_FLUSH_INTERVAL", "5"))
+USAGE_FLUSH_CALLS: Final[int] = int(os.environ.get("USAGE_FLUSH_CALLS", "1000"))
+# Tokens one chat session, or one eval run, may use (0: no budget).
+USAGE_SESSION_TOKEN_BUDGET: Final[int] = int(os.environ.get("USAGE_SESSION_TOKEN_BUDGET", "0"))
+USAGE_RUN_TOKEN_BUDGET: Final[int] = int(os.environ.get("USAGE_RUN_TOKEN_BUDGET", "0"))
+# Budgets cannot be enforced without the ledger, so setting one turns it on.
+USAGE_ENABLED: Final[bool] = os.environ.get(
+    "USAGE_ENABLED", "1" if USAGE_SESSION_TOKEN_BUDGET or USAGE_RUN_TOKEN_BUDGET else "0"
+) == "1"
+# Accounts whose totals are kept in memory, least recently used evicted first.
+USAGE_MAX_ACCOUNTS: Final[int] = int(os.environ.get("USAGE_MAX_ACCOUNTS", "10000"))
+# Prices in USD per million tokens as JSON, e.g. '{"openai/my-model": {"input": 0.4, "output": 1.6}}';
+# "cache_read" and "cache_write" default to "input".
+USAGE_PRICES: Final[Dict[str, Dict[str, float]]] = json.loads(os.environ.get("USAGE_PRICES", "{}"))
+
+# Models missing from litellm's bundled cost map, in USD per million tokens.
+_BUNDLED_PRICES: Final[Dict[str, Dict[str, float]]] = {
+    "anthropic/claude-3-haiku-20240307": {"input": 0.25, "output": 1.25, "cache_read": 0.03, "cache_write": 0.30},
+}
+_ACCOUNT_BUDGETS: Final[Dict[str, int]] = {"session": USAGE_SESSION_TOKEN_BUDGET, "run": USAGE_RUN_TOKEN_BUDGET}
+# Columns a report can be grouped by.
+_GROUPS: Final[Dict[str, str]] = {"model": "model", "account": "account", "day": "date(ts, 'unixepoch')"}
+
+# Account charged for the calls made in the current context (None: unattributed).
+usage_account: ContextVar[Optional[str]] = ContextVar("usage_account", default=None)
+
+
+class TokenBudgetExceeded(Exception):
+    """Raised before a call when its account has used up its token budget."""
+
+    def __init__(self, account: str, used: int, budget: int) -> None:
+        super().__init__(f"{account} used {used} of its {budget} token budget")
+        self.account = account
+        self.used = used
+        self.budget = budget
+
+
+class Prices(NamedTuple):
+    """USD per token."""
+
+    input: float
+    output: float
+    cache_read: float
+    cache_write: float
+
+
+def model_prices(model: str) -> Optional[Prices]:
+    """Prices of ``model``, or ``None`` when no source knows it."""
+    entry = USAGE_PRICES.get(model) or _BUNDLED_PRICES.get(model)
+    if entry is not None:
+        per_token = {name: value / 1e6 for name, value in entry.items()}
+        return Prices(
+            per_token["input"],
+            per_token["output"],
+            per_token.get("cache_read", per_token["input"]),
+            per_token.get("cache_write", per_token["input"]),
+        )
+    os.environ.setdefault("LITELLM_LOCAL_MODEL_COST_MAP", "True")
+    import litellm  # imported on first report only: it is slow to import
+
+    for name in (model, model.split("/", 1)[-1]):
+        entry = litellm.model_cost.get(name)
+        if entry and "input_cost_per_token" in entry:
+            input_cost = entry["input_cost_per_token"]
+            return Prices(
+                input_cost,
+                entry.get("output_cost_per_token", 0.0),
+                entry.get("cache_read_input_token_cost") or input_cost,
+                entry.get("cache_creation_input_token_cost") or input_cost,
+            )
+    return None
+
+
+def call_cost(model: str, prompt: int, completion: int, cached: int = 0, cache_write: int = 0) -> Optional[float]:
+    """USD cost of a call, or ``None`` if the prices of ``model`` are unknown.
+
+    ``prompt`` includes the tokens read from and written to the prompt cache,
+    which are charged at their own price.
+    """
+    prices = model_prices(model)
+    if prices is None:
+        return None
+    uncached = max(prompt - cached - cache_write, 0)
+    return (
+        uncached * prices.input
+        + cached * prices.cache_read
+        + cache_write * prices.cache_write
+        + completion * prices.output
+    )
+
+
+@contextmanager
+def charged_to(account: Optional[str]) -> Iterator[None]:
+    """Charge the calls made inside the block to ``account``."""
+    token = usage_account.set(account)
+    try:
+        yield
+    finally:
+        usage_account.reset(token)
+
+
+class UsageLedger:
+    """In-memory usage of LLM calls, flushed in batches to an SQLite store."""
+
+    def __init__(
+        self,
+        path: str = USAGE_DB_PATH,
+        flush_interval: float = USAGE_FLUSH_INTERVAL,
+        flush_calls: int = USAGE_FLUSH_CALLS,
+        max_accounts: int = USAGE_MAX_ACCOUNTS,
+    ) -> None:
+        self.path = path
+        self.flush_interval = flush_interval
+        self.flush_calls = flush_calls
+        self.max_accounts = max_accounts
+        self.flushes = 0
+        # _lock guards the in-memory state, _db_lock the connection; a flush holds both only to swap the list.
+        self._lock = threading.Lock()
+        self._db_lock = threading.Lock()
+        self._pending: List[Tuple[float, str, str, int, int, int, int]] = []
+        # Tokens used per account whose stored total was loaded by check(), least recently used first.
+        self._used: "OrderedDict[str, int]" = OrderedDict()
+        self._budgets: Dict[str, int] = {}
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        # Writers of other processes hold the lock briefly; wait for them instead of failing.
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None, timeout=30.0)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS calls (
+                ts REAL NOT NULL,
+                account TEXT NOT NULL,
+                model TEXT NOT NULL,
+                prompt_tokens INTEGER NOT NULL,
+                completion_tokens INTEGER NOT NULL,
+                cached_tokens INTEGER NOT NULL,
+                cache_write_tokens INTEGER NOT NULL
+            )
+            """
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS calls_account ON calls (account)")
+        self._closed = False
+        self._wake = threading.Event()
+        self._flusher = threading.Thread(target=self._flush_loop, name="usage-flush", daemon=True)
+        self._flusher.start()
+        atexit.register(self.close)
+
+    def record(
+        self,
+        model: str,
+        prompt: int,
+        completion: int,
+        cached: int = 0,
+        cache_write: int = 0,
+        account: Optional[str] = None,
+    ) -> None:
+        """Charge a call to ``account`` (default: the current :data:`usage_account`)."""
+        if account is None:
+            account = usage_account.get() or ""
+        row = (time.time(), account, model, prompt, completion, cached, cache_write)
+        with self._lock:
+            self._pending.append(row)
+            if account in self._used:
+                self._used[account] += prompt + completion
+                self._used.move_to_end(account)
+            pending = len(self._pending)
+        if pending >= self.flush_calls:
+            self._wake.set()
+
+    def set_budget(self, account: str, tokens: int) -> None:
+        """Budget of ``account``, overriding the one of its kind (0: none)."""
+        self._budgets[account] = tokens
+
+    def budget(self, account: str) -> int:
+        """Token budget of ``account`` (0: none)."""
+        budget = self._budgets.get(account)
+        if budget is None:
+            budget = _ACCOUNT_BUDGETS.get(account.split(":", 1)[0], 0)
+        return budget
+
+    def used(self, account: str) -> int:
+        """Tokens ``account`` used: the stored total when first asked, plus the calls since."""
+        with self._lock:
+            used = self._used.get(account)
+            if used is not None:
+                self._used.move_to_end(account)
+                return used
+        with self._db_lock:
+            self._flush_locked()
+            (stored,) = self._conn.execute(
+                "SELECT COALESCE(SUM(prompt_tokens + completion_tokens), 0) FROM calls WHERE account = ?", (account,)
+            ).fetchone()
+            with self._lock:
+                # Calls recorded since the flush are still pending.
+                pending = sum(row[3] + row[4] for row in self._pending if row[1] == account)
+                used = self._used.setdefault(account, stored + pending)
+                while len(self._used) > self.max_accounts:
+                    self._used.popitem(last=False)
+                return used
+
+    def loaded(self, account: str) -> bool:
+        """Whether the total of ``account`` is in memory, so :meth:`used` needs no query."""
+        with self._lock:
+            return account in self._used
+
+    def check(self, estimate: int = 0, account: Optional[str] = None) -> None:
+        """Refuse a call of about ``estimate`` tokens that would exceed the account's budget.
+
+        Raises:
+            TokenBudgetExceeded: When the account (default: the current
+                :data:`usage_account`) has used its budget, or would with ``estimate``.
+        """
+        if account is None:
+            account = usage_account.get()
+        if not account:
+            return
+        budget = self.budget(account)
+        if not budget:
+            return
+        used = self.used(account)
+        if used + estimate > budget or used >= budget:
+            raise TokenBudgetExceeded(account, used, budget)
+
+    async def acheck(self, estimate: int = 0, account: Optional[str] = None) -> None:
+        """:meth:`check` that loads the stored total of the account in a worker thread.
+
+        Raises:
+            TokenBudgetExceeded: As :meth:`check`.
+        """
+        if account is None:
+            account = usage_account.get()
+        if account and self.budget(account) and not self.loaded(account):
+            # The first check flushes and queries SQLite; keep it off the event loop.
+            await asyncio.to_thread(self.used, account)
+        self.check(estimate, account)
+
+    def flush(self) -> int:
+        """Write the pending calls in one transaction; return how many."""
+        with self._db_lock:
+            return self._flush_locked()
+
+    def _flush_locked(self) -> int:
+        with self._lock:
+            rows, self._pending = self._pending, []
+        if not rows:
+            return 0
+        try:
+            with self._conn:
+                self._conn.execute("BEGIN")
+                self._conn.executemany(
+                    "INSERT INTO calls (ts, account, model, prompt_tokens, completion_tokens, cached_tokens, "
+                    "cache_write_tokens) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                    rows,
+                )
+        except sqlite3.Error as exc:
+            logger.warning("Could not write %d usage records, keeping them for the next flush: %s", len(rows), exc)
+            with self._lock:
+                self._pending[:0] = rows
+            return 0
+        self.flushes += 1
+        return len(rows)
+
+    def _flush_loop(self) -> None:
+        while not self._closed:
+            self._wake.wait(self.flush_interval)
+            self._wake.clear()
+            if not self._closed:
+                self.flush()
+
+    def report(
+        self,
+        by: Sequence[str] = ("model",),
+        since: Optional[float] = None,
+        limit: Optional[int] = None,
+        account: Optional[str] = None,
+    ) -> List[Dict[str, Any]]:
+        """Calls, tokens and USD cost grouped by ``by`` (model, account, day), largest first.
+
+        Pending calls are flushed first. ``since`` (a timestamp) and ``account``
+        select the calls. ``cost_usd`` is ``None`` when a model's prices are unknown.
+        """
+        unknown = [name for name in by if name not in _GROUPS]
+        if unknown:
+            raise ValueError(f"usage reports group by {', '.join(_GROUPS)}; got {unknown}")
+        columns = ", ".join([_GROUPS[name] for name in by] + ["model"])
+        where, params = "ts >= ?", [since or 0.0]
+        if account is not None:
+            where, params = where + " AND account = ?", params + [account]
+        with self._db_lock:
+            self._flush_locked()
+            rows = self._conn.execute(
+                f"SELECT {columns}, COUNT(*), SUM(prompt_tokens), SUM(cached_tokens), SUM(cache_write_tokens), "
+                f"SUM(completion_tokens) FROM calls WHERE {where} GROUP BY {columns}",
+                params,
+            ).fetchall()
+        totals: Dict[Tuple[Any, ...], Dict[str, Any]] = {}
+        for row in rows:
+            key, model = tuple(row[:len(by)]), row[len(by)]
+            calls, prompt, cached, cache_write, completion = row[len(by) + 1:]
+            total = totals.setdefault(key, {
+                **dict(zip(by, key)), "calls": 0, "prompt_tokens": 0, "cached_tokens": 0,
+                "cache_write_tokens": 0, "completion_tokens": 0, "cost_usd": 0.0,
+            })
+            total["calls"] += calls
+            total["prompt_tokens"] += prompt
+            total["cached_tokens"] += cached
+            total["cache_write_tokens"] += cache_write
+            total["completion_tokens"] += completion
+            cost = call_cost(model, prompt, completion, cached, cache_write)
+            total["cost_usd"] = None if cost is None or total["cost_usd"] is None else total["cost_usd"] + cost
+        ordered = sorted(totals.values(), key=lambda total: total["prompt_tokens"] + total["completion_tokens"], reverse=True)
+        return ordered[:limit] if limit else ordered
+
+    def close(self) -> None:
+        """Stop the flush thread and write what is pending."""
+        if self._closed:
+            return
+        self._closed = True
+        self._wake.set()
+        self._flusher.join()
+        self.flush()
+        with self._db_lock:
+            self._conn.close()
+        atexit.unregister(self.close)
+
+
+_ledger: Optional[UsageLedger] = None
+_configured = False
+
+
+def configure_usage_ledger(enabled: bool = USAGE_ENABLED, path: str = USAGE_DB_PATH, **kwargs: Any) -> Optional[UsageLedger]:
+    """Set the process-wide ledger charged by every LLM call (disabled: none) and return it."""
+    global _ledger, _configured
+    if _ledger is not None:
+        _ledger.close()
+    _ledger = UsageLedger(path, **kwargs) if enabled else None
+    _configured = True
+    return _ledger
+
+
+def get_usage_ledger() -> Optional[UsageLedger]:
+    """The process-wide ledger, configured from ``USAGE_ENABLED`` on first use."""
+    if not _configured:
+        configure_usage_ledger()
+    return _ledger
+
+
+def check_budget(estimate: int = 0) -> None:
+    """:meth:`UsageLedger.check` on the process-wide ledger, if any."""
+    ledger = get_usage_ledger()
+    if ledger is not None:
+        ledger.check(estimate)
+
+
+async def acheck_budget(estimate: int = 0) -> None:
+    """:meth:`UsageLedger.acheck` on the process-wide ledger, if any."""
+    ledger = get_usage_ledger()
+    if ledger is not None:
+        await ledger.acheck(estimate)
+
+
+def usage_summary(total: Dict[str, Any]) -> str:
+    """One line describing a row of :meth:`UsageLedger.report`."""
+    cost = "unknown cost" if total["cost_usd"] is None else f"${total['cost_usd']:.4f}"
+    return (
+        f"{total['calls']} calls, {total['prompt_tokens']} prompt tokens ({total['cached_tokens']} cached, "
+        f"{total['cache_write_tokens']} cache writes), {total['completion_tokens']} completion tokens, {cost}"
+    )
+
+
+def main(argv: List[str] = None) -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--path", default=USAGE_DB_PATH)
+    parser.add_argument("--by", nargs="+", choices=list(_GROUPS), default=["model"])
+    parser.add_argument("--since", type=datetime.fromisoformat, help="Only calls from this date or time on.")
+    parser.add_argument("--limit", type=int, help="Only the largest groups.")
+    parser.add_argument("--account", help="Only the calls of this account, e.g. session:<id> or run:<name>.")
+    args = parser.parse_args(argv)
+    if not Path(args.path).exists():
+        parser.error(f"no usage recorded at {args.path}")
+    ledger = UsageLedger(args.path)
+    try:
+        rows = ledger.report(args.by, args.since.timestamp() if args.since else None, args.limit, args.account)
+    finally:
+        ledger.close()
+    for row in rows:
+        print(f"{' '.join(str(row[name]) for name in args.by)}: {usage_summary(row)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -11,25 +11,43 @@
 # output
 # delimeters and structure
 
-import litellm  # type: ignore
+import asyncio
+import json
+import logging
 import os
-from typing import Final, Dict, List
+import random
+import time
+from collections import deque
+from contextvars import ContextVar
+from functools import lru_cache
+from typing import Any, AsyncIterator, Awaitable, Callable, Deque, Final, Dict, List, NamedTuple, Optional, Set, Tuple, TypeVar
+
+import httpx
 
 ## set ENV variables
 from dotenv import load_dotenv
 
+from backend.metrics import LLM_ERRORS, LLM_TOKENS, stage  # noqa: WPS433 import from parent
+from backend.llm_cache import get_llm_cache, llm_cache_key  # noqa: WPS433 import from parent
+from backend.players import get_player_index, player_facts  # noqa: WPS433 import from parent
+from backend.router import CANNED_REPLY, CLARIFY, OUT_OF_SCOPE, get_router  # noqa: WPS433 import from parent
+from backend.usage import acheck_budget, check_budget, get_usage_ledger  # noqa: WPS433 import from parent
+
 load_dotenv(override=False)
 
-response = litellm.completion(
-  model="anthropic/claude-3-sonnet-20240229",
-  messages=[{ "content": "Hello, how are you?","role": "user"}]
-)
+# Use the model cost map bundled with litellm instead of downloading it on
+# import, so that starting the backend never needs the network.
+os.environ.setdefault("LITELLM_LOCAL_MODEL_COST_MAP", "True")
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
 
 SYSTEM_PROMPT: Final[str] = """
 ### Role ###
 You're a helpful football scouting analyst.
 ### Instructions ###
-Provide detailed specifications about players based on the user query. When asked about a player start with the characteristics such as age, team, market price (if you don't know it, just say "unknown"), and then provide a detailed analysis of the player's skills, strengths, and weaknesses.
+Provide detailed specifications about players based on the user query. When asked about a player start with the characteristics such as age, team, market price (take them from the "Player facts" section when the player is listed there; those facts are a snapshot, so give the team and market value with their "as of" date and say that they may have changed since, rather than stating them as current; otherwise, if you don't know it, just say "unknown"), and then provide a detailed analysis of the player's skills, strengths, and weaknesses.
 Your responses should be concise, informative, and relevant to the query.
 At the end if you listed multiple players make a comparison of their skills and characteristics to provide clear information about their fit in different playing styles
 ### output ###
@@ -38,35 +56,819 @@ Your output should be in markdown format, structured with headings and bullet po
 
 # Fetch configuration *after* we loaded the .env file.
 MODEL_NAME: Final[str] = os.environ.get("MODEL_NAME", "anthropic/claude-3-haiku-20240307")
+# Optional override of the provider URL, e.g. a local OpenAI-compatible server.
+API_BASE: Final[Optional[str]] = os.environ.get("LLM_API_BASE") or None
+# Upper bound of concurrent connections a single worker keeps to the provider.
+MAX_CONNECTIONS: Final[int] = int(os.environ.get("LLM_MAX_CONNECTIONS", "100"))
+# Run :func:`warm_up` in the background when the app starts (set to 0 to disable).
+WARM_UP_ON_STARTUP: Final[bool] = os.environ.get("LLM_WARMUP", "1") != "0"
+WARM_UP_TIMEOUT: Final[float] = float(os.environ.get("LLM_WARMUP_TIMEOUT", "5"))
+
+# Prompt token budget when no per-model value is configured; it is also capped
+# by the model's context window when litellm knows it.
+DEFAULT_CONTEXT_TOKEN_BUDGET: Final[int] = int(os.environ.get("CONTEXT_TOKEN_BUDGET", "16000"))
+# Per-model budgets as JSON, e.g. '{"openai/gpt-4.1-nano": 32000}'.
+CONTEXT_TOKEN_BUDGETS: Final[Dict[str, int]] = json.loads(os.environ.get("CONTEXT_TOKEN_BUDGETS", "{}"))
+# Approximate tokens added by the chat format around every message.
+MESSAGE_TOKEN_OVERHEAD: Final[int] = 4
+# Length of each dropped user question quoted in the summary of older turns.
+SUMMARY_SNIPPET_CHARS: Final[int] = 120
+_SUMMARY_HEADER: Final[str] = "### Earlier in this conversation ###"
+_PLAYER_FACTS_HEADER: Final[str] = "### Player facts ###"
+_CLARIFY_INSTRUCTIONS: Final[str] = """
+### Clarification ###
+The request is underspecified. Do not write a scouting report yet: in at most three short sentences, say what you understood and ask for the missing details (position, age range, budget, playing style or league).
+"""
+
+# Seconds one attempt may take before it is abandoned (for streams: until the first chunk).
+LLM_TIMEOUT: Final[float] = float(os.environ.get("LLM_TIMEOUT", "60"))
+# Retries per model on timeouts, connection errors, 408/409/429 and 5xx.
+LLM_MAX_RETRIES: Final[int] = int(os.environ.get("LLM_MAX_RETRIES", "2"))
+LLM_RETRY_BACKOFF: Final[float] = float(os.environ.get("LLM_RETRY_BACKOFF", "0.5"))
+LLM_RETRY_BACKOFF_MAX: Final[float] = float(os.environ.get("LLM_RETRY_BACKOFF_MAX", "8"))
+# Models tried in order once MODEL_NAME has failed, e.g. "openai/gpt-4.1-nano,gemini/gemini-2.0-flash".
+LLM_FALLBACK_MODELS: Final[Tuple[str, ...]] = tuple(
+    model.strip() for model in os.environ.get("LLM_FALLBACK_MODELS", "").split(",") if model.strip()
+)
+# Latency percentile (e.g. 0.95) after which a second, hedged request is sent;
+# unset disables hedging. Hedging starts once LLM_HEDGE_MIN_SAMPLES calls were timed.
+LLM_HEDGE_PERCENTILE: Final[Optional[float]] = (
+    float(os.environ["LLM_HEDGE_PERCENTILE"]) if os.environ.get("LLM_HEDGE_PERCENTILE") else None
+)
+LLM_HEDGE_MIN_SAMPLES: Final[int] = int(os.environ.get("LLM_HEDGE_MIN_SAMPLES", "20"))
+# Number of recent call latencies kept per model for the hedging delay.
+_LATENCY_SAMPLES: Final[int] = 256
+# HTTP statuses worth retrying: request timeout, conflict, rate limit.
+_RETRYABLE_STATUSES: Final[Tuple[int, ...]] = (408, 409, 429)
+
+# Cheaper, faster model that answers the questions routed to a clarification
+# (see backend.router); MODEL_NAME stays its fallback.
+ROUTER_CHEAP_MODEL: Final[str] = os.environ.get("ROUTER_CHEAP_MODEL") or MODEL_NAME
+ROUTER_CLARIFY_MAX_TOKENS: Final[int] = int(os.environ.get("ROUTER_CLARIFY_MAX_TOKENS", "150"))
+
+# Provider prompt caching: "auto" marks cache breakpoints for Anthropic's Claude
+# models (OpenAI and DeepSeek cache stable prefixes without markers), "on"
+# marks them for every model and "off" never does.
+PROMPT_CACHING: Final[str] = os.environ.get("PROMPT_CACHING", "auto")
+# Smallest prompt worth a breakpoint at the end of the conversation; Anthropic
+# does not cache shorter prefixes and charges extra for each cache write.
+PROMPT_CACHE_MIN_TOKENS: Final[int] = int(os.environ.get("PROMPT_CACHE_MIN_TOKENS", "1024"))
 
-def get_agent_response(messages: List[Dict[str, str]]) -> List[Dict[str, str]]:
+# Default endpoints used to open a connection during warm-up when no
+# ``LLM_API_BASE`` is configured.
+_PROVIDER_BASE_URLS: Final[Dict[str, str]] = {
+    "openai": "https://api.openai.com/v1",
+    "anthropic": "https://api.anthropic.com",
+    "gemini": "https://generativelanguage.googleapis.com",
+    "mistral": "https://api.mistral.ai/v1",
+}
+
+def _litellm() -> Any:
+    """Import litellm on first use.
+
+    Importing litellm takes seconds and dominates the cold start of the app,
+    so it is deferred until the first LLM call or :func:`warm_up`.
     """
-    Generate a response from the LLM based on the provided messages.
-    
+    import litellm  # type: ignore
+
+    # Failures are handled (and logged) by the retry policy below.
+    litellm.suppress_debug_info = True
+    return litellm
+
+
+# One HTTP client per worker process, shared by every async LLM call so that
+# connections (and TLS sessions) are reused instead of re-opened per request.
+_async_client: Optional[httpx.AsyncClient] = None
+
+
+def get_async_client() -> httpx.AsyncClient:
+    """Return the worker-wide async HTTP client, creating it on first use."""
+    global _async_client
+    if _async_client is None or _async_client.is_closed:
+        _async_client = httpx.AsyncClient(
+            limits=httpx.Limits(
+                max_connections=MAX_CONNECTIONS,
+                max_keepalive_connections=MAX_CONNECTIONS,
+            ),
+            timeout=httpx.Timeout(600.0, connect=10.0),
+        )
+        # litellm picks this session up for OpenAI-compatible providers.
+        _litellm().aclient_session = _async_client
+    return _async_client
+
+
+async def close_async_client() -> None:
+    """Close the worker-wide async HTTP client (called on app shutdown)."""
+    global _async_client
+    if _async_client is not None:
+        if not _async_client.is_closed:
+            await _async_client.aclose()
+        _litellm().aclient_session = None
+    _async_client = None
+
+
+def _provider_base_url() -> Optional[str]:
+    """Return the URL the configured model is served from, if known."""
+    if API_BASE:
+        return API_BASE
+    provider = MODEL_NAME.split("/", 1)[0] if "/" in MODEL_NAME else "openai"
+    return _PROVIDER_BASE_URLS.get(provider)
+
+
+async def warm_up() -> None:
+    """Prepare the LLM client without spending a completion.
+
+    Imports litellm, loads the player knowledge base and trains the query
+    router off the event loop, creates the shared connection pool and opens one connection to the
+    provider (DNS, TCP and TLS) so the first chat request does not pay for it.
+    Network failures are logged and ignored.
+    """
+    await asyncio.to_thread(_litellm)
+    await asyncio.to_thread(get_player_index)
+    await asyncio.to_thread(get_router)
+    client = get_async_client()
+    url = _provider_base_url()
+    if url is None:
+        return
+    try:
+        await client.head(url, timeout=WARM_UP_TIMEOUT)
+    except httpx.HTTPError as exc:
+        logger.warning("LLM warm-up could not reach %s: %s", url, exc)
+
+
+class ContextStats(NamedTuple):
+    """Prompt size of one request before and after fitting it to the budget."""
+
+    prompt_tokens_before: int
+    prompt_tokens_after: int
+    dropped_messages: int
+    budget: int
+
+
+# Stats of the latest :func:`fit_context` call in the current request context.
+last_context_stats: ContextVar[Optional[ContextStats]] = ContextVar("last_context_stats", default=None)
+
+
+@lru_cache(maxsize=16384)
+def count_message_tokens(model: str, content: str) -> int:
+    """Count the tokens of one message; cached since histories are re-sent every turn."""
+    return _litellm().token_counter(model=model, text=content) + MESSAGE_TOKEN_OVERHEAD
+
+
+@lru_cache(maxsize=None)
+def context_budget(model: str) -> int:
+    """Return the prompt token budget for ``model``."""
+    if model in CONTEXT_TOKEN_BUDGETS:
+        return int(CONTEXT_TOKEN_BUDGETS[model])
+    try:
+        window = _litellm().get_model_info(model).get("max_input_tokens")
+    except Exception:  # Model unknown to litellm (e.g. custom or local endpoints)
+        window = None
+    return min(DEFAULT_CONTEXT_TOKEN_BUDGET, window) if window else DEFAULT_CONTEXT_TOKEN_BUDGET
+
+
+def _summarize_dropped(dropped: List[Dict[str, str]], available: int, model: str) -> List[str]:
+    """Quote the most recent dropped user questions that fit in ``available`` tokens."""
+    lines: List[str] = []
+    for message in reversed(dropped):
+        if message["role"] != "user":
+            continue
+        snippet = " ".join(message["content"].split())[:SUMMARY_SNIPPET_CHARS]
+        line = f"- The user asked: {snippet}"
+        cost = count_message_tokens(model, line) - MESSAGE_TOKEN_OVERHEAD
+        if cost > available:
+            break
+        available -= cost
+        lines.append(line)
+    return lines[::-1]
+
+
+def fit_context(messages: List[Dict[str, str]], model: str = MODEL_NAME) -> Tuple[List[Dict[str, str]], ContextStats]:
+    """
+    Fit a conversation into the prompt token budget of ``model``.
+
+    The system prompt and the most recent turns are kept. Older turns are
+    dropped and replaced by a short summary of the user's earlier questions,
+    sent as a second system message so that the system prompt itself stays
+    byte-identical (and cacheable by the provider), as far as the budget
+    allows. The latest message is always kept, even if it alone exceeds the budget.
+
     Args:
-        messages (List[Dict[str, str]]): A list of message dictionaries with 'role' and 'content'.
-        
+        messages (List[Dict[str, str]]): The conversation, system prompt first.
+        model (str): Model whose budget applies.
+
     Returns:
-        List[Dict[str, str]]: The response from the LLM.
+        Tuple[List[Dict[str, str]], ContextStats]: The messages to send and the trimming stats.
     """
-    # litellm is model-agnostic; we only need to supply the model name and key.
+    budget = context_budget(model)
+    system, turns = (messages[0], messages[1:]) if messages and messages[0]["role"] == "system" else (None, messages)
+    system_tokens = count_message_tokens(model, system["content"]) if system else 0
+    counts = [count_message_tokens(model, message["content"]) for message in turns]
+    before = system_tokens + sum(counts)
+    if before <= budget:
+        stats = ContextStats(before, before, 0, budget)
+        last_context_stats.set(stats)
+        return messages, stats
+
+    # Keep the newest messages that fit next to the system prompt.
+    available = budget - system_tokens
+    keep_from, used = len(turns), 0
+    while keep_from > 0 and (used + counts[keep_from - 1] <= available or keep_from == len(turns)):
+        keep_from -= 1
+        used += counts[keep_from]
+    # Providers expect the conversation to resume with a user turn.
+    while keep_from < len(turns) - 1 and turns[keep_from]["role"] != "user":
+        used -= counts[keep_from]
+        keep_from += 1
+
+    # The summary message costs its header and per-message overhead on top of its lines.
+    summary = _summarize_dropped(
+        turns[:keep_from], available - used - count_message_tokens(model, _SUMMARY_HEADER), model
+    )
+    trimmed = turns[keep_from:]
+    after = system_tokens + used
+    if system is not None:
+        if summary:
+            content = _SUMMARY_HEADER + "\n" + "\n".join(summary)
+            trimmed = [{"role": "system", "content": content}] + trimmed
+            after += count_message_tokens(model, content)
+        trimmed = [system] + trimmed
+
+    stats = ContextStats(before, after, keep_from, budget)
+    last_context_stats.set(stats)
+    logger.debug("Trimmed prompt from %d to %d tokens (%d messages dropped)", before, after, keep_from)
+    return trimmed, stats
+
+
+def with_system_prompt(messages: List[Dict[str, str]]) -> List[Dict[str, str]]:
+    """Ensure the system prompt is the first message of the conversation."""
     # The first message is assumed to be the system prompt if not explicitly provided
     # or if the history is empty. We'll ensure the system prompt is always first.
-    current_messages: List[Dict[str, str]]
     if not messages or messages[0]["role"] != "system":
-        current_messages = [{"role": "system", "content": SYSTEM_PROMPT}] + messages
-    else:
-        current_messages = messages
+        return [{"role": "system", "content": SYSTEM_PROMPT}] + messages
+    return messages
 
-    completion = litellm.completion(
-        model=MODEL_NAME,
-        messages=current_messages
-    )
 
+def with_player_facts(messages: List[Dict[str, str]]) -> List[Dict[str, str]]:
+    """Add the knowledge base's facts about the players the last user message asks about.
+
+    The facts go into the prompt copy of that message only; the returned
+    history keeps what the user wrote.
+    """
+    if not messages or messages[-1]["role"] != "user":
+        return messages
+    with stage("retrieval"):
+        facts = player_facts(messages[-1]["content"])
+    if not facts:
+        return messages
+    content = messages[-1]["content"] + "\n\n" + _PLAYER_FACTS_HEADER + "\n" + "\n".join(f"- {fact}" for fact in facts)
+    return messages[:-1] + [{**messages[-1], "content": content}]
+
+
+def _append_reply(current_messages: List[Dict[str, str]], completion: Any) -> List[Dict[str, str]]:
+    """Append the assistant's reply from ``completion`` to the history."""
     assistant_reply_content: str = (
         completion["choices"][0]["message"]["content"] # type: ignore
         .strip()
     )
-    # Append assistant's response to the history
-    updated_messages = current_messages + [{"role": "assistant", "content": assistant_reply_content}]
-    return updated_messages 
+    return current_messages + [{"role": "assistant", "content": assistant_reply_content}]
+
+
+class RetryPolicy(NamedTuple):
+    """Timeouts, retries, fallback models and hedging applied to every LLM call."""
+
+    timeout: float = LLM_TIMEOUT
+    max_retries: int = LLM_MAX_RETRIES
+    backoff: float = LLM_RETRY_BACKOFF
+    backoff_max: float = LLM_RETRY_BACKOFF_MAX
+    fallback_models: Tuple[str, ...] = LLM_FALLBACK_MODELS
+    hedge_percentile: Optional[float] = LLM_HEDGE_PERCENTILE
+    hedge_min_samples: int = LLM_HEDGE_MIN_SAMPLES
+    model: str = MODEL_NAME
+
+    @property
+    def models(self) -> Tuple[str, ...]:
+        """``model`` followed by the fallback models, in the order they are tried."""
+        return (self.model,) + tuple(model for model in self.fallback_models if model != self.model)
+
+
+DEFAULT_RETRY_POLICY: Final[RetryPolicy] = RetryPolicy()
+
+# Counters of the retry policy, reported by ``GET /llm/stats``.
+call_stats: Dict[str, int] = {
+    "attempts": 0,
+    "retries": 0,
+    "timeouts": 0,
+    "fallbacks": 0,
+    "hedges": 0,
+    "hedge_wins": 0,
+    "failures": 0,
+}
+# model -> latencies of its recent successful attempts, in seconds.
+_latencies: Dict[str, Deque[float]] = {}
+
+
+def is_retryable(exc: BaseException) -> bool:
+    """True for timeouts, connection errors, 408/409/429 and 5xx responses."""
+    if isinstance(exc, (asyncio.TimeoutError, httpx.TransportError)):
+        return True
+    status_code = getattr(exc, "status_code", None)
+    return isinstance(status_code, int) and (status_code in _RETRYABLE_STATUSES or status_code >= 500)
+
+
+def backoff_delay(policy: RetryPolicy, retry: int) -> float:
+    """Seconds to sleep before retry number ``retry`` (0-based): full-jitter exponential backoff."""
+    return random.uniform(0.0, min(policy.backoff_max, policy.backoff * 2 ** retry))
+
+
+def hedge_delay(model: str, policy: RetryPolicy = DEFAULT_RETRY_POLICY) -> Optional[float]:
+    """Seconds after which a hedged request is sent to ``model``, or ``None`` to not hedge."""
+    samples = _latencies.get(model)
+    if policy.hedge_percentile is None or samples is None or len(samples) < policy.hedge_min_samples:
+        return None
+    ordered = sorted(samples)
+    return ordered[min(int(len(ordered) * policy.hedge_percentile), len(ordered) - 1)]
+
+
+def model_api_base(model: str) -> Optional[str]:
+    """``LLM_API_BASE`` only applies to models served by the provider of ``MODEL_NAME``."""
+    if API_BASE is None or model == MODEL_NAME:
+        return API_BASE
+    provider = MODEL_NAME.split("/", 1)[0] if "/" in MODEL_NAME else "openai"
+    return API_BASE if model.startswith(f"{provider}/") else None
+
+
+async def _timed(
+    attempt: Callable[[str, List[Dict[str, str]]], Awaitable[T]], model: str, prompt_messages: List[Dict[str, str]]
+) -> T:
+    """Run one attempt and record its latency for :func:`hedge_delay`."""
+    call_stats["attempts"] += 1
+    start = time.monotonic()
+    result = await attempt(model, prompt_messages)
+    _latencies.setdefault(model, deque(maxlen=_LATENCY_SAMPLES)).append(time.monotonic() - start)
+    return result
+
+
+async def _hedged(call: Callable[[], Awaitable[T]], delay: Optional[float]) -> T:
+    """Run ``call``; if it has not finished after ``delay`` seconds, race a second one.
+
+    The first successful result wins and the other attempt is cancelled. If
+    both fail, the last error is raised.
+    """
+    if delay is None:
+        return await call()
+    tasks = [asyncio.ensure_future(call())]
+    try:
+        done, _ = await asyncio.wait(tasks, timeout=delay)
+        if not done:
+            call_stats["hedges"] += 1
+            tasks.append(asyncio.ensure_future(call()))
+        error: Optional[BaseException] = None
+        pending = set(tasks)
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                error = task.exception()
+                if error is None:
+                    if task is not tasks[0]:
+                        call_stats["hedge_wins"] += 1
+                    return task.result()
+        assert error is not None
+        raise error
+    finally:
+        for task in tasks:
+            task.cancel()
+
+
+# Models whose provider rejected cache breakpoints; they are sent plain text.
+_no_cache_breakpoints: Set[str] = set()
+
+
+def uses_cache_breakpoints(model: str, mode: str = PROMPT_CACHING) -> bool:
+    """True if prompts for ``model`` are sent with ``cache_control`` breakpoints under ``mode``."""
+    if mode == "off" or model in _no_cache_breakpoints:
+        return False
+    return mode == "on" or model.startswith("anthropic/") or "claude" in model
+
+
+def _with_cache_control(message: Dict[str, Any]) -> Dict[str, Any]:
+    """Turn a text message into a content block marked as a cache breakpoint."""
+    block = {"type": "text", "text": message["content"], "cache_control": {"type": "ephemeral"}}
+    return {**message, "content": [block]}
+
+
+def _without_cache_control(messages: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """Undo :func:`with_cache_breakpoints`."""
+    return [
+        {**message, "content": "".join(block["text"] for block in message["content"])}
+        if isinstance(message["content"], list) else message
+        for message in messages
+    ]
+
+
+def with_cache_breakpoints(messages: List[Dict[str, Any]], model: str, prompt_tokens: int) -> List[Dict[str, Any]]:
+    """Mark the stable prefixes of a prompt for provider-side caching.
+
+    The system prompt is the same for every call, so it always gets a
+    breakpoint. Conversations of at least ``PROMPT_CACHE_MIN_TOKENS`` also get
+    one on the message before the latest user turn: the next turn repeats
+    everything up to there as its prefix and reads it from the cache. The
+    latest user turn itself is not marked because its prompt copy carries
+    player facts that the stored history does not. Prompts for models without
+    explicit caching are returned unchanged.
+    """
+    if not messages or not uses_cache_breakpoints(model):
+        return messages
+    marked = list(messages)
+    if marked[0]["role"] == "system":
+        marked[0] = _with_cache_control(marked[0])
+    last = len(marked) - 2 if marked[-1]["role"] == "user" else len(marked) - 1
+    if last > 0 and prompt_tokens >= PROMPT_CACHE_MIN_TOKENS:
+        marked[last] = _with_cache_control(marked[last])
+    return marked
+
+
+def _rejects_cache_control(exc: BaseException) -> bool:
+    return getattr(exc, "status_code", None) == 400 and "cache_control" in str(exc)
+
+
+def _stop_cache_breakpoints(model: str, exc: BaseException) -> bool:
+    """Remember that ``model`` rejected cache breakpoints; True if the call should be repeated."""
+    if not _rejects_cache_control(exc) or model in _no_cache_breakpoints:
+        return False
+    logger.warning("%s rejected prompt cache breakpoints; sending plain prompts from now on", model)
+    _no_cache_breakpoints.add(model)
+    return True
+
+
+def _cache_lookup(model: str, prompt_messages: List[Dict[str, Any]], kwargs: Dict[str, Any]) -> Tuple[Optional[str], Any]:
+    """Key and recorded completion of a call in the LLM cache; ``(None, None)`` when it is off.
+
+    Streaming calls are not cached.
+
+    Raises:
+        LLMCacheMiss: On a miss in ``replay`` mode.
+    """
+    cache = get_llm_cache()
+    if cache is None or kwargs.get("stream"):
+        return None, None
+    key = llm_cache_key(model, prompt_messages, **kwargs)
+    data = cache.get(key)
+    if data is None:
+        return key, None
+    response = _litellm().ModelResponse(**data)
+    # Replayed completions cost nothing; see _record_usage.
+    response._hidden_params["cache_hit"] = True
+    return key, response
+
+
+def _cache_store(key: Optional[str], model: str, response: Any) -> None:
+    cache = get_llm_cache()
+    if key is not None and cache is not None:
+        cache.set(key, model, response.model_dump())
+
+
+def _completion(model: str, prompt_messages: List[Dict[str, Any]], **kwargs: Any) -> Any:
+    """``litellm.completion`` through the LLM cache, without litellm's own retries."""
+    key, cached = _cache_lookup(model, prompt_messages, kwargs)
+    if cached is not None:
+        return cached
+    response = _provider_completion(model, prompt_messages, **kwargs)
+    _cache_store(key, model, response)
+    return response
+
+
+async def _acompletion(model: str, prompt_messages: List[Dict[str, Any]], **kwargs: Any) -> Any:
+    """Async counterpart of :func:`_completion`."""
+    key, cached = _cache_lookup(model, prompt_messages, kwargs)
+    if cached is not None:
+        return cached
+    response = await _aprovider_completion(model, prompt_messages, **kwargs)
+    _cache_store(key, model, response)
+    return response
+
+
+def _provider_completion(model: str, prompt_messages: List[Dict[str, Any]], **kwargs: Any) -> Any:
+    """``litellm.completion`` without litellm's own retries (the policy is the only one).
+
+    If the provider rejects the cache breakpoints, the call is repeated without them.
+    """
+    try:
+        return _litellm().completion(
+            model=model, messages=prompt_messages, api_base=model_api_base(model), max_retries=0, **kwargs
+        )
+    except Exception as exc:
+        if not _stop_cache_breakpoints(model, exc):
+            raise
+        return _litellm().completion(
+            model=model,
+            messages=_without_cache_control(prompt_messages),
+            api_base=model_api_base(model),
+            max_retries=0,
+            **kwargs,
+        )
+
+
+async def _aprovider_completion(model: str, prompt_messages: List[Dict[str, Any]], **kwargs: Any) -> Any:
+    """Async counterpart of :func:`_provider_completion`."""
+    try:
+        return await _litellm().acompletion(
+            model=model, messages=prompt_messages, api_base=model_api_base(model), max_retries=0, **kwargs
+        )
+    except Exception as exc:
+        if not _stop_cache_breakpoints(model, exc):
+            raise
+        return await _litellm().acompletion(
+            model=model,
+            messages=_without_cache_control(prompt_messages),
+            api_base=model_api_base(model),
+            max_retries=0,
+            **kwargs,
+        )
+
+
+def _record_usage(model: str, response: Any) -> None:
+    """Count the tokens the provider reported for a call.
+
+    Prompt tokens are split into the ones read from the provider's prompt
+    cache and the ones processed from scratch; cache writes are counted too.
+    Calls not replayed from the LLM cache are also charged to the current
+    usage account (:mod:`backend.usage`).
+    """
+    usage = getattr(response, "usage", None)
+    if usage is None:
+        return
+    details = getattr(usage, "prompt_tokens_details", None)
+    cached = (getattr(details, "cached_tokens", None) if details is not None else None) or (
+        getattr(usage, "cache_read_input_tokens", None) or 0
+    )
+    prompt = usage.prompt_tokens or 0
+    cache_write = getattr(usage, "cache_creation_input_tokens", None) or 0
+    completion = usage.completion_tokens or 0
+    LLM_TOKENS.inc(cached, model=model, kind="prompt_cached")
+    LLM_TOKENS.inc(max(prompt - cached, 0), model=model, kind="prompt_uncached")
+    LLM_TOKENS.inc(cache_write, model=model, kind="prompt_cache_write")
+    LLM_TOKENS.inc(completion, model=model, kind="completion")
+    ledger = get_usage_ledger()
+    if ledger is not None and not getattr(response, "_hidden_params", {}).get("cache_hit"):
+        ledger.record(model, prompt, completion, cached, cache_write)
+
+
+def _key_arguments(kwargs: Dict[str, Any], sample: Optional[int]) -> Dict[str, Any]:
+    return kwargs if sample is None else {**kwargs, "sample": sample}
+
+
+def cached_completion(model: str, messages: List[Dict[str, Any]], sample: Optional[int] = None, **kwargs: Any) -> Any:
+    """The completion the LLM cache recorded for this call, or None (a miss, or the cache is off).
+
+    Takes the arguments of :func:`acompletion`, which makes the call on a miss.
+
+    Raises:
+        LLMCacheMiss: On a miss in ``replay`` mode.
+    """
+    return _cache_lookup(model, messages, _key_arguments(kwargs, sample))[1]
+
+
+async def acompletion(
+    model: str,
+    messages: List[Dict[str, Any]],
+    sample: Optional[int] = None,
+    api_base: Optional[str] = None,
+    validate: Optional[Callable[[Any], Any]] = None,
+    **kwargs: Any,
+) -> Any:
+    """One ``litellm.acompletion`` call through the LLM cache, charged to the current usage account.
+
+    For callers with their own retry loop (litellm's retries are off). A
+    recorded completion is returned without a call. Otherwise the provider's
+    usage is recorded (see :func:`_record_usage`) and the response is stored
+    in the cache, unless ``validate(response)`` raises: a reply the caller
+    cannot use is not replayed on its next attempt.
+
+    Args:
+        model (str): The litellm model name.
+        messages (List[Dict[str, Any]]): The prompt.
+        sample (Optional[int]): Tells repeated calls with the same prompt apart in the cache.
+        api_base (Optional[str]): The endpoint; ``LLM_API_BASE`` for the provider of ``MODEL_NAME`` by default.
+        validate (Optional[Callable[[Any], Any]]): Raises if the response is unusable.
+        **kwargs: Further ``litellm.acompletion`` arguments, part of the cache key.
+    """
+    key, cached = _cache_lookup(model, messages, _key_arguments(kwargs, sample))
+    if cached is not None:
+        return cached
+    response = await _litellm().acompletion(
+        model=model,
+        messages=messages,
+        api_base=api_base if api_base is not None else model_api_base(model),
+        max_retries=0,
+        **kwargs,
+    )
+    _record_usage(model, response)
+    if validate is not None:
+        validate(response)
+    _cache_store(key, model, response)
+    return response
+
+
+async def _call_with_policy(
+    attempt: Callable[[str, List[Dict[str, str]]], Awaitable[T]],
+    messages: List[Dict[str, str]],
+    policy: RetryPolicy,
+    hedge: bool,
+) -> T:
+    """Run ``attempt(model, prompt_messages)`` with retries, then each fallback model.
+
+    Retryable errors are retried on the same model with backoff; any error
+    that remains moves on to the next model. The last error is raised once
+    every model has failed.
+    """
+    error: Optional[BaseException] = None
+    for index, model in enumerate(policy.models):
+        if index:
+            call_stats["fallbacks"] += 1
+            logger.warning("Falling back to %s after: %s", model, error)
+        # The prompt is fitted per model because their context budgets differ.
+        with stage("fit_context"):
+            prompt_messages, stats = fit_context(messages, model)
+            prompt_messages = with_cache_breakpoints(prompt_messages, model, stats.prompt_tokens_after)
+        for retry in range(policy.max_retries + 1):
+            if retry:
+                call_stats["retries"] += 1
+                await asyncio.sleep(backoff_delay(policy, retry - 1))
+
+            def call() -> Awaitable[T]:
+                return asyncio.wait_for(_timed(attempt, model, prompt_messages), policy.timeout)
+
+            try:
+                with stage("provider"):
+                    return await _hedged(call, hedge_delay(model, policy) if hedge else None)
+            except Exception as exc:
+                error = exc
+                LLM_ERRORS.inc(model=model, type=type(exc).__name__)
+                if isinstance(exc, asyncio.TimeoutError):
+                    call_stats["timeouts"] += 1
+                if not is_retryable(exc):
+                    break
+    call_stats["failures"] += 1
+    assert error is not None
+    raise error
+
+
+def routed_prompt(
+    current_messages: List[Dict[str, str]], policy: RetryPolicy
+) -> Tuple[Optional[List[Dict[str, str]]], RetryPolicy, Dict[str, Any]]:
+    """Route a conversation: the prompt to send, the policy and extra completion arguments.
+
+    The prompt is None for out-of-scope questions, which get ``CANNED_REPLY``.
+    Questions routed to a clarification go to ``ROUTER_CHEAP_MODEL`` with a
+    short reply limit. The agent functions below send exactly this request;
+    callers building requests for another transport (e.g. a Batch API job)
+    should too.
+    """
+    with stage("route"):
+        route = get_router().route(current_messages)
+    if route.name == OUT_OF_SCOPE:
+        return None, policy, {}
+    prompt = with_player_facts(current_messages)
+    if route.name != CLARIFY:
+        return prompt, policy, {}
+    # The instructions follow the system prompt so that it stays cacheable.
+    prompt = prompt[:1] + [{"role": "system", "content": _CLARIFY_INSTRUCTIONS}] + prompt[1:]
+    cheap = policy._replace(model=ROUTER_CHEAP_MODEL, fallback_models=(policy.model,) + policy.fallback_models)
+    return prompt, cheap, {"max_tokens": ROUTER_CLARIFY_MAX_TOKENS}
+
+
+def get_agent_response(
+    messages: List[Dict[str, str]], policy: RetryPolicy = DEFAULT_RETRY_POLICY
+) -> List[Dict[str, str]]:
+    """
+    Generate a response from the LLM based on the provided messages.
+
+    The first question of a conversation is routed (see :mod:`backend.router`):
+    out-of-scope questions get a canned reply without an LLM call and
+    ambiguous ones a short clarification from ``ROUTER_CHEAP_MODEL``. Calls
+    are refused with :class:`~backend.usage.TokenBudgetExceeded` once the
+    current usage account has used its token budget.
+
+    Args:
+        messages (List[Dict[str, str]]): A list of message dictionaries with 'role' and 'content'.
+        policy (RetryPolicy): Timeouts, retries and fallback models; hedging is async-only.
+        
+    Returns:
+        List[Dict[str, str]]: The response from the LLM.
+    """
+    # litellm is model-agnostic; we only need to supply the model name and key.
+    # Older turns may be trimmed from the prompt, but the returned history is complete.
+    current_messages = with_system_prompt(messages)
+    prompt, policy, completion_kwargs = routed_prompt(current_messages, policy)
+    if prompt is None:
+        return current_messages + [{"role": "assistant", "content": CANNED_REPLY}]
+    check_budget()
+
+    error: Optional[BaseException] = None
+    for index, model in enumerate(policy.models):
+        if index:
+            call_stats["fallbacks"] += 1
+            logger.warning("Falling back to %s after: %s", model, error)
+        with stage("fit_context"):
+            prompt_messages, stats = fit_context(prompt, model)
+            prompt_messages = with_cache_breakpoints(prompt_messages, model, stats.prompt_tokens_after)
+        for retry in range(policy.max_retries + 1):
+            if retry:
+                call_stats["retries"] += 1
+                time.sleep(backoff_delay(policy, retry - 1))
+            call_stats["attempts"] += 1
+            try:
+                with stage("provider"):
+                    completion = _completion(model, prompt_messages, timeout=policy.timeout, **completion_kwargs)
+            except Exception as exc:
+                error = exc
+                LLM_ERRORS.inc(model=model, type=type(exc).__name__)
+                if not is_retryable(exc):
+                    break
+            else:
+                _record_usage(model, completion)
+                # Append assistant's response to the history
+                return _append_reply(current_messages, completion)
+    call_stats["failures"] += 1
+    assert error is not None
+    raise error
+
+
+async def aget_agent_response(
+    messages: List[Dict[str, str]], policy: RetryPolicy = DEFAULT_RETRY_POLICY
+) -> List[Dict[str, str]]:
+    """
+    Async counterpart of :func:`get_agent_response`.
+
+    The call awaits ``litellm.acompletion`` so the event loop keeps serving
+    other requests while the model is generating. Slow attempts are hedged
+    when ``policy.hedge_percentile`` is set.
+
+    Args:
+        messages (List[Dict[str, str]]): A list of message dictionaries with 'role' and 'content'.
+        policy (RetryPolicy): Timeouts, retries, fallback models and hedging.
+
+    Returns:
+        List[Dict[str, str]]: The conversation history with the assistant's reply appended.
+    """
+    current_messages = with_system_prompt(messages)
+    prompt, policy, completion_kwargs = routed_prompt(current_messages, policy)
+    if prompt is None:
+        return current_messages + [{"role": "assistant", "content": CANNED_REPLY}]
+    await acheck_budget()
+    get_async_client()
+
+    async def attempt(model: str, prompt_messages: List[Dict[str, str]]) -> Any:
+        completion = await _acompletion(model, prompt_messages, **completion_kwargs)
+        _record_usage(model, completion)
+        return completion
+
+    completion = await _call_with_policy(attempt, prompt, policy, hedge=True)
+    return _append_reply(current_messages, completion)
+
+
+async def astream_agent_response(
+    messages: List[Dict[str, str]], policy: RetryPolicy = DEFAULT_RETRY_POLICY
+) -> AsyncIterator[str]:
+    """
+    Stream the assistant's reply as it is generated.
+
+    Retries and fallbacks apply until the first chunk arrives; after that the
+    client has seen output, so a failure ends the stream. Streams are not hedged.
+
+    Args:
+        messages (List[Dict[str, str]]): A list of message dictionaries with 'role' and 'content'.
+        policy (RetryPolicy): Timeouts (until the first chunk), retries and fallback models.
+
+    Yields:
+        str: Content deltas in the order the model produced them.
+    """
+    prompt, policy, completion_kwargs = routed_prompt(with_system_prompt(messages), policy)
+    if prompt is None:
+        yield CANNED_REPLY
+        return
+    await acheck_budget()
+    get_async_client()
+
+    async def open_stream(model: str, prompt_messages: List[Dict[str, str]]) -> Tuple[str, Any, Any]:
+        # Usage is only reported on streams when asked for, in a last chunk.
+        response = await _acompletion(
+            model, prompt_messages, stream=True, stream_options={"include_usage": True}, **completion_kwargs
+        )
+        chunks = response.__aiter__()
+        try:
+            return model, await chunks.__anext__(), chunks
+        except StopAsyncIteration:
+            return model, None, chunks
+
+    model, chunk, chunks = await _call_with_policy(open_stream, prompt, policy, hedge=False)
+    while chunk is not None:
+        # The usage chunk that ends a stream may have no choices at all.
+        delta: Optional[str] = chunk.choices[0].delta.content if chunk.choices else None
+        if delta:
+            yield delta
+        if getattr(chunk, "usage", None) is not None:
+            # Providers that report usage on streams do so in the last chunk.
+            _record_usage(model, chunk)
+        chunk = await anext(chunks, None)
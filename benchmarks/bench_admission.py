@@ -0,0 +1,97 @@
+"""Burst behaviour of the admission control in front of the LLM.
+
+Sends ``--requests`` distinct ``/chat`` requests at once with the LLM limited
+to ``--concurrency`` calls and ``--queue`` waiting requests. Admitted requests
+should finish in roughly ``ceil(admitted / concurrency) * latency``; the rest
+should be rejected immediately with 503 and a ``Retry-After`` header instead
+of timing out. Exits non-zero if a burst larger than ``--concurrency`` plus
+``--queue`` gets no 503, if more requests are admitted than fit, or if a 503
+lacks ``Retry-After``.
+
+Usage::
+
+    python -m benchmarks.bench_admission --requests 40 --concurrency 4 --queue 4
+"""
+
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import time
+from collections import Counter
+from pathlib import Path
+from typing import List, Tuple
+
+sys.path.append(str(Path(__file__).parent.parent))
+
+from benchmarks.fake_llm import FAKE_MODEL, create_app, free_port, serve
+
+
+async def _timed_post(client, i: int) -> Tuple[int, float, str]:
+    start = time.perf_counter()
+    response = await client.post("/chat", json={"messages": [{"role": "user", "content": f"scout report #{i}"}]})
+    return response.status_code, time.perf_counter() - start, response.headers.get("retry-after", "")
+
+
+async def _burst(base_url: str, requests: int) -> List[Tuple[int, float, str]]:
+    import httpx
+
+    async with httpx.AsyncClient(base_url=base_url, timeout=None) as client:
+        await client.post("/chat", json={"messages": [{"role": "user", "content": "warm-up"}]})
+        return await asyncio.gather(*(_timed_post(client, i) for i in range(requests)))
+
+
+def main(argv: List[str] = None) -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=40)
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--queue", type=int, default=4)
+    parser.add_argument("--latency", type=float, default=1.0)
+    args = parser.parse_args(argv)
+
+    llm_port, app_port = free_port(), free_port()
+    os.environ.update(
+        MODEL_NAME=f"openai/{FAKE_MODEL}",
+        LLM_API_BASE=f"http://127.0.0.1:{llm_port}/v1",
+        LLM_MAX_CONCURRENCY=str(args.concurrency),
+        LLM_MAX_QUEUE=str(args.queue),
+        RESPONSE_CACHE_ENABLED="0",
+    )
+    os.environ.setdefault("OPENAI_API_KEY", "fake-key")
+
+    import httpx
+
+    from backend.main import app
+
+    with serve(create_app(args.latency), llm_port), serve(app, app_port) as base_url:
+        results = asyncio.run(_burst(base_url, args.requests))
+        stats = httpx.get(f"{base_url}/admission/stats").json()
+
+    print(f"statuses: {dict(Counter(code for code, _, _ in results))}")
+    for code in sorted({code for code, _, _ in results}):
+        latencies = sorted(elapsed for c, elapsed, _ in results if c == code)
+        retry_after = sorted({ra for c, _, ra in results if c == code and ra})
+        print(f"  {code}: p50 {statistics.median(latencies):.3f}s, max {latencies[-1]:.3f}s"
+              + (f", Retry-After {retry_after}" if retry_after else ""))
+    print(f"admission stats: {stats}")
+
+    failures = []
+    codes = Counter(code for code, _, _ in results)
+    capacity = args.concurrency + args.queue
+    if args.requests > capacity and not codes[503]:
+        failures.append(f"a burst of {args.requests} at concurrency {args.concurrency} and queue {args.queue} "
+                        "was not shed")
+    if codes[200] > capacity:
+        failures.append(f"{codes[200]} requests admitted, at most {capacity} fit")
+    if set(codes) - {200, 503}:
+        failures.append(f"unexpected statuses: {sorted(set(codes) - {200, 503})}")
+    if any(code == 503 and not retry_after for code, _, retry_after in results):
+        failures.append("503 without Retry-After")
+    for failure in failures:
+        print(f"FAIL: {failure}")
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,182 @@
+"""Eval analytics (``evals/analytics.py``) at millions of annotated rows.
+
+Builds an artifact store of ``--rows`` queries and responses (responses and
+annotations mixed from the real ones, ``--annotated`` of the rows annotated),
+then times:
+
+1. the first :meth:`EvalAnalytics.update` and report (every row processed);
+2. an update after a new annotation snapshot of ``--new`` of the rows, which
+   must only match the annotations of that snapshot;
+3. an update when nothing changed;
+4. the per-row loop it replaces (``iterrows()``, ``json.loads`` and one
+   ``re.search`` per failure mode), on ``--loop-rows`` rows, extrapolated.
+
+Exits non-zero if the incremental report differs from one recomputed from
+scratch, the per-row loop disagrees with the vectorized counts, an update
+processes more than it should, or the first update exceeds ``--budget``
+seconds.
+
+Usage::
+
+    python -m benchmarks.bench_analytics --rows 1000000 --budget 10
+"""
+
+import argparse
+import json
+import random
+import re
+import shutil
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import List
+
+import numpy as np
+import pandas as pd
+
+sys.path.append(str(Path(__file__).parent.parent))
+
+from evals.analytics import FAILURE_MODES, EvalAnalytics, annotation_features, report, row_features
+from evals.artifacts import ArtifactStore
+
+EVALS = Path(__file__).parent.parent / "evals"
+
+
+def build_store(root: Path, rows: int, annotated: float, rng: np.random.Generator) -> ArtifactStore:
+    """A store of ``rows`` synthetic rows, ``annotated`` of them annotated in one snapshot."""
+    queries = pd.read_csv(EVALS / "synthetic_queries_for_analysis.csv")
+    dims = [json.loads(text) for text in queries["dimension_tuple_json"]]
+    countries = sorted({d["Country"] for d in dims})
+    skills = [f"{d['PlayerSkills']} ({i})" for i, d in enumerate(dims * 50)]
+    scenarios = sorted({d["Scenario"] for d in dims})
+    # Five queries per tuple, as generate_synthetic_queries.py makes them.
+    tuples = [
+        json.dumps({"Country": str(rng.choice(countries)), "PlayerSkills": str(rng.choice(skills)),
+                    "Scenario": str(rng.choice(scenarios))})
+        for _ in range(rows // 5 + 1)
+    ]
+    ids = pd.Series([f"SYN{i:07d}" for i in range(rows)])
+    store = ArtifactStore(root)
+    store.write_queries(pd.DataFrame({
+        "id": ids,
+        "query": "looking for players",
+        "dimension_tuple_json": np.repeat(tuples, 5)[:rows],
+        "is_realistic_and_kept": 1,
+        "notes_for_filtering": "",
+    }))
+    lines = [
+        line
+        for text in pd.read_csv(EVALS / "open_coding_results.csv")["open_coding_response"]
+        for line in text.splitlines() if line.strip()
+    ]
+    pool = ["\n".join(random.Random(i).sample(lines, int(rng.integers(3, 30)))) for i in range(5000)]
+    store.write_responses(pd.DataFrame({
+        "query_id": ids,
+        "open_coding_response": np.asarray(pool, dtype=object)[rng.integers(0, len(pool), rows)],
+        "latency_s": rng.lognormal(1.0, 0.5, rows),
+    }))
+    picked = rng.random(rows) < annotated
+    store.snapshot_annotations(dict(zip(ids[picked], annotation_texts(int(picked.sum()), rng))), datetime(2025, 6, 1))
+    return store
+
+
+def annotation_texts(count: int, rng: np.random.Generator) -> List[str]:
+    """``count`` annotations: the real ones, a few hundred variants of them, some blank."""
+    notes = [
+        text
+        for path in sorted(EVALS.glob("annotated_results_*.csv"))
+        for text in pd.read_csv(path)["annotations"].dropna()
+    ]
+    variants = [f"{rng.choice(notes)} {rng.choice(notes).lower()}" for _ in range(500)] + notes + [""]
+    return list(np.asarray(variants, dtype=object)[rng.integers(0, len(variants), count)])
+
+
+def loop_counts(store: ArtifactStore, limit: int) -> pd.DataFrame:
+    """Failure-mode counts by Country of the first ``limit`` rows, one row at a time."""
+    frame = store.annotated_results(["query_id", "dimension_tuple_json", "open_coding_response", "annotations"])
+    frame = frame.head(limit)
+    patterns = {name: re.compile(pattern, re.IGNORECASE) for name, pattern in FAILURE_MODES.items()}
+    counts = {}
+    for _, row in frame.iterrows():
+        country = json.loads(row["dimension_tuple_json"])["Country"]
+        totals = counts.setdefault(country, dict.fromkeys(patterns, 0))
+        len(row["open_coding_response"])
+        for name, pattern in patterns.items():
+            totals[name] += bool(pattern.search(row["annotations"] or ""))
+    return pd.DataFrame.from_dict(counts, orient="index").sort_index()
+
+
+def main(argv: List[str] = None) -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=1_000_000)
+    parser.add_argument("--annotated", type=float, default=0.3, help="Share of rows annotated at the start.")
+    parser.add_argument("--new", type=float, default=0.01, help="Share of rows (re-)annotated by the new snapshot.")
+    parser.add_argument("--loop-rows", type=int, default=20_000)
+    parser.add_argument("--budget", type=float, default=10.0, help="Seconds allowed for the first update and report.")
+    args = parser.parse_args(argv)
+
+    rng = np.random.default_rng(0)
+    failures = []
+    with tempfile.TemporaryDirectory() as tmp:
+        start = time.perf_counter()
+        store = build_store(Path(tmp) / "store", args.rows, args.annotated, rng)
+        print(f"store of {args.rows} rows built in {time.perf_counter() - start:.1f}s")
+
+        start = time.perf_counter()
+        analytics = EvalAnalytics(store)
+        parsed, matched = analytics.update()
+        analytics.report()
+        first = time.perf_counter() - start
+        print(f"first update + report: {first:.2f}s ({parsed} queries parsed, {matched} annotations matched)")
+        if first > args.budget:
+            failures.append(f"the first update took {first:.2f}s (budget {args.budget}s)")
+
+        previous = store.snapshots()[-1].stem
+        new = rng.choice(args.rows, int(args.rows * args.new), replace=False)
+        ids = [f"SYN{i:07d}" for i in new]
+        store.snapshot_annotations(dict(zip(ids, annotation_texts(len(ids), rng))), datetime(2025, 6, 1) + timedelta(days=1))
+        expected = len(store.annotations(since=previous))
+        start = time.perf_counter()
+        analytics = EvalAnalytics(store)
+        parsed, matched = analytics.update()
+        incremental = analytics.report()
+        elapsed = time.perf_counter() - start
+        print(f"update after a snapshot of {len(ids)} annotations + report: {elapsed:.2f}s "
+              f"({parsed} queries parsed, {matched} annotations matched)")
+        if parsed or matched != expected:
+            failures.append(f"the incremental update parsed {parsed} queries and matched {matched} annotations "
+                            f"(expected 0 and {expected})")
+
+        start = time.perf_counter()
+        unchanged = EvalAnalytics(store).update()
+        print(f"update with nothing new: {(time.perf_counter() - start) * 1e3:.0f} ms {unchanged}")
+        if unchanged != (0, 0):
+            failures.append(f"an update with nothing new processed {unchanged}")
+
+        shutil.rmtree(analytics.dir)
+        scratch = EvalAnalytics(store)
+        scratch.update()
+        for name, table in scratch.report().items():
+            if not table.equals(incremental[name]):
+                failures.append(f"the incremental {name} report differs from one recomputed from scratch")
+
+        start = time.perf_counter()
+        looped = loop_counts(store, args.loop_rows)
+        loop = (time.perf_counter() - start) / args.loop_rows * args.rows
+        head = store.annotated_results(["query_id", "dimension_tuple_json", "open_coding_response", "annotations"])
+        head = head.head(args.loop_rows)
+        vectorized = report(row_features(head), annotation_features(head), ["Country"])["failure_modes"]
+        vectorized = vectorized.loc["Country", list(FAILURE_MODES)].sort_index()
+        print(f"per-row loop: {loop:.1f}s estimated for {args.rows} rows (measured on {args.loop_rows})")
+        if not np.array_equal(vectorized.to_numpy(), looped.loc[vectorized.index].to_numpy()):
+            failures.append("the per-row loop counts differ from the vectorized ones")
+
+    for failure in failures:
+        print(f"FAIL: {failure}")
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
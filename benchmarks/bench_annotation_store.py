@@ -0,0 +1,157 @@
+"""The annotation tool's SQLite store (``evals/annotation_store.py``) at 100k rows.
+
+The open coding results are repeated (with new ids) to ``--rows`` rows and:
+
+1. imported into the store, then loaded again (the tool's "Load Data"),
+   compared with reading the whole CSV as the tool used to;
+2. read record by record at random positions and annotated, timing each
+   step of an annotator's click;
+3. annotated by ``--annotators`` processes at once, each SIGKILLed after its
+   saves: every annotation must be in the store afterwards;
+4. exported to CSV, streamed: the peak memory is reported against the
+   CSV's size.
+
+Exits non-zero if a check fails or the p99 of a click exceeds ``--budget-ms``.
+
+Usage::
+
+    python -m benchmarks.bench_annotation_store --rows 100000 --annotators 4
+"""
+
+import argparse
+import multiprocessing
+import random
+import sys
+import tempfile
+import time
+import tracemalloc
+from pathlib import Path
+from typing import List
+
+import pandas as pd
+
+sys.path.append(str(Path(__file__).parent.parent))
+
+from evals.annotation_store import AnnotationStore
+
+RESULTS_CSV = Path(__file__).parent.parent / "evals" / "open_coding_results.csv"
+
+
+def _percentiles(samples: List[float]) -> str:
+    samples = sorted(samples)
+    return f"p50 {samples[len(samples) // 2]:.2f} ms, p99 {samples[int(len(samples) * 0.99)]:.2f} ms"
+
+
+def _annotate(db: str, worker: int, rows: int, saves: int, done) -> None:
+    """Annotate ``saves`` records of this worker's stripe, then wait to be killed."""
+    store = AnnotationStore(Path(db))
+    for i in range(saves):
+        index = (worker + i * 7919) % rows
+        record = store.record(index)
+        store.save(record["query_id"], f"worker {worker} note {i}")
+    done.set()
+    time.sleep(60)
+
+
+def main(argv: List[str] = None) -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=100_000)
+    parser.add_argument("--clicks", type=int, default=2_000)
+    parser.add_argument("--annotators", type=int, default=4)
+    parser.add_argument("--saves", type=int, default=500, help="Saves per annotator process.")
+    parser.add_argument("--budget-ms", type=float, default=20.0)
+    args = parser.parse_args(argv)
+
+    rng = random.Random(0)
+    failures = []
+    with tempfile.TemporaryDirectory() as tmp:
+        tmp = Path(tmp)
+        results = pd.read_csv(RESULTS_CSV)
+        frame = pd.concat([results] * (args.rows // len(results) + 1), ignore_index=True).head(args.rows)
+        frame["query_id"] = [f"ROW{i + 1:06d}" for i in range(args.rows)]
+        csv_path = tmp / "open_coding_results.csv"
+        frame.to_csv(csv_path, index=False)
+        del frame
+
+        start = time.perf_counter()
+        pd.read_csv(csv_path)
+        whole = time.perf_counter() - start
+        store = AnnotationStore(tmp / "annotations.sqlite3")
+        start = time.perf_counter()
+        count = store.import_records(csv_path)
+        imported = time.perf_counter() - start
+        start = time.perf_counter()
+        store.import_records(csv_path)
+        reloaded = time.perf_counter() - start
+        print(f"{count} rows ({csv_path.stat().st_size / 1e6:.0f} MB CSV): whole-CSV read {whole:.2f}s; "
+              f"store import {imported:.2f}s once, then load {reloaded * 1e3:.1f} ms")
+        if count != args.rows:
+            failures.append(f"imported {count} of {args.rows} rows")
+
+        fetch, save, stats = [], [], []
+        for _ in range(args.clicks):
+            index = rng.randrange(args.rows)
+            start = time.perf_counter()
+            record = store.record(index)
+            fetch.append((time.perf_counter() - start) * 1e3)
+            start = time.perf_counter()
+            store.save(record["query_id"], f"note on {record['query_id']}")
+            save.append((time.perf_counter() - start) * 1e3)
+        for _ in range(50):
+            start = time.perf_counter()
+            store.progress()
+            stats.append((time.perf_counter() - start) * 1e3)
+        print(f"record fetch: {_percentiles(fetch)}; save: {_percentiles(save)}; stats: {_percentiles(stats)}")
+        for name, samples in (("record fetch", fetch), ("save", save), ("stats", stats)):
+            if sorted(samples)[int(len(samples) * 0.99)] > args.budget_ms:
+                failures.append(f"{name} p99 is over {args.budget_ms} ms")
+
+        context = multiprocessing.get_context("spawn")
+        events = [context.Event() for _ in range(args.annotators)]
+        workers = [
+            context.Process(target=_annotate, args=(str(store.path), worker, args.rows, args.saves, events[worker]))
+            for worker in range(args.annotators)
+        ]
+        start = time.perf_counter()
+        for worker in workers:
+            worker.start()
+        for event in events:
+            event.wait(120)
+        elapsed = time.perf_counter() - start
+        for worker in workers:
+            worker.kill()
+            worker.join()
+        saved = {
+            query_id: text
+            for chunk in store.changed_since(0)
+            for query_id, text, _ in chunk
+            if text.startswith("worker ")
+        }
+        expected = args.annotators * args.saves
+        print(f"{args.annotators} annotator processes x {args.saves} saves in {elapsed:.2f}s, then SIGKILL: "
+              f"{len(saved)}/{expected} annotations in the store")
+        if len(saved) != expected:
+            failures.append(f"{expected - len(saved)} annotations were lost")
+
+        tracemalloc.start()
+        start = time.perf_counter()
+        rows = store.export_csv(tmp / "export.csv")
+        exported = time.perf_counter() - start
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        export = pd.read_csv(tmp / "export.csv", usecols=["query_id", "annotations"], keep_default_na=False)
+        annotated, _ = store.progress()
+        print(f"export: {rows} rows in {exported:.2f}s, peak Python memory {peak / 1e6:.1f} MB "
+              f"for a {(tmp / 'export.csv').stat().st_size / 1e6:.0f} MB CSV; {annotated} annotated")
+        if rows != args.rows or (export["annotations"] != "").sum() != annotated:
+            failures.append("the export does not match the store")
+        if peak > (tmp / "export.csv").stat().st_size / 4:
+            failures.append("the export held a large part of the dataset in memory")
+
+    for failure in failures:
+        print(f"FAIL: {failure}")
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
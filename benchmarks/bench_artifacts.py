@@ -0,0 +1,145 @@
+"""Disk use and load time of the Parquet artifact store vs. the annotation CSVs.
+
+The synthetic queries and responses are repeated (with new ids) to ``--rows``
+rows, then ``--sessions`` annotation sessions each annotate a new slice of
+rows and edit a few earlier annotations. After every session:
+
+* the CSV way (the annotation tool before the store) writes a full
+  ``annotated_results_*.csv`` copy;
+* the store (``evals/artifacts.py``) writes a snapshot of the changed
+  annotations only.
+
+Reports bytes on disk, export time, and the time to load the annotations for
+analysis (the latest CSV vs. a projected read of the store), plus the size
+of the responses table per codec. Exits non-zero if the store's joined view
+differs from the latest CSV, takes more space, or loads slower.
+
+Usage::
+
+    python -m benchmarks.bench_artifacts --rows 20000 --sessions 10
+"""
+
+import argparse
+import random
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import List
+
+import pandas as pd
+
+sys.path.append(str(Path(__file__).parent.parent))
+
+from evals.artifacts import ANNOTATED_RESULTS_COLUMNS, COMPRESSIONS, ArtifactStore
+
+EVALS = Path(__file__).parent.parent / "evals"
+
+
+def _data(rows: int, rng: random.Random):
+    """Queries and responses of ``rows`` rows; each response is a distinct mix of the real responses' lines."""
+    queries = pd.read_csv(EVALS / "synthetic_queries_for_analysis.csv")
+    responses = pd.read_csv(EVALS / "open_coding_results.csv")
+    lines = [line for text in responses["open_coding_response"] for line in text.splitlines() if line.strip()]
+    repeat = rows // len(responses) + 1
+    ids = [f"ROW{i + 1:06d}" for i in range(rows)]
+    queries = pd.concat([queries] * repeat, ignore_index=True).head(rows).assign(id=ids)
+    responses = pd.concat([responses] * repeat, ignore_index=True).head(rows).assign(query_id=ids)
+    responses["open_coding_response"] = ["\n".join(rng.sample(lines, 40)) for _ in range(rows)]
+    return queries, responses
+
+
+def _size(paths) -> int:
+    return sum(path.stat().st_size for path in paths)
+
+
+def main(argv: List[str] = None) -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=20_000)
+    parser.add_argument("--sessions", type=int, default=10)
+    parser.add_argument("--edits", type=float, default=0.1, help="Share of earlier annotations edited per session.")
+    args = parser.parse_args(argv)
+
+    rng = random.Random(0)
+    queries, responses = _data(args.rows, rng)
+    failures = []
+    with tempfile.TemporaryDirectory() as tmp:
+        tmp = Path(tmp)
+        store = ArtifactStore(tmp / "store")
+        store.write_queries(queries)
+        store.write_responses(responses)
+
+        annotations = {}
+        csv_paths, csv_export, store_export = [], 0.0, 0.0
+        per_session = args.rows // args.sessions
+        started = datetime(2025, 6, 1)
+        for session in range(args.sessions):
+            annotated = list(annotations)
+            for query_id in rng.sample(annotated, int(len(annotated) * args.edits)):
+                annotations[query_id] += " (revised)"
+            for query_id in responses["query_id"][session * per_session:(session + 1) * per_session]:
+                annotations[query_id] = f"note {rng.randrange(1000)} on {query_id}"
+            at = started + timedelta(hours=session)
+
+            start = time.perf_counter()
+            export = responses.copy()
+            export["annotations"] = export["query_id"].map(annotations).fillna("")
+            export["annotation_timestamp"] = at.strftime("%Y-%m-%d %H:%M:%S")
+            path = tmp / f"annotated_results_{at:%Y%m%d_%H%M%S}.csv"
+            export.to_csv(path, index=False)
+            csv_paths.append(path)
+            csv_export += time.perf_counter() - start
+
+            start = time.perf_counter()
+            store.snapshot_annotations(annotations, at)
+            store_export += time.perf_counter() - start
+
+        csv_bytes = _size(csv_paths)
+        store_bytes = _size(store.root.rglob("*.parquet"))
+        snapshot_bytes = _size(store.snapshots())
+        print(f"{args.rows} rows, {args.sessions} sessions")
+        print(f"disk:   CSV exports {csv_bytes / 1e6:.1f} MB; store {store_bytes / 1e6:.1f} MB "
+              f"({snapshot_bytes / 1e6:.2f} MB of snapshots)")
+        print(f"export: CSV {csv_export / args.sessions * 1e3:.0f} ms/session; "
+              f"store {store_export / args.sessions * 1e3:.0f} ms/session")
+
+        start = time.perf_counter()
+        from_csv = pd.read_csv(csv_paths[-1])[["query_id", "annotations"]]
+        csv_load = time.perf_counter() - start
+        start = time.perf_counter()
+        from_store = store.annotated_results(["query_id", "annotations"])
+        store_load = time.perf_counter() - start
+        start = time.perf_counter()
+        full = store.annotated_results()
+        full_load = time.perf_counter() - start
+        print(f"load annotations: latest CSV {csv_load * 1e3:.0f} ms; store, projected {store_load * 1e3:.0f} ms "
+              f"(all columns joined: {full_load * 1e3:.0f} ms)")
+
+        latest = pd.read_csv(csv_paths[-1]).fillna("")
+        for column in ANNOTATED_RESULTS_COLUMNS[:-1]:
+            if not latest[column].astype(str).equals(full[column].fillna("").astype(str)):
+                failures.append(f"the store's {column} differs from the latest CSV export")
+        if not from_csv["annotations"].fillna("").equals(from_store["annotations"]):
+            failures.append("the projected annotations differ from the latest CSV export")
+        if store_bytes >= csv_bytes:
+            failures.append("the store takes more space than the CSV exports")
+        if store_load >= csv_load:
+            failures.append("loading the annotations from the store is slower than from the CSV")
+
+        sizes = []
+        for codec in COMPRESSIONS:
+            path = ArtifactStore(tmp / codec, codec).write_responses(responses)
+            start = time.perf_counter()
+            ArtifactStore(tmp / codec).responses()
+            sizes.append(f"{codec} {path.stat().st_size / 1e6:.2f} MB / {(time.perf_counter() - start) * 1e3:.0f} ms")
+        responses.to_csv(tmp / "responses.csv", index=False)
+        print(f"responses table: {'; '.join(sizes)} (CSV {(tmp / 'responses.csv').stat().st_size / 1e6:.2f} MB)")
+
+    for failure in failures:
+        print(f"FAIL: {failure}")
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,85 @@
+"""Concurrent throughput of ``/chat`` against a fixed-latency fake LLM.
+
+Compares the old behaviour (the blocking ``get_agent_response`` called from
+inside the event loop) with the async ``aget_agent_response`` path now used
+by ``chat_endpoint``. With a blocking call the throughput stays flat at
+``1 / latency``; with the async path it grows with the number of in-flight
+requests.
+
+Usage::
+
+    python -m benchmarks.bench_async_chat --latency 0.5 --concurrency 1 4 16 64
+"""
+
+import argparse
+import asyncio
+import os
+import sys
+import time
+from pathlib import Path
+from typing import List
+
+sys.path.append(str(Path(__file__).parent.parent))
+
+from benchmarks.fake_llm import FAKE_MODEL, create_app, free_port, serve
+
+
+async def _run_blocking(concurrency: int) -> float:
+    """Old endpoint behaviour: sync LLM call inside a coroutine."""
+    from backend.utils import get_agent_response
+
+    async def one() -> None:
+        get_agent_response([{"role": "user", "content": "compare Pedri and Gavi"}])
+
+    start = time.perf_counter()
+    await asyncio.gather(*(one() for _ in range(concurrency)))
+    return time.perf_counter() - start
+
+
+async def _run_async(concurrency: int) -> float:
+    """Current endpoint behaviour, exercised through the ASGI app."""
+    import httpx
+
+    from backend.main import app
+
+    transport = httpx.ASGITransport(app=app)
+    payload = {"messages": [{"role": "user", "content": "compare Pedri and Gavi"}]}
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=None) as client:
+        start = time.perf_counter()
+        responses = await asyncio.gather(*(client.post("/chat", json=payload) for _ in range(concurrency)))
+        elapsed = time.perf_counter() - start
+    assert all(r.status_code == 200 for r in responses), [r.text for r in responses if r.status_code != 200]
+    return elapsed
+
+
+def main(argv: List[str] = None) -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--latency", type=float, default=0.5, help="Fake LLM latency in seconds.")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 4, 16, 64])
+    args = parser.parse_args(argv)
+
+    port = free_port()
+    # The backend reads its configuration at import time.
+    os.environ["MODEL_NAME"] = f"openai/{FAKE_MODEL}"
+    os.environ["LLM_API_BASE"] = f"http://127.0.0.1:{port}/v1"
+    os.environ.setdefault("OPENAI_API_KEY", "fake-key")
+    # Identical requests would otherwise be cache hits or coalesced into one call.
+    os.environ["RESPONSE_CACHE_ENABLED"] = "0"
+    os.environ["SEMANTIC_CACHE_ENABLED"] = "0"
+    os.environ["LLM_CACHE_MODE"] = "off"
+
+    with serve(create_app(latency=args.latency), port):
+        asyncio.run(_report(args.concurrency))
+
+
+async def _report(levels: List[int]) -> None:
+    """Print the throughput of both modes at every concurrency level."""
+    print(f"{'mode':<10}{'in-flight':>10}{'seconds':>10}{'req/s':>10}")
+    for mode, runner in (("blocking", _run_blocking), ("async", _run_async)):
+        await runner(1)  # Warm-up: imports litellm and opens connections.
+        for concurrency in levels:
+            elapsed = await runner(concurrency)
+            print(f"{mode:<10}{concurrency:>10}{elapsed:>10.2f}{concurrency / elapsed:>10.1f}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,78 @@
+"""Single-flight check: N identical concurrent ``/chat`` requests, one upstream call.
+
+Fires ``--requests`` identical requests at once against a fake LLM and
+verifies that the fake saw exactly one completion call, then repeats with a
+failing provider and verifies that every request received the error. Exits
+non-zero if either check fails.
+
+Usage::
+
+    python -m benchmarks.bench_coalescing --requests 50
+"""
+
+import argparse
+import asyncio
+import os
+import sys
+import time
+from pathlib import Path
+from typing import List
+
+sys.path.append(str(Path(__file__).parent.parent))
+
+from benchmarks.fake_llm import FAKE_MODEL, create_app, free_port, serve
+
+
+async def _burst(base_url: str, requests: int, content: str) -> List[int]:
+    """Send ``requests`` identical chat requests at once and return their status codes."""
+    import httpx
+
+    payload = {"messages": [{"role": "user", "content": content}]}
+    async with httpx.AsyncClient(base_url=base_url, timeout=None) as client:
+        responses = await asyncio.gather(*(client.post("/chat", json=payload) for _ in range(requests)))
+    return [response.status_code for response in responses]
+
+
+def main(argv: List[str] = None) -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=50)
+    parser.add_argument("--latency", type=float, default=0.5)
+    args = parser.parse_args(argv)
+
+    llm_port, app_port = free_port(), free_port()
+    os.environ["MODEL_NAME"] = f"openai/{FAKE_MODEL}"
+    os.environ["LLM_API_BASE"] = f"http://127.0.0.1:{llm_port}/v1"
+    os.environ.setdefault("OPENAI_API_KEY", "fake-key")
+    # Coalescing is what is measured here, not the semantic cache.
+    os.environ["SEMANTIC_CACHE_ENABLED"] = "0"
+
+    from backend.main import app
+
+    failures = []
+    fake = create_app(args.latency)
+    with serve(fake, llm_port), serve(app, app_port) as base_url:
+        asyncio.run(_burst(base_url, 1, "warm-up"))
+        fake.state.calls = 0
+        start = time.perf_counter()
+        codes = asyncio.run(_burst(base_url, args.requests, "compare Pedri and Gavi"))
+        elapsed = time.perf_counter() - start
+        print(f"{args.requests} identical requests: {fake.state.calls} upstream call(s), "
+              f"statuses {sorted(set(codes))}, {elapsed:.2f}s")
+        if fake.state.calls != 1 or set(codes) != {200}:
+            failures.append("successful burst was not served by exactly one upstream call")
+
+        # 400 is not retried, so one failing call stays one upstream call.
+        fake.state.calls, fake.state.error_rate, fake.state.error_status = 0, 1.0, 400
+        codes = asyncio.run(_burst(base_url, args.requests, "compare Gavi and Pedri"))
+        print(f"{args.requests} identical failing requests: {fake.state.calls} upstream call(s), "
+              f"statuses {sorted(set(codes))}")
+        if fake.state.calls != 1 or set(codes) != {500}:
+            failures.append("failing burst did not propagate one upstream error to every request")
+
+    for failure in failures:
+        print(f"FAIL: {failure}")
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
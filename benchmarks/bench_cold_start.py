@@ -0,0 +1,112 @@
+"""Cold-start budget of the backend, measured offline.
+
+A fresh interpreter imports ``backend.main``, starts uvicorn and records:
+
+* ``import``: time to ``import backend.main``;
+* ``first_request``: time until ``GET /`` has been answered;
+* ``first_chat``: time until the first ``/chat`` reply (fake LLM, warm-up included).
+
+All timings start before the import. Outbound connections to anything but
+localhost are refused inside the child process, so the run fails if startup
+touches the network. The script exits non-zero when ``first_request``
+exceeds ``--budget`` seconds or a network access was attempted.
+
+Usage::
+
+    python -m benchmarks.bench_cold_start --budget 2.0
+"""
+
+import argparse
+import json
+import os
+import socket
+import subprocess
+import sys
+import time
+from pathlib import Path
+from typing import Dict, List
+
+sys.path.append(str(Path(__file__).parent.parent))
+
+from benchmarks.fake_llm import FAKE_MODEL, create_app, free_port, serve
+
+LOCAL_HOSTS = {"127.0.0.1", "localhost", "::1"}
+
+
+def _block_network(attempts: List[str]) -> None:
+    """Refuse name resolution of non-local hosts, recording every attempt."""
+    real_getaddrinfo = socket.getaddrinfo
+
+    def guarded(host, *args, **kwargs):
+        if host not in LOCAL_HOSTS:
+            attempts.append(str(host))
+            raise socket.gaierror(f"network disabled by bench_cold_start: {host}")
+        return real_getaddrinfo(host, *args, **kwargs)
+
+    socket.getaddrinfo = guarded
+
+
+def _child(app_port: int) -> Dict[str, object]:
+    """Measure startup inside the current (fresh) interpreter."""
+    attempts: List[str] = []
+    _block_network(attempts)
+
+    start = time.perf_counter()
+    from backend.main import app
+    imported = time.perf_counter() - start
+
+    import httpx
+
+    with serve(app, app_port) as base_url:
+        with httpx.Client(base_url=base_url, timeout=None) as client:
+            client.get("/").raise_for_status()
+            first_request = time.perf_counter() - start
+            client.post("/chat", json={"messages": [{"role": "user", "content": "hi"}]}).raise_for_status()
+            first_chat = time.perf_counter() - start
+
+    return {
+        "import": imported,
+        "first_request": first_request,
+        "first_chat": first_chat,
+        "network_attempts": attempts,
+    }
+
+
+def main(argv: List[str] = None) -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--budget", type=float, default=2.0, help="Max seconds from import to first served request.")
+    parser.add_argument("--child", type=int, default=None, help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.child is not None:
+        print(json.dumps(_child(args.child)))
+        return
+
+    llm_port = free_port()
+    env = dict(
+        os.environ,
+        MODEL_NAME=f"openai/{FAKE_MODEL}",
+        LLM_API_BASE=f"http://127.0.0.1:{llm_port}/v1",
+        OPENAI_API_KEY="fake-key",
+    )
+    with serve(create_app(latency=0.0), llm_port):
+        output = subprocess.run(
+            [sys.executable, "-m", "benchmarks.bench_cold_start", "--child", str(free_port())],
+            cwd=Path(__file__).parent.parent, env=env, capture_output=True, text=True, check=True,
+        ).stdout
+    result = json.loads(output.strip().splitlines()[-1])
+
+    for key in ("import", "first_request", "first_chat"):
+        print(f"{key:<15}{result[key]:>8.3f}s")
+    failures = []
+    if result["first_request"] > args.budget:
+        failures.append(f"first request after {result['first_request']:.3f}s exceeds budget of {args.budget:.3f}s")
+    if result["network_attempts"]:
+        failures.append(f"startup tried to reach the network: {sorted(set(result['network_attempts']))}")
+    for failure in failures:
+        print(f"FAIL: {failure}")
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,183 @@
+"""Near-duplicate detection and coverage sampling of ``evals/dedup.py`` at scale.
+
+Builds ``--queries`` synthetic scouting queries with a known answer: distinct
+base requests from templates (some differ in one word only, "striker" vs.
+"winger", which must stay apart) and near-duplicates of them (case, typos,
+emojis, punctuation, filler words), then:
+
+1. times :func:`dedupe_queries` on all of them;
+2. reports pairwise precision and recall of the groups found, per threshold,
+   on a corpus of ``--sweep`` queries;
+3. samples ``--sample`` queries from a skewed corpus (most of it German)
+   with :func:`coverage_sample` and with a uniform random sample, and counts
+   the combinations and dimension values each covers.
+
+Exits non-zero if the full run exceeds ``--budget`` seconds, precision or
+recall at the default threshold is below ``--min-quality``, or the coverage
+sample covers less than the random one.
+
+Usage::
+
+    python -m benchmarks.bench_dedup --queries 300000 --budget 15
+"""
+
+import argparse
+import random
+import sys
+import time
+from pathlib import Path
+from typing import List, Tuple
+
+import numpy as np
+import pandas as pd
+
+sys.path.append(str(Path(__file__).parent.parent))
+
+from evals.dedup import DEDUP_THRESHOLD, DIMENSIONS, coverage_sample, dedupe_queries, query_groups
+
+OPENERS = ["looking for", "need", "find me", "scouting for", "any recommendations for", "searching for", "who is a good"]
+ADJECTIVES = ["fast", "young", "experienced", "cheap", "tall", "creative", "hard working", "left footed", "two footed"]
+POSITIONS = ["striker", "winger", "goalkeeper", "center back", "full back", "defensive midfielder", "playmaker", "wing back"]
+COUNTRIES = ["german", "brazilian", "english", "french", "spanish", "italian", "dutch", "portuguese", "argentinian", "japanese"]
+SKILLS = [
+    "who can finish chances", "good in the air", "who presses high", "comfortable on the ball", "with great vision",
+    "who can play the offside trap", "strong in one on one duels", "good at set pieces", "with leadership",
+    "who can dribble past defenders", "with a long throw", "under 21", "under 500k", "similar to messi",
+]
+STYLES = [
+    "messi", "ronaldo", "mbappe", "haaland", "kane", "salah", "de bruyne", "modric", "kroos", "pedri", "gavi", "bellingham",
+    "musiala", "wirtz", "saka", "foden", "rodri", "kimmich", "van dijk", "rudiger", "alisson", "neuer", "ter stegen",
+    "hakimi", "davies", "cancelo", "lewandowski", "griezmann", "vinicius", "rodrygo",
+]
+CLUBS = [
+    "a pressing side", "a possession team", "a counter attacking team", "a relegation battle", "a title push",
+    "the champions league", "a newly promoted club", "a back three", "a back four", "a low block", "our academy",
+    "a loan deal", "a squad rotation role", "the second division", "a european campaign",
+]
+SCENARIOS = ["exact match", "ambiguous request", "shouldn't be handled"]
+EMOJIS = ["⚽", "🔥", "🙏", "👀", "🇩🇪"]
+FILLER = ["pls", "plz", "please", "can you help", "i need"]
+
+
+def _perturb(text: str, rng: random.Random) -> str:
+    """A near-duplicate of ``text``: one or two surface changes."""
+    for _ in range(rng.randint(1, 2)):
+        kind = rng.randrange(6)
+        if kind == 0:
+            text = text.upper() if rng.random() < 0.5 else text.title()
+        elif kind == 1:  # swap two adjacent letters of one word
+            words = text.split()
+            i = rng.randrange(len(words))
+            if len(words[i]) > 3:
+                j = rng.randrange(len(words[i]) - 1)
+                words[i] = words[i][:j] + words[i][j + 1] + words[i][j] + words[i][j + 2:]
+            text = " ".join(words)
+        elif kind == 2:
+            text = f"{text} {rng.choice(EMOJIS)}"
+        elif kind == 3:
+            text = text + rng.choice(["?", "!!", "...", " ?"])
+        elif kind == 4:
+            text = f"{rng.choice(FILLER)} {text}" if rng.random() < 0.5 else f"{text} {rng.choice(FILLER)}"
+        else:
+            text = text.replace(" ", "  ", 1)
+    return text
+
+
+def corpus(size: int, rng: random.Random, skew: float = 0.0) -> Tuple[List[str], np.ndarray, pd.DataFrame]:
+    """``size`` queries, the base request of each, and its dimensions.
+
+    Base requests are distinct; one in five has a sibling that only differs
+    in the position ("striker" vs. "winger"). Copies of a base request may
+    start with different openers ("need", "scouting for"): they are
+    phrasing, not part of the request. With ``skew``, that share of the base
+    requests is German.
+    """
+    texts, truth, dimensions, seen = [], [], [], set()
+    while len(texts) < size:
+        country = "german" if rng.random() < skew else rng.choice(COUNTRIES)
+        base = (rng.choice(ADJECTIVES), country, rng.choice(POSITIONS), rng.choice(SKILLS), rng.choice(STYLES),
+                rng.choice(CLUBS), rng.choice(SCENARIOS))
+        bases = [base]
+        if rng.random() < 0.2:
+            bases.append((*base[:2], rng.choice([p for p in POSITIONS if p != base[2]]), *base[3:]))
+        for adjective, country, position, skill, style, club, scenario in bases:
+            request = f"a {adjective} {country} {position} {skill}, a {style} type for {club}"
+            if request in seen:
+                continue
+            seen.add(request)
+            for copy in range(min(rng.choice([1, 1, 2, 3, 4]), size - len(texts))):
+                phrased = f"{rng.choice(OPENERS)} {request}"
+                texts.append(phrased if copy == 0 else _perturb(phrased, rng))
+                truth.append(len(seen))
+                dimensions.append((country, f"{position} {skill}", scenario))
+    order = rng.sample(range(size), size)
+    frame = pd.DataFrame([dimensions[i] for i in order], columns=list(DIMENSIONS))
+    return [texts[i] for i in order], np.array([truth[i] for i in order]), frame
+
+
+def _pairs(counts: np.ndarray) -> int:
+    return int((counts * (counts - 1) // 2).sum())
+
+
+def pair_quality(texts: List[str], truth: np.ndarray, threshold: float) -> Tuple[float, float]:
+    """Pairwise precision and recall of the near-duplicate groups found in ``texts``."""
+    groups = query_groups(texts, threshold)
+    both = pd.DataFrame({"pred": groups, "true": truth})
+    together = _pairs(both.value_counts().to_numpy())
+    predicted = _pairs(both["pred"].value_counts().to_numpy())
+    actual = _pairs(both["true"].value_counts().to_numpy())
+    return together / max(predicted, 1), together / max(actual, 1)
+
+
+def main(argv: List[str] = None) -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--queries", type=int, default=300_000)
+    parser.add_argument("--sweep", type=int, default=30_000)
+    parser.add_argument("--thresholds", type=float, nargs="+", default=[0.7, 0.75, 0.8, 0.85, 0.9])
+    parser.add_argument("--sample", type=int, default=500)
+    parser.add_argument("--budget", type=float, default=15.0, help="Seconds allowed for the full run.")
+    parser.add_argument("--min-quality", type=float, default=0.9)
+    args = parser.parse_args(argv)
+
+    rng = random.Random(0)
+    failures = []
+    texts, truth, _ = corpus(args.queries, rng)
+    start = time.perf_counter()
+    kept = dedupe_queries(texts)
+    elapsed = time.perf_counter() - start
+    print(f"{args.queries} queries ({len(set(truth))} distinct requests): kept {len(kept)} "
+          f"in {elapsed:.2f}s at threshold {DEDUP_THRESHOLD}")
+    if elapsed > args.budget:
+        failures.append(f"deduplication took {elapsed:.2f}s (budget {args.budget}s)")
+
+    texts, truth, _ = corpus(args.sweep, rng)
+    for threshold in args.thresholds:
+        precision, recall = pair_quality(texts, truth, threshold)
+        print(f"threshold {threshold:.2f}: pairwise precision {precision:.3f}, recall {recall:.3f} "
+              f"({args.sweep} queries)")
+        if threshold == DEDUP_THRESHOLD and min(precision, recall) < args.min_quality:
+            failures.append(f"precision {precision:.3f} / recall {recall:.3f} at the default threshold")
+
+    _, _, dimensions = corpus(20_000, rng, skew=0.6)
+    combos = dimensions.drop_duplicates()
+    sampled = dimensions.iloc[coverage_sample(dimensions, args.sample)]
+    uniform = dimensions.sample(args.sample, random_state=0)
+    for name, frame in (("coverage", sampled), ("random", uniform)):
+        countries = frame["Country"].value_counts()
+        print(f"{name} sample of {args.sample} from {len(dimensions)} (60% German, {len(combos)} combinations): "
+              f"{len(frame.drop_duplicates())} combinations, "
+              + ", ".join(f"{frame[column].nunique()} {column}" for column in DIMENSIONS)
+              + f"; German {countries.get('german', 0)}, rarest country {countries.min()}")
+    for column in DIMENSIONS:
+        if sampled[column].nunique() < uniform[column].nunique():
+            failures.append(f"the coverage sample has fewer {column} values than a random one")
+    if len(sampled.drop_duplicates()) < len(uniform.drop_duplicates()):
+        failures.append("the coverage sample has fewer combinations than a random one")
+
+    for failure in failures:
+        print(f"FAIL: {failure}")
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,171 @@
+"""The LLM cache (``backend/llm_cache.py``) under the eval scripts.
+
+Against the fake LLM, with a fresh cache file:
+
+1. ``generate_synthetic_queries.py --cache on`` records a run; the same run
+   again makes no call and writes the same CSV;
+2. after a prompt change (``--queries-per-tuple``), only the per-tuple
+   calls are made again, not the tuple batches;
+3. ``--cache replay`` with the fake LLM stopped (offline) reproduces the CSV,
+   and ``open_coding.py`` likewise after one recording run;
+4. ``--workers`` processes write and read the same file concurrently;
+5. a small ``max_bytes`` keeps the file under its limit, evicting the least
+   recently used entries first.
+
+Also reports the lookup latency of a hit. Exits non-zero if a check fails.
+
+Usage::
+
+    python -m benchmarks.bench_llm_cache --tuple-batches 4 --workers 4
+"""
+
+import argparse
+import multiprocessing
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import List
+
+sys.path.append(str(Path(__file__).parent.parent))
+
+from benchmarks.fake_llm import FAKE_MODEL, create_app, free_port, serve
+
+EVALS = Path(__file__).parent.parent / "evals"
+
+
+def _hammer(path: str, worker: int, entries: int) -> None:
+    """Write ``entries`` completions and read back every one, from its own process."""
+    from backend.llm_cache import LLMCache, llm_cache_key
+
+    cache = LLMCache(path)
+    for i in range(entries):
+        key = llm_cache_key("m", [{"role": "user", "content": f"{worker}-{i}"}])
+        cache.set(key, "m", {"worker": worker, "i": i})
+    for i in range(entries):
+        key = llm_cache_key("m", [{"role": "user", "content": f"{worker}-{i}"}])
+        assert cache.get(key) == {"worker": worker, "i": i}
+
+
+def main(argv: List[str] = None) -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--tuple-batches", type=int, default=4)
+    parser.add_argument("--tuples-per-batch", type=int, default=10)
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--entries", type=int, default=500, help="Entries written per worker.")
+    args = parser.parse_args(argv)
+
+    from backend.llm_cache import LLMCache, llm_cache_key
+
+    port = free_port()
+    fake = create_app(0.02)
+    failures = []
+    with tempfile.TemporaryDirectory() as tmp:
+        tmp = Path(tmp)
+        cache_path = str(tmp / "llm_cache.sqlite3")
+        env = {
+            **os.environ,
+            "MODEL_NAME": f"openai/{FAKE_MODEL}",
+            "LLM_API_BASE": f"http://127.0.0.1:{port}/v1",
+            "OPENAI_API_KEY": os.environ.get("OPENAI_API_KEY", "fake-key"),
+        }
+        generate = [
+            sys.executable, str(EVALS / "generate_synthetic_queries.py"), "--model", f"openai/{FAKE_MODEL}",
+            "--api-base", env["LLM_API_BASE"], "--tuple-batches", str(args.tuple_batches),
+            "--tuples-per-batch", str(args.tuples_per_batch), "--rpm", "0", "--tpm", "0", "--restart",
+            "--run-dir", str(tmp / "run"), "--cache-path", cache_path,
+        ]
+        open_coding = [
+            sys.executable, str(EVALS / "open_coding.py"), "--rpm", "0", "--tpm", "0", "--restart",
+            "--run-dir", str(tmp / "oc"), "--input", str(tmp / "queries.csv"), "--cache-path", cache_path,
+        ]
+
+        def run(command: List[str], output: str, *extra: str) -> float:
+            start = time.perf_counter()
+            subprocess.run([*command, "--output", str(tmp / output), *extra], env=env, capture_output=True, check=True)
+            return time.perf_counter() - start
+
+        with serve(fake, port):
+            recorded = run(generate, "queries.csv", "--cache", "on")
+            calls = fake.state.calls
+            again = run(generate, "again.csv", "--cache", "on")
+            print(f"generate, recording: {calls} calls in {recorded:.2f}s; "
+                  f"same run again: {fake.state.calls - calls} calls in {again:.2f}s")
+            if fake.state.calls != calls:
+                failures.append("the repeated run called the LLM")
+            if (tmp / "queries.csv").read_bytes() != (tmp / "again.csv").read_bytes():
+                failures.append("the repeated run wrote a different CSV")
+
+            calls = fake.state.calls
+            run(generate, "tweaked.csv", "--cache", "on", "--queries-per-tuple", "4")
+            tuples = sum(1 for line in (tmp / "run" / "queries.jsonl").read_text().splitlines() if line)
+            print(f"generate, queries-per-tuple 5 -> 4: {fake.state.calls - calls} calls for {tuples} tuples "
+                  f"(tuple batches hit)")
+            if fake.state.calls - calls != tuples:
+                failures.append(f"the prompt change made {fake.state.calls - calls} calls, expected {tuples}")
+
+            calls = fake.state.calls
+            run(open_coding, "coded.csv", "--cache", "on")
+            print(f"open coding, recording: {fake.state.calls - calls} calls")
+
+        # The fake LLM is stopped: replays must not need it.
+        replayed = run(generate, "replayed.csv", "--cache", "replay")
+        coded = run(open_coding, "coded_replayed.csv", "--cache", "replay")
+        print(f"offline replay: generate {replayed:.2f}s, open coding {coded:.2f}s (process start-up included)")
+        if (tmp / "queries.csv").read_bytes() != (tmp / "replayed.csv").read_bytes():
+            failures.append("the replayed generation differs from the recorded one")
+        if (tmp / "coded.csv").read_text().count("\n") != (tmp / "coded_replayed.csv").read_text().count("\n"):
+            failures.append("the replayed open coding has a different number of rows")
+        import pandas as pd
+
+        recorded_coding = pd.read_csv(tmp / "coded.csv")
+        replayed_coding = pd.read_csv(tmp / "coded_replayed.csv")
+        if not recorded_coding["open_coding_response"].equals(replayed_coding["open_coding_response"]):
+            failures.append("the replayed open coding responses differ from the recorded ones")
+
+        cache = LLMCache(cache_path)
+        keys = [row[0] for row in cache._conn.execute("SELECT key FROM completions")]
+        samples = []
+        for key in keys * 20:
+            start = time.perf_counter()
+            cache.get(key)
+            samples.append((time.perf_counter() - start) * 1e3)
+        samples.sort()
+        print(f"hit lookup: p50 {statistics.median(samples):.3f} ms, p99 {samples[int(len(samples) * 0.99)]:.3f} ms "
+              f"over {len(keys)} entries")
+
+        shared = str(tmp / "shared.sqlite3")
+        start = time.perf_counter()
+        with multiprocessing.get_context("spawn").Pool(args.workers) as pool:
+            pool.starmap(_hammer, [(shared, worker, args.entries) for worker in range(args.workers)])
+        entries = LLMCache(shared).stats()["entries"]
+        print(f"{args.workers} processes x {args.entries} writes + reads on one file: {entries} entries "
+              f"in {time.perf_counter() - start:.2f}s")
+        if entries != args.workers * args.entries:
+            failures.append(f"concurrent writers left {entries} entries, expected {args.workers * args.entries}")
+
+        small = LLMCache(str(tmp / "small.sqlite3"), max_bytes=200_000)
+        first = llm_cache_key("m", [{"role": "user", "content": "0"}])
+        for i in range(2000):
+            key = llm_cache_key("m", [{"role": "user", "content": str(i)}])
+            small.set(key, "m", {"text": "x" * 1000})
+            if i % 50 == 0:
+                small.get(first)  # keep the first entry recently used
+        stats = small.stats()
+        print(f"eviction: 2000 x 1 kB into 200 kB -> {stats['entries']} entries, {stats['bytes']} bytes; "
+              f"recently used entry kept: {small.get(first) is not None}")
+        if stats["bytes"] > small.max_bytes + 100 * 1100:
+            failures.append(f"the store grew to {stats['bytes']} bytes")
+        if small.get(first) is None:
+            failures.append("a recently used entry was evicted")
+
+    for failure in failures:
+        print(f"FAIL: {failure}")
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,165 @@
+"""Throughput, crash/resume and Batch API mode of ``evals/open_coding.py``.
+
+The synthetic queries are repeated (with new ids) to ``--rows`` rows and
+open coded against the fake LLM, with ``--error-rate`` of its calls failing:
+
+1. the serial loop on ``--serial-rows`` rows, for a baseline throughput;
+2. the concurrent runner, killed (SIGKILL) a third of the way through and
+   resumed: the resumed run must not send a row that the first one logged,
+   and the output must have every row;
+3. ``--batch-api`` against the fake's Batch API, killed while it waits for
+   the job and resumed: the resumed run must wait for the same job instead of
+   submitting a second one.
+
+Exits non-zero if a check fails or the concurrent runner is not faster than
+the serial loop.
+
+Usage::
+
+    python -m benchmarks.bench_open_coding --rows 400 --concurrency 32
+"""
+
+import argparse
+import json
+import os
+import re
+import signal
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import List, Set
+
+import pandas as pd
+
+sys.path.append(str(Path(__file__).parent.parent))
+
+from benchmarks.fake_llm import FAKE_MODEL, create_app, free_port, serve
+
+SCRIPT = Path(__file__).parent.parent / "evals" / "open_coding.py"
+QUERIES_CSV = Path(__file__).parent.parent / "evals" / "synthetic_queries_for_analysis.csv"
+
+
+def _input(rows: int) -> pd.DataFrame:
+    data = pd.read_csv(QUERIES_CSV)
+    frame = pd.concat([data] * (rows // len(data) + 1), ignore_index=True).head(rows)
+    frame["id"] = [f"ROW{i + 1:05d}" for i in range(len(frame))]
+    # Only the query reaches the LLM; tag it so that the prompts tell the rows apart.
+    frame["query"] = frame["query"] + " (" + frame["id"] + ")"
+    return frame
+
+
+def _logged(path: Path) -> Set[str]:
+    if not path.exists():
+        return set()
+    ids = set()
+    for line in path.read_text(encoding="utf-8").splitlines():
+        try:
+            ids.add(json.loads(line)["query_id"])
+        except (json.JSONDecodeError, KeyError):
+            pass
+    return ids
+
+
+def _sent(payloads: List[dict]) -> List[str]:
+    """Row ids in the prompts received (batch requests included)."""
+    return [match for body in payloads for match in re.findall(r"\((ROW\d+)\)", json.dumps(body["messages"]))]
+
+
+def _kill_when(process: subprocess.Popen, condition, timeout: float = 120.0) -> None:
+    deadline = time.monotonic() + timeout
+    while process.poll() is None and not condition() and time.monotonic() < deadline:
+        time.sleep(0.02)
+    process.send_signal(signal.SIGKILL)
+    process.wait()
+
+
+def main(argv: List[str] = None) -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=400)
+    parser.add_argument("--serial-rows", type=int, default=20)
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--latency", type=float, default=0.3)
+    parser.add_argument("--error-rate", type=float, default=0.05)
+    args = parser.parse_args(argv)
+
+    port = free_port()
+    fake = create_app(args.latency, error_rate=args.error_rate)
+    env = {
+        **os.environ,
+        "MODEL_NAME": f"openai/{FAKE_MODEL}",
+        "LLM_API_BASE": f"http://127.0.0.1:{port}/v1",
+        "OPENAI_API_KEY": os.environ.get("OPENAI_API_KEY", "fake-key"),
+    }
+    failures = []
+
+    with serve(fake, port), tempfile.TemporaryDirectory() as tmp:
+        tmp = Path(tmp)
+        frame = _input(args.rows)
+        frame.to_csv(tmp / "input.csv", index=False)
+        frame.head(args.serial_rows).to_csv(tmp / "serial.csv", index=False)
+        base = [sys.executable, str(SCRIPT), "--output", str(tmp / "out.csv"), "--rpm", "0", "--tpm", "0"]
+
+        start = time.perf_counter()
+        subprocess.run([*base, "--serial", "--input", str(tmp / "serial.csv")], env=env, capture_output=True, check=True)
+        serial = args.serial_rows / (time.perf_counter() - start)
+        print(f"serial:      {serial:.2f} rows/s ({args.serial_rows} rows, process start-up included)")
+
+        run_dir = tmp / "run"
+        command = [*base, "--input", str(tmp / "input.csv"), "--run-dir", str(run_dir),
+                   "--concurrency", str(args.concurrency)]
+        fake.state.payloads = []
+        process = subprocess.Popen(command, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        _kill_when(process, lambda: len(_logged(run_dir / "results.jsonl")) >= args.rows // 3)
+        first = _logged(run_dir / "results.jsonl")
+        fake.state.payloads = []
+        start = time.perf_counter()
+        resumed = subprocess.run(command, env=env, capture_output=True, text=True)
+        elapsed = time.perf_counter() - start
+        sent = _sent(fake.state.payloads)
+        throughput = (args.rows - len(first)) / elapsed
+        report = next((line for line in resumed.stdout.splitlines() if "rows/s" in line), "")
+        print(f"concurrent:  killed after {len(first)}/{args.rows} rows; resumed run sent {len(set(sent))} rows "
+              f"({len(sent) - len(set(sent))} retries) in {elapsed:.2f}s = {throughput:.2f} rows/s")
+        print(f"             report: {report}")
+        if resumed.returncode:
+            failures.append(f"resumed run exited with {resumed.returncode}: {resumed.stderr[-500:]}")
+        if first & set(sent):
+            failures.append(f"{len(first & set(sent))} rows logged by the first run were sent again")
+        output = pd.read_csv(tmp / "out.csv")
+        if list(output["query_id"]) != list(frame["id"]):
+            failures.append(f"output has {len(output)} of {args.rows} rows, or not in input order")
+        if throughput <= serial:
+            failures.append("the concurrent runner is not faster than the serial loop")
+
+        run_dir = tmp / "batch"
+        command = [*base, "--input", str(tmp / "input.csv"), "--run-dir", str(run_dir), "--batch-api",
+                   "--api-base", env["LLM_API_BASE"], "--poll-interval", "0.2"]
+        fake.state.error_rate = 0.0
+        fake.state.batch_delay = 3.0
+        fake.state.payloads = []
+        process = subprocess.Popen(command, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        _kill_when(process, lambda: (run_dir / "results.jsonl").exists() and "batch_id" in (run_dir / "results.jsonl").read_text())
+        submitted = len(fake.state.batches)
+        start = time.perf_counter()
+        resumed = subprocess.run(command, env=env, capture_output=True, text=True)
+        elapsed = time.perf_counter() - start
+        output = pd.read_csv(tmp / "out.csv")
+        print(f"batch api:   killed while waiting; resumed run finished in {elapsed:.2f}s, "
+              f"{len(fake.state.batches)} batch(es) created, {len(output)}/{args.rows} rows, "
+              f"{len(_sent(fake.state.payloads))} requests answered")
+        if resumed.returncode:
+            failures.append(f"resumed batch run exited with {resumed.returncode}: {resumed.stderr[-500:]}")
+        if submitted != 1 or len(fake.state.batches) != 1:
+            failures.append(f"{len(fake.state.batches)} batches were created instead of one")
+        if len(output) != args.rows:
+            failures.append(f"batch output has {len(output)} of {args.rows} rows")
+
+    for failure in failures:
+        print(f"FAIL: {failure}")
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
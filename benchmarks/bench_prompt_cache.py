@@ -0,0 +1,117 @@
+"""Prompt cache breakpoints checked against a fake provider that records payloads.
+
+Runs a ``--turns`` turn conversation through ``aget_agent_response`` with
+``PROMPT_CACHING=on`` against the fake LLM, which simulates Anthropic-style
+prefix caching, and checks that:
+
+* every request marks the system prompt as a cache breakpoint;
+* once the conversation reaches ``PROMPT_CACHE_MIN_TOKENS``, the message
+  before the latest user turn is marked too, and later turns read that prefix
+  from the cache;
+* a provider that rejects ``cache_control`` still answers every call, and
+  later calls are sent without breakpoints.
+
+Prints cached vs. uncached prompt tokens per turn and exits non-zero if a
+check fails.
+
+Usage::
+
+    python -m benchmarks.bench_prompt_cache --turns 6
+"""
+
+import argparse
+import asyncio
+import os
+import sys
+from pathlib import Path
+from typing import Any, Dict, List
+
+import pandas as pd
+
+sys.path.append(str(Path(__file__).parent.parent))
+
+from benchmarks.fake_llm import FAKE_MODEL, create_app, free_port, serve
+
+QUERIES_CSV = Path(__file__).parent.parent / "evals" / "synthetic_queries_for_analysis.csv"
+MODEL = f"openai/{FAKE_MODEL}"
+
+
+def _is_marked(message: Dict[str, Any]) -> bool:
+    content = message["content"]
+    return isinstance(content, list) and any("cache_control" in block for block in content)
+
+
+async def _conversation(queries: List[str]) -> None:
+    from backend.metrics import LLM_TOKENS
+    from backend.utils import aget_agent_response, close_async_client
+
+    history: List[Dict[str, str]] = []
+    print(f"{'turn':>5}{'prompt':>9}{'cached':>9}{'uncached':>10}{'written':>9}")
+    for turn, query in enumerate(queries, start=1):
+        kinds = ("prompt_cached", "prompt_uncached", "prompt_cache_write")
+        before = {kind: LLM_TOKENS.value(model=MODEL, kind=kind) for kind in kinds}
+        history = await aget_agent_response(history + [{"role": "user", "content": query}])
+        cached, uncached, written = (
+            LLM_TOKENS.value(model=MODEL, kind=kind) - before[kind] for kind in before
+        )
+        print(f"{turn:>5}{cached + uncached:>9.0f}{cached:>9.0f}{uncached:>10.0f}{written:>9.0f}")
+    # The shared HTTP client belongs to this event loop.
+    await close_async_client()
+
+
+def main(argv: List[str] = None) -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--turns", type=int, default=6)
+    parser.add_argument("--min-tokens", type=int, default=200, help="PROMPT_CACHE_MIN_TOKENS for the run.")
+    args = parser.parse_args(argv)
+
+    llm_port = free_port()
+    os.environ.update(
+        MODEL_NAME=MODEL,
+        LLM_API_BASE=f"http://127.0.0.1:{llm_port}/v1",
+        PROMPT_CACHING="on",
+        PROMPT_CACHE_MIN_TOKENS=str(args.min_tokens),
+    )
+    os.environ.setdefault("OPENAI_API_KEY", "fake-key")
+
+    from backend.metrics import LLM_TOKENS
+    from backend.utils import uses_cache_breakpoints
+
+    queries = pd.read_csv(QUERIES_CSV)["query"].tolist()[:args.turns]
+    failures = []
+
+    fake = create_app(0.01)
+    with serve(fake, llm_port):
+        asyncio.run(_conversation(queries))
+        payloads = fake.state.payloads
+        if not all(_is_marked(payload["messages"][0]) for payload in payloads):
+            failures.append("a request did not mark the system prompt")
+        if not any(_is_marked(payload["messages"][-2]) for payload in payloads if len(payload["messages"]) > 2):
+            failures.append("no request marked the conversation before the latest user turn")
+        if not LLM_TOKENS.value(model=MODEL, kind="prompt_cached"):
+            failures.append("no prompt tokens were read from the cache")
+        cached = LLM_TOKENS.value(model=MODEL, kind="prompt_cached")
+        total = cached + LLM_TOKENS.value(model=MODEL, kind="prompt_uncached")
+        print(f"cached share of prompt tokens: {cached / total:.0%}")
+
+    rejecting = create_app(0.01, reject_cache_control=True)
+    with serve(rejecting, llm_port):
+        try:
+            asyncio.run(_conversation(queries[:2]))
+            marked = [_is_marked(payload["messages"][0]) for payload in rejecting.state.payloads]
+            print(f"rejecting provider: {len(marked)} requests, breakpoints sent: {marked}")
+            if marked != [True, False, False]:
+                failures.append("breakpoints were not dropped after the provider rejected them")
+        except Exception as exc:
+            failures.append(f"calls failed against a provider without prompt caching: {exc!r}")
+
+    for model in ("anthropic/claude-3-haiku-20240307", "openai/gpt-4o-mini", "gemini/gemini-2.0-flash"):
+        print(f"PROMPT_CACHING=auto marks breakpoints for {model}: {uses_cache_breakpoints(model, 'auto')}")
+
+    for failure in failures:
+        print(f"FAIL: {failure}")
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
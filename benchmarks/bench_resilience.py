@@ -0,0 +1,139 @@
+"""Retry, timeout, fallback and hedging of the LLM calls against injected faults.
+
+Calls ``aget_agent_response`` directly against a fake LLM and checks that:
+
+* transient 503s are retried until every call succeeds;
+* a primary model that always fails falls back to the next model;
+* attempts that exceed the per-attempt timeout are abandoned;
+* hedging a slow tail (``--slow-rate`` of calls take ``--slow-latency`` extra
+  seconds) cuts p99 latency.
+
+Exits non-zero if any check fails.
+
+Usage::
+
+    python -m benchmarks.bench_resilience --calls 200
+"""
+
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import time
+from pathlib import Path
+from typing import List
+
+sys.path.append(str(Path(__file__).parent.parent))
+
+from benchmarks.fake_llm import FAKE_MODEL, create_app, free_port, serve
+
+FALLBACK_MODEL = f"openai/{FAKE_MODEL}-fallback"
+
+
+def _percentile(values: List[float], q: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(int(len(ordered) * q), len(ordered) - 1)]
+
+
+async def _timed_calls(calls: int, concurrency: int, policy) -> List[float]:
+    """Run ``calls`` completions, ``concurrency`` at a time, and return their latencies."""
+    from backend.utils import aget_agent_response
+
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def one(i: int) -> float:
+        async with semaphore:
+            start = time.perf_counter()
+            await aget_agent_response([{"role": "user", "content": f"scout report #{i}"}], policy)
+            return time.perf_counter() - start
+
+    return await asyncio.gather(*(one(i) for i in range(calls)))
+
+
+async def _run(fake, args) -> List[str]:
+    from backend import utils
+    from backend.utils import RetryPolicy, close_async_client
+
+    failures = []
+    base = RetryPolicy(timeout=args.latency + args.slow_latency + 1, backoff=0.01, backoff_max=0.1)
+
+    # Transient errors: every call should succeed thanks to retries.
+    fake.state.error_rate, fake.state.error_status = 0.3, 503
+    try:
+        await _timed_calls(args.calls // 4, args.concurrency, base._replace(max_retries=5))
+        print(f"transient 503s: {args.calls // 4} calls ok, {fake.state.calls} upstream calls, "
+              f"{utils.call_stats['retries']} retries")
+    except Exception as exc:
+        failures.append(f"transient errors were not retried away: {exc!r}")
+    fake.state.error_rate = 0.0
+
+    # Fallback: the primary model always fails.
+    fake.state.failing_models = {FAKE_MODEL}
+    fake.state.models.clear()
+    try:
+        await _timed_calls(10, args.concurrency, base._replace(max_retries=1, fallback_models=(FALLBACK_MODEL,)))
+        print(f"failing primary: calls per model {fake.state.models}")
+        if fake.state.models.get(f"{FAKE_MODEL}-fallback") != 10:
+            failures.append("fallback model did not answer every call")
+    except Exception as exc:
+        failures.append(f"fallback did not recover: {exc!r}")
+    fake.state.failing_models = set()
+
+    # Timeouts: every attempt is slower than the timeout, so the call fails
+    # after (retries + 1) attempts instead of waiting for the provider.
+    fake.state.slow_rate = 1.0
+    start = time.perf_counter()
+    try:
+        await _timed_calls(1, 1, base._replace(timeout=0.2, max_retries=1))
+        failures.append("slow attempts did not time out")
+    except asyncio.TimeoutError:
+        elapsed = time.perf_counter() - start
+        print(f"timeouts: gave up after {elapsed:.2f}s ({utils.call_stats['timeouts']} timed-out attempts)")
+        if elapsed > 1.0:
+            failures.append(f"timed-out call took {elapsed:.2f}s")
+    fake.state.slow_rate = args.slow_rate
+
+    # Hedging: the same slow tail with and without a hedged second request.
+    plain = await _timed_calls(args.calls, args.concurrency, base)
+    hedges_before = utils.call_stats["hedges"]
+    hedged = await _timed_calls(args.calls, args.concurrency, base._replace(hedge_percentile=args.hedge_percentile))
+    hedges = utils.call_stats["hedges"] - hedges_before
+    for name, latencies in (("no hedging", plain), ("hedging", hedged)):
+        print(f"{name:>10}: p50 {statistics.median(latencies) * 1000:7.1f} ms  "
+              f"p95 {_percentile(latencies, 0.95) * 1000:7.1f} ms  p99 {_percentile(latencies, 0.99) * 1000:7.1f} ms")
+    print(f"hedged requests: {hedges} ({hedges / args.calls:.0%} extra calls), "
+          f"{utils.call_stats['hedge_wins']} won by the hedge")
+    if _percentile(hedged, 0.99) > _percentile(plain, 0.99) / 2:
+        failures.append("hedging did not halve p99 latency")
+
+    await close_async_client()
+    return failures
+
+
+def main(argv: List[str] = None) -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--calls", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=5)
+    parser.add_argument("--latency", type=float, default=0.05)
+    parser.add_argument("--slow-rate", type=float, default=0.05)
+    parser.add_argument("--slow-latency", type=float, default=1.0)
+    parser.add_argument("--hedge-percentile", type=float, default=0.9)
+    args = parser.parse_args(argv)
+
+    llm_port = free_port()
+    os.environ["MODEL_NAME"] = f"openai/{FAKE_MODEL}"
+    os.environ["LLM_API_BASE"] = f"http://127.0.0.1:{llm_port}/v1"
+    os.environ.setdefault("OPENAI_API_KEY", "fake-key")
+
+    fake = create_app(args.latency, slow_latency=args.slow_latency)
+    with serve(fake, llm_port):
+        failures = asyncio.run(_run(fake, args))
+
+    for failure in failures:
+        print(f"FAIL: {failure}")
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,135 @@
+"""Latency of player retrieval over a synthetic knowledge base.
+
+Builds a :class:`~backend.players.PlayerIndex` of ``--players`` generated
+players and times ``search`` plus ``facts`` (what a chat request runs) for:
+
+* the queries in ``evals/synthetic_queries_for_analysis.csv`` (filters only);
+* "tell me about <name>" for random players (text only);
+* "<team> defenders under 25" and "<name> vs <country> midfielders" (both).
+
+Checks that named players come first and that filtered results respect the
+filters, prints p50/p99/max latency and exits non-zero if p99 exceeds
+``--budget-ms``.
+
+Usage::
+
+    python -m benchmarks.bench_retrieval --players 100000
+"""
+
+import argparse
+import sys
+import time
+from pathlib import Path
+from typing import Dict, List
+
+import numpy as np
+import pandas as pd
+
+sys.path.append(str(Path(__file__).parent.parent))
+
+from backend.players import POSITIONS, PlayerIndex, parse_query
+from backend.semantic_cache import COUNTRY_TERMS
+
+QUERIES_CSV = Path(__file__).parent.parent / "evals" / "synthetic_queries_for_analysis.csv"
+ROLES = {"GK": ["Goalkeeper"], "DF": ["Centre-Back", "Left-Back", "Right-Back"],
+         "MF": ["Defensive Midfield", "Central Midfield", "Attacking Midfield"],
+         "FW": ["Left Winger", "Right Winger", "Centre-Forward"]}
+SYLLABLES = "ka lo mi ra te zu an be do fi gu ha jo ki le ma no pe ri sa ti vo we xa yu ze".split()
+
+
+def _words(rng: np.random.Generator, count: int, syllables: int) -> List[str]:
+    """``count`` distinct made-up words of ``syllables`` syllables."""
+    words: Dict[str, None] = {}
+    while len(words) < count:
+        words["".join(rng.choice(SYLLABLES, size=syllables)).capitalize()] = None
+    return list(words)
+
+
+def synthetic_index(players: int, seed: int = 0) -> PlayerIndex:
+    """A knowledge base of ``players`` random players, 600 teams and every known country."""
+    rng = np.random.default_rng(seed)
+    first, last = _words(rng, 500, 2), _words(rng, 20000, 4)
+    teams = [f"{city} {suffix}" for city, suffix in zip(_words(rng, 600, 3), rng.choice(["City", "United", "FC", "Athletic"], 600))]
+    # One country word per code, e.g. "Germany" for "de".
+    countries = list({code: term.capitalize() for term, code in reversed(COUNTRY_TERMS.items())}.values())
+    positions = rng.choice(POSITIONS, size=players, p=[0.1, 0.35, 0.3, 0.25])
+    births = np.datetime64("1985-01-01") + rng.integers(0, 23 * 365, size=players).astype("timedelta64[D]")
+    return PlayerIndex(
+        names=[f"{first[i]} {last[j]}" for i, j in zip(rng.integers(0, len(first), players), rng.integers(0, len(last), players))],
+        birth_dates=births.astype(str).tolist(),
+        nationalities=rng.choice(countries, size=players).tolist(),
+        positions=positions.tolist(),
+        roles=[ROLES[position][rng.integers(len(ROLES[position]))] for position in positions],
+        teams=rng.choice(teams, size=players).tolist(),
+        market_values=np.round(rng.lognormal(1.5, 1.2, size=players), 1).tolist(),
+        as_of=["2024-06-01"] * players,
+    )
+
+
+def _queries(index: PlayerIndex, rng: np.random.Generator, count: int) -> Dict[str, List[str]]:
+    rows = rng.integers(0, len(index), size=count)
+    teams = [index._teams[team] for team in index.teams[rows]]
+    return {
+        "eval csv": pd.read_csv(QUERIES_CSV)["query"].tolist(),
+        "name": [f"tell me about {index.names[row]}" for row in rows],
+        "team + filters": [f"{team} defenders under 25" for team in teams],
+        "name + filters": [f"{index.names[row]} vs german midfielders" for row in rows],
+    }
+
+
+def _check(index: PlayerIndex, kind: str, query: str, rows: np.ndarray) -> List[str]:
+    """Describe what is wrong with the result of ``query`` (empty if nothing)."""
+    parsed = parse_query(query)
+    problems = []
+    if kind == "name" and (not len(rows) or query.casefold() != f"tell me about {index.names[rows[0]]}".casefold()):
+        problems.append(f"{query!r}: named player is not the first result")
+    if kind in ("eval csv", "team + filters") and parsed.has_filters:
+        if not index._matches(parsed, rows).all():
+            problems.append(f"{query!r}: a result does not pass the filters")
+    return problems
+
+
+def main(argv: List[str] = None) -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--players", type=int, default=100_000)
+    parser.add_argument("--queries", type=int, default=500, help="Generated queries per kind.")
+    parser.add_argument("--k", type=int, default=5)
+    parser.add_argument("--budget-ms", type=float, default=1.0)
+    args = parser.parse_args(argv)
+
+    start = time.perf_counter()
+    index = synthetic_index(args.players)
+    build = time.perf_counter() - start
+    size = sum(value.nbytes for value in vars(index).values() if isinstance(value, np.ndarray))
+    print(f"built index of {len(index)} players in {build:.2f}s ({size / 2**20:.1f} MiB of arrays, names excluded)")
+
+    failures: List[str] = []
+    all_samples: List[float] = []
+    print(f"{'queries':>15}{'n':>6}{'p50 ms':>9}{'p99 ms':>9}{'max ms':>9}{'hits':>7}")
+    for kind, queries in _queries(index, np.random.default_rng(1), args.queries).items():
+        for query in queries:  # warm-up, and the correctness checks
+            failures += _check(index, kind, query, index.search(query, args.k))
+        samples, hits = [], 0
+        for query in queries:
+            begin = time.perf_counter()
+            facts = index.facts(index.search(query, args.k))
+            samples.append((time.perf_counter() - begin) * 1e3)
+            hits += bool(facts)
+        samples.sort()
+        all_samples += samples
+        p99 = samples[min(int(len(samples) * 0.99), len(samples) - 1)]
+        print(f"{kind:>15}{len(samples):>6}{samples[len(samples) // 2]:>9.3f}{p99:>9.3f}{samples[-1]:>9.3f}"
+              f"{hits / len(samples):>7.0%}")
+
+    all_samples.sort()
+    p99 = all_samples[min(int(len(all_samples) * 0.99), len(all_samples) - 1)]
+    print(f"overall p99: {p99:.3f} ms (budget {args.budget_ms} ms)")
+    if p99 > args.budget_ms:
+        failures.append(f"p99 {p99:.3f} ms exceeds the {args.budget_ms} ms budget")
+    for failure in failures[:20]:
+        print(f"FAIL: {failure}")
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,237 @@
+"""Query routing on the synthetic queries: accuracy, latency and cost.
+
+The queries of ``evals/synthetic_queries_for_analysis.csv`` plus a few
+off-topic questions are routed by :mod:`backend.router`, and the run reports:
+
+* routing accuracy when each dimension tuple is held out of training in turn
+  (its paraphrases would otherwise be in the training set);
+* the route of every query with the router trained on the whole file;
+* latency with the router off (every query to ``MODEL_NAME``) and on, against
+  the fake LLM generating ``--reply-words`` words at ``--tokens-per-second``;
+* estimated cost when ``--model`` serves full reports and ``--cheap-model``
+  clarifications. Prices come from :func:`backend.usage.model_prices`. Prompt tokens
+  are counted on the real prompts; completion tokens are the length of the
+  replies in ``evals/open_coding_results.csv`` (``ROUTER_CLARIFY_MAX_TOKENS``
+  for clarifications, its upper bound).
+
+Questions about players missing from the knowledge base and from the
+training data, lowercase names included, and about competitions
+(``UNSEEN_PLAYERS``) must get the full report: neither the canned reply nor
+a clarification.
+
+Exits non-zero if an in-domain query gets the canned reply, an unseen-player
+question is misrouted, an off-topic one is not refused, or routing does not
+lower latency and cost.
+
+Usage::
+
+    python -m benchmarks.bench_router --model openai/gpt-4.1 --cheap-model openai/gpt-4.1-nano
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import sys
+import time
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+import pandas as pd
+
+sys.path.append(str(Path(__file__).parent.parent))
+
+from benchmarks.fake_llm import FAKE_MODEL, create_app, free_port, serve
+
+EVALS = Path(__file__).parent.parent / "evals"
+QUERIES_CSV = EVALS / "synthetic_queries_for_analysis.csv"
+RESPONSES_CSV = EVALS / "open_coding_results.csv"
+CHEAP_FAKE_MODEL = f"openai/{FAKE_MODEL}-small"
+OFF_TOPIC = [
+    "write a python function that sorts a list",
+    "can you recommend a good pasta recipe?",
+    "who won the 2020 US presidential election",
+    "hi",
+    "translate 'good morning' into French",
+    "what is the capital of Australia?",
+    "tell me a joke",
+    "how do I reset my router password",
+]
+# Questions about players that neither the knowledge base nor the training queries know.
+UNSEEN_PLAYERS = [
+    "Who is Kobbie Mainoo",
+    "who is kobbie mainoo",
+    "who is the best young brazilian",
+    "Is Vinicius Jr worth 150 million?",
+    "tell me about alejandro garnacho",
+    "how good is Warren Zaire-Emery",
+    "is arda guler any good?",
+    "compare endrick and estevao",
+    "rate cole palmer",
+    "Is Benjamin Sesko better than Jonathan David?",
+    "how much is Desire Doue worth",
+    "who should replace Casemiro",
+    "how good is kobbie mainoo",
+    "tell me about warren zaire-emery",
+    "who won the world cup in 2022",
+]
+
+
+def cross_validate(queries: List[str], labels: List[str], groups: List[str]) -> None:
+    """Route each query with a classifier trained without its dimension tuple."""
+    from backend.router import AMBIGUOUS_LABEL, CLARIFY, QueryRouter
+
+    rows = []
+    for group in dict.fromkeys(groups):
+        train = [i for i, g in enumerate(groups) if g != group]
+        router = QueryRouter().fit([queries[i] for i in train], [labels[i] for i in train])
+        for i in (i for i, g in enumerate(groups) if g == group):
+            route = router.classify(queries[i])
+            rows.append((labels[i], route.label, route.name))
+    frame = pd.DataFrame(rows, columns=["label", "predicted", "route"])
+    ambiguous = frame["label"] == AMBIGUOUS_LABEL
+    print(f"held-out tuple label accuracy: {(frame['label'] == frame['predicted']).mean():.0%}")
+    print(f"ambiguous requests sent to the cheap model: {(frame.loc[ambiguous, 'route'] == CLARIFY).mean():.0%}")
+    print(f"other requests sent to the cheap model: {(frame.loc[~ambiguous, 'route'] == CLARIFY).mean():.0%}")
+
+
+def _cost(model: str, prompt_tokens: int, completion_tokens: int) -> Optional[float]:
+    from backend.usage import call_cost
+
+    return call_cost(model, prompt_tokens, completion_tokens)
+
+
+def estimate_costs(
+    queries: List[str], reply_tokens: Dict[str, int], model: str, cheap_model: str
+) -> Tuple[float, float]:
+    """(cost with every query on ``model``, cost with routing), in USD."""
+    from backend.utils import (
+        DEFAULT_RETRY_POLICY,
+        ROUTER_CLARIFY_MAX_TOKENS,
+        count_message_tokens,
+        routed_prompt,
+        with_player_facts,
+        with_system_prompt,
+    )
+
+    baseline = routed = 0.0
+    for query in queries:
+        messages = with_system_prompt([{"role": "user", "content": query}])
+        completion = reply_tokens.get(query, statistics.median(reply_tokens.values()))
+        full_prompt = sum(count_message_tokens(model, m["content"]) for m in with_player_facts(messages))
+        baseline += _cost(model, full_prompt, completion) or 0.0
+        prompt, policy, kwargs = routed_prompt(messages, DEFAULT_RETRY_POLICY)
+        if prompt is None:
+            continue
+        if "max_tokens" in kwargs:
+            tokens = sum(count_message_tokens(cheap_model, m["content"]) for m in prompt)
+            routed += _cost(cheap_model, tokens, min(completion, ROUTER_CLARIFY_MAX_TOKENS)) or 0.0
+        else:
+            routed += _cost(model, full_prompt, completion) or 0.0
+    return baseline, routed
+
+
+async def _latencies(queries: List[str]) -> List[float]:
+    from backend.utils import aget_agent_response, close_async_client
+
+    async def one(query: str) -> float:
+        start = time.perf_counter()
+        await aget_agent_response([{"role": "user", "content": query}])
+        return time.perf_counter() - start
+
+    try:
+        return list(await asyncio.gather(*(one(query) for query in queries)))
+    finally:
+        await close_async_client()
+
+
+def main(argv: List[str] = None) -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--model", default="openai/gpt-4.1", help="Model priced for full reports.")
+    parser.add_argument("--cheap-model", default="openai/gpt-4.1-nano", help="Model priced for clarifications.")
+    parser.add_argument("--latency", type=float, default=0.3)
+    parser.add_argument("--tokens-per-second", type=float, default=200.0)
+    parser.add_argument("--reply-words", type=int, default=None, help="Default: median reply length in the evals.")
+    args = parser.parse_args(argv)
+
+    llm_port = free_port()
+    os.environ.update(
+        MODEL_NAME=f"openai/{FAKE_MODEL}",
+        ROUTER_CHEAP_MODEL=CHEAP_FAKE_MODEL,
+        LLM_API_BASE=f"http://127.0.0.1:{llm_port}/v1",
+    )
+    os.environ.setdefault("OPENAI_API_KEY", "fake-key")
+
+    from backend.router import CANNED_REPLY, FULL, OUT_OF_SCOPE, get_router
+    from backend.utils import count_message_tokens
+
+    data = pd.read_csv(QUERIES_CSV)
+    data = data[data["is_realistic_and_kept"] != 0]
+    queries = data["query"].tolist()
+    tuples = [json.loads(value) for value in data["dimension_tuple_json"]]
+    labels = [value["Scenario"] for value in tuples]
+    responses = pd.read_csv(RESPONSES_CSV)
+    reply_tokens = {
+        query: count_message_tokens(args.model, reply)
+        for query, reply in zip(responses["original_query"], responses["open_coding_response"])
+    }
+    failures = []
+
+    cross_validate(queries, labels, data["dimension_tuple_json"].tolist())
+
+    router = get_router()
+    routes = {query: router.route([{"role": "user", "content": query}]) for query in queries + OFF_TOPIC}
+    frame = pd.DataFrame({"label": labels + ["off-topic"] * len(OFF_TOPIC),
+                          "route": [routes[query].name for query in queries + OFF_TOPIC]})
+    print(pd.crosstab(frame["label"], frame["route"]).to_string())
+    canned = [query for query in queries if routes[query].name == OUT_OF_SCOPE]
+    if canned:
+        failures.append(f"in-domain queries got the canned reply: {canned}")
+    missed = [query for query in OFF_TOPIC if routes[query].name != OUT_OF_SCOPE]
+    if missed:
+        failures.append(f"off-topic queries were sent to a model: {missed}")
+    unseen = {query: router.route([{"role": "user", "content": query}]).name for query in UNSEEN_PLAYERS}
+    misrouted = {query: name for query, name in unseen.items() if name != FULL}
+    print(f"unseen players: {len(UNSEEN_PLAYERS) - len(misrouted)}/{len(UNSEEN_PLAYERS)} get the full report")
+    if misrouted:
+        failures.append(f"questions about unseen players were misrouted: {misrouted}")
+
+    reply_words = args.reply_words or int(statistics.median(reply_tokens.values()))
+    fake = create_app(args.latency, tokens_per_second=args.tokens_per_second, reply_words=reply_words)
+    print(f"\nlatency with {reply_words}-word replies at {args.tokens_per_second:g} words/s "
+          f"(cheap model capped at its max_tokens):")
+    print(f"{'router':>8}{'queries':>11}{'mean s':>8}{'p50 s':>7}{'p95 s':>7}  calls per model")
+    summary = {}
+    with serve(fake, llm_port):
+        asyncio.run(_latencies(queries[:1]))  # imports, tokenizer and connection set-up
+        for enabled, label in ((False, "off"), (True, "on")):
+            router.enabled = enabled
+            for name, subset in (("synthetic", queries), ("+offtopic", queries + OFF_TOPIC)):
+                fake.state.models = {}
+                latencies = sorted(asyncio.run(_latencies(subset)))
+                summary[label, name] = statistics.mean(latencies)
+                print(f"{label:>8}{name:>11}{statistics.mean(latencies):>8.2f}{latencies[len(latencies) // 2]:>7.2f}"
+                      f"{latencies[int(len(latencies) * 0.95)]:>7.2f}  {dict(fake.state.models)}")
+    if summary["on", "synthetic"] >= summary["off", "synthetic"]:
+        failures.append("routing did not lower the mean latency")
+
+    print(f"\nestimated cost, full reports on {args.model}, clarifications on {args.cheap_model}:")
+    for name, subset in (("synthetic", queries), ("+offtopic", queries + OFF_TOPIC)):
+        baseline, routed = estimate_costs(subset, reply_tokens, args.model, args.cheap_model)
+        if not baseline:
+            print(f"{name}: no price for {args.model} in litellm's cost map")
+            continue
+        print(f"{name:>10}: ${baseline:.4f} -> ${routed:.4f} per {len(subset)} queries "
+              f"({1 - routed / baseline:.0%} saved)")
+        if routed >= baseline:
+            failures.append(f"routing did not lower the cost of the {name} set")
+    print(f"\ncanned reply: {CANNED_REPLY}")
+
+    for failure in failures:
+        print(f"FAIL: {failure}")
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
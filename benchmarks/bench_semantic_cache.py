@@ -0,0 +1,135 @@
+"""Offline hit rate and lookup latency of the semantic cache.
+
+Queries from ``evals/synthetic_queries_for_analysis.csv`` are replayed in
+order: each one is looked up, and cached on a miss. A hit is counted as
+correct when the cached query was generated from the same dimension tuple.
+
+The synthetic tuples do not tell players or positions apart, so precision is
+also checked at the default threshold on hand-written near misses: queries
+that must *not* get each other's reply ("compare Pedri and Gavi" vs. "compare
+Pedri and Bellingham", "best young strikers" vs. "best young goalkeepers").
+Any hit among them fails the run. Paraphrases that should hit are reported.
+
+Lookup latency is then measured with the index filled to ``--capacity``.
+
+Usage::
+
+    python -m benchmarks.bench_semantic_cache --thresholds 0.7 0.8 0.9
+"""
+
+import argparse
+import statistics
+import sys
+import time
+from pathlib import Path
+from typing import List, Tuple
+
+import numpy as np
+import pandas as pd
+
+sys.path.append(str(Path(__file__).parent.parent))
+
+from backend.players import player_name_terms
+from backend.semantic_cache import SEMANTIC_CACHE_CAPACITY, SEMANTIC_CACHE_THRESHOLD, SemanticCache
+
+QUERIES_CSV = Path(__file__).parent.parent / "evals" / "synthetic_queries_for_analysis.csv"
+NAMESPACE = "bench"
+
+# (cached query, query that must not get its reply).
+NEAR_MISSES: List[Tuple[str, str]] = [
+    ("Compare Pedri and Gavi", "compare Messi and Ronaldo"),
+    ("Compare Pedri and Gavi", "Compare Haaland and Mbappe"),
+    ("Compare Pedri and Gavi", "Compare Pedri and Bellingham"),
+    ("compare Messi and Ronaldo", "compare Neymar and Suarez"),
+    ("Who is Kobbie Mainoo?", "Who is Alejandro Garnacho?"),
+    ("tell me about Lamine Yamal", "tell me about Nico Williams"),
+    ("Is Vinicius Jr worth 150 million?", "Is Vinicius Jr worth 100 million?"),
+    ("best young strikers", "best young goalkeepers"),
+    ("best young strikers", "best young wingers"),
+    ("best young strikers", "best young strikers in Serie A"),
+    ("German defenders good at the offside trap", "Brazilian defenders good at the offside trap"),
+    ("midfielders under 21 from Spain", "midfielders under 23 from Spain"),
+]
+# (cached query, rephrasing that should get its reply).
+PARAPHRASES: List[Tuple[str, str]] = [
+    ("Compare Pedri and Gavi", "compare pedri and gavi please!"),
+    ("Compare Pedri and Gavi", "pedri vs gavi comparison"),
+    ("best young strikers", "top young strikers"),
+    ("German defenders good at the offside trap", "looking for strong german defensive players for the offside trap"),
+    ("Who is Kylian Mbappé?", "who is kylian mbappe"),
+]
+
+
+def hit_rate(queries: List[str], tuples: List[str], threshold: float) -> None:
+    """Replay the queries and print hit rate and precision at ``threshold``."""
+    cache = SemanticCache(capacity=len(queries), threshold=threshold, names=player_name_terms())
+    hits = correct = 0
+    for query, tuple_json in zip(queries, tuples):
+        cached = cache.get(query, NAMESPACE)
+        if cached is None:
+            cache.set(query, NAMESPACE, tuple_json)
+            continue
+        hits += 1
+        correct += cached == tuple_json
+    precision = correct / hits if hits else 1.0
+    print(f"{threshold:>10.2f}{hits / len(queries):>10.1%}{precision:>11.1%}")
+
+
+def pair_hits(pairs: List[Tuple[str, str]], threshold: float) -> List[Tuple[str, str]]:
+    """The pairs whose second query gets the reply cached for the first at ``threshold``."""
+    hits = []
+    for cached, query in pairs:
+        cache = SemanticCache(capacity=1, threshold=threshold, names=player_name_terms())
+        cache.set(cached, NAMESPACE, cached)
+        if cache.get(query, NAMESPACE) is not None:
+            hits.append((cached, query))
+    return hits
+
+
+def lookup_latency(queries: List[str], capacity: int, repeats: int) -> None:
+    """Print lookup latency percentiles with ``capacity`` cached entries."""
+    cache = SemanticCache(capacity=capacity, names=player_name_terms())
+    rng = np.random.default_rng(0)
+    words = " ".join(queries).split()
+    for i in range(capacity):
+        cache.set(" ".join(rng.choice(words, size=12)), NAMESPACE, str(i))
+    samples = []
+    for _ in range(repeats):
+        for query in queries:
+            start = time.perf_counter()
+            cache.get(query, NAMESPACE)
+            samples.append((time.perf_counter() - start) * 1e3)
+    samples.sort()
+    p99 = samples[int(len(samples) * 0.99) - 1]
+    print(f"lookup latency with {capacity} entries: p50 {statistics.median(samples):.3f} ms, p99 {p99:.3f} ms")
+
+
+def main(argv: List[str] = None) -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--csv", type=Path, default=QUERIES_CSV)
+    parser.add_argument("--thresholds", type=float, nargs="+", default=[0.4, 0.5, 0.6, SEMANTIC_CACHE_THRESHOLD, 0.8])
+    parser.add_argument("--capacity", type=int, default=SEMANTIC_CACHE_CAPACITY)
+    parser.add_argument("--repeats", type=int, default=10)
+    args = parser.parse_args(argv)
+
+    df = pd.read_csv(args.csv)
+    queries, tuples = df["query"].tolist(), df["dimension_tuple_json"].tolist()
+
+    print(f"{'threshold':>10}{'hit rate':>10}{'precision':>11}")
+    for threshold in args.thresholds:
+        hit_rate(queries, tuples, threshold)
+
+    wrong = pair_hits(NEAR_MISSES, SEMANTIC_CACHE_THRESHOLD)
+    found = pair_hits(PARAPHRASES, SEMANTIC_CACHE_THRESHOLD)
+    print(f"at the default threshold {SEMANTIC_CACHE_THRESHOLD}: {len(wrong)}/{len(NEAR_MISSES)} near misses "
+          f"answered from the cache, {len(found)}/{len(PARAPHRASES)} paraphrases")
+    for cached, query in wrong:
+        print(f"  wrong hit: {query!r} got the reply for {cached!r}")
+    lookup_latency(queries, args.capacity, args.repeats)
+    if wrong:
+        print(f"FAIL: {len(wrong)} near misses answered from the cache")
+    sys.exit(1 if wrong else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,71 @@
+"""Time-to-first-token of ``/chat`` versus ``/chat/stream``.
+
+Both endpoints are served by uvicorn against a fake LLM that takes
+``--latency`` seconds to the first token and then generates at
+``--tokens-per-second``. For ``/chat`` the first byte only arrives with the
+whole reply; ``/chat/stream`` should deliver its first token after roughly
+the provider latency.
+
+Usage::
+
+    python -m benchmarks.bench_stream --latency 0.3 --tokens-per-second 50 --requests 10
+"""
+
+import argparse
+import os
+import statistics
+import sys
+import time
+from pathlib import Path
+from typing import List, Tuple
+
+sys.path.append(str(Path(__file__).parent.parent))
+
+from benchmarks.fake_llm import FAKE_MODEL, create_app, free_port, serve
+
+PAYLOAD = {"messages": [{"role": "user", "content": "compare Pedri and Gavi"}]}
+
+
+def _measure(client, path: str) -> Tuple[float, float]:
+    """Return (time to first token, total time) for one request."""
+    start = time.perf_counter()
+    first = None
+    with client.stream("POST", path, json=PAYLOAD) as response:
+        response.raise_for_status()
+        for line in response.iter_lines():
+            if first is None and (path == "/chat" or line.startswith("event: delta")):
+                first = time.perf_counter() - start
+    return first, time.perf_counter() - start
+
+
+def main(argv: List[str] = None) -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--latency", type=float, default=0.3, help="Fake LLM time to first token in seconds.")
+    parser.add_argument("--tokens-per-second", type=float, default=50.0)
+    parser.add_argument("--requests", type=int, default=10)
+    args = parser.parse_args(argv)
+
+    llm_port, app_port = free_port(), free_port()
+    os.environ["MODEL_NAME"] = f"openai/{FAKE_MODEL}"
+    os.environ["LLM_API_BASE"] = f"http://127.0.0.1:{llm_port}/v1"
+    os.environ.setdefault("OPENAI_API_KEY", "fake-key")
+    # Measure the LLM path, not the response caches.
+    os.environ["RESPONSE_CACHE_ENABLED"] = "0"
+    os.environ["SEMANTIC_CACHE_ENABLED"] = "0"
+
+    import httpx
+
+    from backend.main import app
+
+    with serve(create_app(args.latency, args.tokens_per_second), llm_port), serve(app, app_port) as base_url:
+        with httpx.Client(base_url=base_url, timeout=None) as client:
+            print(f"{'endpoint':<14}{'ttft p50':>10}{'total p50':>11}")
+            for path in ("/chat", "/chat/stream"):
+                samples = [_measure(client, path) for _ in range(args.requests)]
+                ttft = statistics.median(s[0] for s in samples)
+                total = statistics.median(s[1] for s in samples)
+                print(f"{path:<14}{ttft:>10.3f}{total:>11.3f}")
+
+
+if __name__ == "__main__":
+    main()
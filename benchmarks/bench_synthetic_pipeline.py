@@ -0,0 +1,171 @@
+"""Crash, resume and rate limits of ``evals/generate_synthetic_queries.py``.
+
+Runs the generator as a subprocess against the fake LLM (structured output,
+with ``--error-rate`` of its calls failing with a 500):
+
+1. a run of ``--tuple-batches`` x ``--tuples-per-batch`` tuples is killed
+   (SIGKILL) once a third of its tuples have queries;
+2. the same command resumes it, and must not request any tuple completed by
+   the first run, nor any tuple batch;
+3. a fresh run of a few more calls than ``--rpm`` must take as long as the
+   limit implies (the bucket starts with one minute's worth of requests).
+
+The limiter's request and token buckets are also timed in process. Exits
+non-zero if a check fails.
+
+Usage::
+
+    python -m benchmarks.bench_synthetic_pipeline --tuple-batches 20 --tuples-per-batch 25
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import re
+import signal
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import List, Set
+
+import pandas as pd
+
+sys.path.append(str(Path(__file__).parent.parent))
+
+from benchmarks.fake_llm import FAKE_MODEL, create_app, free_port, serve
+
+SCRIPT = Path(__file__).parent.parent / "evals" / "generate_synthetic_queries.py"
+
+
+def _requested_tuples(payloads: List[dict]) -> List[str]:
+    """The dimension tuples of the query-generation prompts received, as JSON strings."""
+    tuples = []
+    for body in payloads:
+        match = re.search(r"dimension tuple:(\{.*?\})\nThe queries", body["messages"][-1]["content"], re.S)
+        if match:
+            tuples.append(json.dumps(json.loads(match.group(1)), sort_keys=True))
+    return tuples
+
+
+def _logged_tuples(path: Path) -> Set[str]:
+    if not path.exists():
+        return set()
+    logged = set()
+    for line in path.read_text(encoding="utf-8").splitlines():
+        try:
+            logged.add(json.dumps(json.loads(line)["dimension_tuple"], sort_keys=True))
+        except (json.JSONDecodeError, KeyError):
+            pass
+    return logged
+
+
+async def _time_limiter() -> List[str]:
+    from evals.pipeline import RateLimiter
+
+    problems = []
+    # 300 requests per minute: a full bucket of 300, then 5 per second.
+    limiter = RateLimiter(requests_per_minute=300)
+    start = time.perf_counter()
+    for _ in range(310):
+        await limiter.acquire()
+    elapsed = time.perf_counter() - start
+    print(f"limiter: 310 requests at 300 rpm took {elapsed:.2f}s (expected ~2.0s)")
+    if not 1.8 <= elapsed <= 2.6:
+        problems.append(f"request bucket: 310 requests took {elapsed:.2f}s")
+    # 30k tokens per minute: 30 calls of 1000 tokens, then 500 tokens per second;
+    # a call that used nothing gives its tokens back.
+    limiter = RateLimiter(tokens_per_minute=30_000)
+    start = time.perf_counter()
+    for i in range(32):
+        await limiter.acquire(1000)
+        if i == 0:
+            limiter.settle(1000, 0)
+    elapsed = time.perf_counter() - start
+    print(f"limiter: 32 x 1000 tokens at 30k tpm, one refunded, took {elapsed:.2f}s (expected ~2.0s)")
+    if not 1.8 <= elapsed <= 2.6:
+        problems.append(f"token bucket: 32 calls took {elapsed:.2f}s")
+    return problems
+
+
+def main(argv: List[str] = None) -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--tuple-batches", type=int, default=20)
+    parser.add_argument("--tuples-per-batch", type=int, default=25)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--latency", type=float, default=0.05)
+    parser.add_argument("--error-rate", type=float, default=0.1)
+    parser.add_argument("--rpm", type=float, default=120.0)
+    args = parser.parse_args(argv)
+
+    failures = asyncio.run(_time_limiter())
+    port = free_port()
+    fake = create_app(args.latency, error_rate=args.error_rate)
+    env = {**os.environ, "PYTHONUNBUFFERED": "1"}
+    total = args.tuple_batches * args.tuples_per_batch
+
+    with serve(fake, port), tempfile.TemporaryDirectory() as tmp:
+        run_dir, output = Path(tmp) / "run", Path(tmp) / "queries.csv"
+        command = [
+            sys.executable, str(SCRIPT), "--model", f"openai/{FAKE_MODEL}", "--api-base", f"http://127.0.0.1:{port}/v1",
+            "--tuple-batches", str(args.tuple_batches), "--tuples-per-batch", str(args.tuples_per_batch),
+            "--concurrency", str(args.concurrency), "--rpm", "0", "--tpm", "0",
+            "--run-dir", str(run_dir), "--output", str(output),
+        ]
+        env.setdefault("OPENAI_API_KEY", "fake-key")
+
+        process = subprocess.Popen(command, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        while process.poll() is None and len(_logged_tuples(run_dir / "queries.jsonl")) < total // 3:
+            time.sleep(0.02)
+        process.send_signal(signal.SIGKILL)
+        process.wait()
+        completed = _logged_tuples(run_dir / "queries.jsonl")
+        first_calls = fake.state.calls
+        print(f"run 1: killed after {len(completed)}/{total} tuples and {first_calls} calls")
+
+        fake.state.payloads = []
+        start = time.perf_counter()
+        resumed = subprocess.run(command, env=env, capture_output=True, text=True)
+        elapsed = time.perf_counter() - start
+        requested = _requested_tuples(fake.state.payloads)
+        batches = sum("random combinations" in body["messages"][-1]["content"] for body in fake.state.payloads)
+        print(f"run 2: resumed in {elapsed:.2f}s with {fake.state.calls - first_calls} calls "
+              f"({len(set(requested))} tuples, {batches} tuple batches, {len(requested) - len(set(requested))} retries)")
+        if resumed.returncode:
+            failures.append(f"resumed run exited with {resumed.returncode}: {resumed.stdout[-500:]}")
+        if completed & set(requested):
+            failures.append(f"{len(completed & set(requested))} tuples completed by run 1 were requested again")
+        if batches:
+            failures.append(f"{batches} tuple batches were requested again")
+        if len(requested) == len(set(requested)) and args.error_rate:
+            failures.append("no call was retried despite injected errors")
+        frame = pd.read_csv(output)
+        tuples = frame["dimension_tuple_json"].nunique()
+        print(f"output: {len(frame)} queries for {tuples} tuples, {frame['id'].nunique()} unique ids")
+        if tuples != len(_logged_tuples(run_dir / "queries.jsonl")) or frame["id"].nunique() != len(frame):
+            failures.append("the CSV does not match the log")
+        if tuples < total * 0.95:
+            failures.append(f"only {tuples} of {total} tuples in the output")
+
+        # Fresh run of one batch: every call above one minute's worth waits for the request bucket.
+        per_batch = int(args.rpm) + 5
+        calls = per_batch + 1
+        limited = [*command, "--tuple-batches", "1", "--tuples-per-batch", str(per_batch), "--rpm", str(args.rpm), "--restart"]
+        fake.state.error_rate = 0.0
+        start = time.perf_counter()
+        subprocess.run(limited, env=env, capture_output=True, text=True, check=True)
+        elapsed = time.perf_counter() - start
+        expected = max(calls - args.rpm, 0) * 60 / args.rpm
+        print(f"run 3: {calls} calls at {args.rpm:g} rpm in {elapsed:.2f}s (limit implies >= {expected:.2f}s)")
+        if elapsed < expected:
+            failures.append(f"{calls} calls at {args.rpm:g} rpm finished in {elapsed:.2f}s")
+
+    for failure in failures:
+        print(f"FAIL: {failure}")
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
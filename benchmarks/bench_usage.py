@@ -0,0 +1,249 @@
+"""Token and cost accounting (``backend/usage.py``).
+
+1. The hot path: ``--records`` calls of :meth:`UsageLedger.record` from
+   ``--threads`` threads while the flush thread runs, and :meth:`check` on a
+   budgeted account; every call must reach the store, in a few batched
+   transactions.
+2. Against the fake LLM, the app in this process: a session is given a
+   budget of a few turns and talks until refused with 429; the refused turn
+   must not reach the provider. Concurrent sessions (plain and streamed)
+   follow, and ``/usage/stats`` must account for exactly the tokens the fake
+   reported.
+3. ``generate_synthetic_queries.py --token-budget`` stops early, and the same
+   run without a budget completes what was refused.
+4. Costs of a call for models priced by the bundled table and by litellm.
+
+Exits non-zero if a check fails or recording costs more than
+``--max-record-us`` microseconds per call.
+
+Usage::
+
+    python -m benchmarks.bench_usage --records 200000 --sessions 20
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from pathlib import Path
+from typing import Any, Dict, List
+
+sys.path.append(str(Path(__file__).parent.parent))
+
+from benchmarks.fake_llm import FAKE_MODEL, create_app, free_port, serve
+
+EVALS = Path(__file__).parent.parent / "evals"
+
+
+def bench_hot_path(path: str, records: int, threads: int, failures: List[str], max_record_us: float) -> None:
+    from backend.usage import TokenBudgetExceeded, UsageLedger
+
+    ledger = UsageLedger(path, flush_interval=0.05, flush_calls=1000)
+    per_thread = records // threads
+
+    def work(worker: int) -> None:
+        for i in range(per_thread):
+            ledger.record("m", 100, 20, 50, 0, account=f"session:{worker}-{i % 100}")
+
+    workers = [threading.Thread(target=work, args=(worker,)) for worker in range(threads)]
+    start = time.perf_counter()
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    elapsed = time.perf_counter() - start
+    record_us = elapsed / (per_thread * threads) * 1e6
+    print(f"record(): {record_us:.2f} us per call ({per_thread * threads} calls, {threads} threads, "
+          f"flush thread running)")
+    if record_us > max_record_us:
+        failures.append(f"record() took {record_us:.2f} us per call (max {max_record_us})")
+
+    ledger.set_budget("session:budgeted", 10_000_000)
+    ledger.check(account="session:budgeted")  # loads the stored total once
+    start = time.perf_counter()
+    for _ in range(100_000):
+        ledger.check(account="session:budgeted")
+    print(f"check() on a budgeted account: {(time.perf_counter() - start) * 10:.2f} us per call")
+    ledger.record("m", 60, 0, account="session:budgeted")
+    ledger.set_budget("session:budgeted", 50)
+    try:
+        ledger.check(account="session:budgeted")
+        failures.append("an account over its budget was not refused")
+    except TokenBudgetExceeded:
+        pass
+
+    ledger.flush()
+    flushes = ledger.flushes
+    (rows, tokens) = ledger._conn.execute("SELECT COUNT(*), SUM(prompt_tokens + completion_tokens) FROM calls").fetchone()
+    print(f"store: {rows} rows written in {flushes} transactions")
+    expected = per_thread * threads + 1
+    if rows != expected or tokens != (per_thread * threads) * 120 + 60:
+        failures.append(f"the store holds {rows} calls / {tokens} tokens, expected {expected}")
+    if flushes > expected // 100:
+        failures.append(f"{flushes} transactions for {expected} calls: flushes are not batched")
+    ledger.close()
+
+
+async def _turns(base_url: str, sessions: int, turns: int, stream: bool) -> List[str]:
+    """``sessions`` concurrent conversations of ``turns`` turns; return their session ids."""
+    import httpx
+
+    async def conversation(client: httpx.AsyncClient, number: int) -> str:
+        session_id = None
+        for turn in range(turns):
+            kind = "streamed" if stream else "plain"
+            message = {"role": "user", "content": f"{kind} session {number} turn {turn}: compare Pedri and Gavi"}
+            payload = {"session_id": session_id, "message": message}
+            if stream:
+                async with client.stream("POST", "/chat/session/stream", json=payload) as response:
+                    lines = [line async for line in response.aiter_lines() if line.startswith("data:")]
+                session_id = json.loads(lines[-1][len("data:"):])["session_id"]
+            else:
+                response = await client.post("/chat/session", json=payload)
+                response.raise_for_status()
+                session_id = response.json()["session_id"]
+        return session_id
+
+    async with httpx.AsyncClient(base_url=base_url, timeout=None) as client:
+        return await asyncio.gather(*(conversation(client, number) for number in range(sessions)))
+
+
+def bench_app(llm_port: int, sessions: int, failures: List[str]) -> None:
+    import httpx
+
+    from backend.main import app
+    from backend.usage import get_usage_ledger
+
+    app_port = free_port()
+    fake = create_app(0.02)
+    ledger = get_usage_ledger()
+    with serve(fake, llm_port), serve(app, app_port) as base_url:
+        with httpx.Client(base_url=base_url, timeout=None) as client:
+            first = client.post("/chat/session", json={"message": {"role": "user", "content": "compare Pedri and Gavi"}})
+            first.raise_for_status()
+            session_id = first.json()["session_id"]
+            account = f"session:{session_id}"
+            per_turn = ledger.used(account)
+            ledger.set_budget(account, per_turn * 4)
+            turns, refused = 1, None
+            while refused is None and turns < 50:
+                calls = fake.state.calls
+                used = ledger.used(account)
+                response = client.post("/chat/session", json={
+                    "session_id": session_id, "message": {"role": "user", "content": f"and turn {turns}?"},
+                })
+                if response.status_code == 429:
+                    refused = (used, fake.state.calls - calls)
+                else:
+                    response.raise_for_status()
+                    turns += 1
+            if refused is None:
+                failures.append("the session was never refused")
+            else:
+                print(f"session with a budget of {per_turn * 4} tokens ({per_turn} on its first turn): "
+                      f"refused at turn {turns + 1} with {refused[0]} used; "
+                      f"upstream calls for the refused turn: {refused[1]}")
+                if refused[1] or refused[0] < per_turn * 4:
+                    failures.append("the refused turn reached the provider or came before the budget was used")
+
+        start = time.perf_counter()
+        plain = asyncio.run(_turns(base_url, sessions, 3, stream=False))
+        streamed = asyncio.run(_turns(base_url, sessions // 2, 2, stream=True))
+        print(f"{sessions} sessions x 3 turns and {sessions // 2} streamed x 2 in {time.perf_counter() - start:.2f}s")
+        with httpx.Client(base_url=base_url) as client:
+            by_account = {row["account"]: row for row in client.get("/usage/stats", params={"by": "account"}).json()}
+            by_model = client.get("/usage/stats").json()
+    charged = [by_account.get(f"session:{session_id}", {}).get("calls", 0) for session_id in plain + streamed]
+    if charged != [3] * len(plain) + [2] * len(streamed):
+        failures.append(f"sessions were charged {sorted(set(charged))} calls, expected 3 (2 streamed)")
+    prompt = sum(row["prompt_tokens"] for row in by_model)
+    completion = sum(row["completion_tokens"] for row in by_model)
+    print(f"/usage/stats: {by_model}")
+    print(f"fake LLM reported {fake.state.tokens}; ledger holds prompt {prompt}, completion {completion}")
+    if (prompt, completion) != (fake.state.tokens["prompt"], fake.state.tokens["completion"]):
+        failures.append("the ledger does not hold the tokens the provider reported")
+    if any(row["cost_usd"] is None for row in by_model):
+        failures.append("a model has no cost")
+
+
+def bench_eval_budget(env: Dict[str, Any], tmp: Path, failures: List[str]) -> None:
+    from backend.usage import UsageLedger
+
+    port = free_port()
+    fake = create_app(0.01)
+    generate = [
+        sys.executable, str(EVALS / "generate_synthetic_queries.py"), "--model", f"openai/{FAKE_MODEL}",
+        "--api-base", f"http://127.0.0.1:{port}/v1", "--tuple-batches", "4", "--tuples-per-batch", "10",
+        "--rpm", "0", "--tpm", "0", "--concurrency", "2", "--run-dir", str(tmp / "run"),
+        "--output", str(tmp / "queries.csv"), "--cache", "off", "--run-name", "budgeted", "--dedup-threshold", "0",
+    ]
+    with serve(fake, port):
+        budgeted = subprocess.run([*generate, "--token-budget", "6000"], env=env, capture_output=True, text=True)
+        first = fake.state.calls
+        resumed = subprocess.run([*generate, "--token-budget", "0"], env=env, capture_output=True, text=True)
+    ledger = UsageLedger(env["USAGE_DB_PATH"])
+    (row,) = ledger.report(("account",), account="run:budgeted")
+    ledger.close()
+    tuples = sum(1 for line in (tmp / "run" / "queries.jsonl").read_text().splitlines() if line)
+    print(f"generate with a 6000-token budget: exit {budgeted.returncode}, {first} calls; "
+          f"resumed without budget: exit {resumed.returncode}, {fake.state.calls - first} calls, {tuples} tuples done")
+    print(f"run:budgeted: {row['calls']} calls, {row['prompt_tokens'] + row['completion_tokens']} tokens, "
+          f"fake LLM reported {sum(fake.state.tokens.values())}")
+    if budgeted.returncode != 1 or resumed.returncode != 0:
+        failures.append("the budgeted run did not stop early, or the resumed run did not complete")
+    if row["calls"] != fake.state.calls or row["prompt_tokens"] + row["completion_tokens"] != sum(fake.state.tokens.values()):
+        failures.append("the eval run was not charged what the provider reported")
+
+
+def main(argv: List[str] = None) -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--records", type=int, default=200_000)
+    parser.add_argument("--threads", type=int, default=4)
+    parser.add_argument("--sessions", type=int, default=20)
+    parser.add_argument("--max-record-us", type=float, default=5.0)
+    args = parser.parse_args(argv)
+
+    failures: List[str] = []
+    with tempfile.TemporaryDirectory() as tmp:
+        tmp = Path(tmp)
+        # Set before backend.usage and backend.main read their configuration.
+        env = {
+            "MODEL_NAME": f"openai/{FAKE_MODEL}",
+            "OPENAI_API_KEY": os.environ.get("OPENAI_API_KEY", "fake-key"),
+            "USAGE_ENABLED": "1",
+            "USAGE_DB_PATH": str(tmp / "usage.sqlite3"),
+            "USAGE_PRICES": '{"openai/fake-model": {"input": 0.1, "output": 0.4}}',
+            "SESSION_DB_PATH": str(tmp / "sessions.sqlite3"),
+            "SEMANTIC_CACHE_ENABLED": "0",
+            "LLM_CACHE_MODE": "off",
+        }
+        os.environ.update(env)
+        llm_port = free_port()
+        os.environ["LLM_API_BASE"] = f"http://127.0.0.1:{llm_port}/v1"
+        bench_hot_path(str(tmp / "hot.sqlite3"), args.records, args.threads, failures, args.max_record_us)
+        bench_app(llm_port, args.sessions, failures)
+
+        env["USAGE_DB_PATH"] = str(tmp / "eval_usage.sqlite3")
+        bench_eval_budget({**os.environ, **env}, tmp, failures)
+
+    from backend.usage import call_cost
+
+    haiku = call_cost("anthropic/claude-3-haiku-20240307", 1_000_000, 1_000_000, cached=500_000)
+    gpt = call_cost("openai/gpt-4.1", 1_000_000, 1_000_000)
+    print(f"cost of 1M prompt (half cached) + 1M completion tokens on claude-3-haiku: ${haiku:.4f}; "
+          f"1M + 1M on gpt-4.1: ${gpt:.2f}; unknown model: {call_cost('openai/nonexistent', 10, 10)}")
+    if abs(haiku - (0.125 + 0.015 + 1.25)) > 1e-9 or abs(gpt - 10.0) > 1e-9:
+        failures.append("unexpected costs")
+
+    for failure in failures:
+        print(f"FAIL: {failure}")
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
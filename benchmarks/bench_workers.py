@@ -0,0 +1,202 @@
+"""Multi-worker launch mode (``python -m backend.serve``) against the fake LLM.
+
+Starts ``--workers`` workers sharing state through the SQLite stand-in and
+checks, over fresh connections so that requests spread over the workers:
+
+1. sessions: every turn of ``--sessions`` concurrent sessions reaches the LLM
+   with the full history, whichever worker served the previous turns;
+2. response cache: a question asked ``--repeats`` times calls the LLM once;
+3. rate limit: of a burst of requests from one client, exactly
+   ``CLIENT_RATE_LIMIT_PER_MINUTE`` are admitted across all workers;
+4. graceful shutdown: SIGTERM while LLM calls are in flight; every one of
+   them is answered, new connections are refused and the server exits 0.
+
+Exits non-zero if a check fails.
+
+Usage::
+
+    python -m benchmarks.bench_workers --workers 2 --sessions 8
+"""
+
+import argparse
+import asyncio
+import os
+import signal
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from pathlib import Path
+from typing import Any, Dict, List
+
+sys.path.append(str(Path(__file__).parent.parent))
+
+from benchmarks.fake_llm import FAKE_MODEL, create_app, free_port, serve
+
+RATE_LIMIT = 10
+
+
+def _start(port: int, llm_port: int, workers: int, tmp: Path) -> subprocess.Popen:
+    env = {
+        **os.environ,
+        "MODEL_NAME": f"openai/{FAKE_MODEL}",
+        "LLM_API_BASE": f"http://127.0.0.1:{llm_port}/v1",
+        "OPENAI_API_KEY": os.environ.get("OPENAI_API_KEY", "fake-key"),
+        "SHARED_STATE_URL": f"sqlite:///{tmp / 'shared_state.sqlite3'}",
+        "USAGE_DB_PATH": str(tmp / "usage.sqlite3"),
+        "CLIENT_RATE_LIMIT_PER_MINUTE": str(RATE_LIMIT),
+        "SEMANTIC_CACHE_ENABLED": "0",
+        "LLM_CACHE_MODE": "off",
+    }
+    env.pop("SESSION_BACKEND", None)
+    return subprocess.Popen(
+        [sys.executable, "-m", "backend.serve", "--port", str(port), "--workers", str(workers),
+         "--drain-seconds", "20", "--log-level", "warning"],
+        cwd=Path(__file__).parent.parent, env=env, start_new_session=True,
+    )
+
+
+def _wait_ready(base_url: str, process: subprocess.Popen, workers: int, timeout: float = 120.0) -> float:
+    """Wait until the server answers; return the seconds it took."""
+    import httpx
+
+    start = time.perf_counter()
+    while time.perf_counter() - start < timeout:
+        if process.poll() is not None:
+            raise RuntimeError(f"backend.serve exited with {process.returncode}")
+        try:
+            httpx.get(f"{base_url}/admission/stats", timeout=1.0).raise_for_status()
+            # Give the other workers time to finish importing too.
+            time.sleep(2.0 * workers)
+            return time.perf_counter() - start
+        except httpx.HTTPError:
+            time.sleep(0.2)
+    raise RuntimeError("backend.serve did not start")
+
+
+async def _sessions(base_url: str, sessions: int, turns: int) -> None:
+    import httpx
+
+    async def conversation(number: int) -> None:
+        session_id = None
+        for turn in range(turns):
+            # A new connection per turn, so the turns spread over the workers.
+            async with httpx.AsyncClient(base_url=base_url, timeout=None) as client:
+                response = await client.post("/chat/session", json={
+                    "session_id": session_id,
+                    "message": {"role": "user", "content": f"session {number} turn {turn}: tell me about Pedri"},
+                }, headers={"X-Client-Id": f"bench-session-{number}"})
+                response.raise_for_status()
+                session_id = response.json()["session_id"]
+
+    await asyncio.gather(*(conversation(number) for number in range(sessions)))
+
+
+async def _burst(base_url: str, requests: int, path: str, payload: Dict[str, Any], headers: Dict[str, str]) -> List[int]:
+    import httpx
+
+    async def one() -> int:
+        async with httpx.AsyncClient(base_url=base_url, timeout=None) as client:
+            return (await client.post(path, json=payload, headers=headers)).status_code
+
+    return await asyncio.gather(*(one() for _ in range(requests)))
+
+
+def main(argv: List[str] = None) -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--workers", type=int, default=2)
+    parser.add_argument("--sessions", type=int, default=8)
+    parser.add_argument("--turns", type=int, default=4)
+    parser.add_argument("--repeats", type=int, default=20)
+    parser.add_argument("--latency", type=float, default=0.5, help="Seconds per fake LLM reply.")
+    args = parser.parse_args(argv)
+
+    import httpx
+
+    failures: List[str] = []
+    # Number of messages (system prompt included) of every LLM call, by its last user message.
+    seen: Dict[str, int] = {}
+    lock = threading.Lock()
+
+    def record(messages: List[Dict[str, Any]]) -> None:
+        with lock:
+            seen[str(messages[-1]["content"]).split("\n\n")[0]] = len(messages)
+        return None
+
+    llm_port, port = free_port(), free_port()
+    base_url = f"http://127.0.0.1:{port}"
+    fake = create_app(args.latency, replies=record)
+    with tempfile.TemporaryDirectory() as tmp, serve(fake, llm_port):
+        process = _start(port, llm_port, args.workers, Path(tmp))
+        try:
+            print(f"{args.workers} workers ready in {_wait_ready(base_url, process, args.workers):.1f}s")
+
+            start = time.perf_counter()
+            asyncio.run(_sessions(base_url, args.sessions, args.turns))
+            wrong = [
+                (number, turn, seen.get(f"session {number} turn {turn}: tell me about Pedri"))
+                for number in range(args.sessions) for turn in range(args.turns)
+                if seen.get(f"session {number} turn {turn}: tell me about Pedri") != 2 * turn + 2
+            ]
+            print(f"{args.sessions} sessions x {args.turns} turns in {time.perf_counter() - start:.2f}s; "
+                  f"turns sent without their full history: {len(wrong)}")
+            if wrong:
+                failures.append(f"turns lost their history across workers: {wrong[:5]}")
+
+            calls = fake.state.calls
+            question = {"messages": [{"role": "user", "content": "Compare Pedri and Gavi"}]}
+            first = asyncio.run(_burst(base_url, 1, "/chat", question, {"X-Client-Id": "bench-cache"}))
+            repeated = asyncio.run(_burst(base_url, args.repeats, "/chat", question, {"X-Client-Id": "bench-cache"}))
+            upstream = fake.state.calls - calls
+            print(f"one question asked {args.repeats + 1} times over fresh connections: {upstream} LLM call(s)")
+            if first != [200] or set(repeated) != {200} or upstream != 1:
+                failures.append(f"the response cache is not shared: {upstream} LLM calls")
+
+            burst = asyncio.run(_burst(
+                base_url, RATE_LIMIT + 8, "/chat", {"messages": [{"role": "user", "content": "Who is Lamine Yamal?"}]},
+                {"X-Client-Id": "bench-burst", "Cache-Control": "no-store"},
+            ))
+            admitted = burst.count(200)
+            print(f"burst of {len(burst)} requests from one client at {RATE_LIMIT}/min: "
+                  f"{admitted} admitted, {burst.count(429)} rate limited")
+            if admitted != RATE_LIMIT or burst.count(429) != len(burst) - RATE_LIMIT:
+                failures.append(f"{admitted} requests admitted across workers, expected {RATE_LIMIT}")
+
+            results: List[int] = []
+            in_flight = threading.Thread(target=lambda: results.extend(asyncio.run(_burst(
+                base_url, 2 * args.workers, "/chat", {"messages": [{"role": "user", "content": "Scout Jamal Musiala"}]},
+                {"Cache-Control": "no-store", "X-Client-Id": "bench-drain"},
+            ))))
+            calls = fake.state.calls
+            in_flight.start()
+            while fake.state.calls - calls < 2 * args.workers:
+                time.sleep(0.01)
+            stop = time.perf_counter()
+            process.send_signal(signal.SIGTERM)
+            refused = False
+            while not refused and in_flight.is_alive():
+                try:
+                    httpx.get(f"{base_url}/admission/stats", timeout=1.0)
+                    time.sleep(0.02)
+                except httpx.HTTPError:
+                    # Refused while the calls admitted before SIGTERM were still running.
+                    refused = True
+            in_flight.join()
+            code = process.wait(timeout=60)
+            print(f"SIGTERM with {2 * args.workers} LLM calls in flight: answered {results}, "
+                  f"new connections refused: {refused}, exit {code} after {time.perf_counter() - stop:.2f}s")
+            if results != [200] * (2 * args.workers) or not refused or code != 0:
+                failures.append("the shutdown did not drain the calls in flight cleanly")
+        finally:
+            if process.poll() is None:
+                # The workers too, not only the supervisor.
+                os.killpg(process.pid, signal.SIGKILL)
+
+    for failure in failures:
+        print(f"FAIL: {failure}")
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
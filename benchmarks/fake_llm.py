@@ -0,0 +1,358 @@
+"""Local OpenAI-compatible stub used by the benchmarks.
+
+The server answers ``POST /v1/chat/completions`` after a fixed delay so that
+backend throughput can be measured without paying for (or waiting on) a real
+provider. Streaming requests (``stream: true``) are answered with one SSE chunk
+per word, paced at ``tokens_per_second``; ``max_tokens`` truncates the reply.
+Requests with a JSON-schema ``response_format`` (structured output) get a JSON
+instance of the schema whose arrays have as many items as the first number in
+the prompt ("Generate 5 queries..."). Point the backend at it with::
+
+    MODEL_NAME=openai/fake-model LLM_API_BASE=http://127.0.0.1:<port>/v1
+
+It can also run as its own process::
+
+    python -m benchmarks.fake_llm --port 9000 --latency 0.5 --tokens-per-second 50
+"""
+
+import argparse
+import asyncio
+import random
+import re
+import socket
+import threading
+import time
+from contextlib import contextmanager
+import json
+from email.parser import BytesParser
+from typing import Any, AsyncIterator, Callable, Dict, Iterator, List, Optional, Union
+
+import uvicorn  # type: ignore
+from fastapi import FastAPI, Request  # type: ignore
+from fastapi.responses import JSONResponse, Response, StreamingResponse  # type: ignore
+from starlette.requests import ClientDisconnect  # type: ignore
+
+FAKE_MODEL: str = "fake-model"
+FAKE_REPLY: str = (
+    "## Pedri\n"
+    "- **Age:** 21\n"
+    "- **Team:** FC Barcelona\n"
+    "- **Market price:** unknown\n\n"
+    "### Strengths\n"
+    "- Press-resistant, excellent close control and vision between the lines.\n"
+    "- Progresses the ball with short passes and carries.\n\n"
+    "### Weaknesses\n"
+    "- Limited aerial presence and goal output.\n\n"
+    "## Comparison\n"
+    "Both players fit a possession-based 4-3-3; Pedri suits a controlling interior role."
+)
+
+
+def create_app(
+    latency: float = 0.5,
+    tokens_per_second: Optional[float] = None,
+    error_rate: float = 0.0,
+    error_status: int = 500,
+    slow_rate: float = 0.0,
+    slow_latency: float = 5.0,
+    reject_cache_control: bool = False,
+    reply_words: Optional[int] = None,
+    replies: Optional[Callable[[List[Dict[str, Any]]], Optional[str]]] = None,
+) -> FastAPI:
+    """Build the stub app.
+
+    Args:
+        latency (float): Seconds before the first token (or the whole reply).
+        tokens_per_second (Optional[float]): Generation speed after the first
+            token; ``None`` produces the whole reply instantly.
+        error_rate (float): Fraction of calls answered with ``error_status``
+            (after ``latency``) instead of a completion.
+        error_status (int): HTTP status of injected errors; 408, 409, 429 and 5xx are retried.
+        slow_rate (float): Fraction of calls delayed by an extra ``slow_latency``
+            seconds, to produce a latency tail.
+        slow_latency (float): Extra delay of the slow calls.
+        reject_cache_control (bool): Answer 400 to prompts with ``cache_control``
+            breakpoints, like a provider without prompt caching.
+        reply_words (Optional[int]): Length of the reply in words (the built-in
+            reply is repeated); ``None`` sends it once.
+        replies (Optional[Callable]): Reply to a prompt (its messages), e.g. one
+            recorded from a real model; ``None`` from it falls back to the built-in reply.
+
+    Prompt caching is simulated like Anthropic does it: a message marked with
+    ``cache_control`` stores the prompt prefix ending there, and later prompts
+    starting with a stored prefix report its tokens as ``cached_tokens``.
+    ``app.state.payloads`` keeps the request bodies received.
+
+    A minimal OpenAI Batch API is served too (``POST /v1/files``, ``POST
+    /v1/batches``, ``GET /v1/batches/{id}`` and ``GET
+    /v1/files/{id}/content``): a batch completes ``app.state.batch_delay``
+    seconds (default ``latency``) after it is created, its requests answered
+    like individual calls. ``app.state.batches`` keeps the batches created.
+
+    ``app.state.calls`` counts the calls received, ``app.state.models`` the
+    calls per requested model and ``app.state.tokens`` the prompt and
+    completion tokens reported. Streams report their usage in a last chunk
+    when asked to (``stream_options.include_usage``). ``error_rate``, ``error_status``, ``slow_rate``
+    and ``failing_models`` (models that always get ``error_status``) on
+    ``app.state`` can be changed while the server runs.
+    """
+    app = FastAPI(title="Fake LLM")
+    app.state.calls = 0
+    app.state.error_rate = error_rate
+    app.state.error_status = error_status
+    app.state.slow_rate = slow_rate
+    app.state.failing_models = set()
+    app.state.models = {}
+    app.state.tokens = {"prompt": 0, "completion": 0}
+    app.state.payloads = []
+    app.state.reject_cache_control = reject_cache_control
+    app.state.batch_delay = latency
+    app.state.batch_tasks = set()
+    files: Dict[str, bytes] = {}
+    batches: Dict[str, Dict[str, Any]] = {}
+    app.state.batches = batches
+    cached_prefixes: set = set()
+    rng = random.Random(0)
+    token_delay = 1.0 / tokens_per_second if tokens_per_second else 0.0
+    words = FAKE_REPLY.split(" ")
+    if reply_words:
+        words = (words * (reply_words // len(words) + 1))[:reply_words]
+
+    async def stream_reply(
+        model: str, call_id: int, words: List[str], usage: Optional[Dict[str, Any]] = None
+    ) -> AsyncIterator[str]:
+        for i, word in enumerate(words):
+            if i:
+                await asyncio.sleep(token_delay)
+            chunk = {
+                "id": f"chatcmpl-{call_id}",
+                "object": "chat.completion.chunk",
+                "created": int(time.time()),
+                "model": model,
+                "choices": [{"index": 0, "delta": {"content": word if i == 0 else " " + word}, "finish_reason": None}],
+            }
+            yield f"data: {json.dumps(chunk)}\n\n"
+        final = {
+            "id": f"chatcmpl-{call_id}",
+            "object": "chat.completion.chunk",
+            "created": int(time.time()),
+            "model": model,
+            "choices": [{"index": 0, "delta": {}, "finish_reason": "stop"}],
+        }
+        yield f"data: {json.dumps(final)}\n\n"
+        if usage is not None:
+            yield f"data: {json.dumps({**final, 'choices': [], 'usage': usage})}\n\n"
+        yield "data: [DONE]\n\n"
+
+    @app.post("/v1/chat/completions", response_model=None)
+    @app.post("/chat/completions", response_model=None)
+    async def chat_completions(request: Request) -> Union[Dict[str, Any], JSONResponse, StreamingResponse]:
+        try:
+            body = await request.json()
+        except ClientDisconnect:
+            # A cancelled (e.g. hedged) request that never finished sending.
+            return JSONResponse(status_code=499, content={})
+        return await complete(body)
+
+    async def complete(body: Dict[str, Any]) -> Union[Dict[str, Any], JSONResponse, StreamingResponse]:
+        app.state.calls += 1
+        app.state.payloads.append(body)
+        model = body.get("model", FAKE_MODEL)
+        app.state.models[model] = app.state.models.get(model, 0) + 1
+        slow = app.state.slow_rate and rng.random() < app.state.slow_rate
+        await asyncio.sleep(latency + (slow_latency if slow else 0.0))
+        failing = model in app.state.failing_models
+        if failing or (app.state.error_rate and rng.random() < app.state.error_rate):
+            return JSONResponse(
+                status_code=app.state.error_status,
+                content={"error": {"message": "injected failure", "type": "server_error", "code": app.state.error_status}},
+            )
+        messages = body.get("messages", [])
+        marked = [i for i, message in enumerate(messages) if _has_cache_control(message)]
+        if marked and app.state.reject_cache_control:
+            return JSONResponse(
+                status_code=400,
+                content={"error": {"message": "cache_control is not supported", "type": "invalid_request_error"}},
+            )
+        prefix_tokens = [0]
+        for message in messages:
+            prefix_tokens.append(prefix_tokens[-1] + _count_words(message))
+        cached_tokens = next(
+            (prefix_tokens[i] for i in range(len(messages), 0, -1) if _prefix_key(messages[:i]) in cached_prefixes), 0
+        )
+        for i in marked:
+            cached_prefixes.add(_prefix_key(messages[:i + 1]))
+        cache_write_tokens = prefix_tokens[marked[-1] + 1] - cached_tokens if marked else 0
+        recorded = replies(messages) if replies is not None else None
+        reply = recorded.split(" ") if recorded is not None else words
+        reply = reply[:body["max_tokens"]] if body.get("max_tokens") else reply
+        schema = (body.get("response_format") or {}).get("json_schema", {}).get("schema")
+        if schema is not None:
+            match = re.search(r"\d+", _text(messages[-1])) if messages else None
+            instance = _fake_instance(schema, schema.get("$defs", {}), int(match.group()) if match else 3, rng)
+            reply = json.dumps(instance).split(" ")
+        prompt_tokens = prefix_tokens[-1]
+        completion_tokens = len(reply)
+        usage = {
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": completion_tokens,
+            "total_tokens": prompt_tokens + completion_tokens,
+            "prompt_tokens_details": {"cached_tokens": cached_tokens},
+            "cache_creation_input_tokens": max(cache_write_tokens, 0),
+        }
+        app.state.tokens["prompt"] += prompt_tokens
+        app.state.tokens["completion"] += completion_tokens
+        if body.get("stream"):
+            include_usage = (body.get("stream_options") or {}).get("include_usage")
+            return StreamingResponse(
+                stream_reply(model, app.state.calls, reply, usage if include_usage else None),
+                media_type="text/event-stream",
+            )
+        await asyncio.sleep(token_delay * (len(reply) - 1))
+        return {
+            "id": f"chatcmpl-{app.state.calls}",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": model,
+            "choices": [{
+                "index": 0,
+                "message": {"role": "assistant", "content": " ".join(reply)},
+                "finish_reason": "stop",
+            }],
+            "usage": usage,
+        }
+
+    @app.post("/v1/files", response_model=None)
+    async def upload_file(request: Request) -> Dict[str, Any]:
+        raw = await request.body()
+        header = f"Content-Type: {request.headers['content-type']}\r\n\r\n".encode()
+        parts = BytesParser().parsebytes(header + raw).get_payload()
+        content = next(part.get_payload(decode=True) for part in parts if part.get_filename())
+        file_id = f"file-{len(files) + 1}"
+        files[file_id] = content
+        return {"id": file_id, "object": "file", "bytes": len(content), "purpose": "batch"}
+
+    @app.get("/v1/files/{file_id}/content", response_model=None)
+    async def file_content(file_id: str) -> Response:
+        return Response(files[file_id], media_type="application/jsonl")
+
+    @app.post("/v1/batches", response_model=None)
+    async def create_batch(request: Request) -> Dict[str, Any]:
+        body = await request.json()
+        batch_id = f"batch-{len(batches) + 1}"
+        lines = [json.loads(line) for line in files[body["input_file_id"]].decode().splitlines() if line.strip()]
+        batches[batch_id] = {
+            "id": batch_id, "object": "batch", "endpoint": body["endpoint"], "status": "in_progress",
+            "input_file_id": body["input_file_id"], "output_file_id": None,
+            "request_counts": {"total": len(lines), "completed": 0, "failed": 0},
+        }
+        app.state.batch_tasks.add(asyncio.ensure_future(run_batch(batches[batch_id], lines)))
+        return batches[batch_id]
+
+    @app.get("/v1/batches/{batch_id}", response_model=None)
+    async def get_batch(batch_id: str) -> Dict[str, Any]:
+        return batches[batch_id]
+
+    async def run_batch(batch: Dict[str, Any], lines: List[Dict[str, Any]]) -> None:
+        """Answer every request of a batch concurrently, like a provider's batch worker."""
+        await asyncio.sleep(app.state.batch_delay)
+        responses = await asyncio.gather(*(complete({**line["body"], "stream": False}) for line in lines))
+        output = []
+        for line, response in zip(lines, responses):
+            failed = isinstance(response, JSONResponse)
+            body = json.loads(response.body) if failed else response
+            output.append({"id": f"batch_req_{len(output)}", "custom_id": line["custom_id"],
+                           "response": {"status_code": response.status_code if failed else 200, "body": body},
+                           "error": None})
+            batch["request_counts"]["failed" if failed else "completed"] += 1
+        file_id = f"file-{len(files) + 1}"
+        files[file_id] = "".join(json.dumps(line) + "\n" for line in output).encode()
+        batch.update(status="completed", output_file_id=file_id)
+
+    return app
+
+
+def _text(message: Dict[str, Any]) -> str:
+    content = message.get("content") or ""
+    return content if isinstance(content, str) else "".join(block.get("text", "") for block in content)
+
+
+def _fake_instance(schema: Dict[str, Any], defs: Dict[str, Any], items: int, rng: random.Random) -> Any:
+    """A value valid for the JSON ``schema``: ``items`` array items, random short strings."""
+    if "$ref" in schema:
+        return _fake_instance(defs[schema["$ref"].rsplit("/", 1)[-1]], defs, items, rng)
+    kind = schema.get("type")
+    if kind == "object":
+        return {name: _fake_instance(value, defs, items, rng) for name, value in schema.get("properties", {}).items()}
+    if kind == "array":
+        return [_fake_instance(schema.get("items", {}), defs, items, rng) for _ in range(items)]
+    if kind in ("integer", "number"):
+        return rng.randint(0, 100)
+    if kind == "boolean":
+        return rng.random() < 0.5
+    return f"{schema.get('title', 'value')} {rng.randint(0, 10**6)}"
+
+
+def _has_cache_control(message: Dict[str, Any]) -> bool:
+    content = message.get("content")
+    return isinstance(content, list) and any("cache_control" in block for block in content)
+
+
+def _count_words(message: Dict[str, Any]) -> int:
+    """Stand-in token count: one token per word."""
+    return len(_text(message).split())
+
+
+def _prefix_key(messages: List[Dict[str, Any]]) -> str:
+    return json.dumps([[message.get("role"), _text(message)] for message in messages])
+
+
+def free_port() -> int:
+    """Return a TCP port that is currently free on localhost."""
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+@contextmanager
+def serve(app: FastAPI, port: int) -> Iterator[str]:
+    """Run ``app`` under uvicorn in a background thread and yield its base URL."""
+    config = uvicorn.Config(app, host="127.0.0.1", port=port, log_level="warning")
+    server = uvicorn.Server(config)
+    thread = threading.Thread(target=server.run, daemon=True)
+    thread.start()
+    while not server.started:
+        time.sleep(0.01)
+    try:
+        yield f"http://127.0.0.1:{port}"
+    finally:
+        server.should_exit = True
+        thread.join(timeout=5)
+
+
+def main(argv: List[str] = None) -> None:
+    parser = argparse.ArgumentParser(description="Run the fake OpenAI-compatible LLM server.")
+    parser.add_argument("--port", type=int, default=9000)
+    parser.add_argument("--latency", type=float, default=0.5)
+    parser.add_argument("--tokens-per-second", type=float, default=None)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--error-status", type=int, default=500)
+    parser.add_argument("--slow-rate", type=float, default=0.0)
+    parser.add_argument("--slow-latency", type=float, default=5.0)
+    parser.add_argument("--reply-words", type=int, default=None)
+    args = parser.parse_args(argv)
+
+    app = create_app(
+        args.latency,
+        tokens_per_second=args.tokens_per_second,
+        error_rate=args.error_rate,
+        error_status=args.error_status,
+        slow_rate=args.slow_rate,
+        slow_latency=args.slow_latency,
+        reply_words=args.reply_words,
+    )
+    uvicorn.run(app, host="127.0.0.1", port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
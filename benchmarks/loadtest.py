@@ -0,0 +1,270 @@
+"""Load test of the backend against a local fake LLM.
+
+Starts the fake provider (``benchmarks.fake_llm``) and ``backend.main:app``
+under uvicorn as separate processes, then replays conversations built from
+``evals/synthetic_queries_for_analysis.csv`` at each ``--concurrency`` level
+with a closed loop of clients. Two workloads are run:
+
+* ``single``: every request is a new single-turn conversation;
+* ``history``: conversations of ``--turns`` turns where each request carries
+  the growing history (previous questions and replies) plus the next query.
+
+For each workload and level it reports throughput (RPS), errors and p50/p95/p99
+latency (plus time to first token for ``/chat/stream``). ``--output`` writes
+the results as JSON; ``--baseline`` compares them with an earlier file and
+exits non-zero when RPS dropped or p95 grew by more than ``--tolerance``.
+
+The response caches are disabled unless ``--cache`` is given, since replayed
+queries repeat.
+
+Usage::
+
+    python -m benchmarks.loadtest --concurrency 1 8 32 --requests 200 --output before.json
+    python -m benchmarks.loadtest --concurrency 1 8 32 --requests 200 --baseline before.json
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import platform
+import socket
+import subprocess
+import sys
+import time
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+import pandas as pd
+
+sys.path.append(str(Path(__file__).parent.parent))
+
+from benchmarks.fake_llm import FAKE_MODEL, free_port
+
+ROOT = Path(__file__).parent.parent
+QUERIES_CSV = ROOT / "evals" / "synthetic_queries_for_analysis.csv"
+ENDPOINTS = {"chat": "/chat", "stream": "/chat/stream"}
+# Settings that must match for two runs to be comparable.
+COMPARABLE_SETTINGS = ("endpoint", "latency", "tokens_per_second", "error_rate", "turns", "cache")
+
+
+def _percentile(values: List[float], q: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(int(len(ordered) * q), len(ordered) - 1)]
+
+
+def _wait_for_port(port: int, process: subprocess.Popen, timeout: float = 60.0) -> None:
+    """Block until something listens on ``port``; fail if ``process`` exits first."""
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"process exited with code {process.returncode} before listening on {port}")
+        with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as sock:
+            if sock.connect_ex(("127.0.0.1", port)) == 0:
+                return
+        time.sleep(0.05)
+    raise TimeoutError(f"nothing listening on port {port} after {timeout}s")
+
+
+def _start(args: List[str], port: int, env: Dict[str, str]) -> subprocess.Popen:
+    process = subprocess.Popen([sys.executable, *args], cwd=ROOT, env={**os.environ, **env})
+    try:
+        _wait_for_port(port, process)
+    except Exception:
+        process.terminate()
+        raise
+    return process
+
+
+async def _send(client: Any, endpoint: str, messages: List[Dict[str, str]]) -> Tuple[bool, float, float, list]:
+    """Send one turn; return (ok, latency, time to first byte of content, updated messages)."""
+    start = time.perf_counter()
+    if endpoint == "/chat":
+        response = await client.post(endpoint, json={"messages": messages})
+        latency = time.perf_counter() - start
+        if response.status_code != 200:
+            return False, latency, latency, messages
+        return True, latency, latency, response.json()["messages"]
+
+    first_token: Optional[float] = None
+    event, updated, ok = None, messages, False
+    async with client.stream("POST", endpoint, json={"messages": messages}) as response:
+        if response.status_code != 200:
+            await response.aread()
+            latency = time.perf_counter() - start
+            return False, latency, latency, messages
+        async for line in response.aiter_lines():
+            if line.startswith("event: "):
+                event = line[len("event: "):]
+            elif line.startswith("data: "):
+                if event == "delta" and first_token is None:
+                    first_token = time.perf_counter() - start
+                elif event == "done":
+                    updated, ok = json.loads(line[len("data: "):])["messages"], True
+    latency = time.perf_counter() - start
+    return ok, latency, first_token if first_token is not None else latency, updated
+
+
+async def _run_level(
+    base_url: str, endpoint: str, queries: List[str], concurrency: int, requests: int, turns: int
+) -> Dict[str, Any]:
+    """Closed loop: ``concurrency`` clients send ``requests`` turns in total."""
+    import httpx
+
+    latencies: List[float] = []
+    first_tokens: List[float] = []
+    by_turn: Dict[int, List[float]] = {}
+    errors = 0
+    sent = 0
+    next_conversation = 0
+
+    async def client_loop(client: Any) -> None:
+        nonlocal errors, sent, next_conversation
+        while sent < requests:
+            conversation = next_conversation
+            next_conversation += 1
+            history: List[Dict[str, str]] = []
+            for turn in range(turns):
+                if sent >= requests:
+                    return
+                sent += 1
+                query = queries[(conversation * turns + turn) % len(queries)]
+                ok, latency, first_token, history = await _send(
+                    client, endpoint, history + [{"role": "user", "content": query}]
+                )
+                latencies.append(latency)
+                first_tokens.append(first_token)
+                by_turn.setdefault(turn, []).append(latency)
+                if not ok:
+                    errors += 1
+                    break
+
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    async with httpx.AsyncClient(base_url=base_url, timeout=None, limits=limits) as client:
+        start = time.perf_counter()
+        await asyncio.gather(*(client_loop(client) for _ in range(concurrency)))
+        elapsed = time.perf_counter() - start
+
+    result = {
+        "concurrency": concurrency,
+        "requests": len(latencies),
+        "errors": errors,
+        "seconds": elapsed,
+        "rps": len(latencies) / elapsed,
+        "p50": _percentile(latencies, 0.50),
+        "p95": _percentile(latencies, 0.95),
+        "p99": _percentile(latencies, 0.99),
+        "p50_by_turn": [_percentile(by_turn[turn], 0.50) for turn in sorted(by_turn)],
+    }
+    if endpoint != "/chat":
+        result.update(ttft_p50=_percentile(first_tokens, 0.50), ttft_p95=_percentile(first_tokens, 0.95))
+    return result
+
+
+def _compare(results: List[Dict[str, Any]], baseline: Dict[str, Any], tolerance: float) -> List[str]:
+    """Return a description of every regression against ``baseline``."""
+    previous = {(row["workload"], row["concurrency"]): row for row in baseline["results"]}
+    regressions = []
+    for row in results:
+        before = previous.get((row["workload"], row["concurrency"]))
+        if before is None:
+            continue
+        name = f"{row['workload']} @ {row['concurrency']}"
+        if row["rps"] < before["rps"] * (1 - tolerance):
+            regressions.append(f"{name}: RPS {before['rps']:.1f} -> {row['rps']:.1f}")
+        if row["p95"] > before["p95"] * (1 + tolerance):
+            regressions.append(f"{name}: p95 {before['p95'] * 1000:.0f} ms -> {row['p95'] * 1000:.0f} ms")
+        if row["errors"] > before["errors"]:
+            regressions.append(f"{name}: errors {before['errors']} -> {row['errors']}")
+    return regressions
+
+
+def main(argv: List[str] = None) -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 8, 32])
+    parser.add_argument("--requests", type=int, default=200, help="Requests per workload and level.")
+    parser.add_argument("--turns", type=int, default=4, help="Turns per conversation of the history workload.")
+    parser.add_argument("--workloads", nargs="+", choices=["single", "history"], default=["single", "history"])
+    parser.add_argument("--endpoint", choices=sorted(ENDPOINTS), default="chat")
+    parser.add_argument("--latency", type=float, default=0.2)
+    parser.add_argument("--tokens-per-second", type=float, default=None)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--cache", action="store_true", help="Keep the response caches enabled.")
+    parser.add_argument("--output", type=Path, help="Write the results as JSON.")
+    parser.add_argument("--baseline", type=Path, help="Earlier --output file to compare against.")
+    parser.add_argument("--tolerance", type=float, default=0.1)
+    args = parser.parse_args(argv)
+
+    queries = pd.read_csv(QUERIES_CSV)["query"].tolist()
+    endpoint = ENDPOINTS[args.endpoint]
+    llm_port, app_port = free_port(), free_port()
+
+    fake_args = ["-m", "benchmarks.fake_llm", "--port", str(llm_port), "--latency", str(args.latency),
+                 "--error-rate", str(args.error_rate)]
+    if args.tokens_per_second:
+        fake_args += ["--tokens-per-second", str(args.tokens_per_second)]
+    backend_env = {
+        "MODEL_NAME": f"openai/{FAKE_MODEL}",
+        "LLM_API_BASE": f"http://127.0.0.1:{llm_port}/v1",
+        "OPENAI_API_KEY": os.environ.get("OPENAI_API_KEY", "fake-key"),
+        # Admission control should not be what limits the highest level.
+        "LLM_MAX_CONCURRENCY": os.environ.get("LLM_MAX_CONCURRENCY", str(max(args.concurrency))),
+    }
+    if not args.cache:
+        backend_env["RESPONSE_CACHE_ENABLED"] = "0"
+
+    fake = _start(fake_args, llm_port, {})
+    backend = None
+    try:
+        backend = _start(
+            ["-m", "uvicorn", "backend.main:app", "--port", str(app_port), "--log-level", "warning"],
+            app_port,
+            backend_env,
+        )
+        base_url = f"http://127.0.0.1:{app_port}"
+        # The first request waits for the backend's warm-up; keep it out of the numbers.
+        asyncio.run(_run_level(base_url, endpoint, queries, 1, 1, 1))
+
+        results = []
+        print(f"{'workload':>9}{'conc':>6}{'reqs':>6}{'errors':>8}{'rps':>8}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}")
+        for workload in args.workloads:
+            turns = args.turns if workload == "history" else 1
+            for concurrency in args.concurrency:
+                row = {"workload": workload, **asyncio.run(
+                    _run_level(base_url, endpoint, queries, concurrency, args.requests, turns)
+                )}
+                results.append(row)
+                print(f"{workload:>9}{concurrency:>6}{row['requests']:>6}{row['errors']:>8}{row['rps']:>8.1f}"
+                      f"{row['p50'] * 1000:>9.0f}{row['p95'] * 1000:>9.0f}{row['p99'] * 1000:>9.0f}")
+    finally:
+        for process in (backend, fake):
+            if process is not None:
+                process.terminate()
+                process.wait(timeout=10)
+
+    report = {
+        "config": {
+            **{key: value for key, value in vars(args).items() if key not in ("output", "baseline")},
+            "python": platform.python_version(),
+        },
+        "results": results,
+    }
+    if args.output:
+        args.output.write_text(json.dumps(report, indent=2))
+        print(f"results written to {args.output}")
+    if args.baseline:
+        baseline = json.loads(args.baseline.read_text())
+        for key in COMPARABLE_SETTINGS:
+            if baseline["config"].get(key) != report["config"][key]:
+                print(f"WARNING: baseline was run with {key}={baseline['config'].get(key)!r}, "
+                      f"this run with {report['config'][key]!r}")
+        regressions = _compare(results, baseline, args.tolerance)
+        for regression in regressions:
+            print(f"REGRESSION: {regression}")
+        sys.exit(1 if regressions else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,325 @@
+"""Failure modes, annotation coverage and response distributions of the annotated results.
+
+Every annotated row is reduced once to typed columns:
+
+* its dimensions, parsed from ``dimension_tuple_json`` into categorical
+  ``Country``/``PlayerSkills``/``Scenario`` columns (each distinct JSON text
+  is parsed once, however many rows share it);
+* the length of its response in characters, and its latency;
+* whether it is annotated, and which failure modes its annotation mentions.
+
+Failure modes are the categories of the axial coding, each matched in the
+annotations by a regular expression (:data:`FAILURE_MODES`; ``--modes``
+loads another taxonomy from a JSON file). The reports are pandas group-bys over
+those columns, so millions of rows take seconds.
+
+With the artifact store (:mod:`evals.artifacts`), the columns are kept in
+``evals/store/analytics/`` and updated incrementally: only the annotation
+snapshots written since the previous run are read, and only the queries
+seen for the first time are parsed. Responses are re-measured when their
+table is rewritten.
+
+Usage::
+
+    python evals/analytics.py                          # the artifact store, incrementally
+    python evals/analytics.py --csv evals/annotated_results_20250606_004057.csv
+    python evals/analytics.py --by Country Scenario --output-dir reports/
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import sys
+from pathlib import Path
+from typing import Dict, Final, List, Mapping, Optional, Sequence, Tuple
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.parquet as pq
+
+# Add the project root to Python path
+sys.path.append(str(Path(__file__).parent.parent))
+
+from evals.artifacts import STORE_DIR, ArtifactStore  # noqa: E402
+from evals.dedup import DIMENSIONS  # noqa: E402
+
+# The failure taxonomy of the axial coding (README), matched case-insensitively in the annotations.
+FAILURE_MODES: Final[Dict[str, str]] = {
+    "player_centric_deficiencies": r"characteristics|\bage\b|\bheight\b|more details?|weakness|"
+                                   r"rather than the players|focus on players",
+    "data_freshness_and_completeness": r"updated data|outdated|up to date|compar|\bprices?\b|diverse|different levels",
+    "output_structure_and_organization": r"section|suggestion|add on the query",
+}
+QUANTILES: Final[Sequence[float]] = (0.5, 0.9, 0.99)
+ROW_COLUMNS: Final[List[str]] = ["query_id", *DIMENSIONS, "response_chars", "latency_s"]
+
+
+def parse_dimensions(values: pd.Series, dimensions: Sequence[str] = DIMENSIONS) -> pd.DataFrame:
+    """Categorical columns of the ``dimension_tuple_json`` texts of ``values``.
+
+    Each distinct text is parsed once; rows that are not a JSON object, or
+    lack a dimension, get a missing value.
+    """
+    codes, texts = pd.factorize(values)
+    parsed = []
+    for text in texts:
+        try:
+            record = json.loads(text)
+        except (TypeError, ValueError):
+            record = None
+        parsed.append(record if isinstance(record, dict) else {})
+    table = pd.DataFrame.from_records(parsed, columns=list(dimensions))
+    frame = {}
+    for dimension in dimensions:
+        value_codes, categories = pd.factorize(table[dimension].astype("string"))
+        row_codes = np.where(codes >= 0, value_codes[np.maximum(codes, 0)] if len(value_codes) else -1, -1)
+        frame[dimension] = pd.Categorical.from_codes(row_codes, categories=categories.astype(str))
+    return pd.DataFrame(frame, index=values.index)
+
+
+def match_failure_modes(annotations: pd.Series, modes: Mapping[str, str] = FAILURE_MODES) -> pd.DataFrame:
+    """``annotated`` (non-blank) and one boolean column per failure mode mentioned by each annotation.
+
+    Each distinct annotation is matched once.
+    """
+    codes, texts = pd.factorize(annotations.fillna("").astype("string"))
+    texts = pd.Series(texts, dtype="string")
+    matches = {"annotated": texts.str.strip().str.len() > 0}
+    for name, pattern in modes.items():
+        matches[name] = texts.str.contains(pattern, case=False, regex=True)
+    frame = {
+        name: np.asarray(matched.fillna(False), dtype=bool)[codes] if len(codes) else np.zeros(0, dtype=bool)
+        for name, matched in matches.items()
+    }
+    return pd.DataFrame(frame, index=annotations.index)
+
+
+def row_features(results: pd.DataFrame) -> pd.DataFrame:
+    """The typed columns of ``results`` (``annotated_results`` layout), one row per response."""
+    frame = parse_dimensions(results["dimension_tuple_json"])
+    frame.insert(0, "query_id", results["query_id"].astype("string"))
+    frame["response_chars"] = results["open_coding_response"].fillna("").astype("string").str.len().astype("int64")
+    latency = results["latency_s"] if "latency_s" in results else pd.Series(np.nan, index=results.index)
+    frame["latency_s"] = pd.to_numeric(latency, errors="coerce").astype("float64")
+    return frame.reset_index(drop=True)
+
+
+def annotation_features(results: pd.DataFrame, modes: Mapping[str, str] = FAILURE_MODES) -> pd.DataFrame:
+    """``query_id`` and the :func:`match_failure_modes` columns of each annotation of ``results``."""
+    flags = match_failure_modes(results["annotations"], modes)
+    flags.insert(0, "query_id", results["query_id"].astype("string"))
+    return flags.reset_index(drop=True)
+
+
+def report(
+    rows: pd.DataFrame,
+    flags: pd.DataFrame,
+    by: Sequence[str] = DIMENSIONS,
+    quantiles: Sequence[float] = QUANTILES,
+) -> Dict[str, pd.DataFrame]:
+    """Coverage, failure-mode counts and distributions, overall and per value of each ``by`` dimension.
+
+    Args:
+        rows (pd.DataFrame): :func:`row_features` of the responses.
+        flags (pd.DataFrame): :func:`annotation_features` of the annotations,
+            at most one per ``query_id``.
+        by (Sequence[str]): Dimensions to break the results down by.
+        quantiles (Sequence[float]): Quantiles of the distributions.
+
+    Returns:
+        Dict[str, pd.DataFrame]: ``overview`` (one row per metric),
+        ``failure_modes`` (rows, annotated rows, coverage and the count of each
+        failure mode per dimension value) and ``distributions`` (quantiles of
+        ``response_chars`` and ``latency_s`` per dimension value).
+    """
+    modes = [column for column in flags.columns if column not in ("query_id", "annotated")]
+    frame = rows.merge(flags, on="query_id", how="left")
+    for column in ["annotated", *modes]:
+        frame[column] = frame[column].fillna(False).astype(bool)
+
+    annotated = int(frame["annotated"].sum())
+    overview = {"rows": len(frame), "annotated": annotated, "coverage": annotated / len(frame) if len(frame) else 0.0}
+    overview.update({mode: int(frame[mode].sum()) for mode in modes})
+    overview = pd.Series(overview, name="value", dtype=object).to_frame()
+
+    counts, distributions = [], []
+    measures = ["response_chars", "latency_s"]
+    names = {q: f"p{q * 100:g}" for q in quantiles}
+    whole = frame[measures].quantile(list(quantiles)).unstack()
+    distributions.append(pd.DataFrame([whole.to_numpy()], columns=whole.index, index=pd.MultiIndex.from_tuples([("all", "all")])))
+    for dimension in by:
+        groups = frame.groupby(dimension, observed=True, sort=True)
+        table = groups.agg(rows=("query_id", "size"), annotated=("annotated", "sum"))
+        table["coverage"] = table["annotated"] / table["rows"]
+        table = table.join(groups[modes].sum())
+        table.index = pd.MultiIndex.from_product([[dimension], table.index.astype(str)])
+        counts.append(table)
+        spread = groups[measures].quantile(list(quantiles)).unstack()
+        spread.index = pd.MultiIndex.from_product([[dimension], spread.index.astype(str)])
+        distributions.append(spread)
+    failure_modes = pd.concat(counts) if counts else pd.DataFrame()
+    distributions = pd.concat(distributions)
+    distributions.columns = [f"{measure}_{names[q]}" for measure, q in distributions.columns]
+    for table in (failure_modes, distributions):
+        table.index.names = ["dimension", "value"]
+    return {"overview": overview, "failure_modes": failure_modes, "distributions": distributions}
+
+
+def _isin(values: pd.Series, other: pd.Series) -> np.ndarray:
+    """``values.isin(other)``, in Arrow (pandas checks string arrays one value at a time)."""
+    return pc.is_in(pa.array(values), value_set=pa.array(other)).to_numpy(zero_copy_only=False)
+
+
+def _modes_hash(modes: Mapping[str, str]) -> str:
+    return hashlib.sha256(json.dumps(dict(modes), sort_keys=True).encode("utf-8")).hexdigest()[:16]
+
+
+class EvalAnalytics:
+    """Incrementally maintained :func:`row_features` and :func:`annotation_features` of an artifact store.
+
+    Both are kept as Parquet files in ``<store>/analytics/``, with the state
+    of the store they reflect in their metadata (the versions of the queries
+    and responses tables, the last annotation snapshot, the failure-mode
+    taxonomy), so :meth:`update` only processes what changed since.
+
+    Args:
+        store (ArtifactStore): Store to analyse.
+        modes (Mapping[str, str]): Failure mode name -> regular expression.
+    """
+
+    def __init__(self, store: ArtifactStore, modes: Mapping[str, str] = FAILURE_MODES) -> None:
+        self.store = store
+        self.modes = dict(modes)
+        self.dir = store.root / "analytics"
+        self.rows, self._rows_meta = self._load("rows")
+        self.flags, self._flags_meta = self._load("annotations")
+
+    def _load(self, name: str) -> Tuple[Optional[pd.DataFrame], Dict[str, str]]:
+        path = self.dir / f"{name}.parquet"
+        if not path.exists():
+            return None, {}
+        table = pq.read_table(path)
+        meta = {key.decode(): value.decode() for key, value in (table.schema.metadata or {}).items()
+                if not key.startswith(b"pandas")}
+        return table.to_pandas(), meta
+
+    def _save(self, name: str, frame: pd.DataFrame, meta: Dict[str, str]) -> None:
+        self.dir.mkdir(parents=True, exist_ok=True)
+        table = pa.Table.from_pandas(frame, preserve_index=False)
+        table = table.replace_schema_metadata({**(table.schema.metadata or {}), **meta})
+        path = self.dir / f"{name}.parquet"
+        tmp = path.with_suffix(".tmp")
+        pq.write_table(table, tmp, compression="zstd")
+        os.replace(tmp, path)
+
+    def update(self) -> Tuple[int, int]:
+        """Bring the features up to date with the store.
+
+        Returns:
+            Tuple[int, int]: The number of queries parsed and of annotations
+            matched by this update (0, 0 when nothing changed).
+        """
+        return self._update_rows(), self._update_flags()
+
+    def _update_rows(self) -> int:
+        versions = {"queries": self.store.version("queries"), "responses": self.store.version("responses")}
+        if self.rows is not None and all(self._rows_meta.get(table) == version for table, version in versions.items()):
+            return 0
+        responses = pq.read_table(self.store.root / "responses.parquet", columns=["query_id", "response", "latency_s"])
+        rows = pd.DataFrame({
+            "query_id": responses["query_id"].to_pandas().astype("string"),
+            # Measured in Arrow: the response texts are never converted to Python strings.
+            "response_chars": pc.utf8_length(pc.fill_null(responses["response"], "")).to_numpy().astype("int64"),
+            "latency_s": responses["latency_s"].to_numpy(zero_copy_only=False).astype("float64"),
+        })
+        del responses
+        # Dimensions are reused for the queries already parsed, unless the queries were rewritten.
+        known = pd.DataFrame(columns=["query_id"])
+        if self.rows is not None and self._rows_meta.get("queries") == versions["queries"]:
+            known = self.rows[["query_id", *DIMENSIONS]]
+        new_ids = rows.loc[~_isin(rows["query_id"], known["query_id"].astype("string")), "query_id"]
+        parsed = 0
+        if len(new_ids):
+            queries = self.store.queries(["query_id", "dimension_tuple_json"])
+            queries = queries[_isin(queries["query_id"], new_ids)].reset_index(drop=True)
+            dims = parse_dimensions(queries["dimension_tuple_json"])
+            dims.insert(0, "query_id", queries["query_id"].astype("string"))
+            known = pd.concat([known, dims], ignore_index=True) if len(known) else dims
+            parsed = len(queries)
+        rows = rows.merge(known, on="query_id", how="left")
+        for dimension in DIMENSIONS:
+            rows[dimension] = rows[dimension].astype("category")
+        self.rows = rows[ROW_COLUMNS]
+        self._rows_meta = versions
+        self._save("rows", self.rows, versions)
+        return parsed
+
+    def _update_flags(self) -> int:
+        snapshots = self.store.snapshots()
+        last = snapshots[-1].stem if snapshots else ""
+        modes = _modes_hash(self.modes)
+        fresh = self.flags is None or self._flags_meta.get("modes") != modes
+        since = None if fresh else self._flags_meta.get("snapshot") or None
+        if not fresh and since == (last or None):
+            return 0
+        changed = self.store.annotations(columns=["annotation"], since=since)
+        flags = match_failure_modes(changed["annotation"], self.modes)
+        flags.insert(0, "query_id", changed["query_id"].astype("string"))
+        if not fresh:
+            # The rows of the queries annotated again are replaced.
+            flags = pd.concat([self.flags[~_isin(self.flags["query_id"], flags["query_id"])], flags], ignore_index=True)
+        self.flags = flags
+        self._flags_meta = {"snapshot": last, "modes": modes}
+        self._save("annotations", flags, self._flags_meta)
+        return len(changed)
+
+    def report(self, by: Sequence[str] = DIMENSIONS) -> Dict[str, pd.DataFrame]:
+        """:func:`report` of the current features (call :meth:`update` first)."""
+        return report(self.rows, self.flags, by)
+
+
+def load_modes(path: Optional[Path]) -> Dict[str, str]:
+    """The failure-mode taxonomy of ``path`` (a JSON object of name -> regex), or :data:`FAILURE_MODES`."""
+    if path is None:
+        return dict(FAILURE_MODES)
+    modes = json.loads(Path(path).read_text(encoding="utf-8"))
+    if not isinstance(modes, dict) or not all(isinstance(value, str) for value in modes.values()):
+        raise ValueError(f"{path} must hold a JSON object of failure mode name -> regular expression")
+    return modes
+
+
+def main(argv: List[str] = None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--store", type=Path, default=STORE_DIR, help="Artifact store to analyse incrementally.")
+    parser.add_argument("--csv", type=Path, help="Analyse this annotated_results CSV instead (in full).")
+    parser.add_argument("--by", nargs="+", choices=list(DIMENSIONS), default=list(DIMENSIONS))
+    parser.add_argument("--modes", type=Path, help="JSON file of failure mode name -> regular expression.")
+    parser.add_argument("--output-dir", type=Path, help="Also write each report table to a CSV there.")
+    args = parser.parse_args(argv)
+
+    modes = load_modes(args.modes)
+    if args.csv:
+        results = pd.read_csv(args.csv)
+        tables = report(row_features(results), annotation_features(results, modes), args.by)
+    else:
+        analytics = EvalAnalytics(ArtifactStore(args.store), modes)
+        parsed, matched = analytics.update()
+        print(f"Updated {analytics.dir}: {parsed} new queries parsed, {matched} annotations matched.")
+        tables = analytics.report(args.by)
+
+    with pd.option_context("display.max_rows", 200, "display.width", 200, "display.precision", 3):
+        for name, table in tables.items():
+            print(f"\n## {name}\n")
+            print(table.to_string())
+    if args.output_dir:
+        args.output_dir.mkdir(parents=True, exist_ok=True)
+        for name, table in tables.items():
+            table.to_csv(args.output_dir / f"{name}.csv")
+        print(f"\nWrote {', '.join(tables)} to {args.output_dir}")
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,204 @@
+"""SQLite store behind the open coding annotation tool (``open_coding_visual.py``).
+
+The records to annotate are imported once from ``open_coding_results.csv``,
+in chunks, and then read one at a time by their position, so the tool
+opens a 100k-row dataset as fast as a 40-row one. Each saved annotation is
+upserted by ``query_id`` right away: nothing is lost when the browser or the
+tool crashes, and annotators working at the same time (in WAL mode, even
+from several processes) do not overwrite each other's records. Exports
+stream from the database in chunks.
+"""
+
+import csv
+import os
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Any, Dict, Final, Iterator, List, Optional, Tuple
+
+import pandas as pd
+
+DB_PATH: Final[Path] = Path(__file__).parent / "annotations.sqlite3"
+# Rows read from the CSV, or written to an export, at a time.
+CHUNK_SIZE: Final[int] = 5_000
+RECORD_COLUMNS: Final[List[str]] = ["query_id", "original_query", "dimension_tuple_json", "open_coding_response"]
+EXPORT_COLUMNS: Final[List[str]] = [*RECORD_COLUMNS, "annotations", "annotation_timestamp"]
+
+
+def _timestamp(seconds: Optional[float]) -> str:
+    return time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(seconds)) if seconds else ""
+
+
+class AnnotationStore:
+    """Records to annotate, by position, and their annotations, by ``query_id``."""
+
+    def __init__(self, path: Path = DB_PATH) -> None:
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        # Gradio calls handlers from worker threads; other processes may hold the write lock briefly.
+        self._conn = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None, timeout=30.0)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS records (
+                idx INTEGER PRIMARY KEY,
+                query_id TEXT NOT NULL UNIQUE,
+                original_query TEXT,
+                dimension_tuple_json TEXT,
+                open_coding_response TEXT
+            );
+            CREATE TABLE IF NOT EXISTS annotations (
+                query_id TEXT PRIMARY KEY,
+                annotation TEXT NOT NULL,
+                updated_at REAL NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS annotations_updated_at ON annotations (updated_at);
+            CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT NOT NULL);
+            """
+        )
+
+    def _meta(self, key: str) -> Optional[str]:
+        row = self._conn.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else None
+
+    def _set_meta(self, key: str, value: str) -> None:
+        self._conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)", (key, value))
+
+    def import_records(self, csv_path: Path, chunk_size: int = CHUNK_SIZE) -> int:
+        """Load the records of ``csv_path``, unless this version of it is already loaded.
+
+        The records are replaced in one transaction, so other sessions see the
+        old dataset or the new one. Annotations are kept: they are matched to
+        the new records by ``query_id``.
+
+        Returns:
+            int: The number of records.
+        """
+        stat = os.stat(csv_path)
+        version = f"{Path(csv_path).resolve()}:{stat.st_size}:{stat.st_mtime_ns}"
+        with self._lock:
+            if self._meta("source") == version:
+                return self._count()
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                self._conn.execute("DELETE FROM records")
+                start = 0
+                for chunk in pd.read_csv(csv_path, chunksize=chunk_size, dtype=str, keep_default_na=False):
+                    chunk = chunk.reindex(columns=RECORD_COLUMNS, fill_value="")
+                    self._conn.executemany(
+                        "INSERT INTO records (idx, query_id, original_query, dimension_tuple_json, open_coding_response) "
+                        "VALUES (?, ?, ?, ?, ?)",
+                        ((start + i, *row) for i, row in enumerate(chunk.itertuples(index=False, name=None))),
+                    )
+                    start += len(chunk)
+                self._set_meta("source", version)
+                self._conn.execute("COMMIT")
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+            return start
+
+    def _count(self) -> int:
+        # Records are numbered 0..n-1: the largest key is found without scanning the table.
+        (last,) = self._conn.execute("SELECT MAX(idx) FROM records").fetchone()
+        return 0 if last is None else last + 1
+
+    def count(self) -> int:
+        """Number of records."""
+        with self._lock:
+            return self._count()
+
+    def page(self, start: int, size: int = 1) -> List[Dict[str, Any]]:
+        """Records ``start`` to ``start + size - 1`` with their annotations (``""`` if none)."""
+        with self._lock:
+            rows = self._conn.execute(
+                """
+                SELECT r.idx, r.query_id, r.original_query, r.dimension_tuple_json, r.open_coding_response,
+                       COALESCE(a.annotation, ''), a.updated_at
+                FROM records r LEFT JOIN annotations a ON a.query_id = r.query_id
+                WHERE r.idx >= ? AND r.idx < ? ORDER BY r.idx
+                """,
+                (start, start + size),
+            ).fetchall()
+        columns = ["index", *RECORD_COLUMNS, "annotation", "updated_at"]
+        return [dict(zip(columns, row)) for row in rows]
+
+    def record(self, index: int) -> Optional[Dict[str, Any]]:
+        """The record at position ``index`` with its annotation, or ``None``."""
+        rows = self.page(index, 1)
+        return rows[0] if rows else None
+
+    def save(self, query_id: str, annotation: str) -> None:
+        """Insert or replace the annotation of ``query_id``."""
+        with self._lock:
+            self._conn.execute(
+                "INSERT INTO annotations (query_id, annotation, updated_at) VALUES (?, ?, ?) "
+                "ON CONFLICT (query_id) DO UPDATE SET annotation = excluded.annotation, updated_at = excluded.updated_at",
+                (query_id, annotation, time.time()),
+            )
+
+    def progress(self) -> Tuple[int, int]:
+        """Annotated (non-blank) records and the number of records."""
+        with self._lock:
+            (annotated,) = self._conn.execute(
+                "SELECT COUNT(*) FROM annotations a JOIN records r ON r.query_id = a.query_id "
+                "WHERE TRIM(a.annotation) != ''"
+            ).fetchone()
+            return annotated, self._count()
+
+    def _stream(self, query: str, params: tuple = (), chunk_size: int = CHUNK_SIZE) -> Iterator[List[tuple]]:
+        """Rows of ``query`` in chunks, from a connection of their own so saves are not blocked."""
+        conn = sqlite3.connect(self.path, timeout=30.0)
+        try:
+            cursor = conn.execute(query, params)
+            while rows := cursor.fetchmany(chunk_size):
+                yield rows
+        finally:
+            conn.close()
+
+    def changed_since(self, since: float, chunk_size: int = CHUNK_SIZE) -> Iterator[List[Tuple[str, str, float]]]:
+        """``(query_id, annotation, updated_at)`` of the annotations saved after ``since``, in chunks."""
+        return self._stream(
+            "SELECT query_id, annotation, updated_at FROM annotations WHERE updated_at > ? ORDER BY updated_at",
+            (since,),
+            chunk_size,
+        )
+
+    def export_csv(self, path: Path, chunk_size: int = CHUNK_SIZE) -> int:
+        """Write every record and its annotation to ``path`` in the ``annotated_results`` layout.
+
+        Rows are streamed, ``chunk_size`` at a time, so memory use does not
+        grow with the dataset. Returns the number of rows written.
+        """
+        rows = 0
+        tmp = Path(path).with_suffix(".tmp")
+        with open(tmp, "w", newline="", encoding="utf-8") as f:
+            writer = csv.writer(f)
+            writer.writerow(EXPORT_COLUMNS)
+            for chunk in self._stream(
+                """
+                SELECT r.query_id, r.original_query, r.dimension_tuple_json, r.open_coding_response,
+                       COALESCE(a.annotation, ''), a.updated_at
+                FROM records r LEFT JOIN annotations a ON a.query_id = r.query_id ORDER BY r.idx
+                """,
+                chunk_size=chunk_size,
+            ):
+                writer.writerows((*row[:-1], _timestamp(row[-1])) for row in chunk)
+                rows += len(chunk)
+        os.replace(tmp, path)
+        return rows
+
+    def last_export(self) -> float:
+        """When the annotations were last exported to the artifact store (0: never)."""
+        with self._lock:
+            return float(self._meta("exported_at") or 0)
+
+    def mark_exported(self, at: float) -> None:
+        with self._lock:
+            self._set_meta("exported_at", repr(at))
+
+    def close(self) -> None:
+        self._conn.close()
@@ -0,0 +1,322 @@
+"""Columnar storage of the eval artifacts, joined by ``query_id``.
+
+The CSVs of each stage repeat the previous stages: every annotation export
+copies every query and response again. The store keeps each of them once, as
+Parquet files in one directory (``evals/store`` by default):
+
+* ``queries.parquet``: the synthetic queries (``generate_synthetic_queries.py``);
+* ``responses.parquet``: the agent's responses (``open_coding.py``);
+* ``annotations/*.parquet``: annotation snapshots, each holding only the
+  annotations that changed since the previous one. The current annotations
+  are the latest value of each ``query_id`` across the snapshots.
+
+Reads are projected: :meth:`ArtifactStore.annotated_results` builds the old
+``annotated_results_*.csv`` layout but only opens the files, and reads only
+the columns, that were asked for, so loading the annotations for analysis
+does not read a single response.
+
+Usage::
+
+    python evals/artifacts.py import      # the CSVs in evals/ into the store
+    python evals/artifacts.py info
+    python evals/artifacts.py export --output annotated.csv --columns query_id annotations
+"""
+
+import argparse
+import os
+import sys
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, Final, Iterable, List, Mapping, Optional, Sequence
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+EVALS_DIR: Final[Path] = Path(__file__).parent
+STORE_DIR: Final[Path] = EVALS_DIR / "store"
+COMPRESSIONS: Final[Sequence[str]] = ("zstd", "snappy", "gzip", "none")
+DEFAULT_COMPRESSION: Final[str] = "zstd"
+
+QUERIES_SCHEMA: Final[pa.Schema] = pa.schema(
+    [
+        ("query_id", pa.string()),
+        ("query", pa.string()),
+        ("dimension_tuple_json", pa.string()),
+        ("is_realistic_and_kept", pa.int8()),
+        ("notes_for_filtering", pa.string()),
+    ]
+)
+RESPONSES_SCHEMA: Final[pa.Schema] = pa.schema(
+    [("query_id", pa.string()), ("response", pa.string()), ("latency_s", pa.float64())]
+)
+ANNOTATIONS_SCHEMA: Final[pa.Schema] = pa.schema(
+    [("query_id", pa.string()), ("annotation", pa.string()), ("annotated_at", pa.string())]
+)
+
+# Columns of the annotated_results CSVs -> (table, column in the store).
+ANNOTATED_COLUMNS: Final[Dict[str, tuple]] = {
+    "query_id": ("responses", "query_id"),
+    "original_query": ("queries", "query"),
+    "dimension_tuple_json": ("queries", "dimension_tuple_json"),
+    "open_coding_response": ("responses", "response"),
+    "latency_s": ("responses", "latency_s"),
+    "annotations": ("annotations", "annotation"),
+    "annotation_timestamp": ("annotations", "annotated_at"),
+}
+# The layout of the annotation tool's CSV exports.
+ANNOTATED_RESULTS_COLUMNS: Final[List[str]] = [
+    "query_id", "original_query", "dimension_tuple_json", "open_coding_response", "annotations", "annotation_timestamp",
+]
+
+
+class ArtifactStore:
+    """Parquet tables of one eval: queries, responses and annotation snapshots.
+
+    Args:
+        root (Path): Directory of the store; created on the first write.
+        compression (str): Parquet codec of the files written
+            (``zstd``, ``snappy``, ``gzip`` or ``none``).
+    """
+
+    def __init__(self, root: Path = STORE_DIR, compression: str = DEFAULT_COMPRESSION) -> None:
+        if compression not in COMPRESSIONS:
+            raise ValueError(f"compression must be one of {', '.join(COMPRESSIONS)}; got {compression!r}")
+        self.root = Path(root)
+        self.compression = compression
+
+    @property
+    def annotations_dir(self) -> Path:
+        return self.root / "annotations"
+
+    def _path(self, table: str) -> Path:
+        return self.root / f"{table}.parquet"
+
+    def _write(self, table: pa.Table, path: Path) -> Path:
+        """Write ``table`` to ``path`` atomically: readers see the old file or the new one."""
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = path.with_suffix(".tmp")
+        pq.write_table(table, tmp, compression=None if self.compression == "none" else self.compression)
+        os.replace(tmp, path)
+        return path
+
+    def _read(self, table: str, columns: Optional[List[str]] = None) -> pd.DataFrame:
+        path = self._path(table)
+        if not path.exists():
+            raise FileNotFoundError(f"{path} not found; write or import the {table} first")
+        return pq.read_table(path, columns=columns).to_pandas()
+
+    def version(self, table: str) -> str:
+        """Size and modification time of ``table`` (``queries`` or ``responses``); ``""`` if not written.
+
+        Changes whenever the table is rewritten, so derived data can tell when to refresh.
+        """
+        path = self._path(table)
+        if not path.exists():
+            return ""
+        stat = path.stat()
+        return f"{stat.st_size}:{stat.st_mtime_ns}"
+
+    # -- queries and responses -------------------------------------------------
+
+    def write_queries(self, df: pd.DataFrame) -> Path:
+        """Store the synthetic queries (the columns of ``synthetic_queries_for_analysis.csv``)."""
+        frame = df.rename(columns={"id": "query_id"}).reindex(columns=QUERIES_SCHEMA.names)
+        frame["is_realistic_and_kept"] = frame["is_realistic_and_kept"].fillna(1).astype("int8")
+        return self._write(pa.Table.from_pandas(frame, schema=QUERIES_SCHEMA, preserve_index=False), self._path("queries"))
+
+    def write_responses(self, df: pd.DataFrame) -> Path:
+        """Store the agent responses (the columns of ``open_coding_results.csv``).
+
+        The query text and dimensions are not stored again: they are joined
+        from the queries table by ``query_id``.
+        """
+        frame = df.rename(columns={"open_coding_response": "response"}).reindex(columns=RESPONSES_SCHEMA.names)
+        return self._write(
+            pa.Table.from_pandas(frame, schema=RESPONSES_SCHEMA, preserve_index=False), self._path("responses")
+        )
+
+    def queries(self, columns: Optional[List[str]] = None) -> pd.DataFrame:
+        """The stored queries, only ``columns`` of them if given."""
+        return self._read("queries", columns)
+
+    def responses(self, columns: Optional[List[str]] = None) -> pd.DataFrame:
+        """The stored responses, only ``columns`` of them if given."""
+        return self._read("responses", columns)
+
+    # -- annotations -----------------------------------------------------------
+
+    def snapshots(self) -> List[Path]:
+        """The annotation snapshot files, oldest first."""
+        if not self.annotations_dir.exists():
+            return []
+        return sorted(self.annotations_dir.glob("*.parquet"))
+
+    def annotations(
+        self, as_of: Optional[str] = None, columns: Optional[List[str]] = None, since: Optional[str] = None
+    ) -> pd.DataFrame:
+        """The current annotation of each ``query_id``.
+
+        Args:
+            as_of (Optional[str]): Only apply the snapshots up to this one
+                (its file name without ``.parquet``), to see an earlier state.
+            columns (Optional[List[str]]): ``annotation`` and/or ``annotated_at``
+                (``query_id`` is always read).
+            since (Optional[str]): Only read the snapshots after this one: the
+                annotations that changed since then.
+
+        Returns:
+            pd.DataFrame: One row per annotated ``query_id``.
+        """
+        wanted = ["query_id", *[column for column in (columns or ANNOTATIONS_SCHEMA.names) if column != "query_id"]]
+        paths = [
+            path for path in self.snapshots()
+            if (as_of is None or path.stem <= as_of) and (since is None or path.stem > since)
+        ]
+        if not paths:
+            return pd.DataFrame({column: pd.Series(dtype="object") for column in wanted})
+        table = pa.concat_tables([pq.read_table(path, columns=wanted) for path in paths])
+        # Later snapshots come later in the table: the last row of each query wins.
+        return table.to_pandas().drop_duplicates("query_id", keep="last").reset_index(drop=True)
+
+    def snapshot_annotations(self, annotations: Mapping[str, str], annotated_at: Optional[datetime] = None) -> Optional[Path]:
+        """Record the annotations that differ from the current ones as a new snapshot.
+
+        Args:
+            annotations (Mapping[str, str]): Annotation text by ``query_id``;
+                an empty text clears an earlier annotation.
+            annotated_at (Optional[datetime]): Time of the snapshot (default: now).
+
+        Returns:
+            Optional[Path]: The snapshot file, or ``None`` when nothing changed.
+        """
+        annotated_at = annotated_at or datetime.now()
+        current = self.annotations(columns=["annotation"])
+        previous = dict(zip(current["query_id"], current["annotation"]))
+        changed = {
+            query_id: text or ""
+            for query_id, text in annotations.items()
+            if (text or "") != previous.get(query_id, "")
+        }
+        if not changed:
+            return None
+        timestamp = annotated_at.strftime("%Y-%m-%d %H:%M:%S")
+        table = pa.table(
+            {
+                "query_id": list(changed),
+                "annotation": list(changed.values()),
+                "annotated_at": [timestamp] * len(changed),
+            },
+            schema=ANNOTATIONS_SCHEMA,
+        )
+        name = annotated_at.strftime("%Y%m%d_%H%M%S_%f")
+        return self._write(table, self.annotations_dir / f"{name}.parquet")
+
+    # -- joined view -----------------------------------------------------------
+
+    def annotated_results(self, columns: Optional[Iterable[str]] = None, as_of: Optional[str] = None) -> pd.DataFrame:
+        """Queries, responses and annotations joined by ``query_id``, one row per response.
+
+        Args:
+            columns (Optional[Iterable[str]]): Columns of the ``annotated_results``
+                layout to return (default: all of them). Only the tables and
+                columns they come from are read.
+            as_of (Optional[str]): See :meth:`annotations`.
+
+        Returns:
+            pd.DataFrame: The requested columns, in response order; unannotated
+            rows have an empty ``annotations``.
+        """
+        columns = list(columns or ANNOTATED_RESULTS_COLUMNS)
+        unknown = [column for column in columns if column not in ANNOTATED_COLUMNS]
+        if unknown:
+            raise ValueError(f"unknown columns {unknown}; choose from {', '.join(ANNOTATED_COLUMNS)}")
+        needed: Dict[str, List[str]] = {"queries": [], "responses": [], "annotations": []}
+        for column in columns:
+            table, source = ANNOTATED_COLUMNS[column]
+            if source != "query_id":
+                needed[table].append(source)
+
+        frame = self.responses(["query_id", *needed["responses"]])
+        if needed["queries"]:
+            frame = frame.merge(self.queries(["query_id", *needed["queries"]]), on="query_id", how="left")
+        if needed["annotations"]:
+            annotations = self.annotations(as_of=as_of, columns=needed["annotations"])
+            frame = frame.merge(annotations, on="query_id", how="left")
+            if "annotation" in frame:
+                frame["annotation"] = frame["annotation"].fillna("")
+        renames = {source: column for column, (_, source) in ANNOTATED_COLUMNS.items() if column != source}
+        return frame.rename(columns=renames)[columns]
+
+    def info(self) -> pd.DataFrame:
+        """Rows and bytes on disk of each file of the store."""
+        paths = [self._path("queries"), self._path("responses"), *self.snapshots()]
+        return pd.DataFrame(
+            [
+                {"file": str(path.relative_to(self.root)), "rows": pq.ParquetFile(path).metadata.num_rows,
+                 "bytes": path.stat().st_size}
+                for path in paths
+                if path.exists()
+            ],
+            columns=["file", "rows", "bytes"],
+        )
+
+
+def import_csvs(
+    store: ArtifactStore,
+    queries_csv: Optional[Path] = None,
+    responses_csv: Optional[Path] = None,
+    annotated_csvs: Sequence[Path] = (),
+) -> None:
+    """Load the CSVs of the earlier pipeline into ``store``.
+
+    The ``annotated_results`` exports are applied oldest first, each as the
+    snapshot of the annotations it changed.
+    """
+    if queries_csv is not None:
+        store.write_queries(pd.read_csv(queries_csv))
+    if responses_csv is not None:
+        store.write_responses(pd.read_csv(responses_csv))
+    for path in sorted(annotated_csvs):
+        export = pd.read_csv(path, usecols=["query_id", "annotations", "annotation_timestamp"])
+        annotated_at = pd.to_datetime(export["annotation_timestamp"]).max()
+        annotations = dict(zip(export["query_id"], export["annotations"].fillna("")))
+        store.snapshot_annotations(annotations, annotated_at.to_pydatetime() if pd.notna(annotated_at) else None)
+
+
+def main(argv: List[str] = None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--store", type=Path, default=STORE_DIR)
+    parser.add_argument("--compression", choices=COMPRESSIONS, default=DEFAULT_COMPRESSION)
+    commands = parser.add_subparsers(dest="command", required=True)
+    imports = commands.add_parser("import", help="Load the eval CSVs into the store.")
+    imports.add_argument("--queries", type=Path, default=EVALS_DIR / "synthetic_queries_for_analysis.csv")
+    imports.add_argument("--responses", type=Path, default=EVALS_DIR / "open_coding_results.csv")
+    imports.add_argument("--annotated", type=Path, nargs="*", default=sorted(EVALS_DIR.glob("annotated_results_*.csv")))
+    commands.add_parser("info", help="Rows and size of each file of the store.")
+    export = commands.add_parser("export", help="Write the joined annotated results to a CSV.")
+    export.add_argument("--output", type=Path, required=True)
+    export.add_argument("--columns", nargs="+", choices=list(ANNOTATED_COLUMNS), default=ANNOTATED_RESULTS_COLUMNS)
+    export.add_argument("--as-of", help="Annotation snapshot to stop at.")
+    args = parser.parse_args(argv)
+
+    store = ArtifactStore(args.store, args.compression)
+    if args.command == "import":
+        import_csvs(
+            store,
+            args.queries if args.queries.exists() else None,
+            args.responses if args.responses.exists() else None,
+            args.annotated,
+        )
+        print(f"Imported into {store.root}")
+        print(store.info().to_string(index=False))
+    elif args.command == "info":
+        print(store.info().to_string(index=False))
+    else:
+        frame = store.annotated_results(args.columns, args.as_of)
+        frame.to_csv(args.output, index=False)
+        print(f"Wrote {len(frame)} rows to {args.output}")
+
+
+if __name__ == "__main__":
+    sys.exit(main())
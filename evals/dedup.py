@@ -0,0 +1,300 @@
+"""Near-duplicate detection and coverage-aware sampling of synthetic data.
+
+Generated tuples and queries are compared by the Jaccard similarity of their
+character 4-gram sets, after the normalization of the semantic cache
+(:func:`backend.semantic_cache.tokenize`: case, punctuation, emojis and filler
+words dropped). Everything is vectorized with NumPy, so a few hundred
+thousand queries take seconds on one CPU:
+
+1. the texts are concatenated into one byte array and their 4-grams read
+   from it as ``uint32``s;
+2. each text gets a MinHash signature by one-permutation hashing (one hash
+   per 4-gram, split into ``num_perm`` bins, empty bins filled from their
+   neighbour);
+3. banded LSH proposes candidates: texts sharing all the values of one band
+   of their signatures;
+4. candidates whose signatures agree on at least ``threshold`` of their
+   values (the estimated Jaccard similarity) are near-duplicates; in input
+   order, each text joins the first earlier group leader it is similar to,
+   or leads a group of its own (no chaining through intermediate texts).
+
+Texts only match within the same *block*. For queries, the block is their
+countries, positions, leagues and numbers
+(:func:`backend.semantic_cache.key_terms`), so "German defenders" never
+duplicates "Brazilian defenders" or "German strikers".
+
+:func:`coverage_sample` then picks a subset that covers every
+(Country, PlayerSkills, Scenario) combination before it repeats one, and
+spreads the values of each dimension as evenly as it can.
+"""
+
+import sys
+from pathlib import Path
+from typing import Dict, Final, List, Optional, Sequence, Tuple
+
+import numpy as np
+import pandas as pd
+
+# Add the project root to Python path
+sys.path.append(str(Path(__file__).parent.parent))
+
+from backend.semantic_cache import COUNTRY_TERMS, key_terms, tokenize, tokenize_many  # noqa: E402
+
+# Estimated Jaccard similarity of 4-gram sets from which two texts are near-duplicates.
+DEDUP_THRESHOLD: Final[float] = 0.8
+NUM_PERM: Final[int] = 128
+SHINGLE_SIZE: Final[int] = 4
+# LSH bands are chosen so that a pair at the threshold becomes a candidate with this probability.
+CANDIDATE_RECALL: Final[float] = 0.95
+DIMENSIONS: Final[Sequence[str]] = ("Country", "PlayerSkills", "Scenario")
+
+# Low bits of a 4-gram hash kept as its value (the high bits pick its bin); the bits
+# above them hold the densification offset, so no value reaches the empty marker.
+_VALUE_BITS: Final[int] = 24
+_EMPTY: Final[np.uint32] = np.uint32(0xFFFFFFFF)
+
+
+def _mix(x: np.ndarray) -> np.ndarray:
+    """32-bit finalizer of MurmurHash3, applied elementwise (``uint32`` wraps around)."""
+    x = x ^ (x >> np.uint32(16))
+    x = x * np.uint32(0x85EBCA6B)
+    x ^= x >> np.uint32(13)
+    x *= np.uint32(0xC2B2AE35)
+    x ^= x >> np.uint32(16)
+    return x
+
+
+def _shingles(texts: Sequence[str], n: int = SHINGLE_SIZE) -> Tuple[np.ndarray, np.ndarray]:
+    """Hashed byte ``n``-grams of every text, and the text each one belongs to."""
+    encoded = [f" {text} ".encode("utf-8") for text in texts]
+    lengths = np.fromiter((len(data) for data in encoded), dtype=np.int64, count=len(encoded))
+    data = np.frombuffer(b"".join(encoded), dtype=np.uint8).astype(np.uint32)
+    grams = data[: len(data) - n + 1].copy()
+    for i in range(1, n):
+        grams = (grams << np.uint32(8)) | data[i: len(data) - n + 1 + i]
+    owners = np.repeat(np.arange(len(encoded)), lengths)[: len(grams)]
+    # n-grams that run into the next text are dropped.
+    ends = np.cumsum(lengths)
+    valid = np.arange(len(grams)) + n <= ends[owners]
+    return _mix(grams[valid]), owners[valid]
+
+
+def minhash_signatures(texts: Sequence[str], num_perm: int = NUM_PERM) -> np.ndarray:
+    """One-permutation MinHash signatures of ``texts``, as a ``(len(texts), num_perm)`` array.
+
+    Texts with no 4-gram (empty after normalization) get a row of
+    ``0xFFFFFFFF``, which :func:`near_duplicate_groups` never matches.
+    """
+    if num_perm & (num_perm - 1) or not 1 < num_perm <= 1 << (31 - _VALUE_BITS):
+        raise ValueError(f"num_perm must be a power of two up to {1 << (31 - _VALUE_BITS)}; got {num_perm}")
+    hashes, owners = _shingles(texts)
+    bits = num_perm.bit_length() - 1
+    bins = (hashes >> np.uint32(32 - bits)).astype(np.int64)
+    signatures = np.full(len(texts) * num_perm, _EMPTY, dtype=np.uint32)
+    np.minimum.at(signatures, owners * num_perm + bins, hashes & np.uint32((1 << _VALUE_BITS) - 1))
+    signatures = signatures.reshape(len(texts), num_perm)
+
+    # Densification: an empty bin takes the value of the next non-empty bin
+    # (circularly), offset by the distance, so that two texts still agree on
+    # it exactly when they agree on that bin.
+    empty = signatures == _EMPTY
+    positions = np.arange(num_perm)
+    filled = np.where(empty, 4 * num_perm, positions)
+    doubled = np.concatenate([filled, np.where(empty, 4 * num_perm, positions + num_perm)], axis=1)
+    following = np.minimum.accumulate(doubled[:, ::-1], axis=1)[:, ::-1][:, :num_perm]
+    blank = following >= 2 * num_perm
+    following = np.where(blank, positions, following)
+    values = np.take_along_axis(signatures, following % num_perm, axis=1)
+    distance = (following - positions).astype(np.uint32)
+    signatures = np.where(blank, _EMPTY, values + (distance << np.uint32(_VALUE_BITS)))
+    return signatures
+
+
+def lsh_bands(threshold: float, num_perm: int = NUM_PERM, recall: float = CANDIDATE_RECALL) -> Tuple[int, int]:
+    """``(bands, rows)`` of the LSH index for ``threshold``.
+
+    The most rows per band (the fewest false candidates) with which a pair at
+    ``threshold`` is still proposed with probability ``recall``.
+    """
+    best = (num_perm, 1)
+    for rows in range(1, num_perm + 1):
+        bands = num_perm // rows
+        if 1 - (1 - threshold ** rows) ** bands >= recall:
+            best = (bands, rows)
+    return best
+
+
+def _leaders(size: int, edges: np.ndarray) -> np.ndarray:
+    """Greedy leader clustering over ``edges`` ``(i, j)``, ``j < i``: similar pairs.
+
+    In index order, a node joins the first leader it is similar to, or leads
+    a group of its own. Unlike connected components, this does not chain:
+    every member is similar to its leader itself. Decided in vectorized
+    rounds: a node is a leader once no earlier node it is similar to could
+    still be one.
+
+    Returns:
+        np.ndarray: The leader of each node (itself for leaders).
+    """
+    undecided, leader, dropped = 0, 1, 2
+    state = np.zeros(size, dtype=np.int8)
+    if not len(edges):
+        return np.arange(size)
+    member, earlier = edges[:, 0], edges[:, 1]
+    while True:
+        live = state[member] == undecided
+        if not live.any():
+            break
+        blocked = np.zeros(size, dtype=bool)
+        blocked[member[live & (state[earlier] != dropped)]] = True
+        state[(state == undecided) & ~blocked] = leader
+        joins = live & (state[earlier] == leader)
+        state[member[joins]] = dropped
+        member, earlier = member[state[member] == undecided], earlier[state[member] == undecided]
+    # Each dropped node joins its first (lowest index) leader.
+    groups = np.arange(size)
+    joins = (state[edges[:, 0]] == dropped) & (state[edges[:, 1]] == leader)
+    first = np.full(size, size)
+    np.minimum.at(first, edges[joins, 0], edges[joins, 1])
+    groups[state == dropped] = first[state == dropped]
+    return groups
+
+
+def near_duplicate_groups(
+    texts: Sequence[str],
+    threshold: float = DEDUP_THRESHOLD,
+    blocks: Optional[Sequence[str]] = None,
+    num_perm: int = NUM_PERM,
+) -> np.ndarray:
+    """Group the near-duplicates among ``texts``.
+
+    Args:
+        texts (Sequence[str]): Texts to compare, already normalized.
+        threshold (float): Estimated Jaccard similarity (0-1] from which two
+            texts are near-duplicates.
+        blocks (Optional[Sequence[str]]): Texts only match texts of the same block.
+        num_perm (int): Length of the MinHash signatures (a power of two).
+
+    Returns:
+        np.ndarray: For each text, the index of the first text of its group
+        (its own index when it has no near-duplicate before it).
+    """
+    if not 0 < threshold <= 1:
+        raise ValueError(f"threshold must be in (0, 1]; got {threshold}")
+    if not len(texts):
+        return np.arange(0)
+    # Texts that are equal (in the same block) are grouped by hashing; only the distinct ones are MinHashed.
+    keys = pd.Series(list(texts), dtype=object)
+    if blocks is not None:
+        keys = keys + "\x00" + pd.Series(list(blocks), dtype=object)
+    codes = pd.factorize(keys)[0]
+    _, first_of = np.unique(codes, return_index=True)
+    if len(first_of) < 2:
+        return first_of[codes]
+    unique_texts = [texts[i] for i in first_of]
+    signatures = minhash_signatures(unique_texts, num_perm)
+    if blocks is not None:
+        block_ids = pd.factorize(pd.Series([blocks[i] for i in first_of], dtype=object))[0].astype(np.uint64)
+    else:
+        block_ids = np.zeros(len(first_of), dtype=np.uint64)
+    candidates = np.flatnonzero(signatures[:, 0] != _EMPTY)
+    values = signatures[candidates].astype(np.uint64)
+    seed = block_ids[candidates] * np.uint64(0x9E3779B97F4A7C15)
+    bands, rows = lsh_bands(threshold, num_perm)
+    edges = []
+    for band in range(bands):
+        # One uint64 key per text: its block and the values of this band.
+        key = seed.copy()
+        for column in range(band * rows, (band + 1) * rows):
+            key ^= values[:, column]
+            key *= np.uint64(0x100000001B3)
+        order = np.argsort(key, kind="stable")
+        sorted_keys = key[order]
+        shared = np.r_[False, sorted_keys[1:] == sorted_keys[:-1]]
+        if not shared.any():
+            continue
+        # Each text of a bucket is paired with the bucket's first (lowest index) text.
+        first = order[np.maximum.accumulate(np.where(shared, 0, np.arange(len(order))))]
+        pairs = candidates[np.stack([order[shared], first[shared]], axis=1)]
+        # Keys can collide: check the block and the signatures of every candidate pair.
+        agreement = (signatures[pairs[:, 0]] == signatures[pairs[:, 1]]).mean(axis=1)
+        same_block = block_ids[pairs[:, 0]] == block_ids[pairs[:, 1]]
+        edges.append(pairs[(agreement >= threshold) & same_block])
+    groups = _leaders(len(first_of), np.concatenate(edges) if edges else np.empty((0, 2), dtype=np.int64))
+    # Back to the positions in ``texts``: each group is named after its first text there.
+    return first_of[groups][codes]
+
+
+def normalize(texts: Sequence[str]) -> List[str]:
+    """Texts as compared: lowercase words without punctuation, emojis or filler words."""
+    return [" ".join(tokens) for tokens in tokenize_many(list(texts))]
+
+
+def query_groups(queries: Sequence[str], threshold: float = DEDUP_THRESHOLD) -> np.ndarray:
+    """:func:`near_duplicate_groups` of queries, which only match queries mentioning the same countries and numbers."""
+    tokens = tokenize_many(list(queries))
+    return near_duplicate_groups([" ".join(words) for words in tokens], threshold, [key_terms(words) for words in tokens])
+
+
+def dedupe_queries(queries: Sequence[str], threshold: float = DEDUP_THRESHOLD) -> np.ndarray:
+    """Indices of the queries to keep: the first of each group of near-duplicates."""
+    return np.flatnonzero(query_groups(queries, threshold) == np.arange(len(queries)))
+
+
+def dedupe_tuples(tuples: Sequence[Dict[str, str]], threshold: float = DEDUP_THRESHOLD) -> np.ndarray:
+    """Indices of the dimension tuples to keep.
+
+    Tuples are near-duplicates when their player skills are, for the same
+    country and scenario.
+    """
+    def country(value: str) -> str:
+        tokens = tokenize(value)
+        return " ".join(sorted({COUNTRY_TERMS.get(token, token) for token in tokens}))
+
+    blocks = [f"{country(tup['Country'])}|{' '.join(tokenize(tup['Scenario']))}" for tup in tuples]
+    groups = near_duplicate_groups(normalize([tup["PlayerSkills"] for tup in tuples]), threshold, blocks)
+    return np.flatnonzero(groups == np.arange(len(tuples)))
+
+
+def coverage_sample(dimensions: pd.DataFrame, size: int, seed: int = 0) -> np.ndarray:
+    """Indices of ``size`` rows that cover the dimension values as evenly as possible.
+
+    Every combination of ``dimensions``' columns gets a row before any gets a
+    second one. Combinations are taken in a greedy order that favours values
+    of each column that are least represented so far, so that a small sample
+    still spans all countries, skills and scenarios.
+
+    Args:
+        dimensions (pd.DataFrame): One row per item, one column per dimension.
+        size (int): Number of rows to pick.
+        seed (int): Picks the row of each combination taken in each round.
+
+    Returns:
+        np.ndarray: Row positions, in increasing order.
+    """
+    if size >= len(dimensions):
+        return np.arange(len(dimensions))
+    codes = np.stack([pd.factorize(dimensions[column])[0] for column in dimensions.columns], axis=1)
+    combos, combo_of_row = np.unique(codes, axis=0, return_inverse=True)
+    combo_of_row = combo_of_row.reshape(-1)
+
+    counts = [np.zeros(codes[:, d].max() + 1) for d in range(codes.shape[1])]
+    remaining = np.ones(len(combos), dtype=bool)
+    combo_rank = np.empty(len(combos), dtype=np.int64)
+    for position in range(len(combos)):
+        score = sum(1.0 / (1.0 + counts[d][combos[:, d]]) for d in range(codes.shape[1]))
+        best = int(np.argmax(np.where(remaining, score, -1.0)))
+        combo_rank[best] = position
+        remaining[best] = False
+        for d in range(codes.shape[1]):
+            counts[d][combos[best, d]] += 1
+
+    # Round of each row within its combination, in a random order.
+    shuffled = np.random.default_rng(seed).permutation(len(dimensions))
+    order = shuffled[np.argsort(combo_of_row[shuffled], kind="stable")]
+    starts = np.r_[True, combo_of_row[order][1:] != combo_of_row[order][:-1]]
+    first = np.flatnonzero(starts)[np.cumsum(starts) - 1]
+    rounds = np.empty(len(dimensions), dtype=np.int64)
+    rounds[order] = np.arange(len(dimensions)) - first
+    picked = np.lexsort((combo_rank[combo_of_row], rounds))[:size]
+    return np.sort(picked)
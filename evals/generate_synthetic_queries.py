@@ -1,15 +1,68 @@
+"""Generate synthetic scouting queries for error analysis.
+
+The run has two stages, both async and bounded by a shared requests- and
+tokens-per-minute limiter:
+
+1. ``--tuple-batches`` calls each ask for ``--tuples-per-batch``
+   (country, player skills, scenario) dimension tuples;
+2. one call per unique tuple asks for ``--queries-per-tuple`` queries.
+
+Every finished call is appended to a JSON-lines log in ``--run-dir``
+(``tuples.jsonl`` and ``queries.jsonl``), so a run that crashes or is
+interrupted resumes where it stopped when started again: completed batches
+and tuples are not requested twice. ``--restart`` discards the logs. The CSV
+at ``--output`` is rebuilt from the logs at the end of every run.
+
+``--cache on`` records every completion in the LLM cache
+(:mod:`backend.llm_cache`), so a re-run after a prompt edit only calls the
+LLM for the prompts that changed; ``--cache replay`` runs offline from it.
+``--store`` also writes the queries to the Parquet artifact store
+(:mod:`evals.artifacts`).
+
+Token usage and cost are recorded per run (:mod:`backend.usage`);
+``--token-budget`` refuses the calls once the run used that many tokens,
+leaving the tuples they were for to the next run.
+
+Near-duplicate tuples are dropped before their queries are requested, and
+near-duplicate queries before the CSV is written (:mod:`evals.dedup`,
+``--dedup-threshold``). ``--sample N`` keeps N queries spread evenly across
+the Country/PlayerSkills/Scenario values.
+
+Usage::
+
+    python evals/generate_synthetic_queries.py --tuple-batches 200 --rpm 50 --tpm 50000
+"""
+
+import argparse
+import asyncio
+import hashlib
 import json
 import os
+import sys
+import time
 from pathlib import Path
-from typing import List, Optional, Dict, Any
-from pydantic import BaseModel
+from typing import Any, Dict, List, Optional, Tuple, Type, TypeVar
+
 import pandas as pd
-from litellm import completion
 from dotenv import load_dotenv
-from concurrent.futures import ThreadPoolExecutor, as_completed
-import time
+from pydantic import BaseModel
 from tqdm import tqdm
 
+# Add the project root to Python path
+sys.path.append(str(Path(__file__).parent.parent))
+
+from backend.llm_cache import LLM_CACHE_MODE, LLM_CACHE_MODES, LLM_CACHE_PATH, configure_llm_cache  # noqa: E402
+from backend.usage import USAGE_RUN_TOKEN_BUDGET, check_budget  # noqa: E402
+from backend.utils import (  # noqa: E402
+    RetryPolicy,
+    acompletion,
+    cached_completion,
+    count_message_tokens,
+    is_retryable,
+)
+from evals.dedup import DEDUP_THRESHOLD, DIMENSIONS, coverage_sample, dedupe_queries, dedupe_tuples  # noqa: E402
+from evals.pipeline import JsonlLog, RateLimiter, charged_run, run_name, usage_tokens, with_retries  # noqa: E402
+
 load_dotenv()
 
 # --- Pydantic Models for Structured Output ---
@@ -35,34 +88,83 @@ class QueriesList(BaseModel):
 # --- Configuration ---
 MODEL_NAME = "anthropic/claude-3-haiku-20240307"
 NUM_TUPLES_TO_GENERATE = 10  # Generate more tuples than needed to ensure diversity
+NUM_TUPLE_BATCHES = 5        # Calls asking for NUM_TUPLES_TO_GENERATE tuples each
 NUM_QUERIES_PER_TUPLE = 5    # Generate multiple queries per tuple
 OUTPUT_CSV_PATH = Path(__file__).parent / "synthetic_queries_for_analysis.csv"
-MAX_WORKERS = 5  # Number of parallel LLM calls
-
-def call_llm(messages: List[Dict[str, str]], response_format: Any) -> Any:
-    """Call the LLM with the provided messages and return the response."""
-    max_retries = 1
-    for attempt in range(max_retries):
-        try:
-            response = completion(
-                model=MODEL_NAME,
-                messages=messages,
-                response_format=response_format,
-                stream=False
-            )
-            content = response.choices[0].message.content
-            if content is None or content.strip() == "":
-                raise ValueError("Received empty response from LLM.")
-            return response_format(**json.loads(content))
-        
-        except Exception as e:
-            if attempt == max_retries:
-                raise e
-            time.sleep(1) # wait before retry
-
-def generate_dimension_tuples() -> List[DimensionTuple]:
-
-    prompt = f"""Generate {NUM_TUPLES_TO_GENERATE} random combinations of (country, player skills, scenario) for a football scouting assistant.
+RUN_DIR = Path(__file__).parent / "runs" / "synthetic_queries"
+# Parquet artifact store (evals/artifacts.py), written with --store.
+STORE_DIR = Path(__file__).parent / "store"
+MAX_CONCURRENCY = 5  # Number of LLM calls in flight
+# Provider limits of the account (Anthropic's first usage tier by default).
+REQUESTS_PER_MINUTE = 50
+TOKENS_PER_MINUTE = 50_000
+# Completion tokens reserved per call until the provider reports the real usage.
+COMPLETION_TOKENS_ESTIMATE = 500
+RETRY_POLICY = RetryPolicy(timeout=120.0, max_retries=5, backoff=1.0, backoff_max=30.0, fallback_models=())
+
+M = TypeVar("M", bound=BaseModel)
+
+
+def _is_retryable(exc: BaseException) -> bool:
+    """Provider errors the backend retries, plus empty or malformed structured output."""
+    # json.JSONDecodeError and pydantic's ValidationError are ValueErrors.
+    return is_retryable(exc) or isinstance(exc, ValueError)
+
+
+def tuple_key(dimension_tuple: DimensionTuple) -> str:
+    """Stable identifier of a dimension tuple, used to resume query generation."""
+    return hashlib.sha256(dimension_tuple.model_dump_json().encode()).hexdigest()[:16]
+
+
+def _parse(response: Any, response_format: Type[M]) -> M:
+    content = response.choices[0].message.content
+    if content is None or content.strip() == "":
+        raise ValueError("Received empty response from LLM.")
+    return response_format(**json.loads(content))
+
+
+async def call_llm(
+    messages: List[Dict[str, str]],
+    response_format: Type[M],
+    limiter: Optional[RateLimiter] = None,
+    model: str = MODEL_NAME,
+    api_base: Optional[str] = None,
+    policy: RetryPolicy = RETRY_POLICY,
+    sample: int = 0,
+) -> M:
+    """Call the LLM with the provided messages and parse the response into ``response_format``.
+
+    Transient provider errors and unparsable replies are retried with backoff
+    according to ``policy``; every attempt waits for its share of ``limiter``.
+    With the LLM cache on, a recorded completion is returned without a call.
+    ``sample`` tells repeated calls with the same prompt apart in the cache.
+    Calls are charged to the run's usage account and refused with
+    :class:`~backend.usage.TokenBudgetExceeded` when they would exceed its budget.
+    """
+    cached = cached_completion(model, messages, sample=sample, response_format=response_format)
+    if cached is not None:
+        return _parse(cached, response_format)
+    estimate = sum(count_message_tokens(model, m["content"]) for m in messages) + COMPLETION_TOKENS_ESTIMATE
+    check_budget(estimate)
+
+    async def attempt() -> M:
+        response = await acompletion(
+            model,
+            messages,
+            sample=sample,
+            api_base=api_base,
+            validate=lambda response: _parse(response, response_format),
+            response_format=response_format,
+        )
+        if limiter is not None:
+            limiter.settle(estimate, usage_tokens(response) or estimate)
+        return _parse(response, response_format)
+
+    return await with_retries(attempt, policy, _is_retryable, limiter, estimate)
+
+
+def dimension_tuples_prompt(num_tuples: int = NUM_TUPLES_TO_GENERATE) -> List[Dict[str, str]]:
+    prompt = f"""Generate {num_tuples} random combinations of (country, player skills, scenario) for a football scouting assistant.
 The dimensions are:
 Country: the players nationality. Possible values: Argentina, Brazil, Spain, Venezuela...
 Player skills: specific skills for each player, that includes compare players with other current or past players. Possible values: A player similar to messi, A player with a good awarness, Strong defensive players in off-side systems
@@ -75,45 +177,61 @@ Possible values:
 Output each tuple in the format: (country, player skills, scenario)
 Avoid duplicates. Vary values across dimensions. The goal is to create a diverse set of queries for our assistant.
 
-Generate {NUM_TUPLES_TO_GENERATE} unique dimension tuples following these patterns. Remember to maintain balanced diversity across all dimensions.
+Generate {num_tuples} unique dimension tuples following these patterns. Remember to maintain balanced diversity across all dimensions.
 """
-    messages = [{"role": "user", "content": prompt}]
-
-    try:
-        print("Generating dimension tuples in parallel...")
-        with ThreadPoolExecutor(max_workers=5) as executor:
-            futures = []
-            for _ in range(5):
-                futures.append(executor.submit(call_llm, messages, DimensionTupleList))
-            
-            # Wait for all to complete and collect results
-            responses = []
-            for future in futures:
-                responses.append(future.result())
-            
-        # combine tuple and remove duplicates
-        all_tuples = []
-        for response in responses:
-            print(response.tuples)
-            all_tuples.extend(response.tuples)
-        unique_tuples = []
-        seen = set()
-
-        for tup in all_tuples:
-            tuple_str = tup.model_dump_json()
-            if tuple_str not in seen:
-                seen.add(tuple_str)
-                unique_tuples.append(tup)
-
-        print(f"Generated {len(unique_tuples)} unique dimension tuples.")
-        return unique_tuples
-    except Exception as e:
-        print(f"Error generating dimension tuples: {e}")
-        return []
-
-def generate_queries_for_tuple(dimension_tuple: DimensionTuple) -> List[QueryWithDimensions]:
-
-    prompt = f"""Generate {NUM_QUERIES_PER_TUPLE} realistic football scouting queries based on the following dimension tuple:{dimension_tuple.model_dump_json(indent=2)}
+    return [{"role": "user", "content": prompt}]
+
+
+async def generate_dimension_tuples(
+    log: JsonlLog,
+    limiter: RateLimiter,
+    batches: int = NUM_TUPLE_BATCHES,
+    num_tuples: int = NUM_TUPLES_TO_GENERATE,
+    dedup_threshold: float = DEDUP_THRESHOLD,
+    **llm_kwargs: Any,
+) -> List[DimensionTuple]:
+    """Request the batches missing from ``log`` and return the unique tuples of all of them.
+
+    Each finished batch is appended to ``log``; failed batches are reported
+    and requested again by the next run. Tuples whose player skills are
+    near-duplicates (``dedup_threshold``, 0 to keep them) for the same country
+    and scenario are dropped before any query is generated for them.
+    """
+    done = log.keys("batch")
+    pending = [batch for batch in range(batches) if batch not in done]
+    messages = dimension_tuples_prompt(num_tuples)
+
+    async def one(batch: int) -> Tuple[int, Optional[DimensionTupleList], Optional[Exception]]:
+        try:
+            return batch, await call_llm(messages, DimensionTupleList, limiter, sample=batch, **llm_kwargs), None
+        except Exception as e:
+            return batch, None, e
+
+    if pending:
+        print(f"Generating dimension tuples: {len(pending)} of {batches} batches left...")
+    for future in asyncio.as_completed([one(batch) for batch in pending]):
+        batch, response, error = await future
+        if error is not None:
+            print(f"Error generating dimension tuple batch {batch}: {error}")
+            continue
+        log.append({"batch": batch, "tuples": [tup.model_dump() for tup in response.tuples]})
+
+    # combine tuples in batch order and remove duplicates
+    unique_tuples: Dict[str, DimensionTuple] = {}
+    for record in sorted(log.records(), key=lambda record: record["batch"]):
+        for values in record["tuples"]:
+            tup = DimensionTuple(**values)
+            unique_tuples.setdefault(tuple_key(tup), tup)
+    tuples = list(unique_tuples.values())
+    if dedup_threshold and tuples:
+        tuples = [tuples[i] for i in dedupe_tuples([tup.model_dump() for tup in tuples], dedup_threshold)]
+    print(f"Generated {len(tuples)} unique dimension tuples "
+          f"({len(unique_tuples) - len(tuples)} near-duplicates dropped).")
+    return tuples
+
+
+def queries_prompt(dimension_tuple: DimensionTuple, num_queries: int = NUM_QUERIES_PER_TUPLE) -> List[Dict[str, str]]:
+    prompt = f"""Generate {num_queries} realistic football scouting queries based on the following dimension tuple:{dimension_tuple.model_dump_json(indent=2)}
 The queries should:
 1. Sound like real users asking for scouting players
 2. Naturally incorporate all the dimension values
@@ -127,56 +245,91 @@ The queries should:
    - Some with extra spaces or missing spaces
    - Some with emojis or text speak
 
-Generate {NUM_QUERIES_PER_TUPLE} unique queries that match the given dimensions, varying the text style naturally."""
-
-    messages = [{"role": "user", "content": prompt}]
-    
-    try:
-        response = call_llm(messages, QueriesList)
-        return response.queries
-    except Exception as e:
-        print(f"Error generating queries for tuple: {e}")
-        return []
-
-def generate_queries_parallel(dimension_tuples: List[DimensionTuple]) -> List[QueryWithDimensions]:
-
-    all_queries = []
-
-    query_id = 1
-
-    print(f"Generating {NUM_QUERIES_PER_TUPLE} queries each for {len(dimension_tuples)} dimension tuples in parallel...")
-
-    with ThreadPoolExecutor(max_workers=MAX_WORKERS) as executor:
-        future_to_tuple = {
-            executor.submit(generate_queries_for_tuple, dim_tuple): i
-            for i, dim_tuple in enumerate(dimension_tuples)
-        }
-
-    # process complete generation as they finish
-    with tqdm(total=len(dimension_tuples), desc="Generating Queries") as pbar:
-        for future in as_completed(future_to_tuple):
-            tuple_idx = future_to_tuple[future]
+Generate {num_queries} unique queries that match the given dimensions, varying the text style naturally."""
+    return [{"role": "user", "content": prompt}]
+
+
+async def generate_queries_for_tuple(
+    dimension_tuple: DimensionTuple,
+    limiter: RateLimiter,
+    num_queries: int = NUM_QUERIES_PER_TUPLE,
+    **llm_kwargs: Any,
+) -> List[str]:
+    response = await call_llm(queries_prompt(dimension_tuple, num_queries), QueriesList, limiter, **llm_kwargs)
+    return response.queries
+
+
+async def generate_queries_parallel(
+    dimension_tuples: List[DimensionTuple],
+    log: JsonlLog,
+    limiter: RateLimiter,
+    concurrency: int = MAX_CONCURRENCY,
+    num_queries: int = NUM_QUERIES_PER_TUPLE,
+    **llm_kwargs: Any,
+) -> int:
+    """Generate queries for the tuples that have none in ``log``; return the number that failed.
+
+    At most ``concurrency`` calls are in flight. Each tuple's queries are
+    appended to ``log`` as soon as they arrive.
+    """
+    done = log.keys("tuple_key")
+    pending = [tup for tup in dimension_tuples if tuple_key(tup) not in done]
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def one(tup: DimensionTuple) -> Tuple[DimensionTuple, List[str], Optional[Exception]]:
+        async with semaphore:
             try:
-                queries = future.result()
-                if queries:
-                    for query_text in queries:
-                        all_queries.append(QueryWithDimensions(
-                                id=f"SYN{query_id:03d}",
-                                query=query_text,
-                                dimension_tuple=dimension_tuples[tuple_idx]
-                            ))
-                        query_id += 1
-                pbar.update(1)
+                return tup, await generate_queries_for_tuple(tup, limiter, num_queries, **llm_kwargs), None
             except Exception as e:
-                print(f"Tuple {tuple_idx + 1} generated an exception: {e}")
-                pbar.update(1)
-    return all_queries
-
-def save_queries_to_csv(queries: List[QueryWithDimensions]):
-    """Save generated queries to CSV using pandas."""
+                return tup, [], e
+
+    print(f"Generating {num_queries} queries each for {len(pending)} of {len(dimension_tuples)} dimension tuples...")
+    failed = 0
+    with tqdm(total=len(dimension_tuples), initial=len(dimension_tuples) - len(pending), desc="Generating Queries") as pbar:
+        for future in asyncio.as_completed([one(tup) for tup in pending]):
+            tup, queries, error = await future
+            if error is not None:
+                failed += 1
+                tqdm.write(f"Tuple {tup.model_dump_json()} generated an exception: {error}")
+            else:
+                log.append({"tuple_key": tuple_key(tup), "dimension_tuple": tup.model_dump(), "queries": queries})
+            pbar.update(1)
+    return failed
+
+
+def load_queries(
+    dimension_tuples: List[DimensionTuple],
+    log: JsonlLog,
+    dedup_threshold: float = DEDUP_THRESHOLD,
+    sample: int = 0,
+) -> List[QueryWithDimensions]:
+    """The generated queries, in tuple order, with ids numbered from SYN001.
+
+    Near-duplicate queries (``dedup_threshold``, 0 to keep them) are dropped,
+    keeping the first of each group. With ``sample``, at most that many are
+    kept, spread across the Country/PlayerSkills/Scenario values.
+    """
+    queries_by_tuple = {record["tuple_key"]: record["queries"] for record in log.records()}
+    rows = [(tup, query_text) for tup in dimension_tuples for query_text in queries_by_tuple.get(tuple_key(tup), [])]
+    keep = list(range(len(rows)))
+    if dedup_threshold and rows:
+        keep = dedupe_queries([query_text for _, query_text in rows], dedup_threshold).tolist()
+    if sample and len(keep) > sample:
+        dimensions = pd.DataFrame([rows[i][0].model_dump() for i in keep], columns=list(DIMENSIONS))
+        keep = [keep[i] for i in coverage_sample(dimensions, sample)]
+    if len(keep) < len(rows):
+        print(f"Kept {len(keep)} of {len(rows)} queries ({len(rows) - len(keep)} near-duplicates or not sampled).")
+    return [
+        QueryWithDimensions(id=f"SYN{number:03d}", query=rows[i][1], dimension_tuple=rows[i][0])
+        for number, i in enumerate(keep, start=1)
+    ]
+
+
+def save_queries_to_csv(queries: List[QueryWithDimensions], path: Path = OUTPUT_CSV_PATH) -> Optional[pd.DataFrame]:
+    """Save generated queries to CSV using pandas and return them."""
     if not queries:
         print("No queries to save.")
-        return
+        return None
 
     # Convert to DataFrame
     df = pd.DataFrame([
@@ -189,36 +342,94 @@ def save_queries_to_csv(queries: List[QueryWithDimensions]):
         }
         for q in queries
     ])
-    
+
     # Save to CSV
-    df.to_csv(OUTPUT_CSV_PATH, index=False)
-    print(f"Saved {len(queries)} queries to {OUTPUT_CSV_PATH}")
+    df.to_csv(path, index=False)
+    print(f"Saved {len(queries)} queries to {path}")
+    return df
+
+
+async def run(args: argparse.Namespace) -> int:
+    """Run both stages; return the number of tuple batches and tuples still missing."""
+    tuples_log = JsonlLog(args.run_dir / "tuples.jsonl")
+    queries_log = JsonlLog(args.run_dir / "queries.jsonl")
+    if args.restart:
+        tuples_log.reset()
+        queries_log.reset()
+    limiter = RateLimiter(args.rpm or None, args.tpm or None)
+    policy = RETRY_POLICY._replace(max_retries=args.max_retries)
+    llm_kwargs = {"model": args.model, "api_base": args.api_base, "policy": policy}
+    try:
+        dimension_tuples = await generate_dimension_tuples(
+            tuples_log, limiter, args.tuple_batches, args.tuples_per_batch, args.dedup_threshold, **llm_kwargs
+        )
+        missing_batches = args.tuple_batches - len(tuples_log.keys("batch"))
+        if not dimension_tuples:
+            print("No dimension tuples generated. Exiting.")
+            return missing_batches
+        failed = await generate_queries_parallel(
+            dimension_tuples, queries_log, limiter, args.concurrency, args.queries_per_tuple, **llm_kwargs
+        )
+    finally:
+        tuples_log.close()
+        queries_log.close()
+
+    queries = load_queries(dimension_tuples, queries_log, args.dedup_threshold, args.sample)
+    if queries:
+        df = save_queries_to_csv(queries, args.output)
+        if args.store is not None:
+            from evals.artifacts import ArtifactStore
 
-def main():
-    if "ANTHROPIC_API_KEY" not in os.environ:
+            print(f"Stored the queries in {ArtifactStore(args.store).write_queries(df)}")
+    else:
+        print("failed to generate any queries")
+    if missing_batches or failed:
+        print(f"{missing_batches} tuple batches and {failed} tuples failed; run again to resume.")
+    return missing_batches + failed
+
+
+def main(argv: List[str] = None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--model", default=MODEL_NAME)
+    parser.add_argument("--api-base", help="OpenAI-compatible endpoint (default: LLM_API_BASE for the provider of "
+                        "the backend's MODEL_NAME, the provider's own otherwise).")
+    parser.add_argument("--tuple-batches", type=int, default=NUM_TUPLE_BATCHES)
+    parser.add_argument("--tuples-per-batch", type=int, default=NUM_TUPLES_TO_GENERATE)
+    parser.add_argument("--queries-per-tuple", type=int, default=NUM_QUERIES_PER_TUPLE)
+    parser.add_argument("--concurrency", type=int, default=MAX_CONCURRENCY)
+    parser.add_argument("--rpm", type=float, default=REQUESTS_PER_MINUTE, help="Requests per minute (0: no limit).")
+    parser.add_argument("--tpm", type=float, default=TOKENS_PER_MINUTE, help="Tokens per minute (0: no limit).")
+    parser.add_argument("--max-retries", type=int, default=RETRY_POLICY.max_retries)
+    parser.add_argument("--run-dir", type=Path, default=RUN_DIR, help="Where the resumable logs are kept.")
+    parser.add_argument("--output", type=Path, default=OUTPUT_CSV_PATH)
+    parser.add_argument("--restart", action="store_true", help="Discard the logs of a previous run.")
+    parser.add_argument("--dedup-threshold", type=float, default=DEDUP_THRESHOLD,
+                        help="Similarity from which tuples and queries are near-duplicates (0: keep them).")
+    parser.add_argument("--sample", type=int, default=0,
+                        help="Keep this many queries, covering the dimension values evenly (0: all).")
+    parser.add_argument("--store", type=Path, nargs="?", const=STORE_DIR,
+                        help=f"Also write the queries to the Parquet artifact store (default {STORE_DIR}).")
+    parser.add_argument("--cache", choices=LLM_CACHE_MODES, default=LLM_CACHE_MODE,
+                        help="LLM cache: replay answers from it only, offline (default: LLM_CACHE_MODE).")
+    parser.add_argument("--cache-path", default=LLM_CACHE_PATH)
+    parser.add_argument("--run-name", help="Usage account of the run (default: run directory and start time).")
+    parser.add_argument("--token-budget", type=int, default=USAGE_RUN_TOKEN_BUDGET,
+                        help="Tokens the run may use (0: no budget).")
+    args = parser.parse_args(argv)
+    cache = configure_llm_cache(args.cache, args.cache_path)
+
+    if args.cache != "replay" and args.model.startswith("anthropic/") and "ANTHROPIC_API_KEY" not in os.environ:
         print("Please set the ANTHROPIC_API_KEY environment variable.")
         return
 
     start_time = time.time()
+    with charged_run(args.run_name or run_name(args.run_dir), args.token_budget):
+        missing = asyncio.run(run(args))
+    elapsed_time = time.time() - start_time
+    print(f"Finished in {elapsed_time:.2f} seconds.")
+    if cache is not None:
+        print(f"LLM cache ({args.cache}): {cache.stats()}")
+    sys.exit(1 if missing else 0)
 
-    # Step 1: Generate dimension tuples
-    print("Generating dimension tuples...")
-    dimension_tuples = generate_dimension_tuples()
-    if not dimension_tuples:
-        print("No dimension tuples generated. Exiting.")
-        return
-    print(f"Generated {len(dimension_tuples)} dimension tuples.")
-
-    # Step 2: Generate queries for each tuple in parallel
-    print("Generating queries for each dimension tuple...")
-    queries = generate_queries_parallel(dimension_tuples)
-
-    if queries:
-        save_queries_to_csv(queries)
-        elapsed_time = time.time() - start_time
-        print(f"Generated {len(queries)} queries in {elapsed_time:.2f} seconds.")
-    else:
-        print("failed to generate any queries")
 if __name__ == "__main__":
     main()
-            
@@ -1,25 +1,87 @@
 # open coding
 
+"""Run the synthetic queries through the agent and save its responses for open coding.
+
+By default the rows are processed concurrently (``--concurrency`` calls in
+flight, within ``--rpm`` requests and ``--tpm`` tokens per minute). Each
+finished row is appended to ``results.jsonl`` in ``--run-dir`` as soon as it
+arrives, and a restarted run skips the ``query_id``s already there, so a
+crash loses nothing. Rows that failed are retried by the next run. The CSV
+at ``--output`` is rebuilt from the log, in input order, at the end.
+
+``--batch-api`` sends the pending rows as one job to an OpenAI-compatible
+Batch API (cheaper, answered within 24 hours) instead; the job id is logged,
+so an interrupted run picks up the same job. ``--serial`` keeps the original
+one-call-at-a-time loop.
+
+``--cache on`` answers the calls made before from the LLM cache
+(:mod:`backend.llm_cache`) and records the others; ``--cache replay`` runs
+offline from it and fails the rows it has no completion for. ``--store``
+also writes the responses to the Parquet artifact store (:mod:`evals.artifacts`).
+
+Token usage and cost are recorded per run (:mod:`backend.usage`);
+``--token-budget`` refuses the calls once the run used that many tokens,
+leaving their rows to the next run. Batch API jobs are not charged.
+
+Usage::
+
+    python evals/open_coding.py --concurrency 8 --rpm 50
+"""
+
+import argparse
+import asyncio
+import json
+import os
 import sys
+import time
 from pathlib import Path
 
 # Add the project root to Python path
 project_root = Path(__file__).parent.parent
 sys.path.append(str(project_root))
 
-from backend.utils import get_agent_response
+from backend.utils import (
+    DEFAULT_RETRY_POLICY,
+    MODEL_NAME,
+    aget_agent_response,
+    close_async_client,
+    count_message_tokens,
+    get_agent_response,
+    get_async_client,
+    model_api_base,
+    routed_prompt,
+    with_system_prompt,
+)
+from backend.llm_cache import LLM_CACHE_MODE, LLM_CACHE_MODES, LLM_CACHE_PATH, configure_llm_cache
+from backend.router import CANNED_REPLY
+from backend.usage import USAGE_RUN_TOKEN_BUDGET, check_budget
+from evals.pipeline import JsonlLog, RateLimiter, charged_run, run_name
 
-import pandas as pd 
-from pathlib import Path
-from typing import List, Dict
+import httpx
+import pandas as pd
+from tqdm import tqdm
+from typing import Any, Dict, List, NamedTuple, Optional, Tuple
+
+INPUT_CSV_PATH = Path(__file__).parent / "synthetic_queries_for_analysis.csv"
+OUTPUT_CSV_PATH = Path(__file__).parent / "open_coding_results.csv"
+RUN_DIR = Path(__file__).parent / "runs" / "open_coding"
+# Parquet artifact store (evals/artifacts.py), written with --store.
+STORE_DIR = Path(__file__).parent / "store"
+MAX_CONCURRENCY = 8  # Number of agent calls in flight
+# Provider limits of the account (Anthropic's first usage tier by default).
+REQUESTS_PER_MINUTE = 50
+TOKENS_PER_MINUTE = 50_000
+# Completion tokens reserved per call until the reply's length is known.
+COMPLETION_TOKENS_ESTIMATE = 600
+BATCH_POLL_INTERVAL = 30.0  # Seconds between Batch API status checks
 
 def get_open_coding_messages(df: pd.DataFrame) -> list:
     """
     Generate messages for open coding based on the provided DataFrame.
-    
+
     Args:
         df (pd.DataFrame): DataFrame containing the data to be processed.
-        
+
     Returns:
         list: A list of message dictionaries formatted for the LLM.
     """
@@ -35,96 +97,336 @@ def open_coding(messages):
     response = get_agent_response(messages)
     return response
 
+def open_coding_prompt(row: Dict[str, Any]) -> List[Dict[str, str]]:
+    """The single-turn conversation sent to the agent for one query row.
+
+    Only the user's query is sent, as a user of the app would: the row's
+    dimension tuple (its scenario label in particular) would otherwise steer
+    the router and the reply, and the traces would not show the agent's behaviour.
+    """
+    return [{"role": "user", "content": str(row.get("query", ""))}]
+
+def assistant_reply(response: Any) -> str:
+    """Extract the assistant's reply from what the agent returned."""
+    if isinstance(response, list):
+        for res in response:
+            if res.get('role') == 'assistant':
+                return res.get('content', '')
+    elif isinstance(response, str):
+        return response
+    return ""
+
+def open_coding_result(row: Dict[str, Any], index: int, response: str, latency_s: Optional[float] = None) -> Dict[str, Any]:
+    """One row of the open coding results."""
+    return {
+        'query_id': row.get('id', f'Query_{index+1}'),
+        'original_query': row.get('query', ''),
+        'dimension_tuple_json': row.get('dimension_tuple_json', ''),
+        'open_coding_response': response,
+        'latency_s': latency_s,
+    }
+
 def open_coding_df(df: pd.DataFrame) -> pd.DataFrame:
     """
     Perform open coding on the provided DataFrame and return the results.
-    
+
+    Rows are processed one at a time; see :func:`open_coding_concurrent` for
+    the concurrent, resumable runner.
+
     Args:
         df (pd.DataFrame): DataFrame containing the data to be processed.
-        
+
     Returns:
         pd.DataFrame: DataFrame with queries and open coding results.
     """
     results = []
-    
-    for index, row in df.iterrows():
+
+    for index, row in enumerate(df.to_dict("records")):
         # Create message for this specific query
-        messages = [{
-            "role": "user",
-            "content": f"Open code this football scouting query data: {row.to_dict()}"
-        }]
-        
+        messages = open_coding_prompt(row)
+
         try:
+            start = time.monotonic()
             response = get_agent_response(messages)
-            
-            # Extract the assistant's response
-            assistant_response = ""
-            if isinstance(response, list):
-                for res in response:
-                    if res.get('role') == 'assistant':
-                        assistant_response = res.get('content', '')
-                        break
-            elif isinstance(response, str):
-                assistant_response = response
-            
-            # Store both query and response
-            results.append({
-                'query_id': row.get('id', f'Query_{index+1}'),
-                'original_query': row.get('query', ''),
-                'dimension_tuple_json': row.get('dimension_tuple_json', ''),
-                'open_coding_response': assistant_response
-            })
-            
+            results.append(open_coding_result(row, index, assistant_reply(response), time.monotonic() - start))
+
         except Exception as e:
             print(f"Error processing query {index+1}: {e}")
-            results.append({
-                'query_id': row.get('id', f'Query_{index+1}'),
-                'original_query': row.get('query', ''),
-                'dimension_tuple_json': row.get('dimension_tuple_json', ''),
-                'open_coding_response': f"Error: {str(e)}"
-            })
-    
+            results.append(open_coding_result(row, index, f"Error: {str(e)}"))
+
     return pd.DataFrame(results)
 
+class RunReport(NamedTuple):
+    """Outcome of one run of the concurrent or Batch API runner."""
+
+    total: int  # rows in the input
+    skipped: int  # rows already in the log when the run started
+    completed: int  # rows finished by this run
+    failed: int  # rows that failed in this run (retried by the next one)
+    seconds: float
+
+    def summary(self) -> str:
+        rate = self.completed / self.seconds if self.seconds else 0.0
+        return (
+            f"{self.completed} rows in {self.seconds:.1f}s ({rate:.2f} rows/s, {rate * 60:.0f} rows/min), "
+            f"{self.skipped} already done, {self.failed} failed, "
+            f"{self.skipped + self.completed}/{self.total} complete"
+        )
+
+def _pending_rows(df: pd.DataFrame, log: JsonlLog) -> List[Tuple[int, Dict[str, Any]]]:
+    """(index, row) of the rows whose ``query_id`` has no result in ``log``."""
+    done = log.keys("query_id")
+    rows = enumerate(df.to_dict("records"))
+    return [(index, row) for index, row in rows if row.get('id', f'Query_{index+1}') not in done]
+
+async def open_coding_concurrent(
+    df: pd.DataFrame,
+    log: JsonlLog,
+    concurrency: int = MAX_CONCURRENCY,
+    limiter: Optional[RateLimiter] = None,
+) -> RunReport:
+    """Open code the rows of ``df`` that are not in ``log`` yet, ``concurrency`` at a time.
+
+    Each result is appended to ``log`` as it arrives. The agent applies its
+    own retry policy; rows that still fail are reported and left out of the
+    log. ``limiter`` is charged the prompt tokens plus an estimate of the
+    reply, corrected once the reply is known. Rows whose estimate exceeds
+    what is left of the run's token budget fail without waiting for ``limiter``.
+    """
+    start = time.monotonic()
+    pending = _pending_rows(df, log)
+    semaphore = asyncio.Semaphore(concurrency)
+    limiter = limiter or RateLimiter()
+
+    async def one(index: int, row: Dict[str, Any]) -> Tuple[int, Dict[str, Any], Optional[str], float, Optional[Exception]]:
+        messages = open_coding_prompt(row)
+        prompt_tokens = count_message_tokens(MODEL_NAME, messages[0]["content"])
+        estimate = prompt_tokens + COMPLETION_TOKENS_ESTIMATE
+        async with semaphore:
+            try:
+                check_budget(estimate)
+            except Exception as e:
+                return index, row, None, 0.0, e
+            await limiter.acquire(estimate)
+            began = time.monotonic()
+            try:
+                reply = assistant_reply(await aget_agent_response(messages))
+            except Exception as e:
+                limiter.settle(estimate, prompt_tokens)
+                return index, row, None, time.monotonic() - began, e
+        limiter.settle(estimate, prompt_tokens + count_message_tokens(MODEL_NAME, reply))
+        return index, row, reply, time.monotonic() - began, None
+
+    failed = 0
+    skipped = len(df) - len(pending)
+    with tqdm(total=len(df), initial=skipped, desc="Open coding", unit="row") as pbar:
+        for future in asyncio.as_completed([one(index, row) for index, row in pending]):
+            index, row, reply, latency, error = await future
+            if error is not None:
+                failed += 1
+                tqdm.write(f"Error processing query {index+1}: {error}")
+            else:
+                log.append(open_coding_result(row, index, reply, round(latency, 3)))
+            pbar.update(1)
+    return RunReport(len(df), skipped, len(pending) - failed, failed, time.monotonic() - start)
+
+class BatchClient:
+    """Minimal client of an OpenAI-compatible Batch API (``/files`` and ``/batches``)."""
+
+    def __init__(self, client: httpx.AsyncClient, api_base: str, api_key: str, poll_interval: float = BATCH_POLL_INTERVAL) -> None:
+        self.client = client
+        self.api_base = api_base.rstrip("/")
+        self.headers = {"Authorization": f"Bearer {api_key}"}
+        self.poll_interval = poll_interval
+
+    async def _json(self, method: str, path: str, **kwargs: Any) -> Dict[str, Any]:
+        response = await self.client.request(method, f"{self.api_base}{path}", headers=self.headers, **kwargs)
+        response.raise_for_status()
+        return response.json()
+
+    async def submit(self, requests: List[Dict[str, Any]]) -> str:
+        """Upload ``requests`` as a JSON-lines file, start a batch on it and return its id."""
+        content = "".join(json.dumps(request) + "\n" for request in requests).encode()
+        upload = await self._json("POST", "/files", files={"file": ("open_coding.jsonl", content)}, data={"purpose": "batch"})
+        batch = await self._json(
+            "POST", "/batches",
+            json={"input_file_id": upload["id"], "endpoint": "/v1/chat/completions", "completion_window": "24h"},
+        )
+        return batch["id"]
+
+    async def wait(self, batch_id: str) -> Dict[str, Any]:
+        """Poll the batch until it is no longer running and return it."""
+        while True:
+            batch = await self._json("GET", f"/batches/{batch_id}")
+            if batch["status"] in ("completed", "failed", "expired", "cancelled"):
+                return batch
+            counts = batch.get("request_counts") or {}
+            print(f"Batch {batch_id} {batch['status']}: {counts.get('completed', 0)}/{counts.get('total', '?')} done")
+            await asyncio.sleep(self.poll_interval)
+
+    async def results(self, batch: Dict[str, Any]) -> Dict[str, Dict[str, Any]]:
+        """custom_id -> ``response`` of each request in the finished ``batch``."""
+        if not batch.get("output_file_id"):
+            return {}
+        response = await self.client.get(f"{self.api_base}/files/{batch['output_file_id']}/content", headers=self.headers)
+        response.raise_for_status()
+        lines = (json.loads(line) for line in response.text.splitlines() if line.strip())
+        return {line["custom_id"]: line.get("response") or {} for line in lines}
+
+def _batch_model(model: str) -> str:
+    """The model name the Batch API expects, for OpenAI-compatible ``model``s only."""
+    provider, _, name = model.rpartition("/")
+    if provider not in ("", "openai"):
+        raise ValueError(f"--batch-api needs an OpenAI-compatible model, got {model}")
+    return name
+
+async def open_coding_batch_api(df: pd.DataFrame, log: JsonlLog, client: BatchClient) -> RunReport:
+    """Open code the rows of ``df`` not in ``log`` yet through one Batch API job.
+
+    Prompts are built and routed like :func:`~backend.utils.aget_agent_response`
+    does (out-of-scope rows get the canned reply without a call). The job id is
+    logged before waiting, so a restarted run waits for the same job instead
+    of submitting the rows again. Failed requests are reported and left out
+    of the log.
+    """
+    start = time.monotonic()
+    pending = _pending_rows(df, log)
+    skipped = len(df) - len(pending)
+    by_id = {row.get('id', f'Query_{index+1}'): (index, row) for index, row in pending}
+    jobs = [record for record in log.records() if "batch_id" in record and set(record["query_ids"]) & set(by_id)]
+    if jobs:
+        batch_id = jobs[-1]["batch_id"]
+        print(f"Resuming batch {batch_id}")
+    else:
+        requests = []
+        for query_id, (index, row) in by_id.items():
+            prompt, policy, kwargs = routed_prompt(with_system_prompt(open_coding_prompt(row)), DEFAULT_RETRY_POLICY)
+            if prompt is None:
+                log.append(open_coding_result(row, index, CANNED_REPLY))
+                continue
+            body = {"model": _batch_model(policy.model), "messages": prompt, **kwargs}
+            requests.append({"custom_id": query_id, "method": "POST", "url": "/v1/chat/completions", "body": body})
+        if not requests:
+            return RunReport(len(df), skipped, len(pending), 0, time.monotonic() - start)
+        batch_id = await client.submit(requests)
+        log.append({"batch_id": batch_id, "query_ids": [request["custom_id"] for request in requests]})
+        print(f"Submitted batch {batch_id} with {len(requests)} requests")
+
+    batch = await client.wait(batch_id)
+    responses = await client.results(batch)
+    done = log.keys("query_id")
+    failed = 0
+    for query_id, (index, row) in by_id.items():
+        if query_id in done:
+            continue  # a canned reply logged before the job was submitted
+        response = responses.get(query_id)
+        if not response or response.get("status_code") != 200:
+            failed += 1
+            print(f"Error processing query {index+1}: {(response or {}).get('body') or batch['status']}")
+            continue
+        log.append(open_coding_result(row, index, response["body"]["choices"][0]["message"]["content"]))
+    return RunReport(len(df), skipped, len(pending) - failed, failed, time.monotonic() - start)
+
+def load_results(df: pd.DataFrame, log: JsonlLog) -> pd.DataFrame:
+    """The logged results of the rows of ``df``, in input order."""
+    results = {record["query_id"]: record for record in log.records() if "query_id" in record}
+    ids = [row.get('id', f'Query_{index+1}') for index, row in enumerate(df.to_dict("records"))]
+    columns = ['query_id', 'original_query', 'dimension_tuple_json', 'open_coding_response', 'latency_s']
+    return pd.DataFrame([results[query_id] for query_id in ids if query_id in results], columns=columns)
+
 def open_coding_from_csv(file_path: str) -> pd.DataFrame:
     """
     Perform open coding on a CSV file and return the results as a DataFrame.
-    
+
     Args:
         file_path (str): Path to the CSV file.
-        
+
     Returns:
         pd.DataFrame: DataFrame with queries and open coding results.
     """
     df = pd.read_csv(file_path)
     return open_coding_df(df)
 
-def main():
-    # Example usage - use the synthetic queries CSV
-    INPUT_CSV_PATH = Path(__file__).parent / "synthetic_queries_for_analysis.csv"
-    OUTPUT_CSV_PATH = Path(__file__).parent / "open_coding_results.csv"
+async def run(df: pd.DataFrame, args: argparse.Namespace) -> RunReport:
+    """Run the concurrent or Batch API runner over ``df`` with the options in ``args``."""
+    log = JsonlLog(args.run_dir / "results.jsonl")
+    if args.restart:
+        log.reset()
+    try:
+        if args.batch_api:
+            api_base = args.api_base or model_api_base(MODEL_NAME) or "https://api.openai.com/v1"
+            client = BatchClient(get_async_client(), api_base, os.environ.get("OPENAI_API_KEY", ""), args.poll_interval)
+            report = await open_coding_batch_api(df, log, client)
+        else:
+            # Replayed completions come from the LLM cache, not the provider.
+            replay = args.cache == "replay"
+            limiter = RateLimiter() if replay else RateLimiter(args.rpm or None, args.tpm or None)
+            report = await open_coding_concurrent(df, log, args.concurrency, limiter)
+    finally:
+        log.close()
+        await close_async_client()
+    load_results(df, log).to_csv(args.output, index=False)
+    return report
+
+def main(argv: List[str] = None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--input", type=Path, default=INPUT_CSV_PATH)
+    parser.add_argument("--output", type=Path, default=OUTPUT_CSV_PATH)
+    parser.add_argument("--run-dir", type=Path, default=RUN_DIR, help="Where the resumable log is kept.")
+    parser.add_argument("--restart", action="store_true", help="Discard the log of a previous run.")
+    parser.add_argument("--store", type=Path, nargs="?", const=STORE_DIR,
+                        help=f"Also write the responses to the Parquet artifact store (default {STORE_DIR}).")
+    parser.add_argument("--concurrency", type=int, default=MAX_CONCURRENCY)
+    parser.add_argument("--rpm", type=float, default=REQUESTS_PER_MINUTE, help="Requests per minute (0: no limit).")
+    parser.add_argument("--tpm", type=float, default=TOKENS_PER_MINUTE, help="Tokens per minute (0: no limit).")
+    parser.add_argument("--serial", action="store_true", help="One call at a time, nothing saved until the end.")
+    parser.add_argument("--batch-api", action="store_true", help="Use the OpenAI-compatible Batch API.")
+    parser.add_argument("--api-base", help="Batch API endpoint (default: LLM_API_BASE if MODEL_NAME is an OpenAI "
+                        "model, OpenAI's otherwise).")
+    parser.add_argument("--poll-interval", type=float, default=BATCH_POLL_INTERVAL)
+    parser.add_argument("--cache", choices=LLM_CACHE_MODES, default=LLM_CACHE_MODE,
+                        help="LLM cache: replay answers from it only, offline (default: LLM_CACHE_MODE).")
+    parser.add_argument("--cache-path", default=LLM_CACHE_PATH)
+    parser.add_argument("--run-name", help="Usage account of the run (default: run directory and start time).")
+    parser.add_argument("--token-budget", type=int, default=USAGE_RUN_TOKEN_BUDGET,
+                        help="Tokens the run may use (0: no budget).")
+    args = parser.parse_args(argv)
+    cache = configure_llm_cache(args.cache, args.cache_path)
+    if cache is not None and args.batch_api:
+        parser.error("--cache does not apply to --batch-api runs")
 
     # Check if input file exists
-    if not INPUT_CSV_PATH.exists():
-        print(f"Error: Input file not found at {INPUT_CSV_PATH}")
+    if not args.input.exists():
+        print(f"Error: Input file not found at {args.input}")
         print("Please run generate_synthetic_queries.py first to create the input data.")
         return
 
-    print(f"Processing {INPUT_CSV_PATH}...")
-    results_df = open_coding_from_csv(str(INPUT_CSV_PATH))
-    
+    print(f"Processing {args.input}...")
+    if args.serial:
+        results_df = open_coding_from_csv(str(args.input))
+        results_df.to_csv(args.output, index=False)
+    else:
+        with charged_run(args.run_name or run_name(args.run_dir), args.token_budget):
+            report = asyncio.run(run(pd.read_csv(args.input), args))
+        print(report.summary())
+        results_df = pd.read_csv(args.output)
+    if args.store is not None:
+        from evals.artifacts import ArtifactStore
+
+        print(f"Stored the responses in {ArtifactStore(args.store).write_responses(results_df)}")
+
     # Display sample results
     print("\nSample Open Coding Results:")
-    for idx, row in results_df.head(3).iterrows():
+    for row in results_df.head(3).to_dict("records"):
         print(f"\n--- Query {row['query_id']} ---")
         print(f"Original Query: {row['original_query']}")
-        print(f"Open Coding Response: {row['open_coding_response'][:200]}...")
-    
-    # Save to CSV
-    results_df.to_csv(OUTPUT_CSV_PATH, index=False)
-    print(f"\nResults saved to {OUTPUT_CSV_PATH}")
+        print(f"Open Coding Response: {str(row['open_coding_response'])[:200]}...")
+
+    print(f"\nResults saved to {args.output}")
     print(f"Total rows processed: {len(results_df)}")
     print(f"Columns in output: {list(results_df.columns)}")
+    if cache is not None:
+        print(f"LLM cache ({args.cache}): {cache.stats()}")
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,210 @@
+"""Building blocks for the async, resumable eval pipelines.
+
+* :class:`RateLimiter`: requests-per-minute and tokens-per-minute limits
+  shared by every concurrent call of a run.
+* :func:`with_retries`: timeouts and retries with full-jitter exponential
+  backoff, using the backend's :class:`~backend.utils.RetryPolicy`.
+* :class:`JsonlLog`: an append-only JSON-lines file that records each
+  finished unit of work, so that a crashed run resumes where it stopped.
+* :func:`charged_run`: charges the run's LLM calls to a usage account with
+  a token budget (:mod:`backend.usage`).
+"""
+
+import asyncio
+import json
+import os
+import sys
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from typing import IO, Any, Awaitable, Callable, Dict, Iterator, Optional, TypeVar
+
+# Add the project root to Python path
+sys.path.append(str(Path(__file__).parent.parent))
+
+from backend.usage import USAGE_RUN_TOKEN_BUDGET, charged_to, configure_usage_ledger, get_usage_ledger, usage_summary  # noqa: E402
+from backend.utils import DEFAULT_RETRY_POLICY, RetryPolicy, backoff_delay, is_retryable  # noqa: E402
+
+T = TypeVar("T")
+
+
+class RateLimiter:
+    """Token buckets for requests and tokens per minute, refilled continuously.
+
+    Callers :meth:`acquire` the tokens they expect to use before a call and
+    :meth:`settle` the difference once the provider reports the real usage;
+    an underestimate puts the bucket in debt, which later callers wait out.
+    Waiters are served in arrival order, so large requests are not starved.
+    A limit of ``None`` is not enforced.
+    """
+
+    def __init__(
+        self,
+        requests_per_minute: Optional[float] = None,
+        tokens_per_minute: Optional[float] = None,
+        clock: Callable[[], float] = time.monotonic,
+    ) -> None:
+        self.requests_per_minute = requests_per_minute
+        self.tokens_per_minute = tokens_per_minute
+        self._clock = clock
+        self._updated = clock()
+        # Both buckets start full: a run may send a minute's worth at once.
+        self._requests = requests_per_minute or 0.0
+        self._tokens = tokens_per_minute or 0.0
+        self._lock = asyncio.Lock()
+
+    def _refill(self) -> None:
+        now = self._clock()
+        elapsed, self._updated = now - self._updated, now
+        if self.requests_per_minute:
+            self._requests = min(self.requests_per_minute, self._requests + elapsed * self.requests_per_minute / 60)
+        if self.tokens_per_minute:
+            self._tokens = min(self.tokens_per_minute, self._tokens + elapsed * self.tokens_per_minute / 60)
+
+    def _wait_time(self, tokens: float) -> float:
+        """Seconds until one request and ``tokens`` tokens are available."""
+        wait = 0.0
+        if self.requests_per_minute:
+            wait = max(wait, (1 - self._requests) * 60 / self.requests_per_minute)
+        if self.tokens_per_minute:
+            # A call larger than the whole bucket waits for a full bucket only.
+            needed = min(tokens, self.tokens_per_minute)
+            wait = max(wait, (needed - self._tokens) * 60 / self.tokens_per_minute)
+        return wait
+
+    async def acquire(self, tokens: int = 0) -> None:
+        """Wait until one more request of about ``tokens`` tokens fits in both limits."""
+        async with self._lock:
+            while True:
+                self._refill()
+                wait = self._wait_time(tokens)
+                if wait <= 0:
+                    break
+                await asyncio.sleep(wait)
+            self._requests -= 1
+            self._tokens -= tokens
+
+    def settle(self, estimated: int, actual: int) -> None:
+        """Correct the token bucket once a call's real usage is known."""
+        self._tokens += estimated - actual
+
+
+async def with_retries(
+    call: Callable[[], Awaitable[T]],
+    policy: RetryPolicy = DEFAULT_RETRY_POLICY,
+    retryable: Callable[[BaseException], bool] = is_retryable,
+    limiter: Optional[RateLimiter] = None,
+    tokens: int = 0,
+) -> T:
+    """Await ``call()`` with ``policy.timeout``, retrying ``retryable`` errors.
+
+    Every attempt first acquires one request and ``tokens`` tokens from
+    ``limiter`` (the wait does not count towards the timeout); retries sleep
+    :func:`~backend.utils.backoff_delay` before that. The last error is raised
+    after ``policy.max_retries`` retries or on the first error that is not
+    retryable.
+    """
+    for retry in range(policy.max_retries + 1):
+        if retry:
+            await asyncio.sleep(backoff_delay(policy, retry - 1))
+        if limiter is not None:
+            await limiter.acquire(tokens)
+        try:
+            return await asyncio.wait_for(call(), policy.timeout)
+        except Exception as exc:
+            if retry == policy.max_retries or not retryable(exc):
+                raise
+    raise AssertionError("unreachable")
+
+
+class JsonlLog:
+    """Append-only JSON-lines file of finished work, read back on resume.
+
+    Each :meth:`append` writes and flushes one line (and ``fsync``s it when
+    ``durable``), so a crash loses at most the record being written. A
+    truncated last line left by a crash is skipped by :meth:`records`.
+    """
+
+    def __init__(self, path: Path, durable: bool = True) -> None:
+        self.path = Path(path)
+        self.durable = durable
+        self._file: Optional[IO[str]] = None
+
+    def records(self) -> Iterator[Dict[str, Any]]:
+        """The records written so far, oldest first."""
+        if not self.path.exists():
+            return
+        with open(self.path, encoding="utf-8") as f:
+            for line in f:
+                try:
+                    yield json.loads(line)
+                except json.JSONDecodeError:
+                    continue
+
+    def keys(self, field: str) -> set:
+        """The values of ``field`` in the records written so far."""
+        return {record[field] for record in self.records() if field in record}
+
+    def append(self, record: Dict[str, Any]) -> None:
+        """Write ``record`` as one line."""
+        if self._file is None:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            self._file = open(self.path, "a", encoding="utf-8")
+            if self._file.tell() and not self._ends_with_newline():
+                # Terminate the line left half-written by a crash.
+                self._file.write("\n")
+        self._file.write(json.dumps(record, ensure_ascii=False) + "\n")
+        self._file.flush()
+        if self.durable:
+            os.fsync(self._file.fileno())
+
+    def _ends_with_newline(self) -> bool:
+        with open(self.path, "rb") as f:
+            f.seek(-1, os.SEEK_END)
+            return f.read(1) == b"\n"
+
+    def close(self) -> None:
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def reset(self) -> None:
+        """Delete the log, to start the run over."""
+        self.close()
+        self.path.unlink(missing_ok=True)
+
+
+def usage_tokens(response: Any) -> Optional[int]:
+    """Total tokens a completion reported, or None if it did not."""
+    usage = getattr(response, "usage", None)
+    return getattr(usage, "total_tokens", None) if usage is not None else None
+
+
+def run_name(run_dir: Path) -> str:
+    """Default usage account name of a run: its directory and start time."""
+    return f"{run_dir.name}-{time.strftime('%Y%m%d-%H%M%S')}"
+
+
+@contextmanager
+def charged_run(name: str, token_budget: int = USAGE_RUN_TOKEN_BUDGET) -> Iterator[str]:
+    """Charge the LLM calls made inside the block to the usage account ``run:<name>``.
+
+    Once the run has used ``token_budget`` tokens (0: no budget), further
+    calls are refused with :class:`~backend.usage.TokenBudgetExceeded`; like
+    any failed call, their work is left for the next run. A budget turns the
+    usage ledger on if ``USAGE_ENABLED`` left it off. The run's usage and cost
+    are printed at the end.
+    """
+    account = f"run:{name}"
+    ledger = get_usage_ledger()
+    if ledger is None and token_budget:
+        ledger = configure_usage_ledger(enabled=True)
+    if ledger is not None:
+        ledger.set_budget(account, token_budget)
+    try:
+        with charged_to(account):
+            yield account
+    finally:
+        if ledger is not None:
+            for total in ledger.report(("account",), account=account):
+                print(f"Token usage of {account}: {usage_summary(total)}")
@@ -0,0 +1,324 @@
+"""Offline regression eval of the real backend, with recorded or stubbed LLM replies.
+
+Runs ``backend.main.app`` in this process through httpx's ASGI transport and
+sends every query of ``--input`` (``--repeat`` times) to ``/chat``,
+``--concurrency`` at a time, bypassing the response caches. The model is
+replaced according to ``--llm``:
+
+* ``recorded`` (default): a local OpenAI-compatible stub
+  (:mod:`benchmarks.fake_llm`) answers each query with its reply in
+  ``--recorded`` (``open_coding_results.csv``) after ``--latency`` seconds;
+* ``stub``: the same stub answers every query with its fixed scouting report;
+* ``cache``: the LLM cache (:mod:`backend.llm_cache`) replays the completions
+  recorded for the exact prompts; a prompt that changed since fails as
+  ``unrecorded``. ``--record`` calls ``MODEL_NAME`` for those instead.
+
+The replies are checked with vectorized regular expressions, each distinct
+reply once: a markdown heading, and the age, team and market price fields
+the system prompt asks for. The checks apply to the queries routed to the
+full report; canned and clarification replies are counted apart. Each
+request's time is split with its ``Server-Timing`` stages into model time
+(the ``provider`` stage, litellm included), admission queueing and the app
+layer (everything else).
+
+``--output`` writes the report as JSON. ``--baseline`` compares it with an
+earlier one and exits non-zero when requests failed, a check's pass rate
+dropped by more than ``--tolerance`` or the app layer's p50 or p95 grew by
+more than ``--overhead-tolerance``.
+
+Usage::
+
+    python evals/regression.py --output before.json
+    python evals/regression.py --baseline before.json --repeat 5 --concurrency 16
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import platform
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Any, Dict, Final, List, Optional
+
+import numpy as np
+import pandas as pd
+
+# Add the project root to Python path
+sys.path.append(str(Path(__file__).parent.parent))
+
+from backend.router import FULL, ROUTES  # noqa: E402
+from evals.analytics import parse_dimensions  # noqa: E402
+
+INPUT_CSV_PATH = Path(__file__).parent / "synthetic_queries_for_analysis.csv"
+RECORDED_CSV_PATH = Path(__file__).parent / "open_coding_results.csv"
+LLM_SOURCES = ("recorded", "stub", "cache")
+MAX_CONCURRENCY = 8  # Requests in flight
+MODEL_LATENCY = 0.1  # Seconds the stub takes per reply
+# Structure of a full scouting report, as SYSTEM_PROMPT asks for it.
+CHECKS: Final[Dict[str, str]] = {
+    "heading": r"(?m)^#{1,6}\s+\S",
+    "age": r"\bage\b",
+    "team": r"\b(?:team|club)\b",
+    "market_price": r"\bmarket (?:price|value)\b",
+}
+# App-layer growth below this is scheduling noise, whatever the relative change.
+OVERHEAD_NOISE_MS = 1.0
+# Settings that must match for two reports to be comparable.
+COMPARABLE_SETTINGS = ("llm", "latency", "concurrency", "repeat", "input")
+
+
+def check_replies(replies: pd.Series, checks: Dict[str, str] = CHECKS) -> pd.DataFrame:
+    """One boolean column per check, True where the reply matches its pattern (case-insensitive)."""
+    codes, texts = pd.factorize(replies.fillna("").astype("string"))
+    texts = pd.Series(texts, dtype="string")
+    frame = {}
+    for name, pattern in checks.items():
+        matched = np.asarray(texts.str.contains(pattern, case=False, regex=True).fillna(False), dtype=bool)
+        frame[name] = matched[codes] if len(codes) else np.zeros(0, dtype=bool)
+    return pd.DataFrame(frame, index=replies.index)
+
+
+def _server_timing(header: str) -> Dict[str, float]:
+    """Stage durations (seconds) of a ``Server-Timing`` header."""
+    stages = {}
+    for part in header.split(","):
+        name, _, duration = part.strip().partition(";dur=")
+        if duration:
+            stages[name] = float(duration) / 1000
+    return stages
+
+
+def _recorded_replies(path: Path) -> Any:
+    """Reply function for the stub: the recorded reply to the user's question, if any."""
+    from backend.utils import _PLAYER_FACTS_HEADER
+
+    recorded = pd.read_csv(path)
+    replies = dict(zip(recorded["original_query"], recorded["open_coding_response"]))
+
+    def reply(messages: List[Dict[str, Any]]) -> Optional[str]:
+        content = next((m["content"] for m in reversed(messages) if m["role"] == "user"), "")
+        if isinstance(content, list):
+            content = "".join(block.get("text", "") for block in content)
+        return replies.get(content.split("\n\n" + _PLAYER_FACTS_HEADER)[0])
+
+    return reply
+
+
+async def replay(app: Any, queries: List[str], concurrency: int) -> pd.DataFrame:
+    """Send each query to ``/chat`` as a new conversation; one row per request."""
+    import httpx
+
+    semaphore = asyncio.Semaphore(concurrency)
+    transport = httpx.ASGITransport(app=app)
+
+    async def one(client: httpx.AsyncClient, index: int, query: str) -> Dict[str, Any]:
+        async with semaphore:
+            start = time.perf_counter()
+            response = await client.post(
+                "/chat",
+                json={"messages": [{"role": "user", "content": query}]},
+                # A replayed query must reach the agent every time.
+                headers={"Cache-Control": "no-store", "X-Client-Id": f"regression-{index}"},
+            )
+            total = time.perf_counter() - start
+        stages = _server_timing(response.headers.get("server-timing", ""))
+        ok = response.status_code == 200
+        return {
+            "index": index,
+            "status": response.status_code,
+            "reply": response.json()["messages"][-1]["content"] if ok else None,
+            "error": None if ok else response.text[:200],
+            "total_s": total,
+            "model_s": stages.get("provider", 0.0),
+            "queue_s": stages.get("admission_wait", 0.0),
+        }
+
+    async with httpx.AsyncClient(transport=transport, base_url="http://regression", timeout=None) as client:
+        # Lazy imports and indexes load on the first request; keep them out of the timings.
+        await one(client, -1, queries[0])
+        start = time.perf_counter()
+        rows = await asyncio.gather(*(one(client, index, query) for index, query in enumerate(queries)))
+        elapsed = time.perf_counter() - start
+    frame = pd.DataFrame(rows)
+    frame.attrs["elapsed_s"] = elapsed
+    frame["app_s"] = (frame["total_s"] - frame["model_s"] - frame["queue_s"]).clip(lower=0.0)
+    return frame
+
+
+def _percentiles(values: pd.Series) -> Dict[str, float]:
+    return {
+        "p50_ms": float(values.quantile(0.5) * 1000),
+        "p95_ms": float(values.quantile(0.95) * 1000),
+        "mean_ms": float(values.mean() * 1000),
+    }
+
+
+def build_report(results: pd.DataFrame, checks: pd.DataFrame, config: Dict[str, Any]) -> Dict[str, Any]:
+    """Pass rates of the checks (by route and Scenario) and the time split of the requests."""
+    ok = results["status"] == 200
+    full = ok & (results["route"] == FULL)
+    passed = checks[full.to_numpy()]
+    scenarios = results.loc[full, "Scenario"]
+    timed = results[ok]
+    timing = {column[:-2]: _percentiles(timed[column]) for column in ("total_s", "model_s", "queue_s", "app_s")}
+    if config["llm"] != "cache":
+        # The stub's own latency is known: the rest of the model time is litellm and HTTP.
+        timing["llm_client"] = _percentiles(timed["model_s"] - config["latency"])
+    return {
+        "config": config,
+        "requests": int(len(results)),
+        "errors": int((~ok).sum()),
+        "unrecorded": int(results["error"].fillna("").str.contains("LLMCacheMiss|no recorded completion").sum()),
+        "routes": {route: int((ok & (results["route"] == route)).sum()) for route in ROUTES},
+        "checks": {name: float(passed[name].mean()) if len(passed) else None for name in CHECKS},
+        "checks_by_scenario": {
+            str(scenario): {name: float(value) for name, value in rates.items()}
+            for scenario, rates in passed.groupby(scenarios.to_numpy(), observed=True).mean().iterrows()
+        },
+        "timing": timing,
+        "throughput_rps": float(len(timed) / config["elapsed_s"]) if config.get("elapsed_s") else None,
+    }
+
+
+def compare(report: Dict[str, Any], baseline: Dict[str, Any], tolerance: float, overhead_tolerance: float) -> List[str]:
+    """Return a description of every regression against ``baseline``."""
+    regressions = []
+    if report["errors"] > baseline["errors"]:
+        regressions.append(f"errors {baseline['errors']} -> {report['errors']}")
+    for name, rate in report["checks"].items():
+        before = baseline["checks"].get(name)
+        if rate is not None and before is not None and rate < before - tolerance:
+            regressions.append(f"check {name}: pass rate {before:.2f} -> {rate:.2f}")
+    for stat in ("p50_ms", "p95_ms"):
+        before, now = baseline["timing"]["app"][stat], report["timing"]["app"][stat]
+        if now > before * (1 + overhead_tolerance) and now - before > OVERHEAD_NOISE_MS:
+            regressions.append(f"app layer {stat[:3]}: {before:.2f} ms -> {now:.2f} ms")
+    return regressions
+
+
+def _print_report(report: Dict[str, Any]) -> None:
+    print(f"{report['requests']} requests, {report['errors']} errors ({report['unrecorded']} unrecorded); "
+          f"routes {report['routes']}")
+    print("checks on full reports: " + ", ".join(
+        f"{name} {rate:.0%}" if rate is not None else f"{name} -" for name, rate in report["checks"].items()
+    ))
+    for scenario, rates in report["checks_by_scenario"].items():
+        print(f"  {scenario}: " + ", ".join(f"{name} {rate:.0%}" for name, rate in rates.items()))
+    print(f"{'ms per request':>15}{'p50':>9}{'p95':>9}{'mean':>9}")
+    for part, stats in report["timing"].items():
+        print(f"{part:>15}{stats['p50_ms']:>9.2f}{stats['p95_ms']:>9.2f}{stats['mean_ms']:>9.2f}")
+    if report["throughput_rps"] is not None:
+        print(f"throughput: {report['throughput_rps']:.1f} requests/s")
+
+
+def _configure(args: argparse.Namespace, llm_port: Optional[int]) -> None:
+    """Environment of the backend, set before it is imported."""
+    os.environ["METRICS_TIMING_HEADER"] = "1"
+    os.environ["LLM_WARMUP"] = "0"
+    # Admission control and the rate limit should not be what is measured.
+    os.environ.setdefault("LLM_MAX_CONCURRENCY", str(args.concurrency))
+    os.environ["CLIENT_RATE_LIMIT_PER_MINUTE"] = "0"
+    if args.llm == "cache":
+        os.environ["LLM_CACHE_MODE"] = "on" if args.record else "replay"
+        if args.cache_path:
+            os.environ["LLM_CACHE_PATH"] = args.cache_path
+    else:
+        from benchmarks.fake_llm import FAKE_MODEL
+
+        os.environ["MODEL_NAME"] = os.environ["ROUTER_CHEAP_MODEL"] = f"openai/{FAKE_MODEL}"
+        os.environ.pop("LLM_FALLBACK_MODELS", None)
+        os.environ["LLM_API_BASE"] = f"http://127.0.0.1:{llm_port}/v1"
+        os.environ.setdefault("OPENAI_API_KEY", "fake-key")
+        os.environ["LLM_CACHE_MODE"] = "off"
+        # Stubbed calls cost nothing; keep them out of the usage store.
+        os.environ["USAGE_ENABLED"] = "0"
+
+
+def main(argv: List[str] = None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--input", type=Path, default=INPUT_CSV_PATH)
+    parser.add_argument("--llm", choices=LLM_SOURCES, default="recorded")
+    parser.add_argument("--recorded", type=Path, default=RECORDED_CSV_PATH, help="Replies for --llm recorded.")
+    parser.add_argument("--latency", type=float, default=MODEL_LATENCY, help="Seconds per stubbed reply.")
+    parser.add_argument("--cache-path", help="LLM cache for --llm cache (default: LLM_CACHE_PATH).")
+    parser.add_argument("--record", action="store_true", help="With --llm cache, call the model for what is missing.")
+    parser.add_argument("--concurrency", type=int, default=MAX_CONCURRENCY)
+    parser.add_argument("--repeat", type=int, default=1, help="Send every query this many times.")
+    parser.add_argument("--output", type=Path, help="Write the report as JSON.")
+    parser.add_argument("--baseline", type=Path, help="Earlier --output file to compare against.")
+    parser.add_argument("--tolerance", type=float, default=0.05, help="Allowed drop of a check's pass rate.")
+    parser.add_argument("--overhead-tolerance", type=float, default=0.25,
+                        help="Allowed relative growth of the app layer's p50 and p95.")
+    args = parser.parse_args(argv)
+    if args.record and args.llm != "cache":
+        parser.error("--record only applies to --llm cache")
+
+    queries = pd.read_csv(args.input)
+    queries = pd.concat([queries] * args.repeat, ignore_index=True)
+
+    from benchmarks.fake_llm import create_app, free_port, serve
+
+    llm_port = free_port() if args.llm != "cache" else None
+    _configure(args, llm_port)
+    # The session store and the semantic cache are not used by /chat with no-store.
+    with tempfile.TemporaryDirectory() as tmp:
+        os.environ.setdefault("SESSION_DB_PATH", str(Path(tmp) / "sessions.sqlite3"))
+        from backend.main import app
+        from backend.router import get_router
+        from backend.utils import close_async_client, with_system_prompt
+
+        replies = _recorded_replies(args.recorded) if args.llm == "recorded" else None
+        fake = create_app(args.latency, replies=replies) if llm_port is not None else None
+
+        async def run() -> pd.DataFrame:
+            try:
+                return await replay(app, queries["query"].tolist(), args.concurrency)
+            finally:
+                await close_async_client()
+
+        if fake is not None:
+            with serve(fake, llm_port):
+                results = asyncio.run(run())
+        else:
+            results = asyncio.run(run())
+
+    router = get_router()
+    routes = {query: router.route(with_system_prompt([{"role": "user", "content": query}])).name
+              for query in queries["query"].unique()}
+    results["route"] = queries["query"].map(routes).to_numpy()
+    results["Scenario"] = parse_dimensions(queries["dimension_tuple_json"])["Scenario"].to_numpy()
+    start = time.perf_counter()
+    checks = check_replies(results["reply"])
+    checked = time.perf_counter() - start
+
+    config = {
+        **{key: str(value) if isinstance(value, Path) else value for key, value in vars(args).items()
+           if key not in ("output", "baseline", "cache_path", "recorded")},
+        "elapsed_s": results.attrs["elapsed_s"],
+        "python": platform.python_version(),
+    }
+    report = build_report(results, checks, config)
+    _print_report(report)
+    print(f"checks of {len(results)} replies in {checked * 1000:.1f} ms")
+    if args.output:
+        args.output.write_text(json.dumps(report, indent=2))
+        print(f"report written to {args.output}")
+    failed = report["errors"] > 0
+    if args.baseline:
+        baseline = json.loads(args.baseline.read_text())
+        for key in COMPARABLE_SETTINGS:
+            if baseline["config"].get(key) != report["config"][key]:
+                print(f"WARNING: baseline was run with {key}={baseline['config'].get(key)!r}, "
+                      f"this run with {report['config'][key]!r}")
+        regressions = compare(report, baseline, args.tolerance, args.overhead_tolerance)
+        for regression in regressions:
+            print(f"REGRESSION: {regression}")
+        failed = bool(regressions)
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,58 @@
+"""Shared setup of the backend tests: a local fake LLM and the environment pointing the backend at it.
+
+The backend reads its configuration when it is imported, so the environment
+is set here, before any test module imports it.
+"""
+
+import os
+import sys
+import tempfile
+from pathlib import Path
+from typing import Iterator
+
+import pytest
+from fastapi import FastAPI  # type: ignore
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from benchmarks.fake_llm import FAKE_MODEL, create_app, free_port, serve  # noqa: E402
+
+LLM_PORT = free_port()
+# Seconds the fake LLM takes per reply: long enough for concurrent requests to overlap.
+LLM_LATENCY = 0.2
+
+os.environ.update({
+    "MODEL_NAME": f"openai/{FAKE_MODEL}",
+    "LLM_API_BASE": f"http://127.0.0.1:{LLM_PORT}/v1",
+    "OPENAI_API_KEY": "fake-key",
+    "LLM_WARMUP": "0",
+    "LLM_CACHE_MODE": "off",
+    "SEMANTIC_CACHE_ENABLED": "0",
+    "USAGE_ENABLED": "0",
+    "SESSION_BACKEND": "memory",
+    "SESSION_DB_PATH": str(Path(tempfile.mkdtemp(prefix="chatbot-tests-")) / "sessions.sqlite3"),
+})
+for name in ("LLM_FALLBACK_MODELS", "ROUTER_CHEAP_MODEL", "SHARED_STATE_URL", "PROMPT_CACHING", "RESPONSE_CACHE_DB_PATH"):
+    os.environ.pop(name, None)
+
+
+@pytest.fixture(scope="session")
+def fake_llm_server() -> Iterator[FastAPI]:
+    app = create_app(latency=LLM_LATENCY)
+    with serve(app, LLM_PORT):
+        yield app
+
+
+@pytest.fixture
+def fake_llm(fake_llm_server: FastAPI) -> Iterator[FastAPI]:
+    """The fake LLM with its counters and injected faults reset."""
+    state = fake_llm_server.state
+    state.calls = 0
+    state.payloads.clear()
+    state.models.clear()
+    state.error_rate = 0.0
+    state.error_status = 500
+    state.slow_rate = 0.0
+    state.failing_models.clear()
+    state.reject_cache_control = False
+    yield fake_llm_server
@@ -0,0 +1,63 @@
+"""Admission control: a burst is bounded by concurrency plus queue, the rest is shed at once."""
+
+import asyncio
+import signal
+from typing import List
+
+import pytest
+
+from backend.admission import AdmissionController, Overloaded
+
+
+def test_a_burst_beyond_concurrency_and_queue_is_shed():
+    controller = AdmissionController(max_concurrency=2, max_queue=3, queue_timeout=5.0)
+
+    async def request() -> str:
+        try:
+            async with controller.slot():
+                await asyncio.sleep(0.05)
+            return "served"
+        except Overloaded as error:
+            return error.reason
+
+    async def burst() -> List[str]:
+        # Every request asks for a slot in the same event-loop tick.
+        return await asyncio.gather(*(request() for _ in range(10)))
+
+    results = asyncio.run(burst())
+
+    assert results.count("served") == 5
+    assert results.count("queue_full") == 5
+    assert controller.rejected["queue_full"] == 5
+    assert controller.active == controller.waiting == 0
+
+
+def test_draining_rejects_new_requests():
+    controller = AdmissionController(max_concurrency=2, max_queue=2)
+
+    async def run() -> None:
+        assert await controller.drain(timeout=1.0)
+        async with controller.slot():
+            pass
+
+    with pytest.raises(Overloaded, match="draining"):
+        asyncio.run(run())
+    assert controller.rejected["draining"] == 1
+
+
+def test_a_shutdown_signal_starts_draining_at_once():
+    from backend import main
+
+    received: List[int] = []
+    previous = signal.signal(signal.SIGTERM, lambda number, frame: received.append(number))
+    handlers = main._drain_on_signal()
+    try:
+        signal.raise_signal(signal.SIGTERM)
+        # Set by the signal, before uvicorn waits for the open connections.
+        assert main.admission.draining
+        assert received == [signal.SIGTERM]
+    finally:
+        main.admission.draining = False
+        for signum, handler in handlers.items():
+            signal.signal(signum, handler)
+        signal.signal(signal.SIGTERM, previous)
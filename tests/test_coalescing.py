@@ -0,0 +1,54 @@
+"""Request coalescing: identical concurrent ``/chat`` requests share one upstream call."""
+
+import asyncio
+import uuid
+from typing import Dict, List, Optional
+
+import httpx
+
+# Concurrent identical requests per burst.
+REQUESTS = 20
+
+
+def _burst(content: str, requests: int = REQUESTS, headers: Optional[Dict[str, str]] = None) -> List[httpx.Response]:
+    """Send ``requests`` identical chat requests at once to the app, in process."""
+    from backend.main import app
+    from backend.utils import close_async_client
+
+    async def run() -> List[httpx.Response]:
+        payload = {"messages": [{"role": "user", "content": content}]}
+        transport = httpx.ASGITransport(app=app)
+        try:
+            async with httpx.AsyncClient(transport=transport, base_url="http://test", timeout=None) as client:
+                return await asyncio.gather(*(client.post("/chat", json=payload, headers=headers) for _ in range(requests)))
+        finally:
+            # The client is bound to this event loop.
+            await close_async_client()
+
+    return asyncio.run(run())
+
+
+def test_identical_concurrent_requests_make_one_upstream_call(fake_llm):
+    responses = _burst(f"compare Pedri and Gavi ({uuid.uuid4().hex})")
+
+    assert [response.status_code for response in responses] == [200] * REQUESTS
+    assert fake_llm.state.calls == 1
+    assert len({response.text for response in responses}) == 1
+
+
+def test_an_upstream_error_reaches_every_waiter(fake_llm):
+    # 400 is not retried, so the failing call stays one upstream call.
+    fake_llm.state.error_rate, fake_llm.state.error_status = 1.0, 400
+
+    responses = _burst(f"compare Gavi and Pedri ({uuid.uuid4().hex})")
+
+    assert [response.status_code for response in responses] == [500] * REQUESTS
+    assert fake_llm.state.calls == 1
+
+
+def test_no_store_requests_are_not_coalesced(fake_llm):
+    # A client asking for a fresh reply must not get the one of a concurrent request.
+    responses = _burst(f"who is Lamine Yamal ({uuid.uuid4().hex})", 3, {"Cache-Control": "no-store"})
+
+    assert [response.status_code for response in responses] == [200] * 3
+    assert fake_llm.state.calls == 3
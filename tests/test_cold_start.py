@@ -0,0 +1,39 @@
+"""Startup of the backend: no LLM call at import, offline, within the cold-start budget."""
+
+import json
+import os
+import subprocess
+import sys
+from pathlib import Path
+
+from benchmarks.fake_llm import free_port
+
+# Seconds from ``import backend.main`` until the first request has been served.
+COLD_START_BUDGET = 3.0
+
+
+def test_cold_start_is_offline_and_within_budget(fake_llm):
+    # A fresh interpreter, since this one may have imported the backend already.
+    output = subprocess.run(
+        [sys.executable, "-m", "benchmarks.bench_cold_start", "--child", str(free_port())],
+        cwd=Path(__file__).parent.parent, env=dict(os.environ), capture_output=True, text=True, check=True,
+    ).stdout
+    result = json.loads(output.strip().splitlines()[-1])
+
+    assert result["network_attempts"] == []
+    assert result["first_request"] < COLD_START_BUDGET
+    # Neither the import nor the startup spent a completion ("hi" gets the canned reply).
+    assert fake_llm.state.calls == 0
+
+
+def test_warm_up_does_not_call_the_model(fake_llm):
+    import asyncio
+
+    from backend.utils import close_async_client, warm_up
+
+    async def run() -> None:
+        await warm_up()
+        await close_async_client()
+
+    asyncio.run(run())
+    assert fake_llm.state.calls == 0
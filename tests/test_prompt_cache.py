@@ -0,0 +1,87 @@
+"""Prompt caching: ``cache_control`` breakpoints in the payloads the provider receives."""
+
+import asyncio
+from typing import Any, Dict, List
+
+from benchmarks.fake_llm import FAKE_MODEL
+
+# Models with "claude" in their name get breakpoints under PROMPT_CACHING=auto.
+CLAUDE_MODEL = "openai/claude-fake"
+
+
+def _marked(messages: List[Dict[str, Any]]) -> List[int]:
+    """Indices of the messages carrying a cache breakpoint."""
+    return [
+        i for i, message in enumerate(messages)
+        if isinstance(message["content"], list) and any("cache_control" in block for block in message["content"])
+    ]
+
+
+def _ask(model: str, messages: List[Dict[str, str]]) -> List[Dict[str, str]]:
+    from backend.utils import RetryPolicy, aget_agent_response, close_async_client
+
+    policy = RetryPolicy(model=model, fallback_models=(), max_retries=0, hedge_percentile=None)
+
+    async def run() -> List[Dict[str, str]]:
+        try:
+            return await aget_agent_response(messages, policy)
+        finally:
+            # The client is bound to this event loop.
+            await close_async_client()
+
+    return asyncio.run(run())
+
+
+def _long_conversation() -> List[Dict[str, str]]:
+    from backend.utils import PROMPT_CACHE_MIN_TOKENS
+
+    return [
+        {"role": "user", "content": "scout report on Pedri"},
+        {"role": "assistant", "content": "Pedri is a midfielder. " * PROMPT_CACHE_MIN_TOKENS},
+        {"role": "user", "content": "and how does he compare with Gavi?"},
+    ]
+
+
+def test_the_system_prompt_is_a_breakpoint(fake_llm):
+    _ask(CLAUDE_MODEL, [{"role": "user", "content": "scout report on Pedri"}])
+
+    (payload,) = fake_llm.state.payloads
+    assert payload["messages"][0]["role"] == "system"
+    assert _marked(payload["messages"]) == [0]
+
+
+def test_long_conversations_mark_the_prefix_before_the_latest_turn(fake_llm):
+    history = _long_conversation()
+
+    _ask(CLAUDE_MODEL, history)
+
+    (payload,) = fake_llm.state.payloads
+    # System prompt, first question, long answer, latest question.
+    assert len(payload["messages"]) == len(history) + 1
+    assert _marked(payload["messages"]) == [0, len(history) - 1]
+
+
+def test_models_without_explicit_caching_get_plain_prompts(fake_llm):
+    _ask(f"openai/{FAKE_MODEL}", _long_conversation())
+
+    (payload,) = fake_llm.state.payloads
+    assert _marked(payload["messages"]) == []
+
+
+def test_a_provider_rejecting_breakpoints_gets_the_call_repeated_without_them(fake_llm):
+    from backend import utils
+
+    model = "openai/claude-without-cache-control"
+    fake_llm.state.reject_cache_control = True
+
+    try:
+        history = _ask(model, [{"role": "user", "content": "scout report on Gavi"}])
+
+        assert history[-1]["role"] == "assistant"
+        first, repeated = fake_llm.state.payloads
+        assert _marked(first["messages"]) == [0]
+        assert _marked(repeated["messages"]) == []
+        # Later calls to that model skip the rejected attempt.
+        assert not utils.uses_cache_breakpoints(model)
+    finally:
+        utils._no_cache_breakpoints.discard(model)
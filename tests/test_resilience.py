@@ -0,0 +1,88 @@
+"""Retries, fallback models and timeouts of the LLM calls, against the fake provider."""
+
+import asyncio
+import time
+from typing import Any, Awaitable, Callable, List
+
+import pytest
+
+from benchmarks.fake_llm import FAKE_MODEL
+
+FALLBACK_MODEL = f"{FAKE_MODEL}-fallback"
+# Seconds per attempt: well above the fake's normal latency, well below its slow one.
+TIMEOUT = 1.0
+
+
+def _policy(**changes: Any) -> Any:
+    from backend.utils import RetryPolicy
+
+    # No hedging, so that every attempt is one upstream call.
+    policy = RetryPolicy(
+        model=f"openai/{FAKE_MODEL}", fallback_models=(), max_retries=2, backoff=0.01, backoff_max=0.05,
+        timeout=TIMEOUT, hedge_percentile=None,
+    )
+    return policy._replace(**changes)
+
+
+def _run(call: Callable[[], Awaitable[Any]]) -> Any:
+    from backend.utils import close_async_client
+
+    async def run() -> Any:
+        try:
+            return await call()
+        finally:
+            # The client is bound to this event loop.
+            await close_async_client()
+
+    return asyncio.run(run())
+
+
+def _ask(policy: Any, content: str = "scout report on Pedri") -> List[Any]:
+    from backend.utils import aget_agent_response
+
+    return _run(lambda: aget_agent_response([{"role": "user", "content": content}], policy))
+
+
+def test_transient_errors_are_retried_then_the_fallback_answers(fake_llm):
+    fake_llm.state.failing_models = {FAKE_MODEL}
+    fake_llm.state.error_status = 503
+
+    history = _ask(_policy(fallback_models=(f"openai/{FALLBACK_MODEL}",)))
+
+    assert history[-1]["role"] == "assistant"
+    # One attempt and two retries on the primary, then one on the fallback.
+    assert fake_llm.state.models == {FAKE_MODEL: 3, FALLBACK_MODEL: 1}
+
+
+def test_the_last_error_is_raised_when_every_model_fails(fake_llm):
+    fake_llm.state.failing_models = {FAKE_MODEL, FALLBACK_MODEL}
+    fake_llm.state.error_status = 503
+
+    with pytest.raises(Exception) as raised:
+        _ask(_policy(max_retries=1, fallback_models=(f"openai/{FALLBACK_MODEL}",)))
+
+    assert getattr(raised.value, "status_code", None) == 503
+    assert fake_llm.state.models == {FAKE_MODEL: 2, FALLBACK_MODEL: 2}
+
+
+def test_non_retryable_errors_skip_the_retries(fake_llm):
+    fake_llm.state.error_rate, fake_llm.state.error_status = 1.0, 400
+
+    with pytest.raises(Exception) as raised:
+        _ask(_policy(max_retries=3))
+
+    assert getattr(raised.value, "status_code", None) == 400
+    assert fake_llm.state.models == {FAKE_MODEL: 1}
+
+
+def test_slow_attempts_time_out_instead_of_waiting_for_the_provider(fake_llm):
+    fake_llm.state.slow_rate = 1.0
+
+    start = time.perf_counter()
+    with pytest.raises(asyncio.TimeoutError):
+        _ask(_policy(max_retries=1))
+    elapsed = time.perf_counter() - start
+
+    assert fake_llm.state.calls == 2
+    # Two timed-out attempts, well before the provider would have answered.
+    assert elapsed < 2 * TIMEOUT + 1.0
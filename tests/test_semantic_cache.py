@@ -0,0 +1,28 @@
+"""Semantic cache: memory stays bounded however many distinct key terms are cached."""
+
+from backend.semantic_cache import SemanticCache
+
+
+def test_partitions_are_forgotten_with_their_last_entry():
+    cache = SemanticCache(capacity=8, threshold=0.9, ttl_seconds=60.0)
+
+    # Every age is a distinct key term, hence a new partition.
+    for age in range(16, 216):
+        cache.set(f"best midfielders under {age}", "ns", f"reply {age}")
+
+    stats = cache.stats()
+    assert stats["entries"] == 8
+    assert stats["partitions"] == 8
+    # The most recent entries are still served, the evicted ones are not.
+    assert cache.get("best midfielders under 215", "ns") == "reply 215"
+    assert cache.get("best midfielders under 16", "ns") is None
+
+
+def test_a_partition_survives_while_it_has_entries():
+    cache = SemanticCache(capacity=2, threshold=0.9, ttl_seconds=60.0)
+    cache.set("spanish midfielders", "ns", "first")
+    cache.set("spanish midfielders with vision", "ns", "second")
+    cache.set("french strikers", "ns", "third")
+
+    assert cache.stats()["partitions"] == 2
+    assert cache.get("spanish midfielders with vision", "ns") == "second"
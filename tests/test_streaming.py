@@ -0,0 +1,39 @@
+"""Streaming replies: a usage-only last chunk without choices is counted, not indexed."""
+
+import asyncio
+from types import SimpleNamespace
+from typing import Any, AsyncIterator, List
+
+from backend import utils
+from backend.metrics import LLM_TOKENS
+
+
+def _chunk(content: Any = None, usage: Any = None, choices: bool = True) -> SimpleNamespace:
+    chunk = SimpleNamespace(choices=[SimpleNamespace(delta=SimpleNamespace(content=content))] if choices else [])
+    if usage is not None:
+        chunk.usage = usage
+    return chunk
+
+
+def test_a_usage_chunk_without_choices_ends_the_stream(monkeypatch):
+    model = utils.MODEL_NAME
+    usage = SimpleNamespace(prompt_tokens=30, completion_tokens=4)
+
+    async def stream() -> AsyncIterator[SimpleNamespace]:
+        for chunk in (_chunk("Pedri"), _chunk(" is"), _chunk(" a midfielder."), _chunk(usage=usage, choices=False)):
+            yield chunk
+
+    async def fake_acompletion(*args: Any, **kwargs: Any) -> AsyncIterator[SimpleNamespace]:
+        return stream()
+
+    async def collect() -> List[str]:
+        try:
+            return [delta async for delta in utils.astream_agent_response([{"role": "user", "content": "Tell me about Pedri"}])]
+        finally:
+            await utils.close_async_client()
+
+    monkeypatch.setattr(utils, "_acompletion", fake_acompletion)
+    completion_before = LLM_TOKENS.value(model=model, kind="completion")
+
+    assert asyncio.run(collect()) == ["Pedri", " is", " a midfielder."]
+    assert LLM_TOKENS.value(model=model, kind="completion") - completion_before == 4
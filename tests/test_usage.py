@@ -0,0 +1,42 @@
+"""Usage ledger: account totals stay bounded in memory and budgets survive eviction."""
+
+import asyncio
+
+import pytest
+
+from backend.usage import TokenBudgetExceeded, UsageLedger
+
+
+def test_account_totals_are_bounded_and_reloaded(tmp_path):
+    ledger = UsageLedger(str(tmp_path / "usage.sqlite3"), flush_interval=60.0, max_accounts=2)
+    try:
+        for account in ("session:a", "session:b", "session:c"):
+            ledger.record("openai/fake-model", 60, 40, account=account)
+            assert ledger.used(account) == 100
+        assert not ledger.loaded("session:a")
+        assert ledger.loaded("session:b") and ledger.loaded("session:c")
+
+        ledger.record("openai/fake-model", 10, 0, account="session:a")
+        # Evicted totals are loaded again, pending calls included.
+        assert ledger.used("session:a") == 110
+        assert not ledger.loaded("session:b")
+    finally:
+        ledger.close()
+
+
+def test_acheck_loads_the_stored_total_and_refuses_over_budget(tmp_path):
+    path = str(tmp_path / "usage.sqlite3")
+    ledger = UsageLedger(path)
+    ledger.record("openai/fake-model", 300, 200, account="session:spent")
+    ledger.close()
+
+    ledger = UsageLedger(path)
+    ledger.set_budget("session:spent", 500)
+    try:
+        with pytest.raises(TokenBudgetExceeded):
+            asyncio.run(ledger.acheck(account="session:spent"))
+        assert ledger.loaded("session:spent")
+        asyncio.run(ledger.acheck(account="session:unbudgeted"))
+        assert not ledger.loaded("session:unbudgeted")
+    finally:
+        ledger.close()